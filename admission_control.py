@@ -0,0 +1,307 @@
+"""
+Admission control globale con concorrenza adattiva (AIMD) per le chiamate Gemini.
+
+Tutte le sessioni Streamlit condividono lo stesso processo: senza un limite
+comune i picchi di traffico si trasformano in raffiche di 429. Il controller
+limita le chiamate concorrenti verso il provider, adatta il limite in base a
+latenza ed errori osservati (incremento additivo, decremento moltiplicativo),
+mette in coda le richieste in eccesso con una scadenza e, a coda piena o
+scaduta, le scarta subito sollevando ``AdmissionRejected``.
+
+Configurazione tramite variabili d'ambiente:
+- ``GEMINI_CONCURRENCY_INITIAL`` / ``GEMINI_CONCURRENCY_MIN`` / ``GEMINI_CONCURRENCY_MAX``
+- ``GEMINI_QUEUE_SIZE``: richieste massime in attesa
+- ``GEMINI_QUEUE_TIMEOUT``: secondi massimi di attesa in coda
+- ``GEMINI_LATENCY_TARGET_MS``: latenza oltre la quale il limite viene ridotto
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict
+
+# Evita di contare due volte una chiamata quando invoke delega a un altro metodo intercettato
+_inside_admission: contextvars.ContextVar[bool] = contextvars.ContextVar("inside_admission", default=False)
+
+ADMISSION_METHODS = ("invoke", "_invoke", "a_invoke", "_a_invoke")
+
+_RATE_LIMIT_MARKERS = ("429", "RESOURCE_EXHAUSTED", "rate limit", "quota")
+
+
+class AdmissionRejected(RuntimeError):
+    """Richiesta scartata: coda piena o attesa oltre la scadenza."""
+
+
+def _is_rate_limit_error(exc: BaseException) -> bool:
+    message = str(exc)
+    return any(marker.lower() in message.lower() for marker in _RATE_LIMIT_MARKERS)
+
+
+class AdmissionController:
+    """Semaforo a limite adattivo con coda limitata e metriche."""
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        max_queue: int = 64,
+        queue_timeout: float = 10.0,
+        latency_target_ms: float = 8000.0,
+        decrease_factor: float = 0.7,
+        error_rate_threshold: float = 0.2,
+        window: int = 50,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_target_ms = latency_target_ms
+        self.decrease_factor = decrease_factor
+        self.error_rate_threshold = error_rate_threshold
+
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self._in_flight = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        # Richieste async in attesa: (event loop, future) svegliate da ``release``
+        self._async_waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._outcomes: deque[tuple[float, bool]] = deque(maxlen=window)
+        self._last_decrease = 0.0
+
+        # Metriche cumulative
+        self.admitted = 0
+        self.shed = 0
+        self.shed_timeouts = 0
+        self.rate_limited = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def acquire(self) -> float:
+        """Attende uno slot libero e restituisce i secondi trascorsi in coda."""
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+
+        with self._cond:
+            if self._in_flight >= self.limit:
+                if self._waiting >= self.max_queue:
+                    self.shed += 1
+                    raise AdmissionRejected(f"{self.name}: coda piena ({self._waiting} in attesa)")
+
+                self._waiting += 1
+                try:
+                    while self._in_flight >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.shed += 1
+                            self.shed_timeouts += 1
+                            raise AdmissionRejected(
+                                f"{self.name}: attesa in coda oltre {self.queue_timeout:.1f}s"
+                            )
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            return self._admit(started)
+
+    def _admit(self, started: float) -> float:
+        """Occupa uno slot (con ``_cond`` già acquisito) e aggiorna le metriche di attesa."""
+        self._in_flight += 1
+        self.admitted += 1
+        waited = time.monotonic() - started
+        self.total_wait_s += waited
+        self.max_wait_s = max(self.max_wait_s, waited)
+        return waited
+
+    async def acquire_async(self) -> float:
+        """Come ``acquire``, ma l'attesa è una future sull'event loop.
+
+        Lo slot viene occupato solo sotto il lock, nello stesso passo in cui si
+        verifica che è libero: una task cancellata durante l'attesa non lascia
+        slot occupati e nessun thread dell'executor resta bloccato in coda.
+        """
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        loop = asyncio.get_running_loop()
+
+        with self._cond:
+            if self._in_flight < self.limit:
+                return self._admit(started)
+            if self._waiting >= self.max_queue:
+                self.shed += 1
+                raise AdmissionRejected(f"{self.name}: coda piena ({self._waiting} in attesa)")
+            self._waiting += 1
+
+        try:
+            while True:
+                with self._cond:
+                    if self._in_flight < self.limit:
+                        return self._admit(started)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        self.shed_timeouts += 1
+                        raise AdmissionRejected(f"{self.name}: attesa in coda oltre {self.queue_timeout:.1f}s")
+                    waiter = loop.create_future()
+                    self._async_waiters.append((loop, waiter))
+                try:
+                    await asyncio.wait_for(waiter, remaining)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self._cond:
+                        if (loop, waiter) in self._async_waiters:
+                            self._async_waiters.remove((loop, waiter))
+        finally:
+            with self._cond:
+                self._waiting -= 1
+
+    def release(self, latency_s: float, error: BaseException | None = None) -> None:
+        """Libera lo slot e aggiorna il limite (AIMD) in base all'esito."""
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            failed = error is not None
+            self._outcomes.append((latency_s, failed))
+
+            rate_limited = failed and _is_rate_limit_error(error)
+            if rate_limited:
+                self.rate_limited += 1
+
+            error_rate = sum(1 for _, f in self._outcomes if f) / len(self._outcomes)
+            overloaded = (
+                rate_limited
+                or error_rate > self.error_rate_threshold
+                or latency_s * 1000 > self.latency_target_ms
+            )
+
+            now = time.monotonic()
+            if overloaded:
+                # Un solo decremento per "finestra di latenza", per non far collassare il limite
+                if now - self._last_decrease > max(latency_s, 1.0):
+                    self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif not failed:
+                self._limit = min(float(self.max_limit), self._limit + 1.0 / max(self._limit, 1.0))
+
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                # Event loop già chiuso: nessuno attende più quella future
+                pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Metriche correnti serializzabili (limite, coda, attese, scarti)."""
+        with self._cond:
+            outcomes = list(self._outcomes)
+            return {
+                "name": self.name,
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "queue_depth": self._waiting,
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "shed_timeouts": self.shed_timeouts,
+                "rate_limited": self.rate_limited,
+                "avg_wait_ms": round(self.total_wait_s / self.admitted * 1000, 2) if self.admitted else 0.0,
+                "max_wait_ms": round(self.max_wait_s * 1000, 2),
+                "recent_error_rate": round(sum(1 for _, f in outcomes if f) / len(outcomes), 3) if outcomes else 0.0,
+                "recent_avg_latency_ms": round(sum(l for l, _ in outcomes) / len(outcomes) * 1000, 1) if outcomes else 0.0,
+            }
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _wrap_sync(func: Callable, controller: AdmissionController) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _inside_admission.get():
+            return func(*args, **kwargs)
+        controller.acquire()
+        token = _inside_admission.set(True)
+        started = time.perf_counter()
+        error: BaseException | None = None
+        try:
+            return func(*args, **kwargs)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            _inside_admission.reset(token)
+            controller.release(time.perf_counter() - started, error)
+
+    return wrapper
+
+
+def _wrap_async(func: Callable, controller: AdmissionController) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if _inside_admission.get():
+            return await func(*args, **kwargs)
+        await controller.acquire_async()
+        token = _inside_admission.set(True)
+        started = time.perf_counter()
+        error: BaseException | None = None
+        try:
+            return await func(*args, **kwargs)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            _inside_admission.reset(token)
+            controller.release(time.perf_counter() - started, error)
+
+    return wrapper
+
+
+def with_admission_control(client: Any, controller: AdmissionController) -> Any:
+    """Fa passare le chiamate di generazione del client (sync e async) dal controller."""
+    for method in ADMISSION_METHODS:
+        func = getattr(client, method, None)
+        if func is None or not callable(func):
+            continue
+        if inspect.iscoroutinefunction(func):
+            setattr(client, method, _wrap_async(func, controller))
+        else:
+            setattr(client, method, _wrap_sync(func, controller))
+    return client
+
+
+_gemini_controller: AdmissionController | None = None
+_gemini_controller_lock = threading.Lock()
+
+
+def get_gemini_admission_controller() -> AdmissionController:
+    """Restituisce il controller condiviso da tutte le sessioni del processo."""
+    global _gemini_controller
+
+    with _gemini_controller_lock:
+        if _gemini_controller is None:
+            _gemini_controller = AdmissionController(
+                name="gemini",
+                initial_limit=int(os.getenv("GEMINI_CONCURRENCY_INITIAL", "8")),
+                min_limit=int(os.getenv("GEMINI_CONCURRENCY_MIN", "1")),
+                max_limit=int(os.getenv("GEMINI_CONCURRENCY_MAX", "32")),
+                max_queue=int(os.getenv("GEMINI_QUEUE_SIZE", "64")),
+                queue_timeout=float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10")),
+                latency_target_ms=float(os.getenv("GEMINI_LATENCY_TARGET_MS", "8000")),
+            )
+        return _gemini_controller
@@ -3,268 +3,16 @@ Frontend web per FAQaccia.
 Integra FAQ locali e documentazione ufficiale (MCP) in un'unica interfaccia Streamlit.
 """
 
+import uuid
+
 import streamlit as st
 from chatbot_enhanced import EnhancedFAQChatbot
-from datapizza.memory import Memory
-
-LANGUAGE_OPTIONS = {
-    "it": {
-        "label": "Italiano",
-        "flag": "🇮🇹",
-        "ui": {
-            "language_label": "Lingua",
-            "init_spinner": "🔧 Inizializzazione chatbot con Google Gemini 2.5 Flash...",
-            "init_error": """⚠️ **Errore nell'inizializzazione del chatbot**
-
-{error}
-
-**Assicurati di:**
-1. Aver eseguito l'ingestion: `python ingest_faq.py`
-2. Aver configurato il file `.env` con GOOGLE_API_KEY e OPENAI_API_KEY
-3. Aver indicizzato la documentazione ufficiale con `python -m datapizza_mcp.indexer`
-4. Aver configurato Qdrant (host remoto o embedded) tramite le variabili `QDRANT_*`
-""",
-            "hero_subtitle": "Il chatbot per rispondere ai dubbi sul framework Datapizza-AI.",
-            "sidebar_model_title": "### 🧠 Modello AI",
-            "sidebar_model_info": "**Google Gemini 2.5 Flash** con Memory attiva\n\nIntegra FAQ + documentazione ufficiale (MCP).",
-            "sidebar_tips_title": "### 💡 Suggerimenti",
-            "sidebar_tips_body": """Prova a chiedere:
-- Cosa differenzia Datapizza-AI da altri framework?
-- Supporta modelli Llama?
-- Come funziona la memory?
-- Quali sono i casi d'uso concreti?
-- Posso usare documenti aziendali in locale?
-
-**Novità**: Il chatbot ora ricorda la conversazione! 🧠
-""",
-            "sidebar_debug_title": "### 🧪 Debug",
-            "debug_checkbox_label": "Mostra dettagli retrieval",
-            "debug_checkbox_help": "Abilita il logging della query riscritta, dei chunk trovati e di eventuali fallback.",
-            "debug_no_logs": "Invia una domanda per visualizzare i dettagli di debug.",
-            "debug_query_rewritten": "**Query riscritta**",
-            "debug_fallback_overridden": "Il modello aveva restituito il fallback: mostrato il testo più rilevante dalle FAQ.",
-            "debug_fallback_triggered": "Il modello ha restituito il fallback (nessuna informazione rilevante trovata).",
-            "debug_top_chunks_sidebar": "**Top chunk (max 3)**",
-            "debug_chunk_source_unknown": "sorgente sconosciuta",
-            "score_label": " · punteggio: ",
-            "debug_docs_excerpt": "**Documentazione ufficiale (estratto)**",
-            "debug_docs_chunks_sidebar": "**Chunk documentazione (max 2)**",
-            "debug_docs_chunk_source_fallback": "documentazione",
-            "debug_details_title": "🔍 Dettagli retrieval",
-            "debug_chunks_label": "**Chunk recuperati**",
-            "debug_no_chunks": "Nessun chunk recuperato dal vector store.",
-            "debug_top_chunks_expander": "**Top chunk (max 3)**",
-            "debug_docs_chunks_expander": "**Chunk documentazione (max 3)**",
-            "docs_not_supported_info": "Configura OPENAI_API_KEY per abilitare la documentazione ufficiale (Qdrant deve contenere 'datapizza_official_docs').",
-            "docs_toggle_label": "Includi documentazione ufficiale",
-            "docs_toggle_help": "Abilita il recupero tramite MCP della collection 'datapizza_official_docs'.",
-            "settings_title": "### ⚙️ Impostazioni",
-            "slider_label": "Chunks da recuperare",
-            "slider_help": "Numero di chunks rilevanti da recuperare dal vector store",
-            "stats_title": "### 📊 Statistiche",
-            "metric_messages": "Messaggi totali",
-            "clear_chat_button": "🗑️ Pulisci chat",
-            "resources_title": "### 📚 Risorse",
-            "resources_links": """- [Documentazione](https://docs.datapizza.ai/)
-- [GitHub](https://github.com/datapizza-labs/datapizza-ai)
-- [Guida RAG](https://docs.datapizza.ai/0.0.2/Guides/RAG/rag/)
-""",
-            "empty_chat_title": "Benvenuto in FAQaccia!",
-            "empty_chat_intro": "Chiedimi qualcosa per iniziare oppure prova uno dei suggerimenti.",
-            "empty_chat_suggestions": [
-                "Come posso integrare Datapizza-AI in un progetto esistente?",
-                "Quali differenze ci sono rispetto a un classico framework RAG?",
-                "Serve una chiave API per usare la documentazione ufficiale?",
-            ],
-            "input_label": "Messaggio",
-            "input_placeholder": "Scrivi la tua domanda qui...",
-            "submit_button": "Invia",
-            "thinking_spinner": "🤔 Sto pensando...",
-            "generic_error": "Si è verificato un errore: {error}",
-            "footer_text": """<div class="footer">
-        Costruito con ❤️ usando <a href="https://docs.datapizza.ai/" target="_blank">Datapizza-AI</a>
-        e <a href="https://streamlit.io/" target="_blank">Streamlit</a>
-    </div>
-    </div>""",
-            "user_avatar": "TU",
-            "assistant_avatar": "AI",
-        },
-    },
-    "en": {
-        "label": "English",
-        "flag": "🇬🇧",
-        "ui": {
-            "language_label": "Language",
-            "init_spinner": "🔧 Initializing chatbot with Google Gemini 2.5 Flash...",
-            "init_error": """⚠️ **Chatbot initialization error**
-
-{error}
-
-**Make sure to:**
-1. Run the ingestion: `python ingest_faq.py`
-2. Configure the `.env` file with GOOGLE_API_KEY and OPENAI_API_KEY
-3. Index the official documentation with `python -m datapizza_mcp.indexer`
-4. Configure Qdrant (remote host or embedded) via the `QDRANT_*` variables
-""",
-            "hero_subtitle": "The chatbot that answers questions about the Datapizza-AI framework.",
-            "sidebar_model_title": "### 🧠 AI Model",
-            "sidebar_model_info": "**Google Gemini 2.5 Flash** with active Memory\n\nCombines FAQ + official documentation (MCP).",
-            "sidebar_tips_title": "### 💡 Tips",
-            "sidebar_tips_body": """Try asking:
-- What sets Datapizza-AI apart from other frameworks?
-- Does it support Llama models?
-- How does the memory work?
-- What are concrete use cases?
-- Can I use on-premise company documents?
-
-**What's new**: The chatbot now remembers the conversation! 🧠
-""",
-            "sidebar_debug_title": "### 🧪 Debug",
-            "debug_checkbox_label": "Show retrieval details",
-            "debug_checkbox_help": "Enable logging for the rewritten query, retrieved chunks, and fallback status.",
-            "debug_no_logs": "Send a question to view the debug details.",
-            "debug_query_rewritten": "**Rewritten query**",
-            "debug_fallback_overridden": "The model returned the fallback; showing the most relevant FAQ snippet instead.",
-            "debug_fallback_triggered": "The model returned the fallback (no relevant information found).",
-            "debug_top_chunks_sidebar": "**Top chunks (max 3)**",
-            "debug_chunk_source_unknown": "unknown source",
-            "score_label": " · score: ",
-            "debug_docs_excerpt": "**Official documentation (excerpt)**",
-            "debug_docs_chunks_sidebar": "**Documentation chunks (max 2)**",
-            "debug_docs_chunk_source_fallback": "documentation",
-            "debug_details_title": "🔍 Retrieval details",
-            "debug_chunks_label": "**Retrieved chunks**",
-            "debug_no_chunks": "No chunks retrieved from the vector store.",
-            "debug_top_chunks_expander": "**Top chunks (max 3)**",
-            "debug_docs_chunks_expander": "**Documentation chunks (max 3)**",
-            "docs_not_supported_info": "Configure OPENAI_API_KEY to enable the official documentation (Qdrant must contain 'datapizza_official_docs').",
-            "docs_toggle_label": "Include official documentation",
-            "docs_toggle_help": "Enable MCP retrieval from the 'datapizza_official_docs' collection.",
-            "settings_title": "### ⚙️ Settings",
-            "slider_label": "Chunks to retrieve",
-            "slider_help": "Number of relevant chunks to fetch from the vector store",
-            "stats_title": "### 📊 Statistics",
-            "metric_messages": "Total messages",
-            "clear_chat_button": "🗑️ Clear chat",
-            "resources_title": "### 📚 Resources",
-            "resources_links": """- [Documentation](https://docs.datapizza.ai/)
-- [GitHub](https://github.com/datapizza-labs/datapizza-ai)
-- [RAG guide](https://docs.datapizza.ai/0.0.2/Guides/RAG/rag/)
-""",
-            "empty_chat_title": "Welcome to FAQaccia!",
-            "empty_chat_intro": "Ask me something to get started or try one of the suggestions.",
-            "empty_chat_suggestions": [
-                "How can I integrate Datapizza-AI into an existing project?",
-                "What makes it different from a classic RAG framework?",
-                "Do I need an API key to use the official documentation?",
-            ],
-            "input_label": "Message",
-            "input_placeholder": "Type your question here...",
-            "submit_button": "Send",
-            "thinking_spinner": "🤔 Thinking...",
-            "generic_error": "An error occurred: {error}",
-            "footer_text": """<div class="footer">
-        Built with ❤️ using <a href="https://docs.datapizza.ai/" target="_blank">Datapizza-AI</a>
-        and <a href="https://streamlit.io/" target="_blank">Streamlit</a>
-    </div>
-    </div>""",
-            "user_avatar": "YOU",
-            "assistant_avatar": "AI",
-        },
-    },
-    "de": {
-        "label": "Deutsch",
-        "flag": "🇩🇪",
-        "ui": {
-            "language_label": "Sprache",
-            "init_spinner": "🔧 Chatbot wird mit Google Gemini 2.5 Flash initialisiert...",
-            "init_error": """⚠️ **Fehler bei der Initialisierung des Chatbots**
-
-{error}
-
-**Stelle sicher, dass du:**
-1. Die Ingestion ausgeführt hast: `python ingest_faq.py`
-2. Die Datei `.env` mit GOOGLE_API_KEY und OPENAI_API_KEY konfiguriert hast
-3. Die offizielle Dokumentation mit `python -m datapizza_mcp.indexer` indiziert hast
-4. Qdrant (Remote-Host oder Embedded) über die Variablen `QDRANT_*` konfiguriert hast
-""",
-            "hero_subtitle": "Der Chatbot, der Fragen zum Datapizza-AI-Framework beantwortet.",
-            "sidebar_model_title": "### 🧠 KI-Modell",
-            "sidebar_model_info": "**Google Gemini 2.5 Flash** mit aktivem Gedächtnis\n\nKombiniert FAQ + offizielle Dokumentation (MCP).",
-            "sidebar_tips_title": "### 💡 Tipps",
-            "sidebar_tips_body": """Frag zum Beispiel:
-- Was unterscheidet Datapizza-AI von anderen Frameworks?
-- Unterstützt es Llama-Modelle?
-- Wie funktioniert das Memory?
-- Welche konkreten Use Cases gibt es?
-- Kann ich lokale Unternehmensdokumente nutzen?
-
-**Neu**: Der Chatbot merkt sich jetzt das Gespräch! 🧠
-""",
-            "sidebar_debug_title": "### 🧪 Debug",
-            "debug_checkbox_label": "Retrieval-Details anzeigen",
-            "debug_checkbox_help": "Aktiviere das Logging für die umformulierte Anfrage, gefundene Chunks und etwaige Fallbacks.",
-            "debug_no_logs": "Stelle eine Frage, um die Debug-Details zu sehen.",
-            "debug_query_rewritten": "**Umformulierte Anfrage**",
-            "debug_fallback_overridden": "Das Modell hat den Fallback geliefert; stattdessen wird der relevanteste FAQ-Ausschnitt angezeigt.",
-            "debug_fallback_triggered": "Das Modell hat den Fallback ausgegeben (keine relevanten Informationen gefunden).",
-            "debug_top_chunks_sidebar": "**Top-Chunks (max. 3)**",
-            "debug_chunk_source_unknown": "unbekannte Quelle",
-            "score_label": " · Score: ",
-            "debug_docs_excerpt": "**Offizielle Dokumentation (Auszug)**",
-            "debug_docs_chunks_sidebar": "**Dokumentations-Chunks (max. 2)**",
-            "debug_docs_chunk_source_fallback": "Dokumentation",
-            "debug_details_title": "🔍 Retrieval-Details",
-            "debug_chunks_label": "**Abgerufene Chunks**",
-            "debug_no_chunks": "Keine Chunks aus dem Vektor-Store gefunden.",
-            "debug_top_chunks_expander": "**Top-Chunks (max. 3)**",
-            "debug_docs_chunks_expander": "**Dokumentations-Chunks (max. 3)**",
-            "docs_not_supported_info": "Konfiguriere OPENAI_API_KEY, um die offizielle Dokumentation zu aktivieren (Qdrant muss 'datapizza_official_docs' enthalten).",
-            "docs_toggle_label": "Offizielle Dokumentation einbeziehen",
-            "docs_toggle_help": "Aktiviert den MCP-Retrieval der Collection 'datapizza_official_docs'.",
-            "settings_title": "### ⚙️ Einstellungen",
-            "slider_label": "Chunks abrufen",
-            "slider_help": "Anzahl relevanter Chunks, die aus dem Vektor-Store geholt werden",
-            "stats_title": "### 📊 Statistiken",
-            "metric_messages": "Nachrichten insgesamt",
-            "clear_chat_button": "🗑️ Chat löschen",
-            "resources_title": "### 📚 Ressourcen",
-            "resources_links": """- [Dokumentation](https://docs.datapizza.ai/)
-- [GitHub](https://github.com/datapizza-labs/datapizza-ai)
-- [RAG-Anleitung](https://docs.datapizza.ai/0.0.2/Guides/RAG/rag/)
-""",
-            "empty_chat_title": "Willkommen bei FAQaccia!",
-            "empty_chat_intro": "Frag mich etwas, um zu starten, oder nutze eine der Vorschläge.",
-            "empty_chat_suggestions": [
-                "Wie integriere ich Datapizza-AI in ein bestehendes Projekt?",
-                "Worin unterscheidet es sich von einem klassischen RAG-Framework?",
-                "Brauche ich einen API-Schlüssel, um die offizielle Dokumentation zu nutzen?",
-            ],
-            "input_label": "Nachricht",
-            "input_placeholder": "Schreibe deine Frage hier...",
-            "submit_button": "Senden",
-            "thinking_spinner": "🤔 Ich überlege...",
-            "generic_error": "Es ist ein Fehler aufgetreten: {error}",
-            "footer_text": """<div class="footer">
-        Erstellt mit ❤️ dank <a href="https://docs.datapizza.ai/" target="_blank">Datapizza-AI</a>
-        und <a href="https://streamlit.io/" target="_blank">Streamlit</a>
-    </div>
-    </div>""",
-            "user_avatar": "DU",
-            "assistant_avatar": "AI",
-        },
-    },
-}
-
-DEFAULT_LANGUAGE = "it"
-
-
-def get_ui_value(language: str, key: str):
-    default_ui = LANGUAGE_OPTIONS[DEFAULT_LANGUAGE]["ui"]
-    lang_ui = LANGUAGE_OPTIONS.get(language, {}).get("ui", {})
-    if key in lang_ui:
-        return lang_ui[key]
-    return default_ui.get(key)
+from cost_ledger import get_cost_ledger
+from debug_traces import get_trace_buffer, materialize_chunks
+from session_store import get_session_store
+from transcript_view import TRANSCRIPT_WINDOW, render_transcript
+from ui_strings import DEFAULT_LANGUAGE, LANGUAGE_OPTIONS, get_ui_value
+from warmup import get_warm_up, serve_precomputed_answer, warm_up_on_start
 
 # Configurazione della pagina
 st.set_page_config(
@@ -580,51 +328,54 @@ def ui_text(key: str):
     return get_ui_value(st.session_state.language, key)
 
 
-# Inizializzazione dello stato della sessione
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+def docs_excerpt(doc_chunks, max_chars: int = 800) -> str:
+    """Estratto della documentazione ufficiale dai chunk materializzati."""
+    excerpt = "\n\n".join((chunk.get("text") or "").strip() for chunk in doc_chunks).strip()
+    return excerpt[:max_chars] + "…" if len(excerpt) > max_chars else excerpt
+
+
+# Lo stato conversazionale (messaggi, Memory, log di debug) vive nel session store
+# condiviso: le sessioni inattive vengono spostate su disco e ripristinate al bisogno
+session_store = get_session_store()
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+session = session_store.get(st.session_state.session_id)
 
 # Stato debug e log
 if "debug" not in st.session_state:
     st.session_state.debug = False
-if "debug_logs" not in st.session_state:
-    st.session_state.debug_logs = []
 if "use_official_docs" not in st.session_state:
     st.session_state.use_official_docs = True
+if "transcript_window" not in st.session_state:
+    st.session_state.transcript_window = TRANSCRIPT_WINDOW
 
-# Inizializza la Memory per mantenere il contesto della conversazione
-if "memory" not in st.session_state:
-    st.session_state.memory = Memory()
 
-should_init_chatbot = (
-    "chatbot" not in st.session_state
-    or not isinstance(st.session_state.get("chatbot"), EnhancedFAQChatbot)
-)
+@st.cache_resource(show_spinner=False)
+def get_shared_chatbot() -> EnhancedFAQChatbot:
+    """Un solo chatbot per processo: client e pipeline condivisi, stato della domanda nel RequestContext."""
+    chatbot = EnhancedFAQChatbot(use_official_docs=True)
+    if warm_up_on_start():
+        # Warm-up del processo: connessioni del chatbot condiviso e risposte ai suggerimenti
+        get_warm_up().start(chatbot)
+    else:
+        # Client, Qdrant e pipeline si costruiscono in background mentre la pagina si carica
+        chatbot.start_warm_up()
+    return chatbot
 
-if should_init_chatbot:
-    with st.spinner(ui_text("init_spinner")):
-        try:
-            # Passa la memory condivisa al chatbot
-            st.session_state.chatbot = EnhancedFAQChatbot(
-                memory=st.session_state.memory,
-                debug_mode=st.session_state.debug,
-                use_official_docs=st.session_state.use_official_docs,
-            )
-            st.session_state.chatbot_ready = True
-        except Exception as e:
-            st.session_state.chatbot_ready = False
-            st.session_state.error_message = str(e)
-    if st.session_state.get("chatbot_ready", False):
-        st.session_state.use_official_docs = st.session_state.chatbot.use_official_docs
-elif st.session_state.get("chatbot_ready", False):
-    # Mantieni sincronizzato il flag di debug
-    st.session_state.chatbot.set_debug_mode(st.session_state.debug)
-    st.session_state.use_official_docs = st.session_state.chatbot.use_official_docs
+
+with st.spinner(ui_text("init_spinner")):
+    try:
+        chatbot = get_shared_chatbot()
+        st.session_state.chatbot_ready = True
+    except Exception as e:
+        st.session_state.chatbot_ready = False
+        st.session_state.error_message = str(e)
 
 # Verifica se il chatbot è pronto
 if not st.session_state.chatbot_ready:
     st.error(ui_text("init_error").format(error=st.session_state.error_message))
     st.stop()
+st.session_state.use_official_docs = st.session_state.use_official_docs and chatbot.supports_official_docs
 
 # Wrapper principale
 st.markdown('<div class="app-wrapper">', unsafe_allow_html=True)
@@ -661,6 +412,21 @@ with st.sidebar:
     st.markdown(ui_text("sidebar_model_title"))
     st.info(ui_text("sidebar_model_info"))
 
+    # Pronto solo a warm-up concluso (processo e chatbot condiviso)
+    warm_up_status = get_warm_up().snapshot()
+    if chatbot.setup_error:
+        # Costruzione in background fallita: visibile subito, non solo alla prima domanda
+        st.error(ui_text("setup_failed").format(error=chatbot.setup_error))
+    elif warm_up_status["state"] == "failed":
+        st.caption(ui_text("warmup_failed"))
+    elif warm_up_status["state"] in {"ready", "idle"} and chatbot.is_ready:
+        st.caption(ui_text("warmup_ready").format(
+            total_ms=warm_up_status["total_ms"] or chatbot.setup_ms,
+            answers=warm_up_status["precomputed"] + warm_up_status["reused"],
+        ))
+    else:
+        st.caption(ui_text("warmup_running"))
+
     st.markdown(ui_text("sidebar_tips_title"))
     st.markdown(ui_text("sidebar_tips_body"))
 
@@ -674,44 +440,52 @@ with st.sidebar:
     )
     if debug_toggle != st.session_state.debug:
         st.session_state.debug = debug_toggle
-        if st.session_state.get("chatbot_ready", False):
-            st.session_state.chatbot.set_debug_mode(debug_toggle)
-        st.session_state.debug_logs = []
+        session.debug_trace_ids = []
+        session_store.save(st.session_state.session_id, session)
 
     if st.session_state.debug:
-        if st.session_state.debug_logs:
-            last_debug = st.session_state.debug_logs[-1]
+        # Le trace sono compatte: il testo dei chunk viene materializzato solo qui
+        last_debug = get_trace_buffer().get(session.debug_trace_ids[-1]) if session.debug_trace_ids else None
+        if last_debug:
             st.markdown(ui_text("debug_query_rewritten"))
             st.code(last_debug.get("rewritten_query") or "—", language="text")
 
             if last_debug.get("fallback_overridden"):
                 st.warning(ui_text("debug_fallback_overridden"))
+            elif last_debug.get("generator_skipped"):
+                st.info(ui_text("debug_fallback_gated").format(**last_debug["relevance"]))
             elif last_debug.get("fallback_triggered"):
                 st.info(ui_text("debug_fallback_triggered"))
 
-            st.markdown(ui_text("debug_top_chunks_sidebar"))
-            for chunk in last_debug.get("chunks", [])[:3]:
-                metadata = chunk.get("metadata", {}) or {}
-                source = metadata.get("source") or ui_text("debug_chunk_source_unknown")
-                score = chunk.get("score")
-                score_label = None
-                if score is not None:
-                    try:
-                        score_label = round(float(score), 3)
-                    except (TypeError, ValueError):
-                        score_label = score
-                preview = chunk.get("text", "").strip().replace("\n", " ")
-                preview = preview[:220] + ("…" if len(preview) > 220 else "")
-                bullet = f"- `{source}`"
-                if score_label is not None:
-                    bullet += f"{ui_text('score_label')}{score_label}"
-                st.markdown(f"{bullet}\n\n    {preview}")
-            docs_excerpt = last_debug.get("official_docs_excerpt")
-            if last_debug.get("official_docs_used") and docs_excerpt:
-                st.markdown(ui_text("debug_docs_excerpt"))
-                st.code(docs_excerpt, language="markdown")
-                doc_chunks = last_debug.get("official_docs_chunks") or []
+            # Il testo dei chunk si materializza solo quando il dettaglio viene aperto
+            if st.checkbox(ui_text("debug_details_title"), key="debug_show_chunks"):
+                chunks = materialize_chunks(last_debug.get("chunks", [])[:3])
+                if chunks:
+                    st.markdown(ui_text("debug_top_chunks_sidebar"))
+                else:
+                    st.info(ui_text("debug_no_chunks"))
+                for chunk in chunks:
+                    metadata = chunk.get("metadata", {}) or {}
+                    source = metadata.get("source") or ui_text("debug_chunk_source_unknown")
+                    score = chunk.get("score")
+                    score_label = None
+                    if score is not None:
+                        try:
+                            score_label = round(float(score), 3)
+                        except (TypeError, ValueError):
+                            score_label = score
+                    preview = chunk.get("text", "").strip().replace("\n", " ")
+                    preview = preview[:220] + ("…" if len(preview) > 220 else "")
+                    bullet = f"- `{source}`"
+                    if score_label is not None:
+                        bullet += f"{ui_text('score_label')}{score_label}"
+                    st.markdown(f"{bullet}\n\n    {preview}")
+                doc_chunks = []
+                if last_debug.get("official_docs_used"):
+                    doc_chunks = materialize_chunks((last_debug.get("official_docs_chunks") or [])[:3])
                 if doc_chunks:
+                    st.markdown(ui_text("debug_docs_excerpt"))
+                    st.code(docs_excerpt(doc_chunks), language="markdown")
                     st.markdown(ui_text("debug_docs_chunks_sidebar"))
                     for chunk in doc_chunks[:2]:
                         meta = chunk.get("metadata", {}) or {}
@@ -731,6 +505,25 @@ with st.sidebar:
                         if score_label is not None:
                             bullet += f"{ui_text('score_label')}{score_label}"
                         st.markdown(f"{bullet}\n\n    {preview}")
+            # Contatori di processo: non stanno nelle trace per domanda
+            st.caption(ui_text("debug_admission").format(**chatbot.stats()["admission"]))
+            cost = last_debug.get("cost")
+            if cost:
+                st.caption(ui_text("debug_cost").format(
+                    llm_calls=cost["llm"]["calls"],
+                    input_tokens=cost["llm"]["input_tokens"],
+                    output_tokens=cost["llm"]["output_tokens"],
+                    embedding_calls=cost["embedding"]["calls"],
+                    qdrant_requests=cost["qdrant"]["requests"],
+                ))
+            store_stats = session_store.stats()
+            st.caption(
+                ui_text("debug_session_store").format(
+                    resident_kb=round(store_stats["resident_bytes"] / 1024, 1),
+                    restore_p95_ms=store_stats["restore_ms"]["p95"] or 0,
+                    **store_stats,
+                )
+            )
         else:
             st.info(ui_text("debug_no_logs"))
 
@@ -738,7 +531,7 @@ with st.sidebar:
 
     st.markdown(ui_text("settings_title"))
 
-    docs_supported = getattr(st.session_state.chatbot, "supports_official_docs", False)
+    docs_supported = chatbot.supports_official_docs
     if not docs_supported:
         st.info(ui_text("docs_not_supported_info"))
 
@@ -750,9 +543,8 @@ with st.sidebar:
     )
     if docs_toggle != st.session_state.use_official_docs:
         st.session_state.use_official_docs = docs_toggle
-        if st.session_state.get("chatbot_ready", False):
-            st.session_state.chatbot.use_official_docs = docs_toggle
-        st.session_state.debug_logs = []
+        session.debug_trace_ids = []
+        session_store.save(st.session_state.session_id, session)
         st.rerun()
 
     # Numero di chunks da recuperare
@@ -768,15 +560,15 @@ with st.sidebar:
 
     # Statistiche
     st.markdown(ui_text("stats_title"))
-    st.metric(ui_text("metric_messages"), len(st.session_state.messages))
+    st.metric(ui_text("metric_messages"), len(session.messages))
+    st.caption(ui_text("session_cost").format(**get_cost_ledger().session_totals(st.session_state.session_id)))
 
     # Pulsante per pulire la chat
     if st.button(ui_text("clear_chat_button"), use_container_width=True):
-        st.session_state.messages = []
-        # Resetta anche la memory per cancellare il contesto
-        st.session_state.memory = Memory()
-        st.session_state.chatbot.memory = st.session_state.memory
-        st.session_state.debug_logs = []
+        # Resetta messaggi, memory e log di debug della sessione
+        session.reset()
+        session_store.save(st.session_state.session_id, session)
+        st.session_state.transcript_window = TRANSCRIPT_WINDOW
         st.rerun()
 
     st.markdown("---")
@@ -788,19 +580,18 @@ with st.sidebar:
 chat_container = st.container()
 
 with chat_container:
-    if st.session_state.messages:
-        st.markdown('<div class="chat-shell">', unsafe_allow_html=True)
-        for message in st.session_state.messages:
-            role = message["role"]
-            avatar = ui_text("user_avatar") if role == "user" else ui_text("assistant_avatar")
-            classes = "chat-message user" if role == "user" else "chat-message assistant"
-            st.markdown(
-                f'<div class="{classes}"><div class="avatar">{avatar}</div><div class="bubble">',
-                unsafe_allow_html=True,
-            )
-            st.markdown(message["content"])
-            st.markdown("</div></div>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
+    if session.messages:
+        # Solo gli ultimi messaggi, in un'unica chiamata: l'HTML di ciascuno è in cache
+        hidden_count, transcript_html = render_transcript(
+            session.messages,
+            st.session_state.transcript_window,
+            {"user": ui_text("user_avatar"), "assistant": ui_text("assistant_avatar")},
+        )
+        if hidden_count:
+            if st.button(ui_text("load_earlier_button").format(count=hidden_count), use_container_width=True):
+                st.session_state.transcript_window += TRANSCRIPT_WINDOW
+                st.rerun()
+        st.markdown(transcript_html, unsafe_allow_html=True)
     else:
         suggestions = ui_text("empty_chat_suggestions")
         suggestion_items = "".join(f"<li>{item}</li>" for item in suggestions)
@@ -832,90 +623,49 @@ with st.form(key="chat_form", clear_on_submit=True):
 
 # Gestione invio messaggio
 if submit_button and user_input:
-    st.session_state.messages.append({"role": "user", "content": user_input})
+    # La sessione resta bloccata durante la domanda: lo store non la serializza a metà
+    with session.lock:
+        # Prima domanda uguale a un suggerimento: risposta precalcolata dal warm-up
+        precomputed = None
+        if not session.messages:
+            precomputed = serve_precomputed_answer(
+                session.memory,
+                current_language_code,
+                user_input,
+                st.session_state.use_official_docs,
+                chatbot.answer_version,
+                session_id=st.session_state.session_id,
+            )
+        session.messages.append({"role": "user", "content": user_input})
+        debug_info = None
 
-    with st.spinner(ui_text("thinking_spinner")):
-        try:
+        with st.spinner(ui_text("thinking_spinner")):
             try:
-                response = st.session_state.chatbot.ask(
-                    user_input,
-                    language=current_language_code,
-                    k=k,
-                )
-            except TypeError as exc:
-                if "unexpected keyword argument 'language'" in str(exc):
-                    response = st.session_state.chatbot.ask(user_input, k=k)
+                if precomputed is not None:
+                    response = precomputed
                 else:
-                    raise
-            debug_info = st.session_state.chatbot.last_debug_info
-        except Exception as e:
-            error_message = ui_text("generic_error").format(error=str(e))
-            st.error(error_message)
-            st.session_state.messages.append({"role": "assistant", "content": error_message})
-        else:
-            if debug_info:
-                st.session_state.debug_logs.append(debug_info)
-                if len(st.session_state.debug_logs) > 50:
-                    st.session_state.debug_logs = st.session_state.debug_logs[-50:]
-
-            st.session_state.messages.append({"role": "assistant", "content": response})
-
-            if st.session_state.debug and debug_info:
-                with st.expander(ui_text("debug_details_title"), expanded=False):
-                    st.markdown(ui_text("debug_query_rewritten"))
-                    st.code(debug_info.get("rewritten_query") or "—", language="text")
-
-                    if debug_info.get("fallback_overridden"):
-                        st.warning(ui_text("debug_fallback_overridden"))
-                    elif debug_info.get("fallback_triggered"):
-                        st.info(ui_text("debug_fallback_triggered"))
-
-                    chunks = debug_info.get("chunks", [])
-                    if chunks:
-                        st.markdown(ui_text("debug_chunks_label"))
-                        for chunk in chunks[:3]:
-                            metadata = chunk.get("metadata", {}) or {}
-                            source = metadata.get("source") or ui_text("debug_chunk_source_unknown")
-                            score = chunk.get("score")
-                            score_label = None
-                            if score is not None:
-                                try:
-                                    score_label = round(float(score), 3)
-                                except (TypeError, ValueError):
-                                    score_label = score
-                            preview = chunk.get("text", "").strip().replace("\n", " ")
-                            preview = preview[:320] + ("…" if len(preview) > 320 else "")
-                            bullet = f"- `{source}`"
-                            if score_label is not None:
-                                bullet += f"{ui_text('score_label')}{score_label}"
-                            st.markdown(f"{bullet}\n\n    {preview}")
-                    else:
-                        st.info(ui_text("debug_no_chunks"))
-                    docs_excerpt = debug_info.get("official_docs_excerpt")
-                    if debug_info.get("official_docs_used") and docs_excerpt:
-                        st.markdown(ui_text("debug_docs_excerpt"))
-                        st.code(docs_excerpt, language="markdown")
-                        doc_chunks = debug_info.get("official_docs_chunks") or []
-                        if doc_chunks:
-                            st.markdown(ui_text("debug_docs_chunks_expander"))
-                            for chunk in doc_chunks[:3]:
-                                meta = chunk.get("metadata", {}) or {}
-                                source = meta.get("file_path") or meta.get("source") or ui_text(
-                                    "debug_docs_chunk_source_fallback"
-                                )
-                                score = chunk.get("score")
-                                score_label = None
-                                if score is not None:
-                                    try:
-                                        score_label = round(float(score), 3)
-                                    except (TypeError, ValueError):
-                                        score_label = score
-                                preview = (chunk.get("text") or "").strip().replace("\n", " ")
-                                preview = preview[:320] + ("…" if len(preview) > 320 else "")
-                                bullet = f"- `{source}`"
-                                if score_label is not None:
-                                    bullet += f"{ui_text('score_label')}{score_label}"
-                                st.markdown(f"{bullet}\n\n    {preview}")
+                    # Memory e opzioni della sessione viaggiano con la domanda: il chatbot è condiviso
+                    result = chatbot.answer(
+                        user_input,
+                        session.memory,
+                        language=current_language_code,
+                        k=k,
+                        session_id=st.session_state.session_id,
+                        use_official_docs=st.session_state.use_official_docs,
+                        debug_mode=st.session_state.debug,
+                    )
+                    response, debug_info = result.text, result.trace
+            except Exception as e:
+                error_message = ui_text("generic_error").format(error=str(e))
+                st.error(error_message)
+                session.messages.append({"role": "assistant", "content": error_message})
+            else:
+                if debug_info:
+                    session.add_debug_trace(debug_info["trace_id"])
+
+                session.messages.append({"role": "assistant", "content": response})
+            finally:
+                session_store.save(st.session_state.session_id, session)
 
     st.rerun()
 
@@ -0,0 +1,244 @@
+"""
+Risposte in blocco: esegue un file di domande con concorrenza limitata.
+
+Legge le domande da un file JSONL (``{"id", "question", "language"}``, con
+``id`` e ``language`` opzionali) oppure di testo (una domanda per riga) e le
+passa a ``EnhancedFAQChatbot.answer_async`` con al massimo ``--concurrency``
+richieste in volo. Ogni domanda usa una ``Memory`` nuova, quindi le risposte
+non dipendono dall'ordine di esecuzione.
+
+Per ogni domanda viene scritta una riga JSONL con risposta, ID dei chunk
+recuperati (FAQ e docs ufficiali) e tempi per fase. Le righe sono aggiunte e
+scritte su disco man mano: rilanciando lo stesso comando le domande già
+presenti nel file di output vengono saltate, così un run interrotto riprende
+da dove si era fermato (``--no-resume`` per ricominciare da capo).
+
+Esempi:
+    python batch_ask.py benchmarks/retrieval_queries.jsonl --output answers.jsonl
+    python batch_ask.py domande.txt --language en --concurrency 8 --no-docs
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Set
+
+from dotenv import load_dotenv
+
+from perf_stats import summarize
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+
+@dataclass
+class BatchItem:
+    id: str
+    question: str
+    language: str
+
+
+def _item_id(question: str, language: str) -> str:
+    return hashlib.sha256(f"{language}\x00{question}".encode("utf-8")).hexdigest()[:16]
+
+
+def load_items(path: str, default_language: str = "it") -> List[BatchItem]:
+    """Carica le domande da JSONL o da testo semplice (una per riga)."""
+    items: List[BatchItem] = []
+    seen: Set[str] = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{line_number}: JSON non valido ({e})") from e
+                question = str(data.get("question", "")).strip()
+                language = data.get("language") or default_language
+                item_id = str(data.get("id") or _item_id(question, language))
+            else:
+                question, language = line, default_language
+                item_id = _item_id(question, language)
+            if not question:
+                continue
+            if item_id in seen:
+                print(f"⚠ Domanda duplicata saltata ({item_id}): {question[:60]}")
+                continue
+            seen.add(item_id)
+            items.append(BatchItem(id=item_id, question=question, language=language))
+    return items
+
+
+def completed_ids(path: str) -> Set[str]:
+    """ID già presenti nel file di output (le righe troncate da un'interruzione sono ignorate)."""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("id") and not record.get("error"):
+                done.add(record["id"])
+    return done
+
+
+def _chunk_ids(refs: Any) -> List[str]:
+    return [getattr(ref, "id", ref) for ref in refs or []]
+
+
+async def answer_item(chatbot: Any, item: BatchItem, k: int, score_threshold: float) -> Dict[str, Any]:
+    """Risponde a una domanda con una Memory nuova e riduce la trace a una riga JSONL."""
+    from datapizza.memory import Memory
+
+    started = time.perf_counter()
+    result = await chatbot.answer_async(
+        item.question, Memory(), item.language, k=k, score_threshold=score_threshold, session_id="batch"
+    )
+    trace = result.trace or {}
+
+    error = None
+    if not trace:
+        error = "elaborazione fallita"
+    elif trace.get("load_shed"):
+        error = "load_shed"
+
+    return {
+        "id": item.id,
+        "question": item.question,
+        "language": item.language,
+        "answer": result.text,
+        "faq_chunk_ids": _chunk_ids(trace.get("chunks")),
+        "docs_chunk_ids": _chunk_ids(trace.get("official_docs_chunks")),
+        "fallback": trace.get("fallback_triggered"),
+        "generator_skipped": trace.get("generator_skipped"),
+        "timings": {**trace.get("timings", {}), "wall_ms": round((time.perf_counter() - started) * 1000, 1)},
+        "embedding": trace.get("embedding"),
+        "compression": trace.get("compression"),
+        "cost": trace.get("cost"),
+        "error": error,
+    }
+
+
+async def run_batch(items: List[BatchItem], output_path: str, concurrency: int, k: int, score_threshold: float, use_official_docs: bool) -> List[Dict[str, Any]]:
+    from chatbot_enhanced import EnhancedFAQChatbot
+
+    # Un solo chatbot condiviso: memory e trace sono per domanda (answer_async)
+    chatbot = EnhancedFAQChatbot(use_official_docs=use_official_docs)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    results: List[Dict[str, Any]] = []
+    write_lock = asyncio.Lock()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+
+        async def _worker(item: BatchItem):
+            async with semaphore:
+                try:
+                    record = await answer_item(chatbot, item, k, score_threshold)
+                except Exception as e:
+                    record = {"id": item.id, "question": item.question, "language": item.language, "error": str(e)}
+
+            async with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                results.append(record)
+                status = "❌" if record.get("error") else ("↩️" if record.get("fallback") else "✅")
+                print(f"{status} [{len(results)}/{len(items)}] {item.question[:70]}")
+
+        await asyncio.gather(*(_worker(item) for item in items))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Risponde in blocco a un file di domande (output JSONL).")
+    parser.add_argument("input", help="File JSONL ({id, question, language}) o testo (una domanda per riga)")
+    parser.add_argument("--output", default="batch_answers.jsonl", help="File JSONL dei risultati (in append)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "4")))
+    parser.add_argument("--language", default="it", help="Lingua per le domande che non la specificano")
+    parser.add_argument("--k", type=int, default=10, help="Chunk FAQ da recuperare")
+    parser.add_argument("--score-threshold", type=float, default=0.5)
+    parser.add_argument("--no-docs", action="store_true", help="Disabilita la documentazione ufficiale")
+    parser.add_argument("--no-resume", action="store_true", help="Ricomincia da capo svuotando l'output")
+    args = parser.parse_args()
+
+    items = load_items(args.input, args.language)
+    if args.no_resume and os.path.exists(args.output):
+        os.remove(args.output)
+    done = completed_ids(args.output)
+    pending = [item for item in items if item.id not in done]
+
+    print("=" * 70)
+    print(f"📦 Batch: {len(items)} domande, {len(items) - len(pending)} già completate, concorrenza {args.concurrency}")
+    print("=" * 70)
+    if not pending:
+        print("✅ Niente da fare: tutte le domande hanno già una risposta.")
+        return
+
+    started = time.perf_counter()
+    results = asyncio.run(
+        run_batch(pending, args.output, max(1, args.concurrency), args.k, args.score_threshold, not args.no_docs)
+    )
+    elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if not r.get("error")]
+    print("\n" + "=" * 70)
+    print(
+        f"✅ Completate {len(ok)}/{len(results)} in {elapsed:.1f}s "
+        f"({len(results) / elapsed:.2f} domande/s) – fallback: {sum(1 for r in ok if r.get('fallback'))}"
+    )
+    for stage in ("faq_retrieval_ms", "official_docs_ms", "compression_ms", "generation_total_ms", "total_ms"):
+        values = [r["timings"][stage] for r in ok if stage in r.get("timings", {})]
+        if values:
+            stats = summarize(values, digits=1)
+            print(f"   {stage}: p50={stats['p50']} p95={stats['p95']} max={stats['max']}")
+    embeddings = [r["embedding"] for r in ok if r.get("embedding")]
+    if embeddings:
+        calls = sum(e["calls"] for e in embeddings) / len(embeddings)
+        embed_ms = summarize([e["ms"] for e in embeddings], digits=1)
+        shared = sum(1 for e in embeddings if e.get("shared_space"))
+        print(
+            f"   embedding: {calls:.2f} chiamate/domanda, p50={embed_ms['p50']} p95={embed_ms['p95']} ms "
+            f"(spazio condiviso in {shared}/{len(embeddings)})"
+        )
+    compressions = [r["compression"] for r in ok if r.get("compression")]
+    if compressions:
+        ratio = summarize([c["ratio"] for c in compressions], digits=3)
+        saved = sum(c["tokens_saved"] for c in compressions) / len(compressions)
+        compress_ms = summarize([c["ms"] for c in compressions], digits=1)
+        print(
+            f"   compressione contesto: ratio p50={ratio['p50']} p95={ratio['p95']}, "
+            f"{saved:.0f} token risparmiati/domanda, costo p50={compress_ms['p50']} ms"
+        )
+    costs = [r["cost"] for r in ok if r.get("cost")]
+    if costs:
+        llm_calls = sum(c["llm"]["calls"] for c in costs) / len(costs)
+        input_tokens = sum(c["llm"]["input_tokens"] for c in costs) / len(costs)
+        output_tokens = sum(c["llm"]["output_tokens"] for c in costs) / len(costs)
+        qdrant_requests = sum(c["qdrant"]["requests"] for c in costs) / len(costs)
+        print(
+            f"   costo per domanda: {llm_calls:.2f} chiamate LLM, {input_tokens:.0f} token in / "
+            f"{output_tokens:.0f} out, {qdrant_requests:.2f} richieste Qdrant"
+        )
+    print(f"📄 Risultati in {args.output}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)
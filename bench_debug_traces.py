@@ -0,0 +1,150 @@
+"""
+Benchmark di memoria delle trace di debug: preview complete vs riferimenti compatti.
+
+Simula ``--sessions`` sessioni che inviano ``--requests`` domande ciascuna,
+con ``--k`` chunk da ``--chunk-chars`` caratteri per risposta, e conserva fino
+a 50 trace per sessione come fa l'interfaccia:
+- ``previews``: il vecchio formato, con testo e metadati dei chunk in ogni trace
+- ``refs``: trace con soli (collection, id, score) nel ring buffer di processo
+
+Ogni modalità gira in un sottoprocesso separato, così l'RSS non è falsato
+dall'altra; per ciascuna riporta i byte allocati sul percorso caldo
+(tracemalloc), la memoria trattenuta a fine run e l'RSS.
+
+Esempio:
+    python bench_debug_traces.py --sessions 200 --requests 60
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tracemalloc
+from typing import Any, Dict, List
+
+MODES = ("previews", "refs")
+TRACES_PER_SESSION = 50
+
+
+def _current_rss_mb() -> float | None:
+    """RSS corrente in MB (Linux, da /proc); None se non disponibile."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _fake_chunks(rng: random.Random, request: int, k: int, chunk_chars: int) -> List[Any]:
+    from retrieval import RetrievedChunk
+
+    # Testi nuovi a ogni richiesta, come i payload appena decodificati da Qdrant
+    return [
+        RetrievedChunk(
+            id=str(rng.randrange(10_000)),
+            text=f"{request}-{i} " + "x" * chunk_chars,
+            metadata={"source": "datapizza_faq.md", "language": "it", "section": f"Domanda {i}"},
+            score=rng.random(),
+        )
+        for i in range(k)
+    ]
+
+
+def run_mode(mode: str, sessions: int, requests: int, k: int, chunk_chars: int, seed: int = 42) -> Dict[str, Any]:
+    from debug_traces import chunk_refs, record_trace
+
+    rng = random.Random(seed)
+    session_logs: List[List[Any]] = [[] for _ in range(sessions)]
+
+    gc.collect()
+    rss_before = _current_rss_mb()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    hot_path_bytes = 0
+
+    for request in range(requests):
+        for session in range(sessions):
+            chunks = _fake_chunks(rng, request, k, chunk_chars)
+
+            started_bytes, _ = tracemalloc.get_traced_memory()
+            if mode == "previews":
+                trace = {
+                    "question": "domanda",
+                    "chunks": [
+                        {"id": c.id, "score": c.score, "metadata": c.metadata, "text": c.text} for c in chunks
+                    ],
+                }
+                session_logs[session].append(trace)
+            else:
+                trace = record_trace({"session_id": f"s{session}", "chunks": chunk_refs(chunks, "datapizzai_faq")})
+                session_logs[session].append(trace["trace_id"])
+            if len(session_logs[session]) > TRACES_PER_SESSION:
+                del session_logs[session][:-TRACES_PER_SESSION]
+            hot_path_bytes += max(0, tracemalloc.get_traced_memory()[0] - started_bytes)
+
+            del chunks, trace
+
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = _current_rss_mb()
+
+    return {
+        "mode": mode,
+        "hot_path_bytes_per_request": round(hot_path_bytes / (sessions * requests), 1),
+        "retained_mb": round((retained - baseline) / (1024 * 1024), 2),
+        "peak_mb": round((peak - baseline) / (1024 * 1024), 2),
+        "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark di memoria delle trace di debug.")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=60, help="Richieste per sessione")
+    parser.add_argument("--k", type=int, default=10, help="Chunk per richiesta")
+    parser.add_argument("--chunk-chars", type=int, default=2000)
+    parser.add_argument("--mode", choices=MODES, help="Esegue una sola modalità (uso interno)")
+    parser.add_argument("--output", help="Scrive il report JSON su file")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.sessions, args.requests, args.k, args.chunk_chars)))
+        return
+
+    results = []
+    for mode in MODES:
+        completed = subprocess.run(
+            [
+                sys.executable, os.path.abspath(__file__), "--mode", mode,
+                "--sessions", str(args.sessions), "--requests", str(args.requests),
+                "--k", str(args.k), "--chunk-chars", str(args.chunk_chars),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+    print("=" * 70)
+    print(f"🧪 Trace di debug – {args.sessions} sessioni × {args.requests} richieste, k={args.k}")
+    print("=" * 70)
+    for result in results:
+        print(
+            f"[{result['mode']}] hot path: {result['hot_path_bytes_per_request']} B/richiesta | trattenuti: {result['retained_mb']} MB | "
+            f"picco: {result['peak_mb']} MB | ΔRSS: {result['rss_delta_mb']} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark dell'ingestion in streaming su un albero markdown sintetico.
+
+Genera (se necessario) un corpus di dimensione configurabile, poi esegue
+parsing, split e batching dei chunk come in ``ingest_faq.py`` senza chiamare
+l'embedder né Qdrant, riportando picco di RSS e throughput in chunk/s.
+
+Esempio:
+    python bench_ingestion.py --size-mb 1024 --dir /tmp/faq_bench
+"""
+
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+from ingest_faq import INGEST_BATCH_SIZE, _batched, iter_chunks, iter_document_paths
+
+_WORDS = (
+    "datapizza pipeline embedder chunk qdrant memory agent client splitter parser "
+    "retrieval vettore risposta domanda framework modulo documento contesto"
+).split()
+
+
+def _peak_rss_mb() -> float:
+    """Picco di RSS del processo corrente in MB (ru_maxrss è in KB su Linux, byte su macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return peak / divisor
+
+
+def generate_corpus(directory: str, size_mb: int, file_mb: int = 8, seed: int = 42) -> int:
+    """Scrive un albero di file markdown fino a ``size_mb`` MB, un paragrafo alla volta."""
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    per_file = file_mb * 1024 * 1024
+    written = 0
+    file_index = 0
+
+    while written < target:
+        subdir = os.path.join(directory, f"section_{file_index // 50:03d}")
+        os.makedirs(subdir, exist_ok=True)
+        path = os.path.join(subdir, f"doc_{file_index:05d}.md")
+        file_written = 0
+        with open(path, "w", encoding="utf-8") as f:
+            question = 0
+            while file_written < per_file and written < target:
+                words = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(40, 160)))
+                block = f"### Q: Domanda {question}?\n\n{words}.\n\n"
+                f.write(block)
+                file_written += len(block)
+                written += len(block)
+                question += 1
+        file_index += 1
+
+    return file_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dell'ingestion in streaming.")
+    parser.add_argument("--dir", default="/tmp/datapizza_ingest_bench", help="Directory del corpus sintetico")
+    parser.add_argument("--size-mb", type=int, default=1024, help="Dimensione del corpus da generare")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--skip-generate", action="store_true", help="Riusa il corpus già presente")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🏁 Benchmark ingestion in streaming")
+    print("=" * 60)
+
+    if not args.skip_generate:
+        print(f"🧱 Generazione corpus sintetico ({args.size_mb} MB) in {args.dir}...")
+        files = generate_corpus(args.dir, args.size_mb)
+        print(f"   • {files} file generati")
+
+    rss_before = _peak_rss_mb()
+    started = time.perf_counter()
+    chunks = 0
+    batches = 0
+    total_chars = 0
+
+    paths = iter_document_paths([args.dir], include="*.md", exclude="")
+    for batch in _batched(iter_chunks(paths), args.batch_size):
+        batches += 1
+        chunks += len(batch)
+        total_chars += sum(len(chunk.text) for chunk in batch)
+
+    elapsed = time.perf_counter() - started
+    print()
+    print(f"📦 Chunk generati : {chunks} in {batches} batch")
+    print(f"🔤 Caratteri      : {total_chars / (1024 * 1024):.1f} MB")
+    print(f"⏱️  Durata         : {elapsed:.1f}s ({chunks / elapsed if elapsed else 0:.0f} chunk/s)")
+    print(f"🧠 Picco RSS      : {_peak_rss_mb():.1f} MB (prima del run: {rss_before:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
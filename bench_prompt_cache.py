@@ -0,0 +1,203 @@
+"""
+Benchmark del layout dei prompt: token di input fatturati e time-to-first-token.
+
+Confronta due layout della richiesta finale di ``EnhancedFAQChatbot``:
+- ``legacy``: system prompt, contesto e domanda concatenati nell'input (dopo la cronologia)
+- ``prefix_stable``: system prompt precompilato come ``system_prompt``, poi cronologia, poi contesto + domanda
+
+In modalità offline (default) simula sessioni multi-turno con
+``LocalPrefixCache`` e riporta token di input, token in cache e token
+fatturati. Con ``--live`` invia le stesse richieste a Gemini in streaming e
+misura il time-to-first-token, leggendo i token in cache dai metadati di
+utilizzo (richiede GOOGLE_API_KEY). La modalità live non è ancora stata
+verificata contro l'API: il formato dei chunk di ``stream_invoke`` e dei
+metadati di utilizzo è quello atteso dal client datapizza.
+
+Esempi:
+    python bench_prompt_cache.py --sessions 20 --turns 6
+    python bench_prompt_cache.py --live --sessions 2 --turns 4 --output prompt_cache.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+from chatbot_enhanced import BASE_SYSTEM_PROMPT_TEMPLATE, LANGUAGE_CONFIG
+from perf_stats import summarize
+from prompt_cache import LocalPrefixCache, compile_system_prompts, usage_from_response
+from retrieval_benchmark import DEFAULT_QUERIES_PATH, load_queries
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+LAYOUTS = ("legacy", "prefix_stable")
+LEGACY_CLIENT_SYSTEM_PROMPT = "Sei un assistente esperto che risponde alle domande su Datapizza-AI."
+
+
+def _synthetic_context(rng: random.Random, chars: int) -> str:
+    words = ["pipeline", "embedder", "Qdrant", "chunk", "memory", "client", "agent", "retrieval", "modulo", "tool"]
+    body = " ".join(rng.choice(words) for _ in range(chars // 8))
+    return f"=== INFORMAZIONI DALLE FAQ ===\n\nFAQ #1:\n{body[:chars]}\n\n"
+
+
+def build_request(layout: str, system_prompt: str, instruction: str, context: str, question: str) -> Dict[str, str]:
+    """Restituisce ``system_prompt`` e ``input`` della richiesta finale per il layout indicato."""
+    dynamic = (
+        f"{context}\n\nDomanda dell'utente: {question}\n\n"
+        f"Rispondi alla domanda basandoti sulle informazioni sopra riportate.\nRicorda: {instruction}"
+    )
+    if layout == "legacy":
+        return {"system_prompt": LEGACY_CLIENT_SYSTEM_PROMPT, "input": f"{system_prompt}\n\n{dynamic}"}
+    return {"system_prompt": system_prompt, "input": dynamic}
+
+
+def simulate(layout: str, questions: List[Any], sessions: int, turns: int, context_chars: int, answer_chars: int, seed: int) -> Dict[str, Any]:
+    """Simula sessioni multi-turno e contabilizza i token con la cache locale."""
+    prefixes = compile_system_prompts(
+        BASE_SYSTEM_PROMPT_TEMPLATE,
+        tuple((code, cfg["fallback"], cfg["instruction"]) for code, cfg in LANGUAGE_CONFIG.items()),
+    )
+    cache = LocalPrefixCache(
+        min_tokens=int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024")),
+        discount=float(os.getenv("PROMPT_CACHE_DISCOUNT", "0.75")),
+    )
+    rng = random.Random(seed)
+
+    for _ in range(sessions):
+        history: List[str] = []
+        for _ in range(turns):
+            query = rng.choice(questions)
+            language = query.language if query.language in prefixes else "it"
+            request = build_request(
+                layout,
+                prefixes[language].text,
+                LANGUAGE_CONFIG[language]["instruction"],
+                _synthetic_context(rng, context_chars),
+                query.question,
+            )
+            cache.record([request["system_prompt"], *history, request["input"]])
+            history += [f"user:{query.question}", f"assistant:{'x' * answer_chars}"]
+
+    return cache.snapshot()
+
+
+def measure_live(layout: str, questions: List[Any], sessions: int, turns: int, context_chars: int, seed: int) -> Dict[str, Any]:
+    """Invia le richieste a Gemini in streaming e misura time-to-first-token e token in cache."""
+    from datapizza.clients.google import GoogleClient
+    from datapizza.memory import Memory
+    from datapizza.type import ROLE, TextBlock
+
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise RuntimeError("GOOGLE_API_KEY non configurata: impossibile eseguire il benchmark live.")
+
+    client = GoogleClient(model="gemini-2.5-flash", api_key=api_key, system_prompt=LEGACY_CLIENT_SYSTEM_PROMPT)
+    prefixes = compile_system_prompts(
+        BASE_SYSTEM_PROMPT_TEMPLATE,
+        tuple((code, cfg["fallback"], cfg["instruction"]) for code, cfg in LANGUAGE_CONFIG.items()),
+    )
+    rng = random.Random(seed)
+    ttft_ms: List[float] = []
+    prompt_tokens = 0
+    cached_tokens = 0
+
+    for _ in range(sessions):
+        memory = Memory()
+        for _ in range(turns):
+            query = rng.choice(questions)
+            language = query.language if query.language in prefixes else "it"
+            request = build_request(
+                layout,
+                prefixes[language].text,
+                LANGUAGE_CONFIG[language]["instruction"],
+                _synthetic_context(rng, context_chars),
+                query.question,
+            )
+
+            started = time.perf_counter()
+            first_token_at = None
+            last_chunk = None
+            text = ""
+            for chunk in client.stream_invoke(input=request["input"], system_prompt=request["system_prompt"], memory=memory):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                last_chunk = chunk
+                text += getattr(chunk, "delta", "") or ""
+            ttft_ms.append(((first_token_at or time.perf_counter()) - started) * 1000)
+
+            prompt, cached = usage_from_response(last_chunk)
+            prompt_tokens += prompt or 0
+            cached_tokens += cached or 0
+
+            memory.add_turn(TextBlock(content=query.question), role=ROLE.USER)
+            memory.add_turn(TextBlock(content=text), role=ROLE.ASSISTANT)
+
+    return {
+        "ttft_ms": summarize(ttft_ms, digits=1),
+        "input_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "billed_input_tokens": round(prompt_tokens - cached_tokens * float(os.getenv("PROMPT_CACHE_DISCOUNT", "0.75")), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del prompt caching (token fatturati e TTFT).")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES_PATH, help="Domande usate per le sessioni simulate")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=6, help="Turni per sessione")
+    parser.add_argument("--context-chars", type=int, default=4000, help="Dimensione del contesto recuperato")
+    parser.add_argument("--answer-chars", type=int, default=1200, help="Lunghezza delle risposte simulate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--live", action="store_true", help="Misura il TTFT reale su Gemini (online)")
+    parser.add_argument("--output", help="Scrive il report JSON su file")
+    args = parser.parse_args()
+
+    questions = [q for q in load_queries(args.queries) if not q.off_topic]
+    report: Dict[str, Any] = {"sessions": args.sessions, "turns": args.turns, "layouts": {}}
+
+    for layout in LAYOUTS:
+        result: Dict[str, Any] = {
+            "simulated": simulate(
+                layout, questions, args.sessions, args.turns, args.context_chars, args.answer_chars, args.seed
+            )
+        }
+        if args.live:
+            result["live"] = measure_live(layout, questions, args.sessions, args.turns, args.context_chars, args.seed)
+        report["layouts"][layout] = result
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print("=" * 70)
+    print(f"🧮 Prompt caching – {args.sessions} sessioni × {args.turns} turni")
+    print("=" * 70)
+    for layout, result in report["layouts"].items():
+        sim = result["simulated"]
+        print(
+            f"[{layout}] input={sim['input_tokens']} in cache={sim['cached_tokens']} "
+            f"fatturati={sim['billed_input_tokens']} hit rate={sim['hit_rate']}"
+        )
+        live = result.get("live")
+        if live:
+            ttft = live["ttft_ms"]
+            print(
+                f"   live: TTFT p50={ttft['p50']} ms p95={ttft['p95']} ms | "
+                f"input={live['input_tokens']} in cache={live['cached_tokens']}"
+            )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,187 @@
+"""
+Benchmark dei trasporti Qdrant: latenza di upsert e ricerca via REST e gRPC.
+
+Per ogni trasporto crea una collection temporanea, carica ``--points`` vettori
+casuali in batch da ``--batch`` (upsert con ``wait=True``), esegue ``--queries``
+ricerche in sequenza e le stesse ricerche da ``--concurrency`` thread, poi
+elimina la collection. I client sono costruiti con ``qdrant_client_kwargs``,
+quindi con gli stessi timeout e la stessa dimensione del pool dell'app.
+
+Trasporti confrontati:
+- ``embedded``: Qdrant in-process (``:memory:``), riferimento senza rete;
+- ``rest``: REST con le impostazioni di default del client (su localhost
+  senza keep-alive);
+- ``rest-pool``: REST con pool di ``--pool-size`` connessioni keep-alive;
+- ``grpc``: gRPC su ``--grpc-port``.
+
+REST e gRPC richiedono un server locale, ad esempio
+``docker run -p 6333:6333 -p 6334:6334 qdrant/qdrant``; se non risponde, i
+trasporti di rete vengono saltati.
+
+Esempi:
+    python bench_qdrant_transport.py
+    python bench_qdrant_transport.py --points 20000 --dim 768 --queries 500 --output /tmp/transport.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from perf_stats import summarize
+from qdrant_config import QdrantTarget, operation_timeout, qdrant_client_kwargs
+
+_WORDS = (
+    "datapizza pipeline embedder chunk qdrant memory agent client splitter parser "
+    "retrieval vettore risposta domanda framework modulo documento contesto"
+).split()
+
+
+def _random_vector(rng: random.Random, dim: int) -> List[float]:
+    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+def build_client(target: QdrantTarget, pool_size: int | None = None):
+    from qdrant_client import QdrantClient
+
+    kwargs = qdrant_client_kwargs(target, pool_size)
+    if target.location:
+        return QdrantClient(api_key=target.api_key, **kwargs)
+    return QdrantClient(host=target.host, port=target.port, api_key=target.api_key, **kwargs)
+
+
+def run_transport(client, args: argparse.Namespace) -> Dict[str, Any]:
+    """Upsert e ricerche su una collection temporanea; restituisce le latenze in ms."""
+    from qdrant_client import models
+
+    rng = random.Random(args.seed)
+    collection = f"bench_transport_{uuid.uuid4().hex[:8]}"
+    client.create_collection(
+        collection_name=collection,
+        vectors_config=models.VectorParams(size=args.dim, distance=models.Distance.COSINE),
+    )
+    try:
+        upsert_ms: List[float] = []
+        for start in range(0, args.points, args.batch):
+            points = [
+                models.PointStruct(
+                    id=index,
+                    vector=_random_vector(rng, args.dim),
+                    payload={"text": " ".join(rng.choice(_WORDS) for _ in range(args.payload_words))},
+                )
+                for index in range(start, min(start + args.batch, args.points))
+            ]
+            started = time.perf_counter()
+            client.upsert(collection_name=collection, points=points, wait=True)
+            upsert_ms.append((time.perf_counter() - started) * 1000)
+
+        queries = [_random_vector(rng, args.dim) for _ in range(args.queries)]
+
+        def search(vector: List[float]) -> float:
+            started = time.perf_counter()
+            client.query_points(
+                collection_name=collection,
+                query=vector,
+                limit=args.k,
+                with_payload=True,
+                timeout=operation_timeout("search"),
+            )
+            return (time.perf_counter() - started) * 1000
+
+        search_ms = [search(vector) for vector in queries]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            concurrent_ms = list(executor.map(search, queries))
+        concurrent_s = time.perf_counter() - started
+    finally:
+        client.delete_collection(collection)
+
+    return {
+        "upsert_batch_ms": summarize(upsert_ms, digits=2),
+        "upsert_points_per_s": round(args.points / (sum(upsert_ms) / 1000), 1) if upsert_ms else None,
+        "search_ms": summarize(search_ms, digits=2),
+        "concurrent_search_ms": summarize(concurrent_ms, digits=2),
+        "concurrent_qps": round(len(queries) / concurrent_s, 1) if concurrent_s else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenza di upsert e ricerca Qdrant: embedded, REST e gRPC.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--grpc-port", type=int, default=6334)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch", type=int, default=256, help="Punti per upsert")
+    parser.add_argument("--payload-words", type=int, default=200, help="Parole di testo nel payload di ogni punto")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8, help="Thread per le ricerche concorrenti")
+    parser.add_argument("--pool-size", type=int, default=8, help="Connessioni del trasporto rest-pool")
+    parser.add_argument(
+        "--transport",
+        action="append",
+        choices=["embedded", "rest", "rest-pool", "grpc"],
+        help="Trasporto da misurare (ripetibile, default: tutti)",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Scrive i risultati JSON su questo file")
+    args = parser.parse_args()
+
+    network = QdrantTarget(host=args.host, port=args.port, grpc_port=args.grpc_port)
+    transports = {
+        "embedded": (QdrantTarget(location=":memory:"), None),
+        "rest": (network, None),
+        "rest-pool": (network, args.pool_size),
+        "grpc": (QdrantTarget(host=args.host, port=args.port, grpc_port=args.grpc_port, prefer_grpc=True), None),
+    }
+
+    print("=" * 70)
+    print(f"🏁 Benchmark trasporti Qdrant: {args.points} punti × {args.dim} dim, {args.queries} ricerche k={args.k}")
+    print("=" * 70)
+
+    results: Dict[str, Any] = {}
+    for name in args.transport or list(transports):
+        target, pool_size = transports[name]
+        client = build_client(target, pool_size)
+        try:
+            if not target.location:
+                client.get_collections()
+        except Exception as exc:
+            print(f"⚠ {name}: server non raggiungibile su {args.host} ({exc}), trasporto saltato")
+            client.close()
+            continue
+        print(f"⏱️  {name}...")
+        try:
+            results[name] = run_transport(client, args)
+        finally:
+            client.close()
+
+    print()
+    print(f"{'trasporto':<10} {'upsert p50':>11} {'upsert p95':>11} {'punti/s':>9} "
+          f"{'search p50':>11} {'search p95':>11} {'conc p95':>9} {'qps':>8}")
+    for name, result in results.items():
+        upsert, search, concurrent = result["upsert_batch_ms"], result["search_ms"], result["concurrent_search_ms"]
+        print(
+            f"{name:<10} {upsert['p50']:>11} {upsert['p95']:>11} {result['upsert_points_per_s']:>9} "
+            f"{search['p50']:>11} {search['p95']:>11} {concurrent['p95']:>9} {result['concurrent_qps']:>8}"
+        )
+    print("(latenze in ms)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2, ensure_ascii=False)
+        print(f"💾 Risultati salvati in {args.output}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)
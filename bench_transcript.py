@@ -0,0 +1,137 @@
+"""
+Benchmark del tempo di rerun della chat Streamlit al crescere della conversazione.
+
+Per ogni lunghezza (``--sizes``, default 10, 100 e 500 messaggi) esegue con
+``streamlit.testing.v1.AppTest`` uno script che disegna la conversazione in
+due modi:
+- ``legacy``: tre ``st.markdown`` per messaggio, su tutti i messaggi
+- ``windowed``: ``transcript_view.render_transcript`` (ultimi ``--window``
+  messaggi in un'unica chiamata, HTML per messaggio in cache)
+
+Ogni modalità viene rieseguita ``--reruns`` volte sulla stessa sessione, come
+accade dopo ogni invio; si riportano p50/p95 del rerun e il numero di
+elementi prodotti.
+
+Esempio:
+    python bench_transcript.py --sizes 10 100 500 --reruns 20 --output transcript.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from perf_stats import summarize
+
+MODES = ("legacy", "windowed")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_SCRIPT = """
+import json
+import sys
+
+import streamlit as st
+
+sys.path.insert(0, {repo_dir!r})
+messages = json.loads({messages!r})
+
+if {mode!r} == "legacy":
+    st.markdown('<div class="chat-shell">', unsafe_allow_html=True)
+    for message in messages:
+        classes = "chat-message user" if message["role"] == "user" else "chat-message assistant"
+        st.markdown(f'<div class="{{classes}}"><div class="avatar">AI</div><div class="bubble">', unsafe_allow_html=True)
+        st.markdown(message["content"])
+        st.markdown("</div></div>", unsafe_allow_html=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+else:
+    from transcript_view import render_transcript
+
+    hidden, transcript_html = render_transcript(messages, {window}, {{"user": "TU", "assistant": "AI"}})
+    if hidden:
+        st.button(f"Carica messaggi precedenti ({{hidden}} nascosti)")
+    st.markdown(transcript_html, unsafe_allow_html=True)
+"""
+
+
+def _synthetic_messages(count: int, answer_chars: int, seed: int = 42) -> List[Dict[str, str]]:
+    rng = random.Random(seed)
+    words = ["pipeline", "**embedder**", "Qdrant", "`DagPipeline`", "memory", "client", "agent", "retrieval"]
+    messages: List[Dict[str, str]] = []
+    for index in range(count):
+        if index % 2 == 0:
+            messages.append({"role": "user", "content": f"Domanda {index}: come funziona {rng.choice(words)}?"})
+        else:
+            body = " ".join(rng.choice(words) for _ in range(answer_chars // 9))
+            messages.append({"role": "assistant", "content": f"Risposta {index}:\n\n- {body}\n- fine"})
+    return messages
+
+
+def measure(mode: str, size: int, reruns: int, window: int, answer_chars: int) -> Dict[str, Any]:
+    from streamlit.testing.v1 import AppTest
+
+    script = _SCRIPT.format(
+        repo_dir=REPO_DIR,
+        messages=json.dumps(_synthetic_messages(size, answer_chars)),
+        mode=mode,
+        window=window,
+    )
+    app = AppTest.from_string(script, default_timeout=60)
+    app.run()  # primo run: import e cache fredde, escluso dalle statistiche
+
+    durations: List[float] = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        durations.append((time.perf_counter() - started) * 1000)
+    if app.exception:
+        raise RuntimeError(f"script di benchmark fallito ({mode}, {size}): {app.exception}")
+
+    return {
+        "mode": mode,
+        "messages": size,
+        "elements": len(app.markdown) + len(app.button),
+        "rerun_ms": summarize(durations, digits=1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del rerun della chat Streamlit.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500], help="Lunghezze della conversazione")
+    parser.add_argument("--reruns", type=int, default=20, help="Rerun misurati per configurazione")
+    parser.add_argument("--window", type=int, default=int(os.getenv("TRANSCRIPT_WINDOW", "20")))
+    parser.add_argument("--answer-chars", type=int, default=900, help="Lunghezza delle risposte simulate")
+    parser.add_argument("--output", help="Scrive il report JSON su file")
+    args = parser.parse_args()
+
+    results = [
+        measure(mode, size, args.reruns, args.window, args.answer_chars)
+        for size in args.sizes
+        for mode in MODES
+    ]
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+    print("=" * 70)
+    print(f"🖥️ Rerun della chat – finestra {args.window} messaggi, {args.reruns} rerun")
+    print("=" * 70)
+    for result in results:
+        rerun = result["rerun_ms"]
+        print(
+            f"[{result['mode']:>8}] {result['messages']:>4} messaggi: p50={rerun['p50']} ms "
+            f"p95={rerun['p95']} ms | elementi={result['elements']}"
+        )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)
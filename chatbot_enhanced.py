@@ -4,30 +4,58 @@ Chatbot RAG Enhanced - Integra FAQ locali e documentazione ufficiale via MCP.
 
 import os
 import asyncio
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Dict, List
 
 from dotenv import load_dotenv
 
-from datapizza.clients.google import GoogleClient
-from datapizza.embedders.google import GoogleEmbedder
-from datapizza.modules.prompt import ChatPromptTemplate
-from datapizza.modules.rewriters import ToolRewriter
-from datapizza.pipeline import DagPipeline
 from datapizza.memory import Memory
 from datapizza.type import ROLE, TextBlock
 
+from admission_control import (
+    AdmissionRejected,
+    get_gemini_admission_controller,
+    with_admission_control,
+)
+from collection_aliases import collection_available
+from context_compression import ContextCompressor, compression_enabled
+from cost_ledger import cost_component, finish_request_cost, start_request_cost, with_cost_tracking
+from debug_traces import ChunkRef, chunk_refs, record_trace
+from deferred_setup import WARMUP_PROBE_TEXT, DeferredSetup
+from embeddings import (
+    EmbeddingMeter,
+    build_embedder,
+    faq_space,
+    official_docs_space,
+    shared_embedding_space,
+    start_embedding_meter,
+)
+from llm_cassette import cassette_api_key, with_cassette
+from prompt_cache import compile_system_prompts, get_prompt_cache, memory_segments
 from qdrant_config import (
     COLLECTION_NAME,
-    build_qdrant_vectorstore,
+    OFFICIAL_DOCS_COLLECTION,
     describe_qdrant_target,
+    get_qdrant_vectorstore,
 )
-
-from official_docs_retriever import DocsResult, query_official_docs
+from query_expansion import MultiQueryRewriter, multi_query_enabled
+from request_context import ChatAnswer, RequestContext
+from resilience import get_breaker, qdrant_breaker_name, resilience_snapshot
+from retrieval import (
+    best_score,
+    faq_relevance_threshold,
+    get_relevance_gate,
+    hydrate_texts,
+    search_chunks,
+    search_collections,
+    start_transfer_meter,
+)
+from shared_cache import cache_snapshot, content_version, get_cache
 
 # Carica variabili d'ambiente
 load_dotenv()
 
-EMBEDDING_MODEL = os.getenv("FAQ_EMBEDDING_MODEL", "gemini-embedding-001")
+GENERATION_MODEL = "gemini-2.5-flash"
 
 LANGUAGE_CONFIG: Dict[str, Dict[str, str]] = {
     "it": {
@@ -69,7 +97,7 @@ REGOLE IMPORTANTI:
 8. {language_instruction}"""
 
 
-class EnhancedFAQChatbot:
+class EnhancedFAQChatbot(DeferredSetup):
     """Chatbot RAG che interroga sia FAQ locali che documentazione ufficiale."""
     
     def __init__(self, memory: Memory = None, debug_mode: bool = False, use_official_docs: bool = True):
@@ -80,54 +108,76 @@ class EnhancedFAQChatbot:
             debug_mode: Abilita il logging di debug
             use_official_docs: Se True, integra anche la documentazione ufficiale via MCP
         """
-        self.google_api_key = os.getenv("GOOGLE_API_KEY")
+        self.google_api_key = cassette_api_key("GOOGLE_API_KEY")
         
         if not self.google_api_key:
             raise ValueError("GOOGLE_API_KEY non trovata nel file .env")
         
         self.memory = memory if memory is not None else Memory()
         self.debug_mode = debug_mode
-        self.supports_official_docs = bool(os.getenv("OPENAI_API_KEY"))
+        self.supports_official_docs = bool(cassette_api_key(official_docs_space().api_key_env))
 
         self.use_official_docs = use_official_docs and self.supports_official_docs
         self.last_debug_info: Dict[str, Any] | None = None
 
         self.base_system_prompt_template = BASE_SYSTEM_PROMPT_TEMPLATE
-        
-        # Inizializza componenti
+        # System prompt statici precompilati per lingua: prefisso stabile per il caching
+        self.system_prompts = compile_system_prompts(
+            self.base_system_prompt_template,
+            tuple((code, cfg["fallback"], cfg["instruction"]) for code, cfg in LANGUAGE_CONFIG.items()),
+        )
+        # Versione delle risposte generate: cambia con modello e system prompt (risposte precalcolate)
+        self.answer_version = content_version(
+            GENERATION_MODEL, *(prompt.fingerprint for _, prompt in sorted(self.system_prompts.items()))
+        )
+        # Tutte le istanze del processo condividono lo stesso admission controller
+        self.admission_controller = get_gemini_admission_controller()
+
+        # Client e pipeline vengono costruiti al primo utilizzo (o con start_warm_up)
+        self._init_deferred_setup()
+
+    def _setup(self):
+        """Costruisce client, vector store e pipeline (eseguito una sola volta)."""
         self._setup_clients()
         self._setup_pipeline()
     
     def _setup_clients(self):
         """Configura i client Google (Gemini 2.5 Flash)."""
-        self.google_client = GoogleClient(
-            model="gemini-2.5-flash",
+        from datapizza.clients.google import GoogleClient
+        from datapizza.modules.rewriters import ToolRewriter
+
+        generation_model = GENERATION_MODEL
+        self.google_client = with_admission_control(with_cost_tracking(with_cassette(GoogleClient(
+            model=generation_model,
             api_key=self.google_api_key,
             system_prompt="Sei un assistente esperto che risponde alle domande su Datapizza-AI.",
             temperature=0.7
-        )
+        ), "google_client")), self.admission_controller)
         
-        self.embedder = GoogleEmbedder(
-            api_key=self.google_api_key,
-            model_name=EMBEDDING_MODEL
-        )
+        # Embedder dello spazio delle FAQ (Gemini di default)
+        self.embedder = build_embedder(faq_space(), cache=True)
+        self.context_compressor = ContextCompressor(self.embedder, faq_space()) if compression_enabled() else None
         
-        self.query_rewriter = ToolRewriter(
-            client=self.google_client,
-            system_prompt="""Riscrivi la domanda dell'utente per migliorare il retrieval.
+        rewrite_prompt = """Riscrivi la domanda dell'utente per migliorare il retrieval.
             - Mantieni il contesto specifico: "questo framework" si riferisce a "Datapizza-AI"
             - Espandi abbreviazioni ma resta specifico
             - Aggiungi termini chiave rilevanti per Datapizza-AI
             - Restituisci solo la query riscritta, senza spiegazioni aggiuntive."""
+        self.query_rewriter = ToolRewriter(client=self.google_client, system_prompt=rewrite_prompt)
+        # Namespace della cache delle riscritture: cambia con modello e prompt
+        self.rewrite_cache_version = content_version("tool_rewriter", generation_model, rewrite_prompt)
+        # Multi-query: una sola chiamata restituisce più varianti della domanda
+        self.multi_query_rewriter = (
+            MultiQueryRewriter(self.google_client, model=generation_model) if multi_query_enabled() else None
         )
     
     def _setup_vectorstore(self):
         """Configura il vector store Qdrant per le FAQ."""
-        vectorstore = build_qdrant_vectorstore()
+        vectorstore = get_qdrant_vectorstore()
 
         try:
             client = vectorstore.get_client()
-            if not client.collection_exists(COLLECTION_NAME):
+            if not collection_available(client, COLLECTION_NAME):
                 raise RuntimeError(
                     f"La collection '{COLLECTION_NAME}' non esiste su {describe_qdrant_target()}. "
                     "Esegui prima lo script di ingestion o verifica la configurazione Qdrant."
@@ -140,142 +190,349 @@ class EnhancedFAQChatbot:
         return vectorstore
     
     def _setup_pipeline(self):
-        """Configura la DagPipeline per il retrieval dalle FAQ."""
+        """Configura la DagPipeline per riscrittura ed embedding della domanda."""
+        from datapizza.pipeline import DagPipeline
+
         self.retriever = self._setup_vectorstore()
         
-        # Template per il prompt
-        self.prompt_template = ChatPromptTemplate(
-            user_prompt_template="Domanda dell'utente: {{user_prompt}}",
-            retrieval_prompt_template="""
-Informazioni dalle FAQ:
-{% for chunk in chunks %}
----
-{{ chunk.text }}
----
-{% endfor %}
-"""
-        )
-        
-        # Crea la DagPipeline per FAQ
+        # La ricerca (con score) e la generazione avvengono fuori dalla DAG,
+        # così il gate di rilevanza può evitare la chiamata al generatore
         self.dag_pipeline = DagPipeline()
         
         self.dag_pipeline.add_module("rewriter", self.query_rewriter)
         self.dag_pipeline.add_module("embedder", self.embedder)
-        self.dag_pipeline.add_module("retriever", self.retriever)
-        self.dag_pipeline.add_module("prompt", self.prompt_template)
-        self.dag_pipeline.add_module("generator", self.google_client)
         
         self.dag_pipeline.connect("rewriter", "embedder", target_key="text")
-        self.dag_pipeline.connect("embedder", "retriever", target_key="query_vector")
-        self.dag_pipeline.connect("retriever", "prompt", target_key="chunks")
-        self.dag_pipeline.connect("prompt", "generator", target_key="memory")
+
+    def _warm_connections(self):
+        """Embed e ricerche di prova: connessioni a Qdrant e ai provider di embedding già aperte."""
+        vector = self.embedder.embed(WARMUP_PROBE_TEXT)
+        search_chunks(self.retriever, COLLECTION_NAME, vector, 1)
+        if not self.use_official_docs:
+            return
+        if shared_embedding_space():
+            # Spazio condiviso: la documentazione si interroga con lo stesso client e vettore
+            search_chunks(self.retriever, OFFICIAL_DOCS_COLLECTION, vector, 1)
+        else:
+            from official_docs_retriever import warm_up_official_docs
+
+            warm_up_official_docs()
+
+    def _retrieve(self, question: str, k: int, docs_k: int = 0, timings: Dict[str, float] | None = None):
+        """Riscrive ed embedda la domanda, poi cerca le FAQ (bloccante: eseguito in un thread).
+
+        Con ``docs_k`` > 0 (spazio di embedding condiviso) gli stessi vettori
+        cercano anche la documentazione ufficiale, in parallelo alle FAQ; un
+        errore sulla documentazione viene restituito al posto dei suoi chunk.
+        Restituisce anche il vettore della domanda, riusato dalla compressione.
+        In ``timings`` finiscono ``faq_retrieval_ms`` (riscrittura, embedding e
+        ricerca FAQ) e, con ``docs_k``, ``official_docs_ms`` (sola ricerca docs).
+        """
+        started = time.perf_counter()
+        if self.multi_query_rewriter is not None:
+            # Varianti → un embed batch → una ricerca batch → fusione per rango
+            with cost_component("rewrite"):
+                query_variants = self.multi_query_rewriter.rewrite(question)
+            rewritten_query = query_variants[0]
+            vectors = self.embedder.embed(query_variants)
+        else:
+            query_variants = []
+            rewritten_query = get_cache("rewrites").get(self.rewrite_cache_version, question)
+            if rewritten_query is not None:
+                # Riscrittura già nota (anche a un altro worker): solo l'embed, spesso in cache
+                vectors = [self.embedder.embed(rewritten_query)]
+            else:
+                with cost_component("rewrite"):
+                    faq_result = self.dag_pipeline.run({
+                        "rewriter": {"user_prompt": question},
+                    })
+                rewritten_query = faq_result.get("rewriter")
+                vectors = [faq_result.get("embedder")]
+                if isinstance(rewritten_query, str) and rewritten_query:
+                    get_cache("rewrites").put(self.rewrite_cache_version, question, rewritten_query)
+
+        searches = [(COLLECTION_NAME, vectors, k)]
+        if docs_k:
+            searches.append((OFFICIAL_DOCS_COLLECTION, vectors, docs_k))
+        prepare_ms = (time.perf_counter() - started) * 1000
+        search_ms: Dict[str, float] = {}
+        results = search_collections(self.retriever, searches, parent_collections={COLLECTION_NAME}, timings=search_ms)
+        if timings is not None:
+            # Ogni collection con la propria ricerca: le due richieste sono in parallelo
+            timings["faq_retrieval_ms"] = round(prepare_ms + search_ms.get(COLLECTION_NAME, 0.0), 1)
+            if docs_k:
+                timings["official_docs_ms"] = search_ms.get(OFFICIAL_DOCS_COLLECTION)
+        if isinstance(results[0], Exception):
+            raise results[0]
+        return rewritten_query, query_variants, results[0], results[1] if docs_k else None, vectors[0]
 
     def set_debug_mode(self, enabled: bool):
         """Abilita o disabilita il debug runtime."""
         self.debug_mode = enabled
 
+    def stats(self) -> Dict[str, Any]:
+        """Contatori di processo, fuori dalle trace per domanda (che restano compatte)."""
+        return {
+            "setup": self.health(),
+            "admission": self.admission_controller.snapshot(),
+            "resilience": resilience_snapshot(),
+            "cache": cache_snapshot(),
+            "relevance_gate": get_relevance_gate().snapshot(),
+            "prompt_cache": get_prompt_cache().snapshot(),
+        }
+
     def _get_language_config(self, language: str) -> Dict[str, str]:
         """Restituisce la configurazione della lingua richiesta."""
         return LANGUAGE_CONFIG.get(language, LANGUAGE_CONFIG["it"])
 
     def _compose_system_prompt(self, language: str) -> str:
-        """Genera il prompt di sistema in base alla lingua selezionata."""
-        lang_cfg = self._get_language_config(language)
-        return self.base_system_prompt_template.format(
-            fallback_message=lang_cfg["fallback"],
-            language_instruction=lang_cfg["instruction"],
-        )
+        """Restituisce il prompt di sistema precompilato per la lingua selezionata."""
+        return self.system_prompts.get(language, self.system_prompts["it"]).text
 
-    async def ask_async(
+    async def answer_async(
         self,
         question: str,
+        memory: Memory | None = None,
         language: str = "it",
         k: int = 10,
         score_threshold: float = 0.5,
-    ) -> str:
+        session_id: str | None = None,
+        use_official_docs: bool | None = None,
+        debug_mode: bool | None = None,
+    ) -> ChatAnswer:
         """
-        Versione asincrona di ask() che interroga sia FAQ che docs ufficiali.
-        
+        Risponde a una domanda interrogando sia FAQ che docs ufficiali (rientrante).
+
+        Lo stato della domanda vive in un ``RequestContext``: la stessa istanza
+        può servire in parallelo domande di sessioni diverse.
+
         Args:
             question: La domanda dell'utente
+            memory: Memory della sessione, aggiornata con il turno (None = domanda isolata)
             language: Codice lingua ISO (es. "it", "en", "de")
             k: Numero di chunks da recuperare dalle FAQ (default: 10)
-            score_threshold: Soglia minima di similarity score (default: 0.5)
-        
+            score_threshold: Soglia di rilevanza delle FAQ (default: 0.5, override con
+                FAQ_RELEVANCE_THRESHOLD); sotto soglia, e senza docs rilevanti,
+                si risponde con il fallback senza chiamare il generatore
+            session_id: Sessione a cui attribuire trace e costo nel ledger
+            use_official_docs: Override per la domanda (default: impostazione dell'istanza)
+            debug_mode: Override per la domanda (default: impostazione dell'istanza)
+
         Returns:
-            La risposta del chatbot
+            Risposta e trace della domanda
+        """
+        ctx = RequestContext(
+            memory=memory if memory is not None else Memory(),
+            language=language,
+            session_id=session_id,
+            use_official_docs=(
+                self.use_official_docs if use_official_docs is None else use_official_docs
+            ) and self.supports_official_docs,
+            debug_mode=self.debug_mode if debug_mode is None else debug_mode,
+        )
+        # Token, embedding e richieste Qdrant della domanda: nella trace e nel ledger
+        request_cost = start_request_cost()
+        embedding_meter = start_embedding_meter()
+        result = ChatAnswer(self._get_language_config(language)["error"])
+        try:
+            result = await self._answer_async(question, ctx, k, score_threshold, embedding_meter)
+            return result
+        finally:
+            finish_request_cost(request_cost, result.trace, session_id, language, embedding_meter)
+
+    def answer(self, question: str, memory: Memory | None = None, **kwargs: Any) -> ChatAnswer:
+        """Versione sincrona di ``answer_async`` (stessi argomenti)."""
+        return asyncio.run(self.answer_async(question, memory, **kwargs))
+
+    async def ask_async(
+        self,
+        question: str,
+        language: str = "it",
+        k: int = 10,
+        score_threshold: float = 0.5,
+        session_id: str | None = None,
+    ) -> str:
         """
+        Versione a sessione singola di ``answer_async``: usa ``self.memory`` e
+        salva la trace in ``self.last_debug_info`` (non rientrante).
+        """
+        result = await self.answer_async(question, self.memory, language, k, score_threshold, session_id)
+        self.last_debug_info = result.trace
+        return result.text
+
+    async def _answer_async(
+        self,
+        question: str,
+        ctx: RequestContext,
+        k: int,
+        score_threshold: float,
+        embedding_meter: EmbeddingMeter,
+    ) -> ChatAnswer:
+        """Retrieval, gate di rilevanza e generazione di una domanda (vedi ``answer_async``)."""
         env_debug = os.getenv("FAQ_DEBUG", "").lower() in {"1", "true", "yes", "on"}
-        debug_mode = self.debug_mode or env_debug
-        self.last_debug_info = None
+        debug_mode = ctx.debug_mode or env_debug
+        language = ctx.language
 
         lang_cfg = self._get_language_config(language)
         system_prompt = self._compose_system_prompt(language)
+        request_started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        transfer_meter = start_transfer_meter()
 
         try:
-            # 1. Interroga le FAQ locali (sincrono)
-            if debug_mode:
-                print("🔍 Step 1: Interrogo le FAQ locali...")
-            
-            faq_result = self.dag_pipeline.run({
-                "rewriter": {"user_prompt": question},
-                "prompt": {"user_prompt": question},
-                "retriever": {
-                    "collection_name": COLLECTION_NAME,
-                    "k": k
-                },
-                "generator": {
-                    "input": question,
-                    "system_prompt": system_prompt,
-                    "memory": self.memory
-                }
-            })
-            
-            rewritten_query = faq_result.get("rewriter")
-            faq_chunks = faq_result.get("retriever") or []
-            faq_chunk_previews: List[Dict[str, Any]] = []
-            
-            if debug_mode:
-                print(f"   • Query riscritta: {rewritten_query}")
-                print(f"   • Chunk FAQ recuperati: {len(faq_chunks)}")
-
-            for chunk in faq_chunks:
-                metadata = getattr(chunk, "metadata", {}) or {}
-                faq_chunk_previews.append(
-                    {
-                        "id": getattr(chunk, "id", None),
-                        "score": getattr(chunk, "score", None),
-                        "metadata": metadata,
-                        "text": chunk.text,
-                    }
+            skipped_branches: List[str] = []
+
+            if not self.is_ready:
+                # Primo utilizzo: attende la costruzione dei client (eventualmente già in corso)
+                stage_started = time.perf_counter()
+                await asyncio.to_thread(self.warm_up)
+                timings["warm_up_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+
+            # 1-2. Rami attivi: FAQ (se il breaker è chiuso) e documentazione ufficiale
+            faq_enabled = not get_breaker(qdrant_breaker_name(COLLECTION_NAME)).is_open
+            if not faq_enabled:
+                # Breaker aperto: il ramo FAQ viene saltato senza attendere timeout
+                skipped_branches.append("faq")
+                if debug_mode:
+                    print("   ⚠ Circuit FAQ aperto: ramo saltato")
+
+            docs_enabled = False
+            if ctx.use_official_docs:
+                # Import differito: l'embedder della documentazione serve solo se il ramo è attivo
+                from official_docs_retriever import (
+                    docs_result_from_chunks,
+                    official_docs_available,
+                    query_official_docs,
                 )
-            
-            # 2. Interroga la documentazione ufficiale (asincrono)
-            official_docs_text = ""
-            official_docs_previews: Optional[List[Dict[str, Any]]] = None
-            if self.use_official_docs:
+
+                docs_enabled = official_docs_available()
+                if not docs_enabled:
+                    # Breaker docs/embedder aperto: nessuna attesa sul ramo che sta fallendo
+                    skipped_branches.append("official_docs")
+                    if debug_mode:
+                        print("   ⚠ Circuit documentazione ufficiale aperto: ramo saltato")
+
+            # Spazio di embedding condiviso: la domanda viene embeddata una sola volta
+            shared_search = faq_enabled and docs_enabled and shared_embedding_space()
+            docs_k = 3
+
+            async def _faq_branch():
+                if not faq_enabled:
+                    return None, [], [], None, None
+                if debug_mode:
+                    print("🔍 Step 1: Interrogo le FAQ locali...")
+                return await asyncio.to_thread(self._retrieve, question, k, docs_k if shared_search else 0, timings)
+
+            async def _docs_branch():
+                if not docs_enabled or shared_search:
+                    return None
                 if debug_mode:
                     print("🔍 Step 2: Interrogo la documentazione ufficiale...")
-                
+                stage_started = time.perf_counter()
                 try:
-                    docs_result: DocsResult = await query_official_docs(question, max_results=3)
-                    official_docs_text = docs_result.combined_text
-                    official_docs_previews = docs_result.chunk_previews
-                    if debug_mode:
-                        print(
-                            f"   • Documentazione ufficiale recuperata: "
-                            f"{len(official_docs_text)} caratteri / {len(official_docs_previews or [])} chunk"
-                        )
+                    return await query_official_docs(question, max_results=docs_k, remember=debug_mode)
                 except Exception as e:
                     if debug_mode:
                         print(f"   ⚠ Errore nel recuperare docs ufficiali: {e}")
-                    official_docs_text = ""
-                    official_docs_previews = []
-            
-            # 3. Combina le informazioni e genera la risposta finale
+                    return None
+                finally:
+                    timings["official_docs_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+
+            # Con spazi separati i due rami (e i due embedding) procedono in parallelo
+            (rewritten_query, query_variants, faq_chunks, shared_docs_chunks, query_vector), docs_result = await asyncio.gather(
+                _faq_branch(), _docs_branch()
+            )
+            if isinstance(shared_docs_chunks, Exception):
+                if debug_mode:
+                    print(f"   ⚠ Errore nel recuperare docs ufficiali: {shared_docs_chunks}")
+            elif shared_docs_chunks is not None:
+                docs_result = await asyncio.to_thread(docs_result_from_chunks, shared_docs_chunks, debug_mode)
+
+            # Solo riferimenti (collection, id, score): il testo si materializza nel debug
+            faq_refs = chunk_refs(faq_chunks, COLLECTION_NAME, remember=debug_mode)
+            official_docs_text = docs_result.combined_text if docs_result else ""
+            official_docs_refs: List[ChunkRef] = docs_result.chunk_refs if docs_result else []
+            docs_best_score = docs_result.best_score if docs_result else None
+
+            if debug_mode:
+                print(f"   • Query riscritta: {rewritten_query}")
+                print(f"   • Chunk FAQ recuperati: {len(faq_chunks)}")
+                if docs_result:
+                    print(
+                        f"   • Documentazione ufficiale recuperata: "
+                        f"{len(official_docs_text)} caratteri / {len(official_docs_refs)} chunk"
+                    )
+
+            if not faq_enabled and docs_result is None:
+                # Nessuna fonte interrogata (breaker aperti o docs spente): non è un "nessuna
+                # informazione", quindi niente fallback e niente conteggio nel gate
+                if debug_mode:
+                    print("   ⚠ Nessuna fonte disponibile: risposta di errore senza generazione")
+                trace = record_trace({
+                    "session_id": ctx.session_id,
+                    "degraded": True,
+                    "generator_skipped": True,
+                    "answered": False,
+                    "timings": {**timings, "total_ms": round((time.perf_counter() - request_started) * 1000, 1)},
+                    "embedding": {**embedding_meter.snapshot(), "shared_space": shared_search},
+                    "skipped_branches": skipped_branches,
+                })
+                return ChatAnswer(lang_cfg["error"], trace)
+
+            # 3. Gate di rilevanza: senza contesto utile il fallback non richiede il modello
+            relevance = get_relevance_gate().evaluate(
+                best_score(faq_chunks),
+                faq_relevance_threshold(score_threshold),
+                docs_best_score,
+            )
+            if not relevance["passed"]:
+                fallback_text = lang_cfg["fallback"]
+                ctx.memory.add_turn(TextBlock(content=question), role=ROLE.USER)
+                ctx.memory.add_turn(TextBlock(content=fallback_text), role=ROLE.ASSISTANT)
+                if debug_mode:
+                    print(
+                        f"   ⚠ Nessuna fonte sopra soglia (FAQ {relevance['best_faq_score']}, "
+                        f"docs {relevance['best_docs_score']}): fallback senza generazione"
+                    )
+                trace = record_trace({
+                    "session_id": ctx.session_id,
+                    "rewritten_query": rewritten_query,
+                    "query_variants": query_variants,
+                    "chunks": faq_refs,
+                    "fallback_triggered": True,
+                    "fallback_overridden": False,
+                    "generator_skipped": True,
+                    "answered": False,
+                    "relevance": relevance,
+                    "timings": {**timings, "total_ms": round((time.perf_counter() - request_started) * 1000, 1)},
+                    "embedding": {**embedding_meter.snapshot(), "shared_space": shared_search},
+                    "retrieval_bytes": transfer_meter.snapshot(),
+                    "official_docs_used": False,
+                    "official_docs_chunks": official_docs_refs,
+                    "skipped_branches": skipped_branches,
+                })
+                return ChatAnswer(fallback_text, trace)
+
+            # 4. Combina le informazioni e genera la risposta finale
             if debug_mode:
                 print("🔍 Step 3: Genero la risposta finale...")
             
+            # Con il docstore il testo si legge solo per le FAQ che entrano nel prompt
+            faq_chunks = await asyncio.to_thread(hydrate_texts, self.retriever, COLLECTION_NAME, faq_chunks[:5])
+
+            # Compressione estrattiva: solo le frasi delle FAQ più vicine alla domanda
+            compression = None
+            if self.context_compressor is not None and faq_chunks and query_vector is not None:
+                faq_chunks, compression = await asyncio.to_thread(
+                    self.context_compressor.compress, query_vector, faq_chunks[:5]
+                )
+                timings["compression_ms"] = compression["ms"]
+                if debug_mode:
+                    print(
+                        f"   • Contesto FAQ compresso: {compression['input_chars']} → "
+                        f"{compression['output_chars']} caratteri ({compression['ratio']:.0%})"
+                    )
+
             # Costruisci il contesto combinato
             combined_context = ""
             
@@ -289,21 +546,28 @@ Informazioni dalle FAQ:
             if official_docs_text and len(official_docs_text) > 0:
                 combined_context += "\n" + official_docs_text + "\n\n"
             
-            # Genera risposta finale usando il client direttamente
-            final_prompt = f"""{system_prompt}
-
-{combined_context}
+            # Solo la parte variabile (contesto + domanda) va nell'input: il system
+            # prompt statico e la cronologia formano il prefisso riutilizzabile
+            final_prompt = f"""{combined_context}
 
 Domanda dell'utente: {question}
 
 Rispondi alla domanda basandoti sulle informazioni sopra riportate.
 Ricorda: {lang_cfg["instruction"]}"""
+            prompt_segments = [system_prompt, *memory_segments(ctx.memory), final_prompt]
             
-            # Usa il client Google per generare la risposta
-            final_response = self.google_client.invoke(
-                input=final_prompt,
-                memory=self.memory
-            )
+            # Usa il client Google per generare la risposta (non in streaming: il tempo
+            # misurato è l'intera generazione, non il time-to-first-token)
+            stage_started = time.perf_counter()
+            with cost_component("generation"):
+                final_response = await asyncio.to_thread(
+                    self.google_client.invoke,
+                    input=final_prompt,
+                    system_prompt=system_prompt,
+                    memory=ctx.memory
+                )
+            timings["generation_total_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+            prompt_cache_info = get_prompt_cache().record(prompt_segments, final_response)
             
             # Estrai il testo dalla risposta
             response_text = ""
@@ -323,37 +587,50 @@ Ricorda: {lang_cfg["instruction"]}"""
             final_response_text = response_text.strip()
             
             # Salva nella memory
-            self.memory.add_turn(TextBlock(content=question), role=ROLE.USER)
-            self.memory.add_turn(TextBlock(content=final_response_text), role=ROLE.ASSISTANT)
+            ctx.memory.add_turn(TextBlock(content=question), role=ROLE.USER)
+            ctx.memory.add_turn(TextBlock(content=final_response_text), role=ROLE.ASSISTANT)
             
             if debug_mode:
                 print(f"✅ Risposta generata: {len(final_response_text)} caratteri")
 
-            official_excerpt = ""
-            if official_docs_text:
-                official_excerpt = official_docs_text.strip()
-                if len(official_excerpt) > 800:
-                    official_excerpt = official_excerpt[:800] + "…"
-
-            self.last_debug_info = {
-                "question": question,
+            trace = record_trace({
+                "session_id": ctx.session_id,
                 "rewritten_query": rewritten_query,
-                "chunks": faq_chunk_previews,
-                "fallback_triggered": False,
+                "query_variants": query_variants,
+                "chunks": faq_refs,
+                "fallback_triggered": final_response_text == lang_cfg["fallback"],
                 "fallback_overridden": False,
-                "response": final_response_text,
+                "generator_skipped": False,
+                # Risposta generata dal modello (riusabile, ad es. dal warm-up)
+                "answered": final_response_text != lang_cfg["fallback"],
+                "relevance": relevance,
+                "timings": {**timings, "total_ms": round((time.perf_counter() - request_started) * 1000, 1)},
+                "embedding": {**embedding_meter.snapshot(), "shared_space": shared_search},
+                "retrieval_bytes": transfer_meter.snapshot(),
+                "compression": compression,
+                "prompt_cache": prompt_cache_info,
                 "official_docs_used": bool(official_docs_text),
-                "official_docs_excerpt": official_excerpt,
-                "official_docs_chunks": official_docs_previews or [],
-            }
+                "official_docs_chunks": official_docs_refs,
+                "skipped_branches": skipped_branches,
+            })
             
-            return final_response_text
+            return ChatAnswer(final_response_text, trace)
             
+        except AdmissionRejected as e:
+            # Load shedding: risposta immediata senza stack trace
+            if debug_mode:
+                print(f"⚠ Richiesta scartata dall'admission control: {e}")
+            trace = record_trace({
+                "session_id": ctx.session_id,
+                "load_shed": True,
+                "answered": False,
+            })
+            return ChatAnswer(lang_cfg["error"], trace)
         except Exception as e:
             print(f"⚠ Errore durante l'elaborazione: {e}")
             import traceback
             traceback.print_exc()
-            return lang_cfg["error"]
+            return ChatAnswer(lang_cfg["error"])
     
     def ask(
         self,
@@ -361,11 +638,12 @@ Ricorda: {lang_cfg["instruction"]}"""
         language: str = "it",
         k: int = 10,
         score_threshold: float = 0.5,
+        session_id: str | None = None,
     ) -> str:
         """
         Versione sincrona di ask() (wrapper per ask_async).
         """
-        return asyncio.run(self.ask_async(question, language, k, score_threshold))
+        return asyncio.run(self.ask_async(question, language, k, score_threshold, session_id))
     
     def interactive_mode(self):
         """Modalità interattiva per chattare con il bot."""
@@ -403,6 +681,8 @@ def main():
     """Funzione principale per avviare il chatbot enhanced."""
     try:
         chatbot = EnhancedFAQChatbot(use_official_docs=True, debug_mode=False)
+        # I client si costruiscono mentre l'utente scrive la prima domanda
+        chatbot.start_warm_up()
         chatbot.interactive_mode()
     except Exception as e:
         print(f"✗ Errore nell'inizializzazione del chatbot: {e}")
@@ -9,26 +9,43 @@ from typing import Any, Dict, List
 
 from dotenv import load_dotenv
 
-from datapizza.clients.google import GoogleClient
-from datapizza.embedders.google import GoogleEmbedder
-from datapizza.modules.prompt import ChatPromptTemplate
-from datapizza.modules.rewriters import ToolRewriter
-from datapizza.pipeline import DagPipeline
 from datapizza.memory import Memory
 from datapizza.type import ROLE, TextBlock
 
+from admission_control import (
+    AdmissionRejected,
+    get_gemini_admission_controller,
+    with_admission_control,
+)
+from collection_aliases import collection_available
+from context_compression import ContextCompressor, compression_enabled
+from cost_ledger import cost_component, finish_request_cost, start_request_cost, with_cost_tracking
+from debug_traces import chunk_refs, record_trace
+from deferred_setup import WARMUP_PROBE_TEXT, DeferredSetup
+from embeddings import build_embedder, faq_space, start_embedding_meter
+from llm_cassette import cassette_api_key, with_cassette
 from qdrant_config import (
     COLLECTION_NAME,
-    build_qdrant_vectorstore,
     describe_qdrant_target,
+    get_qdrant_vectorstore,
+)
+from query_expansion import MultiQueryRewriter, multi_query_enabled
+from request_context import ChatAnswer, RequestContext
+from retrieval import (
+    best_score,
+    faq_relevance_threshold,
+    get_relevance_gate,
+    hydrate_texts,
+    search_chunks,
+    search_parents,
+    start_transfer_meter,
 )
+from shared_cache import cache_snapshot, content_version, get_cache
 
 # Carica variabili d'ambiente
 load_dotenv()
 
-EMBEDDING_MODEL = os.getenv("FAQ_EMBEDDING_MODEL", "gemini-embedding-001")
-
-class FAQChatbot:
+class FAQChatbot(DeferredSetup):
     """Chatbot RAG per le FAQ di Datapizza-AI con Google Gemini e Memory."""
     
     def __init__(self, memory: Memory = None, debug_mode: bool = False):
@@ -38,7 +55,7 @@ class FAQChatbot:
             memory: Istanza di Memory per gestire la cronologia della conversazione
             debug_mode: Abilita il logging di debug dei passi di retrieval
         """
-        self.google_api_key = os.getenv("GOOGLE_API_KEY")
+        self.google_api_key = cassette_api_key("GOOGLE_API_KEY")
         
         if not self.google_api_key:
             raise ValueError("GOOGLE_API_KEY non trovata nel file .env")
@@ -47,41 +64,54 @@ class FAQChatbot:
         self.memory = memory if memory is not None else Memory()
         self.debug_mode = debug_mode
         self.last_debug_info: Dict[str, Any] | None = None
-        
-        # Inizializza componenti
+        # Tutte le istanze del processo condividono lo stesso admission controller
+        self.admission_controller = get_gemini_admission_controller()
+
+        # Client e pipeline vengono costruiti al primo utilizzo (o con start_warm_up)
+        self._init_deferred_setup()
+
+    def _setup(self):
+        """Costruisce client, vector store e pipeline (eseguito una sola volta)."""
         self._setup_clients()
         self._setup_pipeline()
     
     def _setup_clients(self):
         """Configura i client Google (Gemini 2.5 Flash)."""
-        self.google_client = GoogleClient(
-            model="gemini-2.5-flash",  # Gemini 2.5 Flash
+        from datapizza.clients.google import GoogleClient
+        from datapizza.modules.rewriters import ToolRewriter
+
+        generation_model = "gemini-2.5-flash"
+        self.google_client = with_admission_control(with_cost_tracking(with_cassette(GoogleClient(
+            model=generation_model,  # Gemini 2.5 Flash
             api_key=self.google_api_key,
             system_prompt="Sei un assistente esperto che risponde alle domande sulle FAQ di Datapizza-AI.",
             temperature=0.7
-        )
+        ), "google_client")), self.admission_controller)
         
-        self.embedder = GoogleEmbedder(
-            api_key=self.google_api_key,
-            model_name=EMBEDDING_MODEL
-        )
+        # Embedder dello spazio delle FAQ (Gemini di default)
+        self.embedder = build_embedder(faq_space(), cache=True)
+        self.context_compressor = ContextCompressor(self.embedder, faq_space()) if compression_enabled() else None
         
-        self.query_rewriter = ToolRewriter(
-            client=self.google_client,
-            system_prompt="""Riscrivi la domanda dell'utente per migliorare il retrieval dalle FAQ di Datapizza-AI.
+        rewrite_prompt = """Riscrivi la domanda dell'utente per migliorare il retrieval dalle FAQ di Datapizza-AI.
             - Mantieni il contesto specifico: "questo framework" si riferisce a "Datapizza-AI"
             - Espandi abbreviazioni ma resta specifico
             - Aggiungi termini chiave rilevanti per Datapizza-AI
             - Restituisci solo la query riscritta, senza spiegazioni aggiuntive."""
+        self.query_rewriter = ToolRewriter(client=self.google_client, system_prompt=rewrite_prompt)
+        # Namespace della cache delle riscritture: cambia con modello e prompt
+        self.rewrite_cache_version = content_version("tool_rewriter", generation_model, rewrite_prompt)
+        # Multi-query: una sola chiamata restituisce più varianti della domanda
+        self.multi_query_rewriter = (
+            MultiQueryRewriter(self.google_client, model=generation_model) if multi_query_enabled() else None
         )
     
     def _setup_vectorstore(self):
         """Configura il vector store Qdrant."""
-        vectorstore = build_qdrant_vectorstore()
+        vectorstore = get_qdrant_vectorstore()
 
         try:
             client = vectorstore.get_client()
-            if not client.collection_exists(COLLECTION_NAME):
+            if not collection_available(client, COLLECTION_NAME):
                 raise RuntimeError(
                     f"La collection '{COLLECTION_NAME}' non esiste su {describe_qdrant_target()}. "
                     "Esegui prima lo script di ingestion o verifica la configurazione Qdrant."
@@ -95,6 +125,9 @@ class FAQChatbot:
     
     def _setup_pipeline(self):
         """Configura la DagPipeline per il retrieval e la generazione."""
+        from datapizza.modules.prompt import ChatPromptTemplate
+        from datapizza.pipeline import DagPipeline
+
         self.retriever = self._setup_vectorstore()
         
         # System prompt da aggiungere alla configurazione del client
@@ -123,92 +156,148 @@ Informazioni dalle FAQ:
 """
         )
         
-        # Crea la DagPipeline
+        # DagPipeline di retrieval: riscrittura ed embedding della domanda.
+        # La ricerca avviene fuori dalla DAG per avere gli score dei chunk.
         self.dag_pipeline = DagPipeline()
-        
-        # Aggiungi moduli (con query rewriter riattivato)
         self.dag_pipeline.add_module("rewriter", self.query_rewriter)
         self.dag_pipeline.add_module("embedder", self.embedder)
-        self.dag_pipeline.add_module("retriever", self.retriever)
-        self.dag_pipeline.add_module("prompt", self.prompt_template)
-        self.dag_pipeline.add_module("generator", self.google_client)
-        
-        # Connetti i moduli (con rewriter)
         self.dag_pipeline.connect("rewriter", "embedder", target_key="text")
-        self.dag_pipeline.connect("embedder", "retriever", target_key="query_vector")
-        self.dag_pipeline.connect("retriever", "prompt", target_key="chunks")
-        self.dag_pipeline.connect("prompt", "generator", target_key="memory")
+
+        # DagPipeline di generazione: eseguita solo se il gate di rilevanza passa
+        self.generation_pipeline = DagPipeline()
+        self.generation_pipeline.add_module("prompt", self.prompt_template)
+        self.generation_pipeline.add_module("generator", self.google_client)
+        self.generation_pipeline.connect("prompt", "generator", target_key="memory")
+
+    def _warm_connections(self):
+        """Embed e ricerca di prova: connessioni a Qdrant e all'embedder già aperte."""
+        search_chunks(self.retriever, COLLECTION_NAME, self.embedder.embed(WARMUP_PROBE_TEXT), 1)
 
     def set_debug_mode(self, enabled: bool):
         """Abilita o disabilita il debug runtime (override della variabile d'ambiente)."""
         self.debug_mode = enabled
+
+    def stats(self) -> Dict[str, Any]:
+        """Contatori di processo, fuori dalle trace per domanda (che restano compatte)."""
+        return {
+            "setup": self.health(),
+            "admission": self.admission_controller.snapshot(),
+            "cache": cache_snapshot(),
+            "relevance_gate": get_relevance_gate().snapshot(),
+        }
     
-    def ask(self, question: str, k: int = 10, score_threshold: float = 0.5) -> str:
+    def answer(
+        self,
+        question: str,
+        memory: Memory | None = None,
+        k: int = 10,
+        score_threshold: float = 0.5,
+        session_id: str | None = None,
+        debug_mode: bool | None = None,
+    ) -> ChatAnswer:
         """
-        Invia una domanda al chatbot e ottiene una risposta.
-        La conversazione viene salvata nella Memory per mantenere il contesto.
-        
+        Risponde a una domanda aggiornando la Memory della sessione (rientrante).
+
+        Lo stato della domanda vive in un ``RequestContext``: la stessa istanza
+        può servire in parallelo domande di sessioni diverse.
+
         Args:
             question: La domanda dell'utente
-            k: Numero di chunks da recuperare (default: 5)
-            score_threshold: Soglia minima di similarity score (default: 0.5)
-        
+            memory: Memory della sessione, aggiornata con il turno (None = domanda isolata)
+            k: Numero di chunks da recuperare (default: 10)
+            score_threshold: Soglia di rilevanza (default: 0.5, override con
+                FAQ_RELEVANCE_THRESHOLD); sotto soglia si risponde con il
+                fallback senza chiamare il generatore
+            session_id: Sessione a cui attribuire trace e costo nel ledger
+            debug_mode: Override per la domanda (default: impostazione dell'istanza)
+
         Returns:
-            La risposta del chatbot
+            Risposta e trace della domanda
         """
+        ctx = RequestContext(
+            memory=memory if memory is not None else Memory(),
+            session_id=session_id,
+            debug_mode=self.debug_mode if debug_mode is None else debug_mode,
+        )
+        # Token, embedding e richieste Qdrant della domanda: nella trace e nel ledger
+        request_cost = start_request_cost()
+        embedding_meter = start_embedding_meter()
+        transfer_meter = start_transfer_meter()
+        result = ChatAnswer("Si è verificato un errore nell'elaborazione della domanda.")
+        try:
+            result = self._answer(question, ctx, k, score_threshold)
+            return result
+        finally:
+            if result.trace is not None:
+                result.trace["embedding"] = embedding_meter.snapshot()
+                result.trace["retrieval_bytes"] = transfer_meter.snapshot()
+            finish_request_cost(request_cost, result.trace, session_id, ctx.language, embedding_meter)
+
+    def ask(self, question: str, k: int = 10, score_threshold: float = 0.5, session_id: str | None = None) -> str:
+        """
+        Invia una domanda al chatbot e ottiene una risposta.
+        La conversazione viene salvata in ``self.memory`` e la trace in
+        ``self.last_debug_info`` (uso a sessione singola, non rientrante).
+        """
+        result = self.answer(question, self.memory, k, score_threshold, session_id)
+        self.last_debug_info = result.trace
+        return result.text
+
+    def _answer(self, question: str, ctx: RequestContext, k: int, score_threshold: float) -> ChatAnswer:
+        """Retrieval, gate di rilevanza e generazione di una domanda (vedi ``answer``)."""
         env_debug = os.getenv("FAQ_DEBUG", "").lower() in {"1", "true", "yes", "on"}
-        debug_mode = self.debug_mode or env_debug
-        self.last_debug_info = None
+        debug_mode = ctx.debug_mode or env_debug
 
         fallback_message = "Non sono ancora state fatte domande a riguardo."
         fallback_triggered = False
         fallback_overridden = False
 
-        chunk_previews: List[Dict[str, Any]] = []
-
         try:
-            # Esegui la pipeline con memory e query rewriter
-            result = self.dag_pipeline.run({
-                "rewriter": {"user_prompt": question},  # Ri-scrivi la query
-                "prompt": {"user_prompt": question},
-                "retriever": {
-                    "collection_name": COLLECTION_NAME,
-                    "k": k
-                },
-                "generator": {
-                    "input": question,
-                    "system_prompt": self.system_prompt,
-                    "memory": self.memory  # Passa la memory al generator
-                }
-            })
-            
-            rewritten_query = result.get("rewriter")
-            retrieved_chunks = result.get("retriever") or []
-
-            chunk_previews = []
-            language_counts: Dict[str, int] = {}
-
-            for chunk in retrieved_chunks:
-                metadata = getattr(chunk, "metadata", {}) or {}
-                lang = metadata.get("language") or metadata.get("Language") or "unknown"
-                language_counts[lang] = language_counts.get(lang, 0) + 1
-
-                chunk_previews.append(
-                    {
-                        "id": getattr(chunk, "id", None),
-                        "score": getattr(chunk, "score", None),
-                        "metadata": metadata,
-                        "text": chunk.text,
-                    }
-                )
+            # Primo utilizzo: attende la costruzione dei client (eventualmente già in corso)
+            self.warm_up()
+
+            query_variants: List[str] = []
+            if self.multi_query_rewriter is not None:
+                # Varianti → un embed batch → una ricerca batch → fusione per rango
+                with cost_component("rewrite"):
+                    query_variants = self.multi_query_rewriter.rewrite(question)
+                rewritten_query = query_variants[0]
+                vectors = self.embedder.embed(query_variants)
+            else:
+                rewritten_query = get_cache("rewrites").get(self.rewrite_cache_version, question)
+                if rewritten_query is not None:
+                    # Riscrittura già nota (anche a un altro worker): solo l'embed, spesso in cache
+                    vectors = [self.embedder.embed(rewritten_query)]
+                else:
+                    # Riscrivi ed esegui l'embedding della query, poi cerca i chunk con score
+                    with cost_component("rewrite"):
+                        result = self.dag_pipeline.run({
+                            "rewriter": {"user_prompt": question},  # Ri-scrivi la query
+                        })
+                    rewritten_query = result.get("rewriter")
+                    vectors = [result.get("embedder")]
+                    if isinstance(rewritten_query, str) and rewritten_query:
+                        get_cache("rewrites").put(self.rewrite_cache_version, question, rewritten_query)
+            # Span figli raggruppati per sezione parent (layout piatto: primi k chunk)
+            retrieved_chunks = search_parents(self.retriever, COLLECTION_NAME, vectors, k)
+
+            # Solo riferimenti (collection, id, score): il testo si materializza nel debug
+            refs = chunk_refs(retrieved_chunks, COLLECTION_NAME, remember=debug_mode)
 
             if debug_mode:
+                language_counts: Dict[str, int] = {}
+                for chunk in retrieved_chunks:
+                    metadata = getattr(chunk, "metadata", {}) or {}
+                    lang = metadata.get("language") or metadata.get("Language") or "unknown"
+                    language_counts[lang] = language_counts.get(lang, 0) + 1
+
                 print("🔍 FAQ_DEBUG attivo")
                 print(f"   • Query originale : {question}")
                 print(f"   • Query riscritta : {rewritten_query}")
                 print(f"   • Chunk recuperati: {len(retrieved_chunks)}")
                 if language_counts:
                     print("   • Lingue chunk     :", language_counts)
+                hydrate_texts(self.retriever, COLLECTION_NAME, retrieved_chunks[:3])
                 for idx, chunk in enumerate(retrieved_chunks[:3], 1):
                     meta = getattr(chunk, "metadata", {}) or {}
                     src = meta.get("source")
@@ -216,8 +305,58 @@ Informazioni dalle FAQ:
                     preview = chunk.text.replace("\n", " ")[:240]
                     print(f"     #{idx}: {preview}{'…' if len(chunk.text) > 240 else ''}")
 
+            # Gate di rilevanza: se nessun chunk supera la soglia il fallback è immediato
+            relevance = get_relevance_gate().evaluate(
+                best_score(retrieved_chunks),
+                faq_relevance_threshold(score_threshold),
+            )
+            if not relevance["passed"]:
+                ctx.memory.add_turn(TextBlock(content=question), role=ROLE.USER)
+                ctx.memory.add_turn(TextBlock(content=fallback_message), role=ROLE.ASSISTANT)
+                if debug_mode:
+                    print(
+                        f"   • Nessun chunk sopra soglia ({relevance['best_faq_score']} < "
+                        f"{relevance['faq_threshold']}): fallback senza generazione"
+                    )
+                trace = record_trace({
+                    "session_id": ctx.session_id,
+                    "rewritten_query": rewritten_query,
+                    "query_variants": query_variants,
+                    "debug_enabled": debug_mode,
+                    "chunks": refs,
+                    "fallback_triggered": True,
+                    "fallback_overridden": False,
+                    "generator_skipped": True,
+                    "answered": False,
+                    "relevance": relevance,
+                })
+                return ChatAnswer(fallback_message, trace)
+
+            # Con il docstore il testo si legge solo ora, per i chunk che entrano nel prompt
+            hydrate_texts(self.retriever, COLLECTION_NAME, retrieved_chunks)
+
+            # Compressione estrattiva: solo le frasi più vicine alla domanda entrano nel prompt
+            compression = None
+            if self.context_compressor is not None and vectors and vectors[0] is not None:
+                retrieved_chunks, compression = self.context_compressor.compress(vectors[0], retrieved_chunks)
+                if debug_mode:
+                    print(
+                        f"   • Contesto compresso: {compression['input_chars']} → "
+                        f"{compression['output_chars']} caratteri ({compression['ratio']:.0%}, {compression['ms']} ms)"
+                    )
+
+            with cost_component("faq_generator"):
+                generation = self.generation_pipeline.run({
+                    "prompt": {"user_prompt": question, "chunks": retrieved_chunks},
+                    "generator": {
+                        "input": question,
+                        "system_prompt": self.system_prompt,
+                        "memory": ctx.memory  # Passa la memory al generator
+                    }
+                })
+
             # Estrai la risposta dal generator
-            generator_result = result.get("generator")
+            generator_result = generation.get("generator")
             
             # Il generator restituisce un ClientResponse object che contiene blocks
             response_text = ""
@@ -250,33 +389,47 @@ Informazioni dalle FAQ:
             final_response = response_text.strip()
 
             # Salva il turno di conversazione nella memory
-            self.memory.add_turn(TextBlock(content=question), role=ROLE.USER)
+            ctx.memory.add_turn(TextBlock(content=question), role=ROLE.USER)
             if response_content:
                 if isinstance(response_content, list):
                     for block in response_content:
-                        self.memory.add_turn(block, role=ROLE.ASSISTANT)
+                        ctx.memory.add_turn(block, role=ROLE.ASSISTANT)
                 else:
-                    self.memory.add_turn(response_content, role=ROLE.ASSISTANT)
+                    ctx.memory.add_turn(response_content, role=ROLE.ASSISTANT)
             else:
-                self.memory.add_turn(TextBlock(content=response_text), role=ROLE.ASSISTANT)
+                ctx.memory.add_turn(TextBlock(content=response_text), role=ROLE.ASSISTANT)
 
-            self.last_debug_info = {
-                "question": question,
+            trace = record_trace({
+                "session_id": ctx.session_id,
                 "rewritten_query": rewritten_query,
+                "query_variants": query_variants,
                 "debug_enabled": debug_mode,
-                "chunks": chunk_previews,
+                "chunks": refs,
                 "fallback_triggered": fallback_triggered,
                 "fallback_overridden": fallback_overridden,
-                "response": final_response,
-            }
+                "generator_skipped": False,
+                "answered": not fallback_triggered,
+                "relevance": relevance,
+                "compression": compression,
+            })
             
-            return final_response
+            return ChatAnswer(final_response, trace)
             
+        except AdmissionRejected as e:
+            # Load shedding: risposta immediata senza stack trace
+            if debug_mode:
+                print(f"⚠ Richiesta scartata dall'admission control: {e}")
+            trace = record_trace({
+                "session_id": ctx.session_id,
+                "load_shed": True,
+                "answered": False,
+            })
+            return ChatAnswer("Si è verificato un errore nell'elaborazione della domanda.", trace)
         except Exception as e:
             print(f"⚠ Errore durante l'elaborazione: {e}")
             import traceback
             traceback.print_exc()
-            return "Si è verificato un errore nell'elaborazione della domanda."
+            return ChatAnswer("Si è verificato un errore nell'elaborazione della domanda.")
     
     def interactive_mode(self):
         """Modalità interattiva per chattare con il bot."""
@@ -316,6 +469,8 @@ def main():
     """Funzione principale per avviare il chatbot."""
     try:
         chatbot = FAQChatbot()
+        # I client si costruiscono mentre l'utente scrive la prima domanda
+        chatbot.start_warm_up()
         chatbot.interactive_mode()
     except Exception as e:
         print(f"✗ Errore nell'inizializzazione del chatbot: {e}")
@@ -1,91 +1,309 @@
 """
-Script per verificare il contenuto di Qdrant dopo l'ingestion.
+Diagnostica delle collection Qdrant: stato, qualità dei dati e latenza di ricerca.
+
+Usa il target configurato in ``qdrant_config`` e, per default, controlla sia la
+collection delle FAQ sia quella della documentazione ufficiale. Per ogni
+collection riporta punti e segmenti, distribuzione della dimensione dei
+payload, testi duplicati, anomalie sulle norme dei vettori e i percentili
+p50/p95/p99 di un batch di ricerche di prova (eseguite con vettori già
+indicizzati, quindi senza chiamare nessun embedder). Se la versione ha un
+docstore locale (``chunk_docstore.py``) i testi duplicati si cercano lì.
+
+Target e collection vengono da ``qdrant_config`` (``QDRANT_URL``/``QDRANT_API_KEY``,
+``QDRANT_HOST``/``QDRANT_PORT`` o ``QDRANT_LOCATION``; ``FAQ_COLLECTION_NAME`` e
+``OFFICIAL_DOCS_COLLECTION``).
+
+Configurazione tramite variabili d'ambiente (default delle opzioni da riga di comando):
+- ``CHECK_QDRANT_SAMPLE_LIMIT`` (default 10000): punti scansionati per collection
+- ``CHECK_QDRANT_PROBES`` (default 50): ricerche di prova per collection
+- ``CHECK_QDRANT_K`` (default 10): risultati per ricerca di prova
+- ``CHECK_QDRANT_NORM_SIGMA`` (default 3.0): deviazioni standard oltre cui una norma è anomala
+
+Esempi:
+    python check_qdrant.py
+    python check_qdrant.py --probes 200 --json > qdrant_health.json
 """
 
-from qdrant_client import QdrantClient
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+from chunk_docstore import get_docstore
+from collection_aliases import collection_available, resolve_alias
+from perf_stats import summarize
+from qdrant_config import (
+    COLLECTION_NAME,
+    OFFICIAL_DOCS_COLLECTION,
+    describe_qdrant_target,
+    extract_vector_dimensions,
+    get_qdrant_client,
+    operation_timeout,
+    qdrant_target,
+)
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+# Scostamento (in deviazioni standard) oltre il quale una norma è considerata anomala
+NORM_OUTLIER_SIGMA = float(os.getenv("CHECK_QDRANT_NORM_SIGMA", "3.0"))
+
+
+def _payload_text(payload: Dict[str, Any]) -> str | None:
+    text = payload.get("text")
+    return text if isinstance(text, str) else None
+
+
+def _extract_vector(vector: Any, vector_name: str | None) -> List[float] | None:
+    if isinstance(vector, dict):
+        if vector_name and vector_name in vector:
+            return vector[vector_name]
+        return next(iter(vector.values()), None)
+    return vector
+
+
+def _norm_report(norms: List[float]) -> Dict[str, Any]:
+    finite = [n for n in norms if math.isfinite(n)]
+    report: Dict[str, Any] = {
+        "summary": summarize(finite, digits=4),
+        "non_finite": len(norms) - len(finite),
+        "zero": sum(1 for n in finite if n == 0.0),
+        "outliers": 0,
+        "not_unit_normalized": sum(1 for n in finite if abs(n - 1.0) > 1e-2),
+    }
+    if len(finite) > 1:
+        mean = sum(finite) / len(finite)
+        std = math.sqrt(sum((n - mean) ** 2 for n in finite) / len(finite))
+        if std > 0:
+            report["outliers"] = sum(1 for n in finite if abs(n - mean) > NORM_OUTLIER_SIGMA * std)
+    return report
+
+
+def profile_collection(
+    client,
+    collection: str,
+    sample_limit: int,
+    probes: int,
+    k: int,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """Raccoglie statistiche e latenze di ricerca per una singola collection."""
+    if not collection_available(client, collection):
+        return {"collection": collection, "exists": False}
+
+    info = client.get_collection(collection)
+    dims = extract_vector_dimensions(info)
+    vector_name = next((name for name in dims if name != "default"), None)
+
+    report: Dict[str, Any] = {
+        "collection": collection,
+        "exists": True,
+        "alias_of": resolve_alias(client, collection),
+        "status": str(getattr(info.status, "value", info.status)),
+        "points_count": info.points_count,
+        "indexed_vectors_count": info.indexed_vectors_count,
+        "segments_count": info.segments_count,
+        "vector_dimensions": dims,
+    }
+
+    # Scansione (eventualmente campionata) di payload e vettori
+    payload_sizes: List[float] = []
+    norms: List[float] = []
+    text_hashes: Dict[str, int] = {}
+    probe_vectors: List[List[float]] = []
+    scanned = 0
+    offset = None
+    docstore = get_docstore(client, collection)
+    report["docstore"] = (
+        {"collection": docstore.collection, "records": len(docstore), "mb": round(docstore.size_bytes / 1e6, 2)}
+        if docstore is not None
+        else None
+    )
+
+    while scanned < sample_limit:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=min(256, sample_limit - scanned),
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        for point in points:
+            payload = point.payload or {}
+            payload_sizes.append(len(json.dumps(payload, ensure_ascii=False).encode("utf-8")))
+
+            text = _payload_text(payload)
+            if not text and docstore is not None:
+                text = docstore.records([str(point.id)]).get(str(point.id), (None, {}))[0]
+            if text is not None:
+                digest = hashlib.sha1(text.strip().encode("utf-8")).hexdigest()
+                text_hashes[digest] = text_hashes.get(digest, 0) + 1
+
+            vector = _extract_vector(point.vector, vector_name)
+            if vector:
+                norms.append(math.sqrt(sum(v * v for v in vector)))
+                probe_vectors.append(vector)
+        scanned += len(points)
+        if offset is None or not points:
+            break
 
-def check_collection():
-    """Verifica il contenuto della collection datapizza_faq."""
+    duplicate_groups = [count for count in text_hashes.values() if count > 1]
+    report["scanned_points"] = scanned
+    report["payload_bytes"] = summarize(payload_sizes, digits=1)
+    report["duplicate_texts"] = {
+        "groups": len(duplicate_groups),
+        "redundant_points": sum(count - 1 for count in duplicate_groups),
+        "points_without_text": scanned - sum(text_hashes.values()),
+    }
+    report["vector_norms"] = _norm_report(norms)
+
+    # Ricerche di prova con vettori campionati dalla collection stessa
+    latencies: List[float] = []
+    errors = 0
+    rng = random.Random(seed)
+    candidates = [v for v in probe_vectors if all(math.isfinite(x) for x in v)]
+    for _ in range(probes if candidates else 0):
+        query = rng.choice(candidates)
+        started = time.perf_counter()
+        try:
+            client.query_points(
+                collection_name=collection,
+                query=query,
+                using=vector_name,
+                limit=k,
+                with_payload=False,
+                timeout=operation_timeout("search"),
+            )
+        except Exception:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    report["search_latency_ms"] = summarize(latencies, digits=2)
+    report["search_latency_ms"]["k"] = k
+    report["search_latency_ms"]["errors"] = errors
+    return report
+
+
+def _print_human(report: Dict[str, Any]) -> None:
     print("=" * 70)
-    print("🔍 Verifica contenuto Qdrant")
+    print("🔍 Diagnostica Qdrant")
     print("=" * 70)
+    print(f"🔗 Target: {report['target']}")
     print()
-    
-    # Connessione a Qdrant
-    client = QdrantClient(host="localhost", port=6333)
-    
-    collection_name = "datapizza_faq"
-    
-    # Verifica che la collection esista
-    try:
-        collections = client.get_collections().collections
-        collection_names = [c.name for c in collections]
-        
-        print(f"📚 Collections trovate: {collection_names}")
-        
-        if collection_name not in collection_names:
-            print(f"\n❌ Collection '{collection_name}' non trovata!")
-            print("   Esegui prima: python ingest_faq.py")
-            return
-        
-        print(f"✅ Collection '{collection_name}' trovata")
-        print()
-        
-        # Ottieni informazioni sulla collection
-        collection_info = client.get_collection(collection_name)
-        print(f"📊 Informazioni collection:")
-        print(f"  - Points count: {collection_info.points_count}")
-        print(f"  - Vectors count: {collection_info.vectors_count}")
-        print()
-        
-        if collection_info.points_count == 0:
-            print("⚠️  La collection è vuota! Esegui: python ingest_faq.py")
-            return
-        
-        # Recupera alcuni punti di esempio
-        print(f"📄 Esempi di chunks salvati (primi 5):")
-        print()
-        
-        points = client.scroll(
-            collection_name=collection_name,
-            limit=5,
-            with_payload=True,
-            with_vectors=False
-        )[0]
-        
-        for i, point in enumerate(points, 1):
-            print(f"--- Chunk {i} (ID: {point.id}) ---")
-            payload = point.payload
-            
-            if 'text' in payload:
-                text = payload['text']
-                print(f"Testo: {text[:200]}{'...' if len(text) > 200 else ''}")
-            
-            if 'metadata' in payload:
-                print(f"Metadata: {payload['metadata']}")
-            
+
+    for col in report["collections"]:
+        name = col["collection"]
+        if not col.get("exists"):
+            print(f"❌ Collection '{name}' non trovata")
+            if name == COLLECTION_NAME:
+                print("   Esegui prima: python ingest_faq.py")
             print()
-        
-        # Test di ricerca
-        print("=" * 70)
-        print("🔍 Test ricerca semantica")
-        print("=" * 70)
-        print()
-        
-        test_query = "Cosa differenzia Datapizza da Langchain?"
-        print(f"Query: {test_query}")
+            continue
+
+        alias = f" → {col['alias_of']}" if col.get("alias_of") else ""
+        print(f"📚 {name}{alias} ({col['status']})")
+        print(
+            f"  - Punti: {col['points_count']} (indicizzati: {col['indexed_vectors_count']}), "
+            f"segmenti: {col['segments_count']}, dimensioni: {col['vector_dimensions']}"
+        )
+        if not col["points_count"]:
+            print("  ⚠️  La collection è vuota!")
+            print()
+            continue
+
+        sizes = col["payload_bytes"]
+        print(
+            f"  - Payload (byte, {col['scanned_points']} punti): p50={sizes['p50']} "
+            f"p95={sizes['p95']} max={sizes['max']}"
+        )
+        if col["docstore"]:
+            store = col["docstore"]
+            print(f"  - Docstore locale: {store['records']} record, {store['mb']} MB (testo fuori dal payload)")
+        dup = col["duplicate_texts"]
+        print(
+            f"  - Testi duplicati: {dup['groups']} gruppi, {dup['redundant_points']} punti ridondanti, "
+            f"{dup['points_without_text']} senza testo"
+        )
+        norms = col["vector_norms"]
+        print(
+            f"  - Norme vettori: media={norms['summary']['mean']} zero={norms['zero']} "
+            f"non finite={norms['non_finite']} outlier={norms['outliers']}"
+        )
+        lat = col["search_latency_ms"]
+        print(
+            f"  - Latenza ricerca (ms, {lat['count']} probe, k={lat['k']}): p50={lat['p50']} "
+            f"p95={lat['p95']} p99={lat['p99']} errori={lat['errors']}"
+        )
         print()
-        
-        # Per testare la ricerca, dovrei generare l'embedding della query
-        # Ma per ora vediamo solo se ci sono dati
-        print(f"✅ Collection contiene {collection_info.points_count} chunks")
-        print("   Per testare la ricerca completa, usa il chatbot")
-        
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diagnostica delle collection Qdrant.")
+    parser.add_argument(
+        "--collection",
+        action="append",
+        dest="collections",
+        help=f"Collection da analizzare (ripetibile). Default: {COLLECTION_NAME}, {OFFICIAL_DOCS_COLLECTION}",
+    )
+    parser.add_argument(
+        "--sample-limit",
+        type=int,
+        default=int(os.getenv("CHECK_QDRANT_SAMPLE_LIMIT", "10000")),
+        help="Numero massimo di punti scansionati",
+    )
+    parser.add_argument(
+        "--probes",
+        type=int,
+        default=int(os.getenv("CHECK_QDRANT_PROBES", "50")),
+        help="Numero di ricerche di prova per collection",
+    )
+    parser.add_argument(
+        "--k",
+        type=int,
+        default=int(os.getenv("CHECK_QDRANT_K", "10")),
+        help="Risultati richiesti per ricerca di prova",
+    )
+    parser.add_argument("--json", action="store_true", help="Stampa solo il report JSON su stdout")
+    parser.add_argument("--output", help="Scrive il report JSON anche su questo file")
+    args = parser.parse_args()
+
+    collections = args.collections or [COLLECTION_NAME, OFFICIAL_DOCS_COLLECTION]
+
+    try:
+        client = get_qdrant_client()
+        report = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "target": describe_qdrant_target(),
+            "transport": qdrant_target().transport,
+            "collections": [
+                profile_collection(client, name, args.sample_limit, args.probes, args.k)
+                for name in collections
+            ],
+        }
     except Exception as e:
-        print(f"❌ Errore: {e}")
+        print(f"❌ Errore: {e}", file=sys.stderr)
         import traceback
         traceback.print_exc()
+        sys.exit(1)
 
-if __name__ == "__main__":
-    check_collection()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        _print_human(report)
 
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Docstore locale dei chunk: testo e metadati fuori da Qdrant.
+
+Con il docstore attivo (``ingest_faq.py --docstore``) Qdrant conserva solo i
+vettori e i campi filtrabili dei metadati; le ricerche chiedono
+``with_payload=False`` e ricevono soltanto ID e score. Testo e metadati
+completi vivono in un docstore di sola lettura costruito durante l'ingestion,
+uno per collection fisica (versione dietro l'alias):
+
+- ``<dir>/<collection>.blob``: i record uno dopo l'altro, ciascuno
+  ``[u32 lunghezza metadati][metadati JSON][testo UTF-8]``;
+- ``<dir>/<collection>.idx``: intestazione (magic + numero di record) e
+  record a lunghezza fissa ``(chiave 16 byte, offset, lunghezza)`` ordinati
+  per chiave. La chiave è l'UUID del punto (o l'MD5 dell'ID se non è un UUID).
+
+Entrambi i file sono letti tramite ``mmap``: una lookup è una ricerca binaria
+sull'indice e una slice del blob, senza caricare il docstore in memoria e
+condividendo le pagine tra i worker della stessa macchina. I metadati si
+leggono senza decodificare il testo, che il retriever recupera solo per i
+chunk finiti davvero nel prompt.
+
+``get_docstore`` risolve l'alias sulla collection fisica (riletto al più ogni
+``FAQ_DOCSTORE_ALIAS_TTL_S``) e restituisce None se la versione non ha un
+docstore: in quel caso il retrieval legge il payload da Qdrant come prima.
+I punti di una versione con docstore portano nel payload il flag
+``DOCSTORE_FLAG``: se un processo non trova i file (altra directory di lavoro,
+altro host, ``FAQ_DOCSTORE_DIR`` diverso) il retrieval solleva
+``DocstoreUnavailable`` invece di mandare al modello un contesto vuoto.
+
+Configurazione tramite variabili d'ambiente:
+- ``FAQ_DOCSTORE`` (default off): ``ingest_faq.py`` costruisce il docstore
+- ``FAQ_DOCSTORE_DIR`` (default ``.cache/docstore`` accanto a questo modulo)
+- ``FAQ_DOCSTORE_ALIAS_TTL_S`` (default 60)
+
+Esempi:
+    python chunk_docstore.py stats
+    python chunk_docstore.py get --collection datapizzai_faq --id 2b1f0c4e-...
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Tuple
+
+DOCSTORE_DIR = os.getenv(
+    "FAQ_DOCSTORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "docstore")
+)
+ALIAS_TTL_S = float(os.getenv("FAQ_DOCSTORE_ALIAS_TTL_S", "60"))
+
+# Campo del payload Qdrant dei punti il cui testo vive nel docstore
+DOCSTORE_FLAG = "text_in_docstore"
+
+_MAGIC = b"FAQDOC1\0"
+_HEADER = struct.Struct("<8sQ")
+_ENTRY = struct.Struct("<16sQI")
+_META_LEN = struct.Struct("<I")
+
+
+class DocstoreUnavailable(RuntimeError):
+    """La versione servita tiene il testo nel docstore, ma i file non sono raggiungibili."""
+
+
+def docstore_enabled() -> bool:
+    return os.getenv("FAQ_DOCSTORE", "0").lower() in {"1", "true", "yes", "on"}
+
+
+def docstore_paths(collection: str, directory: str | None = None) -> Tuple[str, str]:
+    """Percorsi (blob, indice) del docstore di una collection fisica."""
+    base = os.path.join(directory or DOCSTORE_DIR, collection)
+    return f"{base}.blob", f"{base}.idx"
+
+
+def point_key(point_id: Any) -> bytes:
+    """Chiave a 16 byte di un ID di punto Qdrant (UUID o intero)."""
+    try:
+        return uuid.UUID(str(point_id)).bytes
+    except ValueError:
+        return hashlib.md5(str(point_id).encode("utf-8")).digest()
+
+
+class DocstoreWriter:
+    """Scrive il docstore di una collection durante l'ingestion.
+
+    I record vanno nel blob man mano che arrivano; ``close`` ordina l'indice e
+    rinomina i file temporanei, quindi un'ingestion interrotta non lascia un
+    docstore a metà.
+    """
+
+    def __init__(self, collection: str, directory: str | None = None):
+        self.collection = collection
+        self.blob_path, self.index_path = docstore_paths(collection, directory)
+        os.makedirs(os.path.dirname(self.blob_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._blob = open(f"{self.blob_path}.tmp", "wb")
+        self._entries: Dict[bytes, Tuple[int, int]] = {}
+        self._offset = 0
+        self.bytes = 0
+
+    def add(self, point_id: Any, text: str, metadata: Dict[str, Any] | None = None) -> None:
+        meta = json.dumps(metadata or {}, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        record = _META_LEN.pack(len(meta)) + meta + (text or "").encode("utf-8")
+        with self._lock:
+            self._blob.write(record)
+            # Un ID riscritto punta all'ultimo record
+            self._entries[point_key(point_id)] = (self._offset, len(record))
+            self._offset += len(record)
+            self.bytes = self._offset
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self) -> None:
+        with self._lock:
+            self._blob.flush()
+            os.fsync(self._blob.fileno())
+            self._blob.close()
+            with open(f"{self.index_path}.tmp", "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, len(self._entries)))
+                for key in sorted(self._entries):
+                    offset, length = self._entries[key]
+                    f.write(_ENTRY.pack(key, offset, length))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(f"{self.blob_path}.tmp", self.blob_path)
+            os.replace(f"{self.index_path}.tmp", self.index_path)
+
+    def abort(self) -> None:
+        with self._lock:
+            self._blob.close()
+            for path in (f"{self.blob_path}.tmp", f"{self.index_path}.tmp"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def _map(path: str) -> mmap.mmap | bytes:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class ChunkDocstore:
+    """Docstore di sola lettura su ``mmap``: lookup per ID di testo e metadati."""
+
+    def __init__(self, collection: str, directory: str | None = None):
+        self.collection = collection
+        blob_path, index_path = docstore_paths(collection, directory)
+        self._index = _map(index_path)
+        magic, self._count = _HEADER.unpack_from(self._index, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{index_path}: formato del docstore non riconosciuto")
+        self._blob = _map(blob_path)
+        self.size_bytes = len(self._blob) + len(self._index)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _find(self, point_id: Any) -> Tuple[int, int] | None:
+        key = point_key(point_id)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, offset, length = _ENTRY.unpack_from(self._index, _HEADER.size + middle * _ENTRY.size)
+            if entry_key == key:
+                return offset, length
+            if entry_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def __contains__(self, point_id: Any) -> bool:
+        return self._find(point_id) is not None
+
+    def _read(self, point_id: Any, with_text: bool) -> Tuple[Dict[str, Any], str | None] | None:
+        location = self._find(point_id)
+        if location is None:
+            return None
+        offset, length = location
+        (meta_len,) = _META_LEN.unpack_from(self._blob, offset)
+        meta_end = offset + _META_LEN.size + meta_len
+        metadata = json.loads(self._blob[offset + _META_LEN.size:meta_end])
+        if not with_text:
+            return metadata, None
+        return metadata, self._blob[meta_end:offset + length].decode("utf-8")
+
+    def metadata(self, point_ids: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+        """Metadati dei punti presenti (il testo non viene letto)."""
+        found: Dict[str, Dict[str, Any]] = {}
+        for point_id in point_ids:
+            record = self._read(point_id, with_text=False)
+            if record is not None:
+                found[str(point_id)] = record[0]
+        return found
+
+    def records(self, point_ids: Iterable[Any]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """(testo, metadati) dei punti presenti."""
+        found: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        for point_id in point_ids:
+            record = self._read(point_id, with_text=True)
+            if record is not None:
+                found[str(point_id)] = (record[1] or "", record[0])
+        return found
+
+    def read_bytes(self, point_ids: Iterable[Any], with_text: bool = True) -> int:
+        """Byte letti dal blob per i punti indicati (per i benchmark)."""
+        total = 0
+        for point_id in point_ids:
+            location = self._find(point_id)
+            if location is None:
+                continue
+            offset, length = location
+            if with_text:
+                total += length
+            else:
+                total += _META_LEN.size + _META_LEN.unpack_from(self._blob, offset)[0]
+        return total
+
+    def close(self) -> None:
+        for mapped in (self._index, self._blob):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+
+_docstores: Dict[str, ChunkDocstore | None] = {}
+_physical: Dict[str, Tuple[float, str]] = {}
+_docstores_lock = threading.Lock()
+
+
+def physical_collection(client: Any, collection: str, refresh: bool = False) -> str:
+    """Collection fisica dietro l'alias (o il nome stesso), con caching.
+
+    La lettura dell'alias è una chiamata di rete: avviene fuori dal lock. La
+    cache vale ``FAQ_DOCSTORE_ALIAS_TTL_S`` secondi; ``refresh`` la rilegge subito.
+    """
+    from collection_aliases import resolve_alias
+
+    with _docstores_lock:
+        cached = _physical.get(collection)
+    if cached and not refresh and time.monotonic() - cached[0] < ALIAS_TTL_S:
+        return cached[1]
+    physical = resolve_alias(client, collection) or collection
+    with _docstores_lock:
+        _physical[collection] = (time.monotonic(), physical)
+    return physical
+
+
+def get_docstore(client: Any, collection: str, refresh: bool = False) -> ChunkDocstore | None:
+    """Docstore della versione servita da ``collection`` (alias o nome fisico), o None.
+
+    Con ``refresh`` l'alias viene riletto subito e un docstore assente viene
+    cercato di nuovo su disco: serve quando un ID trovato da Qdrant manca dal
+    docstore (alias appena spostato) o quando Qdrant segnala un docstore che
+    questo processo non ha ancora aperto.
+    """
+    physical = physical_collection(client, collection, refresh)
+    with _docstores_lock:
+        if physical not in _docstores or (refresh and _docstores[physical] is None):
+            blob_path, index_path = docstore_paths(physical)
+            exists = os.path.exists(blob_path) and os.path.exists(index_path)
+            _docstores[physical] = ChunkDocstore(physical) if exists else None
+        return _docstores[physical]
+
+
+def require_docstore(client: Any, collection: str) -> ChunkDocstore:
+    """Docstore di una versione marcata con ``DOCSTORE_FLAG``; solleva se i file mancano."""
+    docstore = get_docstore(client, collection, refresh=True)
+    if docstore is None:
+        raise DocstoreUnavailable(
+            f"La collection '{collection}' tiene il testo nel docstore locale, "
+            f"ma i file non sono in {DOCSTORE_DIR} (FAQ_DOCSTORE_DIR)"
+        )
+    return docstore
+
+
+def delete_docstore(collection: str, directory: str | None = None) -> bool:
+    """Elimina i file del docstore di una collection fisica (es. versioni potate)."""
+    with _docstores_lock:
+        docstore = _docstores.pop(collection, None)
+        if docstore is not None:
+            docstore.close()
+    deleted = False
+    for path in docstore_paths(collection, directory):
+        if os.path.exists(path):
+            os.remove(path)
+            deleted = True
+    return deleted
+
+
+def copy_docstore(source: str, target: str, directory: str | None = None) -> bool:
+    """Copia il docstore della collection fisica ``source`` su ``target`` (stessi ID di punto)."""
+    copied = False
+    for source_path, target_path in zip(docstore_paths(source, directory), docstore_paths(target, directory)):
+        if os.path.exists(source_path):
+            shutil.copyfile(source_path, f"{target_path}.tmp")
+            os.replace(f"{target_path}.tmp", target_path)
+            copied = True
+    return copied
+
+
+def list_docstores(directory: str | None = None) -> List[Dict[str, Any]]:
+    directory = directory or DOCSTORE_DIR
+    if not os.path.isdir(directory):
+        return []
+    stats: List[Dict[str, Any]] = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".idx"):
+            continue
+        collection = filename[: -len(".idx")]
+        docstore = ChunkDocstore(collection, directory)
+        stats.append({"collection": collection, "records": len(docstore), "mb": round(docstore.size_bytes / 1e6, 2)})
+        docstore.close()
+    return stats
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Docstore locale dei chunk (testo e metadati fuori da Qdrant).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Docstore presenti, record e dimensione")
+    get_parser = subparsers.add_parser("get", help="Testo e metadati di un punto")
+    get_parser.add_argument("--collection", required=True, help="Alias o collection fisica")
+    get_parser.add_argument("--id", required=True)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        stats = list_docstores()
+        if not stats:
+            print(f"⚠ Nessun docstore in {DOCSTORE_DIR}")
+        for entry in stats:
+            print(f"📦 {entry['collection']}: {entry['records']} record, {entry['mb']} MB")
+        return
+
+    from qdrant_config import get_qdrant_client
+
+    docstore = get_docstore(get_qdrant_client(), args.collection)
+    if docstore is None:
+        print(f"❌ Nessun docstore per '{args.collection}'", file=sys.stderr)
+        sys.exit(1)
+    record = docstore.records([args.id]).get(args.id)
+    if record is None:
+        print(f"❌ ID {args.id} non presente in '{docstore.collection}'", file=sys.stderr)
+        sys.exit(1)
+    text, metadata = record
+    print(json.dumps({"collection": docstore.collection, "metadata": metadata, "text": text}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,302 @@
+"""
+Collection versionate dietro alias Qdrant (re-indexing blue/green).
+
+``COLLECTION_NAME`` e ``OFFICIAL_DOCS_COLLECTION`` sono nomi di alias: ogni
+ingestion scrive in una nuova collection fisica ``<alias>__v<timestamp UTC>``,
+esegue una ricerca di controllo e solo allora sposta l'alias sulla nuova
+versione. Lo spostamento è una singola chiamata ``update_collection_aliases``
+(atomica lato Qdrant), quindi il chatbot non vede mai una collection vuota o
+a metà. Le versioni precedenti restano disponibili per il rollback immediato;
+``prune_versions`` elimina le più vecchie oltre ``COLLECTION_KEEP_VERSIONS``
+(default 3, inclusa quella attiva) insieme al loro docstore locale (vedi
+``chunk_docstore.py``). Una versione che non supera l'ingestion o la ricerca di
+controllo viene eliminata subito (``discard_version``), così tra le versioni
+restano solo build complete.
+
+Una collection fisica con il nome dell'alias (layout precedente) viene prima
+copiata in una versione ``<alias>__v<timestamp>`` precedente a quella promossa
+(docstore compreso), così resta il bersaglio del rollback; solo se la copia è
+completa viene eliminata, subito prima di creare l'alias. Se la copia fallisce
+la promozione si interrompe e la collection resta intatta.
+
+Esempi:
+    python collection_aliases.py status
+    python collection_aliases.py rollback --alias datapizzai_faq
+    python collection_aliases.py promote --alias datapizzai_faq --version datapizzai_faq__v20261019120000
+    python collection_aliases.py prune --alias datapizzai_faq --keep 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Sequence
+
+from chunk_docstore import copy_docstore, delete_docstore
+from qdrant_config import COLLECTION_NAME, OFFICIAL_DOCS_COLLECTION, describe_qdrant_target, get_qdrant_client
+
+VERSION_SEPARATOR = "__v"
+KEEP_VERSIONS = int(os.getenv("COLLECTION_KEEP_VERSIONS", "3"))
+# Score minimo della ricerca di controllo quando non si conosce l'ID atteso
+SMOKE_MIN_SCORE = float(os.getenv("COLLECTION_SMOKE_MIN_SCORE", "0.9"))
+
+
+def new_version_name(alias: str, now: datetime | None = None) -> str:
+    """Nome della prossima collection fisica dell'alias (ordinabile lessicograficamente)."""
+    now = now or datetime.now(timezone.utc)
+    return f"{alias}{VERSION_SEPARATOR}{now.strftime('%Y%m%d%H%M%S')}"
+
+
+def list_versions(client: Any, alias: str) -> List[str]:
+    """Collection fisiche dell'alias, dalla più vecchia alla più recente."""
+    pattern = re.compile(rf"^{re.escape(alias)}{VERSION_SEPARATOR}\d{{14}}$")
+    names = (collection.name for collection in client.get_collections().collections)
+    return sorted(name for name in names if pattern.match(name))
+
+
+def resolve_alias(client: Any, alias: str) -> str | None:
+    """Collection fisica a cui punta l'alias (None se l'alias non esiste)."""
+    for description in client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def collection_available(client: Any, name: str) -> bool:
+    """True se ``name`` è una collection o un alias esistente."""
+    return resolve_alias(client, name) is not None or client.collection_exists(name)
+
+
+def _legacy_version_name(client: Any, alias: str, version: str) -> str:
+    """Nome di versione libero che precede ``version`` (per il rollback dopo la migrazione)."""
+    match = re.fullmatch(rf"{re.escape(alias)}{VERSION_SEPARATOR}(\d{{14}})", version)
+    now = (
+        datetime.strptime(match.group(1), "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+        if match
+        else datetime.now(timezone.utc)
+    )
+    existing = set(list_versions(client, alias))
+    while True:
+        now -= timedelta(seconds=1)
+        name = new_version_name(alias, now)
+        if name not in existing:
+            return name
+
+
+def copy_collection(client: Any, source: str, target: str, batch_size: int = 256) -> int:
+    """Copia punti (vettori compresi) e docstore di ``source`` in una nuova collection ``target``.
+
+    Solleva ``RuntimeError`` se la copia non contiene tutti i punti della sorgente.
+    """
+    params = client.get_collection(source).config.params
+    client.create_collection(
+        collection_name=target,
+        vectors_config=params.vectors,
+        sparse_vectors_config=params.sparse_vectors,
+    )
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=source,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if points:
+            from qdrant_client import models as qdrant_models
+
+            client.upsert(
+                collection_name=target,
+                points=[
+                    qdrant_models.PointStruct(id=point.id, vector=point.vector or {}, payload=point.payload)
+                    for point in points
+                ],
+                wait=True,
+            )
+        if offset is None:
+            break
+    expected = client.count(collection_name=source, exact=True).count
+    copied = client.count(collection_name=target, exact=True).count
+    if copied != expected:
+        raise RuntimeError(f"Copia di '{source}' in '{target}' incompleta: {copied}/{expected} punti.")
+    copy_docstore(source, target)
+    return copied
+
+
+def promote_version(client: Any, alias: str, version: str) -> str | None:
+    """Sposta atomicamente l'alias su ``version``; restituisce la versione precedente."""
+    from qdrant_client import models as qdrant_models
+
+    previous = resolve_alias(client, alias)
+    operations: List[Any] = []
+    if previous is not None:
+        operations.append(qdrant_models.DeleteAliasOperation(
+            delete_alias=qdrant_models.DeleteAlias(alias_name=alias)
+        ))
+    elif client.collection_exists(alias):
+        # Layout precedente: la collection fisica diventa una versione prima di lasciare il nome all'alias
+        legacy = _legacy_version_name(client, alias, version)
+        try:
+            points = copy_collection(client, alias, legacy)
+        except Exception as exc:
+            if client.collection_exists(legacy):
+                client.delete_collection(legacy)
+            raise RuntimeError(
+                f"Migrazione di '{alias}' non riuscita: la collection resta intatta e l'alias non viene creato ({exc})"
+            ) from exc
+        print(f"⚠ Collection fisica '{alias}' copiata in '{legacy}' ({points} punti) e sostituita dall'alias")
+        client.delete_collection(alias)
+        delete_docstore(alias)
+    operations.append(qdrant_models.CreateAliasOperation(
+        create_alias=qdrant_models.CreateAlias(collection_name=version, alias_name=alias)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    return previous
+
+
+def rollback(client: Any, alias: str, to: str | None = None) -> str:
+    """Riporta l'alias su ``to`` o sulla versione precedente a quella attiva."""
+    current = resolve_alias(client, alias)
+    versions = list_versions(client, alias)
+    if to is None:
+        older = [version for version in versions if current is None or version < current]
+        if not older:
+            raise RuntimeError(f"Nessuna versione precedente a '{current}' per l'alias '{alias}'.")
+        to = older[-1]
+    elif to not in versions:
+        raise RuntimeError(f"'{to}' non è una versione dell'alias '{alias}'.")
+    promote_version(client, alias, to)
+    return to
+
+
+def prune_versions(client: Any, alias: str, keep: int = KEEP_VERSIONS) -> List[str]:
+    """Elimina le versioni più vecchie oltre le ultime ``keep`` (mai quella attiva), docstore compreso."""
+    current = resolve_alias(client, alias)
+    versions = list_versions(client, alias)
+    kept = set(versions[-max(keep, 1):]) | {current}
+    deleted = [version for version in versions if version not in kept]
+    for version in deleted:
+        client.delete_collection(version)
+        delete_docstore(version)
+    return deleted
+
+
+def discard_version(client: Any, version: str) -> None:
+    """Elimina una versione non promossa (build fallita) e il suo docstore.
+
+    Le build abortite non devono restare tra le versioni: occuperebbero posti
+    di ``keep`` in ``prune_versions`` e potrebbero diventare il bersaglio di
+    ``rollback``.
+    """
+    alias = version.split(VERSION_SEPARATOR)[0]
+    if resolve_alias(client, alias) == version:
+        raise RuntimeError(f"'{version}' è la versione attiva di '{alias}': non viene eliminata.")
+    if client.collection_exists(version):
+        client.delete_collection(version)
+    delete_docstore(version)
+
+
+def smoke_search(
+    client: Any,
+    collection: str,
+    vector: Sequence[float],
+    vector_name: str | None = None,
+    expected_id: Any = None,
+    min_score: float = SMOKE_MIN_SCORE,
+) -> Dict[str, Any]:
+    """Ricerca di controllo su una versione prima della promozione.
+
+    Il vettore è quello di un testo appena indicizzato: il primo risultato deve
+    essere il punto atteso (se noto) o avere uno score di almeno ``min_score``.
+    """
+    response = client.query_points(collection_name=collection, query=list(vector), using=vector_name, limit=1)
+    top = response.points[0] if response.points else None
+    if top is None:
+        passed = False
+    elif expected_id is not None:
+        passed = str(top.id) == str(expected_id)
+    else:
+        passed = top.score >= min_score
+    return {
+        "collection": collection,
+        "top_id": str(top.id) if top else None,
+        "top_score": round(top.score, 4) if top else None,
+        "expected_id": None if expected_id is None else str(expected_id),
+        "passed": passed,
+    }
+
+
+def describe_alias(client: Any, alias: str) -> Dict[str, Any]:
+    current = resolve_alias(client, alias)
+    versions = list_versions(client, alias)
+    return {
+        "alias": alias,
+        "current": current,
+        "legacy_collection": current is None and client.collection_exists(alias),
+        "versions": [
+            {"name": version, "points": client.count(collection_name=version, exact=True).count}
+            for version in versions
+        ],
+    }
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Gestione degli alias e delle versioni delle collection Qdrant.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    status_parser = subparsers.add_parser("status", help="Mostra versione attiva e versioni disponibili")
+    status_parser.add_argument("--alias", action="append", help="Alias da mostrare (ripetibile)")
+
+    rollback_parser = subparsers.add_parser("rollback", help="Riporta l'alias alla versione precedente")
+    rollback_parser.add_argument("--alias", default=COLLECTION_NAME)
+    rollback_parser.add_argument("--to", help="Versione esplicita (default: la precedente a quella attiva)")
+
+    promote_parser = subparsers.add_parser("promote", help="Sposta l'alias su una versione")
+    promote_parser.add_argument("--alias", default=COLLECTION_NAME)
+    promote_parser.add_argument("--version", required=True)
+
+    prune_parser = subparsers.add_parser("prune", help="Elimina le versioni più vecchie")
+    prune_parser.add_argument("--alias", default=COLLECTION_NAME)
+    prune_parser.add_argument("--keep", type=int, default=KEEP_VERSIONS)
+
+    args = parser.parse_args()
+    client = get_qdrant_client()
+    print(f"🔗 Target Qdrant: {describe_qdrant_target()}")
+
+    if args.command == "status":
+        for alias in args.alias or [COLLECTION_NAME, OFFICIAL_DOCS_COLLECTION]:
+            status = describe_alias(client, alias)
+            print("=" * 70)
+            if status["legacy_collection"]:
+                print(f"🏷️ {alias}: collection fisica (nessun alias, layout precedente)")
+            else:
+                print(f"🏷️ {alias} → {status['current'] or 'nessuna versione attiva'}")
+            for version in status["versions"]:
+                marker = "▶" if version["name"] == status["current"] else " "
+                print(f"   {marker} {version['name']}  ({version['points']} punti)")
+    elif args.command == "rollback":
+        target = rollback(client, args.alias, args.to)
+        print(f"✓ Alias '{args.alias}' riportato su '{target}'")
+    elif args.command == "promote":
+        if args.version not in list_versions(client, args.alias):
+            raise RuntimeError(f"'{args.version}' non è una versione dell'alias '{args.alias}'.")
+        previous = promote_version(client, args.alias, args.version)
+        print(f"✓ Alias '{args.alias}' → '{args.version}' (prima: {previous or 'nessuna'})")
+    elif args.command == "prune":
+        deleted = prune_versions(client, args.alias, args.keep)
+        print(f"🧹 Versioni eliminate: {', '.join(deleted) if deleted else 'nessuna'}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)
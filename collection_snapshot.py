@@ -0,0 +1,384 @@
+"""
+Export/import di una collection Qdrant in un bundle binario compatto.
+
+Evita di ripagare l'embedding dell'intero corpus su ogni nuovo ambiente
+(devcontainer, CI, nuova region): la collection viene esportata una volta e
+ricaricata in blocco nel target risolto da ``qdrant_config``.
+Se la destinazione è un alias esistente, l'import crea una nuova versione e
+sposta l'alias solo a import completato (vedi ``collection_aliases.py``).
+
+Struttura del bundle (una directory):
+- ``manifest.json``: modello di embedding, dimensione, nome del vettore, distanza, conteggi
+- ``vectors.f32``: vettori float32 little-endian contigui (righe da ``dimension`` valori)
+- ``ids.jsonl.gz`` e ``payload.<n>.jsonl.gz``: payload in formato colonnare, una riga per punto
+  (l'n-esimo file contiene il campo ``payload_fields[n]`` del manifest)
+
+Esempi:
+    python collection_snapshot.py export --collection datapizzai_faq --out snapshots/faq
+    python collection_snapshot.py import --bundle snapshots/faq --recreate
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+from qdrant_client import models as qdrant_models
+
+from collection_aliases import new_version_name, promote_version, resolve_alias
+from embeddings import faq_space, official_docs_space
+from qdrant_config import (
+    COLLECTION_NAME,
+    OFFICIAL_DOCS_COLLECTION,
+    describe_qdrant_target,
+    get_qdrant_client,
+)
+from retrieval import is_parent_payload
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+IDS_FILE = "ids.jsonl.gz"
+PAYLOAD_FILE_TEMPLATE = "payload.{index}.jsonl.gz"
+
+DEFAULT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "256"))
+DEFAULT_WORKERS = int(os.getenv("SNAPSHOT_WORKERS", "4"))
+
+
+def _default_embedding_model(collection: str) -> str | None:
+    """Modello di embedding noto per le collection del progetto."""
+    if collection == COLLECTION_NAME:
+        return faq_space().model
+    if collection == OFFICIAL_DOCS_COLLECTION:
+        return official_docs_space().model
+    return None
+
+
+def _vector_layout(info: qdrant_models.CollectionInfo) -> Tuple[str | None, int, str]:
+    """Restituisce (nome vettore, dimensione, distanza) della collection.
+
+    Sono supportate collection con un solo vettore denso, con nome o anonimo.
+    """
+    vectors_cfg = info.config.params.vectors
+    if isinstance(vectors_cfg, qdrant_models.VectorParams):
+        return None, vectors_cfg.size, str(vectors_cfg.distance.value)
+    if isinstance(vectors_cfg, dict) and len(vectors_cfg) == 1:
+        name, params = next(iter(vectors_cfg.items()))
+        return name, params.size, str(params.distance.value)
+    raise ValueError("Sono supportate solo collection con un singolo vettore denso.")
+
+
+def _dump_line(value: Any) -> bytes:
+    return (json.dumps(value, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _to_float32_bytes(values: array) -> bytes:
+    """Serializza un array float32 in little-endian indipendentemente dalla piattaforma."""
+    if sys.byteorder != "little":
+        values = array("f", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+class _ColumnWriter:
+    """Scrive i payload in colonne gzip, aggiungendo null per i campi assenti."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.rows = 0
+        self.columns: Dict[str, gzip.GzipFile] = {}
+
+    def _open_column(self, field: str) -> gzip.GzipFile:
+        path = os.path.join(self.directory, PAYLOAD_FILE_TEMPLATE.format(index=len(self.columns)))
+        handle = gzip.open(path, "wb")
+        # Backfill delle righe già scritte prima della comparsa del campo
+        null_line = _dump_line(None)
+        for _ in range(self.rows):
+            handle.write(null_line)
+        self.columns[field] = handle
+        return handle
+
+    def write(self, payload: Dict[str, Any]) -> None:
+        for field in payload:
+            if field not in self.columns:
+                self._open_column(field)
+        for field, handle in self.columns.items():
+            handle.write(_dump_line(payload.get(field)))
+        self.rows += 1
+
+    def close(self) -> List[str]:
+        for handle in self.columns.values():
+            handle.close()
+        # L'ordine di inserimento corrisponde all'indice dei file colonna
+        return list(self.columns)
+
+
+def export_collection(
+    collection: str,
+    out_dir: str,
+    embedding_model: str | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Dict[str, Any]:
+    """Esporta la collection in un bundle e restituisce il manifest scritto."""
+    client = get_qdrant_client()
+    info = client.get_collection(collection)
+    vector_name, dimension, distance = _vector_layout(info)
+
+    os.makedirs(out_dir, exist_ok=True)
+    columns = _ColumnWriter(out_dir)
+    count = 0
+    started = time.perf_counter()
+
+    with open(os.path.join(out_dir, VECTORS_FILE), "wb") as vectors_file, gzip.open(
+        os.path.join(out_dir, IDS_FILE), "wb"
+    ) as ids_file:
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            for point in points:
+                vector = point.vector
+                if isinstance(vector, dict):
+                    vector = vector.get(vector_name) if vector_name else next(iter(vector.values()), None)
+                if vector is None and vector_name and is_parent_payload(point.payload):
+                    # Parent senza vettore (layout parent/child): riga di zeri nel bundle
+                    vector = [0.0] * dimension
+                if vector is None or len(vector) != dimension:
+                    raise ValueError(f"Vettore mancante o di dimensione errata per il punto {point.id}")
+
+                vectors_file.write(_to_float32_bytes(array("f", vector)))
+                ids_file.write(_dump_line(point.id))
+                columns.write(point.payload or {})
+                count += 1
+
+            if offset is None:
+                break
+
+    fields = columns.close()
+    manifest = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "collection": collection,
+        "embedding_model": embedding_model or _default_embedding_model(collection),
+        "vector_name": vector_name,
+        "dimension": dimension,
+        "distance": distance,
+        "dtype": "float32",
+        "byteorder": "little",
+        "count": count,
+        "payload_fields": fields,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "export_seconds": round(time.perf_counter() - started, 3),
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    return manifest
+
+
+def load_manifest(bundle_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(bundle_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Versione del bundle non supportata: {manifest.get('format_version')}")
+    return manifest
+
+
+def iter_bundle_points(bundle_dir: str, manifest: Dict[str, Any]) -> Iterator[qdrant_models.PointStruct]:
+    """Rilegge il bundle in streaming restituendo un PointStruct per riga."""
+    dimension = manifest["dimension"]
+    vector_name = manifest.get("vector_name")
+    row_bytes = dimension * 4
+    fields = manifest.get("payload_fields", [])
+
+    column_files = {
+        field: gzip.open(os.path.join(bundle_dir, PAYLOAD_FILE_TEMPLATE.format(index=index)), "rb")
+        for index, field in enumerate(fields)
+    }
+    try:
+        with open(os.path.join(bundle_dir, VECTORS_FILE), "rb") as vectors_file, gzip.open(
+            os.path.join(bundle_dir, IDS_FILE), "rb"
+        ) as ids_file:
+            for id_line in ids_file:
+                raw = vectors_file.read(row_bytes)
+                if len(raw) != row_bytes:
+                    raise ValueError("File dei vettori troncato rispetto agli ID.")
+                values = array("f")
+                values.frombytes(raw)
+                if sys.byteorder != "little":
+                    values.byteswap()
+
+                payload = {}
+                for field, handle in column_files.items():
+                    value = json.loads(handle.readline())
+                    if value is not None:
+                        payload[field] = value
+
+                vector = values.tolist()
+                if vector_name and not any(vector) and is_parent_payload(payload):
+                    vector_struct = {}
+                else:
+                    vector_struct = {vector_name: vector} if vector_name else vector
+                yield qdrant_models.PointStruct(
+                    id=json.loads(id_line),
+                    vector=vector_struct,
+                    payload=payload,
+                )
+    finally:
+        for handle in column_files.values():
+            handle.close()
+
+
+def import_bundle(
+    bundle_dir: str,
+    collection: str | None = None,
+    recreate: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int = DEFAULT_WORKERS,
+) -> Dict[str, Any]:
+    """Carica il bundle nel target Qdrant configurato con upsert paralleli."""
+    manifest = load_manifest(bundle_dir)
+    collection = collection or manifest["collection"]
+    client = get_qdrant_client()
+
+    alias = None
+    if resolve_alias(client, collection) is not None:
+        # Alias attivo: il bundle diventa una nuova versione, promossa a import completato
+        alias, collection = collection, new_version_name(collection)
+
+    vector_params = qdrant_models.VectorParams(
+        size=manifest["dimension"],
+        distance=qdrant_models.Distance(manifest["distance"]),
+    )
+    vector_name = manifest.get("vector_name")
+
+    if client.collection_exists(collection):
+        if not recreate:
+            raise RuntimeError(
+                f"La collection '{collection}' esiste già: usa --recreate per sovrascriverla."
+            )
+        client.delete_collection(collection)
+
+    client.create_collection(
+        collection_name=collection,
+        vectors_config={vector_name: vector_params} if vector_name else vector_params,
+    )
+
+    started = time.perf_counter()
+    imported = 0
+    pending = set()
+
+    def _upsert(points: List[qdrant_models.PointStruct]) -> int:
+        client.upsert(collection_name=collection, points=points, wait=True)
+        return len(points)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch: List[qdrant_models.PointStruct] = []
+        for point in iter_bundle_points(bundle_dir, manifest):
+            batch.append(point)
+            if len(batch) < batch_size:
+                continue
+            # Limita i batch in volo per mantenere la memoria costante
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                imported += sum(future.result() for future in done)
+            pending.add(executor.submit(_upsert, batch))
+            batch = []
+
+        if batch:
+            pending.add(executor.submit(_upsert, batch))
+        for future in pending:
+            imported += future.result()
+
+    if alias is not None:
+        if imported != manifest["count"]:
+            raise RuntimeError(
+                f"Importati {imported} punti su {manifest['count']}: l'alias '{alias}' resta invariato."
+            )
+        promote_version(client, alias, collection)
+
+    return {
+        "collection": collection,
+        "alias": alias,
+        "points": imported,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def _bundle_size_bytes(bundle_dir: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(bundle_dir, name))
+        for name in os.listdir(bundle_dir)
+        if os.path.isfile(os.path.join(bundle_dir, name))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export/import di collection Qdrant in bundle binari.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Esporta una collection in un bundle")
+    export_parser.add_argument("--collection", default=COLLECTION_NAME)
+    export_parser.add_argument("--out", required=True, help="Directory di destinazione del bundle")
+    export_parser.add_argument("--embedding-model", help="Modello di embedding da registrare nel manifest")
+    export_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    import_parser = subparsers.add_parser("import", help="Importa un bundle nel target Qdrant configurato")
+    import_parser.add_argument("--bundle", required=True, help="Directory del bundle")
+    import_parser.add_argument("--collection", help="Nome della collection di destinazione (default: quello del manifest)")
+    import_parser.add_argument("--recreate", action="store_true", help="Ricrea la collection se esiste")
+    import_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    import_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+
+    args = parser.parse_args()
+    print(f"🔗 Target Qdrant: {describe_qdrant_target()}")
+
+    if args.command == "export":
+        manifest = export_collection(args.collection, args.out, args.embedding_model, args.batch_size)
+        size_mb = _bundle_size_bytes(args.out) / (1024 * 1024)
+        print(
+            f"✓ Esportati {manifest['count']} punti da '{manifest['collection']}' "
+            f"({manifest['dimension']} dim, modello {manifest['embedding_model']}) "
+            f"in {manifest['export_seconds']:.1f}s"
+        )
+        print(f"📦 Bundle: {args.out} ({size_mb:.2f} MB)")
+    else:
+        manifest = load_manifest(args.bundle)
+        print(
+            f"📦 Bundle '{manifest['collection']}': {manifest['count']} punti, "
+            f"{manifest['dimension']} dim, modello {manifest['embedding_model']}"
+        )
+        result = import_bundle(
+            args.bundle,
+            collection=args.collection,
+            recreate=args.recreate,
+            batch_size=args.batch_size,
+            workers=args.workers,
+        )
+        rate = result["points"] / result["seconds"] if result["seconds"] else 0.0
+        print(
+            f"✓ Importati {result['points']} punti in '{result['collection']}' "
+            f"in {result['seconds']:.1f}s ({rate:.0f} punti/s)"
+        )
+        if result["alias"]:
+            print(f"🔀 Alias '{result['alias']}' → '{result['collection']}'")
+
+
+if __name__ == "__main__":
+    main()
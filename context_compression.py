@@ -0,0 +1,248 @@
+"""
+Compressione estrattiva del contesto FAQ prima della generazione.
+
+Tra retrieval e composizione del prompt, i chunk recuperati vengono divisi in
+frasi (i blocchi di codice restano interi) e ogni frase riceve come punteggio
+la similarità coseno con il vettore della domanda, calcolata in un'unica
+moltiplicazione matrice-vettore. Si tengono le frasi migliori, ciascuna con le
+``CONTEXT_COMPRESSION_NEIGHBORS`` frasi vicine dello stesso chunk, finché il
+contesto resta entro ``CONTEXT_COMPRESSION_BUDGET_CHARS``; le frasi tenute
+mantengono l'ordine originale e i salti sono marcati con "…".
+
+Gli embedding delle frasi sono calcolati in ingestion (``ingest_faq.py``) e
+salvati in un file SQLite indicizzato per (spazio di embedding, frase): a query
+time si leggono dalla cache e solo le frasi mancanti vengono embeddate, in
+richieste da al più ``EMBEDDING_MAX_BATCH`` frasi, e aggiunte alla cache. Se
+il contesto è già entro il budget i chunk passano invariati; altrimenti ogni
+chunk recuperato conserva almeno la sua frase migliore, anche oltre il budget.
+
+Configurazione tramite variabili d'ambiente:
+- ``CONTEXT_COMPRESSION`` (default on)
+- ``CONTEXT_COMPRESSION_BUDGET_CHARS`` (default 3000)
+- ``CONTEXT_COMPRESSION_NEIGHBORS`` (default 1)
+- ``CONTEXT_COMPRESSION_EMBED_MISSING`` (default on): embedda le frasi non in cache
+- ``SENTENCE_EMBEDDING_CACHE_PATH`` (default ``.cache/sentence_embeddings.sqlite``)
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from embeddings import EMBEDDING_MAX_BATCH, EmbeddingSpace
+from prompt_cache import estimate_tokens
+
+# Blocchi di codice: non vengono spezzati in frasi
+_CODE_BLOCK = re.compile(r"(```.*?```|~~~.*?~~~)", re.DOTALL)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _env_flag(name: str, default: str = "1") -> bool:
+    return os.getenv(name, default).lower() in {"1", "true", "yes", "on"}
+
+
+def compression_enabled() -> bool:
+    return _env_flag("CONTEXT_COMPRESSION")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Frasi di un chunk: righe e fine frase nel testo, blocchi di codice interi."""
+    sentences: List[str] = []
+    for index, part in enumerate(_CODE_BLOCK.split(text)):
+        if index % 2:
+            if part.strip():
+                sentences.append(part.strip())
+            continue
+        for line in part.splitlines():
+            sentences.extend(s.strip() for s in _SENTENCE_END.split(line) if s.strip())
+    return sentences
+
+
+def sentence_key(space: EmbeddingSpace, sentence: str) -> str:
+    return hashlib.sha1(f"{space.label}\n{sentence}".encode("utf-8")).hexdigest()
+
+
+class SentenceEmbeddingStore:
+    """Cache SQLite degli embedding delle frasi (float32, chiave = spazio + frase)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sentences (key TEXT PRIMARY KEY, vector BLOB)")
+        self._conn.commit()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, array]:
+        found: Dict[str, array] = {}
+        with self._lock:
+            # SQLite limita il numero di parametri per query
+            for offset in range(0, len(keys), 500):
+                batch = list(keys[offset:offset + 500])
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM sentences WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        rows = [(key, array("f", vector).tobytes()) for key, vector in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO sentences VALUES (?, ?)", rows)
+            self._conn.commit()
+
+
+_sentence_store: SentenceEmbeddingStore | None = None
+_sentence_store_lock = threading.Lock()
+
+
+def get_sentence_store() -> SentenceEmbeddingStore:
+    global _sentence_store
+
+    with _sentence_store_lock:
+        if _sentence_store is None:
+            _sentence_store = SentenceEmbeddingStore(
+                os.getenv("SENTENCE_EMBEDDING_CACHE_PATH", ".cache/sentence_embeddings.sqlite")
+            )
+        return _sentence_store
+
+
+def _ensure_embeddings(
+    embedder: Any, space: EmbeddingSpace, sentences: Sequence[str], embed_missing: bool
+) -> Tuple[Dict[str, array], int, int]:
+    """Vettori per frase dalla cache, embeddando le mancanti a blocchi; restituisce anche hit ed embeddate."""
+    store = get_sentence_store()
+    keys = {sentence: sentence_key(space, sentence) for sentence in sentences}
+    cached = store.get_many(list(set(keys.values())))
+    vectors = {sentence: cached[key] for sentence, key in keys.items() if key in cached}
+
+    missing = [sentence for sentence in keys if sentence not in vectors]
+    if missing and embed_missing:
+        for offset in range(0, len(missing), EMBEDDING_MAX_BATCH):
+            batch = missing[offset:offset + EMBEDDING_MAX_BATCH]
+            embedded = embedder.embed(batch)
+            store.put_many((keys[sentence], vector) for sentence, vector in zip(batch, embedded))
+            vectors.update({sentence: array("f", vector) for sentence, vector in zip(batch, embedded)})
+    return vectors, len(keys) - len(missing), len(missing) if embed_missing else 0
+
+
+def precompute_sentence_embeddings(embedder: Any, space: EmbeddingSpace, texts: Iterable[str]) -> int:
+    """Popola la cache con le frasi dei testi indicati (usata in ingestion); restituisce le frasi embeddate."""
+    sentences = list(dict.fromkeys(sentence for text in texts for sentence in split_sentences(text)))
+    if not sentences:
+        return 0
+    return _ensure_embeddings(embedder, space, sentences, embed_missing=True)[2]
+
+
+class ContextCompressor:
+    """Riduce i chunk alle frasi più simili alla domanda, entro un budget di caratteri."""
+
+    def __init__(
+        self,
+        embedder: Any,
+        space: EmbeddingSpace,
+        budget_chars: int | None = None,
+        neighbors: int | None = None,
+        embed_missing: bool | None = None,
+    ):
+        self.embedder = embedder
+        self.space = space
+        self.budget_chars = budget_chars or int(os.getenv("CONTEXT_COMPRESSION_BUDGET_CHARS", "3000"))
+        self.neighbors = neighbors if neighbors is not None else int(os.getenv("CONTEXT_COMPRESSION_NEIGHBORS", "1"))
+        self.embed_missing = (
+            embed_missing if embed_missing is not None else _env_flag("CONTEXT_COMPRESSION_EMBED_MISSING")
+        )
+
+    def compress(self, query_vector: Sequence[float], chunks: Sequence[Any]) -> Tuple[List[Any], Dict[str, Any]]:
+        """Restituisce i chunk compressi (stessa classe, ``text`` ridotto) e le statistiche."""
+        import numpy as np
+
+        started = time.perf_counter()
+        input_text = "\n\n".join(chunk.text for chunk in chunks)
+        stats: Dict[str, Any] = {
+            "input_chars": len(input_text),
+            "output_chars": len(input_text),
+            "ratio": 1.0,
+            "tokens_saved": 0,
+            "sentences": 0,
+            "kept": 0,
+            "cache_hits": 0,
+            "embedded": 0,
+        }
+        if not chunks or len(input_text) <= self.budget_chars:
+            stats["ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return list(chunks), stats
+
+        per_chunk = [split_sentences(chunk.text) for chunk in chunks]
+        flat: List[Tuple[int, int]] = [(c, s) for c, sentences in enumerate(per_chunk) for s in range(len(sentences))]
+        vectors, stats["cache_hits"], stats["embedded"] = _ensure_embeddings(
+            self.embedder, self.space, [per_chunk[c][s] for c, s in flat], self.embed_missing
+        )
+
+        # Coseno vettorizzato: frasi senza vettore restano a 0 (possono entrare come vicine)
+        query = np.asarray(query_vector, dtype=np.float32)
+        matrix = np.zeros((len(flat), query.shape[0]), dtype=np.float32)
+        for row, (c, s) in enumerate(flat):
+            vector = vectors.get(per_chunk[c][s])
+            if vector is not None and len(vector) == query.shape[0]:
+                matrix[row] = vector
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = (matrix @ query) / np.where(norms == 0, 1.0, norms)
+
+        selected: set[Tuple[int, int]] = set()
+        used = 0
+        for row in np.argsort(-scores, kind="stable"):
+            c, s = flat[row]
+            window = [
+                (c, n) for n in range(max(0, s - self.neighbors), min(len(per_chunk[c]), s + self.neighbors + 1))
+                if (c, n) not in selected
+            ]
+            cost = sum(len(per_chunk[c][n]) + 1 for _, n in window)
+            if used + cost > self.budget_chars:
+                if not selected:
+                    # Anche la sola frase migliore supera il budget: la si tiene comunque
+                    selected.add((c, s))
+                    used += len(per_chunk[c][s])
+                continue
+            selected.update(window)
+            used += cost
+
+        # Nessun chunk recuperato sparisce dal prompt: almeno la sua frase migliore
+        best_row: Dict[int, int] = {}
+        for row in np.argsort(-scores, kind="stable"):
+            best_row.setdefault(flat[row][0], row)
+        for c, row in best_row.items():
+            if not any(cc == c for cc, _ in selected):
+                selected.add(flat[row])
+
+        compressed: List[Any] = []
+        for c, chunk in enumerate(chunks):
+            kept = sorted(s for cc, s in selected if cc == c)
+            if not kept:
+                continue
+            parts = [per_chunk[c][kept[0]]]
+            for previous, current in zip(kept, kept[1:]):
+                parts.append(("\n" if current == previous + 1 else "\n…\n") + per_chunk[c][current])
+            compressed.append(dataclasses.replace(chunk, text="".join(parts)))
+
+        output_text = "\n\n".join(chunk.text for chunk in compressed)
+        stats.update({
+            "output_chars": len(output_text),
+            "ratio": round(len(output_text) / len(input_text), 3),
+            "tokens_saved": estimate_tokens(input_text) - estimate_tokens(output_text),
+            "sentences": len(flat),
+            "kept": len(selected),
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+        return compressed, stats
@@ -0,0 +1,360 @@
+"""
+Contabilità per domanda di token e chiamate ai backend.
+
+Una ``ask_async`` può chiamare il rewriter, il generatore finale (o il nodo
+generatore della pipeline FAQ), gli embedder Google e OpenAI e più volte
+Qdrant. ``RequestCost`` raccoglie per la richiesta corrente (via contextvar,
+propagata anche ad ``asyncio.to_thread``):
+
+- chiamate LLM con token di input e output per componente (``cost_component``);
+  se il provider non riporta l'utilizzo i token vengono stimati;
+- richieste Qdrant per backend, comprese le richieste di riserva dell'hedging;
+- chiamate di embedding, lette dall'``EmbeddingMeter`` della domanda (anche
+  quando la risposta è un errore senza trace).
+
+A fine domanda il costo finisce nella trace (``cost``) e in ``CostLedger``:
+un file JSONL append-only (una riga per domanda, con sessione, lingua ed
+esito) più contatori aggregati in memoria per processo, sessione e lingua.
+``python cost_ledger.py`` aggrega il file per confrontare periodi o
+configurazioni (ad es. con e senza cache o compressione).
+
+Configurazione tramite variabili d'ambiente:
+- ``COST_LEDGER`` (default on): scrive il ledger su file
+- ``COST_LEDGER_PATH`` (default ``.cache/cost_ledger.jsonl``)
+
+Esempi:
+    python cost_ledger.py
+    python cost_ledger.py --by language --since 2026-10-01
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator
+
+from prompt_cache import estimate_tokens, output_tokens_from_response, usage_from_response
+
+COST_METHODS = ("invoke", "_invoke", "a_invoke", "_a_invoke")
+COUNTER_FIELDS = ("questions", "llm_calls", "input_tokens", "output_tokens", "embedding_calls", "qdrant_requests")
+
+
+def _env_flag(name: str, default: str = "1") -> bool:
+    return os.getenv(name, default).lower() in {"1", "true", "yes", "on"}
+
+
+class RequestCost:
+    """Chiamate LLM (con token) e richieste ai backend di una singola domanda."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.llm: Dict[str, Dict[str, int]] = {}
+        self.backends: Dict[str, int] = {}
+
+    def record_llm(self, component: str, input_tokens: int, output_tokens: int, estimated: bool) -> None:
+        with self._lock:
+            entry = self.llm.setdefault(
+                component, {"calls": 0, "input_tokens": 0, "output_tokens": 0, "estimated_calls": 0}
+            )
+            entry["calls"] += 1
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+            entry["estimated_calls"] += int(estimated)
+
+    def record_request(self, backend: str) -> None:
+        with self._lock:
+            self.backends[backend] = self.backends.get(backend, 0) + 1
+
+    def snapshot(self, embedding: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        with self._lock:
+            by_component = {name: dict(entry) for name, entry in self.llm.items()}
+            backends = dict(self.backends)
+        qdrant = {name: count for name, count in backends.items() if name.startswith("qdrant:")}
+        return {
+            "llm": {
+                "calls": sum(entry["calls"] for entry in by_component.values()),
+                "input_tokens": sum(entry["input_tokens"] for entry in by_component.values()),
+                "output_tokens": sum(entry["output_tokens"] for entry in by_component.values()),
+                "estimated_calls": sum(entry["estimated_calls"] for entry in by_component.values()),
+                "by_component": by_component,
+            },
+            "embedding": {
+                "calls": (embedding or {}).get("calls", 0),
+                "by_provider": {
+                    provider: stats["calls"] for provider, stats in (embedding or {}).get("by_provider", {}).items()
+                },
+            },
+            "qdrant": {"requests": sum(qdrant.values()), "by_target": qdrant},
+        }
+
+
+_current_cost: contextvars.ContextVar[RequestCost | None] = contextvars.ContextVar("request_cost", default=None)
+_current_component: contextvars.ContextVar[str] = contextvars.ContextVar("cost_component", default="llm")
+_inside_llm_call: contextvars.ContextVar[bool] = contextvars.ContextVar("inside_llm_call", default=False)
+
+
+def start_request_cost() -> RequestCost:
+    """Crea il contatore della richiesta corrente (contesto del task asyncio o del thread)."""
+    cost = RequestCost()
+    _current_cost.set(cost)
+    return cost
+
+
+@contextlib.contextmanager
+def cost_component(name: str) -> Iterator[None]:
+    """Attribuisce a ``name`` le chiamate LLM eseguite nel blocco (es. ``rewrite``, ``generation``)."""
+    token = _current_component.set(name)
+    try:
+        yield
+    finally:
+        _current_component.reset(token)
+
+
+def counted_call(backend: str, func: Callable) -> Callable:
+    """``func`` che conta ogni esecuzione sulla richiesta corrente, anche da thread senza contesto."""
+    cost = _current_cost.get()
+    if cost is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cost.record_request(backend)
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _response_text(response: Any) -> str:
+    content = getattr(response, "content", response)
+    if isinstance(content, list):
+        return "".join(block if isinstance(block, str) else str(getattr(block, "content", "")) for block in content)
+    return content if isinstance(content, str) else str(content or "")
+
+
+def _record_llm_call(kwargs: Dict[str, Any], response: Any) -> None:
+    cost = _current_cost.get()
+    if cost is None:
+        return
+    input_tokens, _ = usage_from_response(response)
+    output_tokens = output_tokens_from_response(response)
+    estimated = input_tokens is None or output_tokens is None
+    if input_tokens is None:
+        prompt = f"{kwargs.get('system_prompt') or ''}\n{kwargs.get('input') or ''}"
+        input_tokens = estimate_tokens(prompt)
+    if output_tokens is None:
+        output_tokens = estimate_tokens(_response_text(response))
+    cost.record_llm(_current_component.get(), input_tokens, output_tokens, estimated)
+
+
+def with_cost_tracking(client: Any) -> Any:
+    """Conta token e chiamate dei metodi di generazione del client (sync e async)."""
+    for method in COST_METHODS:
+        func = getattr(client, method, None)
+        if func is None or not callable(func):
+            continue
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, _func=func, **kwargs):
+                if _inside_llm_call.get():
+                    return await _func(*args, **kwargs)
+                token = _inside_llm_call.set(True)
+                try:
+                    response = await _func(*args, **kwargs)
+                finally:
+                    _inside_llm_call.reset(token)
+                _record_llm_call(kwargs, response)
+                return response
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, _func=func, **kwargs):
+                if _inside_llm_call.get():
+                    return _func(*args, **kwargs)
+                token = _inside_llm_call.set(True)
+                try:
+                    response = _func(*args, **kwargs)
+                finally:
+                    _inside_llm_call.reset(token)
+                _record_llm_call(kwargs, response)
+                return response
+        setattr(client, method, wrapper)
+    return client
+
+
+def question_outcome(trace: Dict[str, Any] | None) -> str:
+    if not trace:
+        return "error"
+    if trace.get("load_shed"):
+        return "shed"
+    if trace.get("generator_skipped"):
+        return "fallback_gated"
+    if trace.get("fallback_triggered"):
+        return "fallback"
+    return "answered"
+
+
+def _counters(cost: Dict[str, Any]) -> Dict[str, int]:
+    return {
+        "questions": 1,
+        "llm_calls": cost["llm"]["calls"],
+        "input_tokens": cost["llm"]["input_tokens"],
+        "output_tokens": cost["llm"]["output_tokens"],
+        "embedding_calls": cost["embedding"]["calls"],
+        "qdrant_requests": cost["qdrant"]["requests"],
+    }
+
+
+def _add_counters(target: Dict[str, int], counters: Dict[str, int]) -> None:
+    for field in COUNTER_FIELDS:
+        target[field] = target.get(field, 0) + counters.get(field, 0)
+
+
+class CostLedger:
+    """Ledger JSONL append-only con contatori aggregati per processo, sessione e lingua."""
+
+    def __init__(self, path: str | None, max_sessions: int = 10000):
+        self.path = path
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+        self.totals: Dict[str, int] = {}
+        self.by_language: Dict[str, Dict[str, int]] = {}
+        self.by_outcome: Dict[str, int] = {}
+        self._by_session: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+
+    def record(
+        self,
+        cost: Dict[str, Any],
+        session_id: str | None,
+        language: str,
+        outcome: str,
+        trace_id: int | None = None,
+    ) -> Dict[str, Any]:
+        """Aggiunge la domanda al ledger e ai contatori; restituisce la riga scritta."""
+        session_id = session_id or "default"
+        entry = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "trace_id": trace_id,
+            "session_id": session_id,
+            "language": language,
+            "outcome": outcome,
+            **cost,
+        }
+        counters = _counters(cost)
+        with self._lock:
+            _add_counters(self.totals, counters)
+            _add_counters(self.by_language.setdefault(language, {}), counters)
+            self.by_outcome[outcome] = self.by_outcome.get(outcome, 0) + 1
+            _add_counters(self._by_session.setdefault(session_id, {}), counters)
+            self._by_session.move_to_end(session_id)
+            while len(self._by_session) > self.max_sessions:
+                self._by_session.popitem(last=False)
+            if self._file is not None:
+                self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._file.flush()
+        return entry
+
+    def session_totals(self, session_id: str) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._by_session.get(session_id) or {field: 0 for field in COUNTER_FIELDS})
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "totals": dict(self.totals),
+                "by_language": {language: dict(c) for language, c in self.by_language.items()},
+                "by_outcome": dict(self.by_outcome),
+                "sessions": len(self._by_session),
+            }
+
+
+_ledger: CostLedger | None = None
+_ledger_lock = threading.Lock()
+
+
+def get_cost_ledger() -> CostLedger:
+    global _ledger
+
+    with _ledger_lock:
+        if _ledger is None:
+            path = os.getenv("COST_LEDGER_PATH", ".cache/cost_ledger.jsonl") if _env_flag("COST_LEDGER") else None
+            _ledger = CostLedger(path)
+        return _ledger
+
+
+def empty_request_cost() -> Dict[str, Any]:
+    """Costo di una risposta servita senza backend (es. risposta precalcolata)."""
+    return RequestCost().snapshot()
+
+
+def finish_request_cost(
+    cost: RequestCost,
+    trace: Dict[str, Any] | None,
+    session_id: str | None,
+    language: str,
+    embedding_meter: Any = None,
+) -> Dict[str, Any]:
+    """Chiude la domanda: costo nella trace (se presente) e riga nel ledger.
+
+    Le chiamate di embedding si leggono da ``embedding_meter``, così restano nel
+    costo anche quando la domanda fallisce prima di produrre una trace.
+    """
+    snapshot = cost.snapshot(embedding_meter.snapshot() if embedding_meter is not None else None)
+    if trace is not None:
+        trace["cost"] = snapshot
+    get_cost_ledger().record(snapshot, session_id, language, question_outcome(trace), (trace or {}).get("trace_id"))
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggrega il ledger dei costi per domanda.")
+    parser.add_argument("--path", default=os.getenv("COST_LEDGER_PATH", ".cache/cost_ledger.jsonl"))
+    parser.add_argument("--by", choices=["language", "session_id", "outcome", "day"], default="outcome")
+    parser.add_argument("--since", help="Data ISO (UTC) da cui partire, es. 2026-10-01")
+    args = parser.parse_args()
+
+    groups: Dict[str, Dict[str, int]] = {}
+    with open(args.path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if args.since and entry["ts"] < args.since:
+                continue
+            key = entry["ts"][:10] if args.by == "day" else str(entry.get(args.by))
+            _add_counters(groups.setdefault(key, {}), _counters(entry))
+
+    print("=" * 70)
+    print(f"💰 Ledger costi: {args.path} (per {args.by})")
+    print("=" * 70)
+    totals: Dict[str, int] = {}
+    for key, counters in sorted(groups.items()):
+        _add_counters(totals, counters)
+    for key, counters in [*sorted(groups.items()), ("TOTALE", totals)]:
+        questions = counters.get("questions", 0) or 1
+        print(
+            f"{key:<20} {counters.get('questions', 0):>6} domande · per domanda: "
+            f"{counters.get('llm_calls', 0) / questions:.2f} LLM, "
+            f"{counters.get('input_tokens', 0) / questions:.0f}+{counters.get('output_tokens', 0) / questions:.0f} token, "
+            f"{counters.get('embedding_calls', 0) / questions:.2f} embedding, "
+            f"{counters.get('qdrant_requests', 0) / questions:.2f} Qdrant"
+        )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)
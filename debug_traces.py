@@ -0,0 +1,171 @@
+"""
+Trace di debug compatte con materializzazione pigra del testo dei chunk.
+
+Sul percorso caldo i chatbot registrano solo riferimenti ai chunk
+(collection, ID, score) invece di copiare testo e metadati. Le trace vivono in
+un ring buffer per processo e le sessioni conservano solo il loro ``trace_id``.
+Il testo viene ricostruito solo quando il pannello di debug lo mostra:
+prima dalla cache locale dei chunk (LRU limitata, popolata al momento del
+retrieval con gli oggetti già in memoria, solo per le domande in debug),
+altrimenti dal docstore locale
+della collection (``chunk_docstore.py``) o, senza docstore, dai payload di
+Qdrant.
+
+Le trace contengono solo i dati della domanda (ID, score, flag e tempi),
+senza il testo di domanda e risposta né i contatori di processo (admission,
+breaker, cache, gate), che i chatbot espongono con ``stats()``.
+
+Configurazione tramite variabili d'ambiente:
+- ``DEBUG_TRACE_BUFFER_SIZE`` (default 2000): trace conservate nel processo
+- ``CHUNK_TEXT_CACHE_SIZE`` (default 512): chunk tenuti nella cache locale
+"""
+
+from __future__ import annotations
+
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+
+class ChunkRef(NamedTuple):
+    """Riferimento compatto a un chunk recuperato."""
+
+    collection: str
+    id: str
+    score: float | None
+
+
+class ChunkTextCache:
+    """LRU limitata (collection, id) → (testo, metadati)."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, collection: str, chunk_id: str, text: str, metadata: Dict[str, Any]) -> None:
+        with self._lock:
+            key = (collection, chunk_id)
+            self._entries[key] = (text, metadata)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, collection: str, chunk_id: str) -> Tuple[str, Dict[str, Any]] | None:
+        with self._lock:
+            return self._entries.get((collection, chunk_id))
+
+
+class TraceBuffer:
+    """Ring buffer delle trace di debug del processo, indicizzato per ``trace_id``."""
+
+    def __init__(self, max_traces: int = 2000):
+        self._traces: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._max_traces = max_traces
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, trace: Dict[str, Any]) -> int:
+        with self._lock:
+            trace_id = next(self._ids)
+            trace["trace_id"] = trace_id
+            self._traces[trace_id] = trace
+            while len(self._traces) > self._max_traces:
+                self._traces.popitem(last=False)
+            return trace_id
+
+    def get(self, trace_id: int) -> Dict[str, Any] | None:
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._traces)
+
+
+_chunk_cache = ChunkTextCache(int(os.getenv("CHUNK_TEXT_CACHE_SIZE", "512")))
+_trace_buffer = TraceBuffer(int(os.getenv("DEBUG_TRACE_BUFFER_SIZE", "2000")))
+
+
+def get_trace_buffer() -> TraceBuffer:
+    return _trace_buffer
+
+
+def chunk_refs(chunks: Iterable[Any], collection: str, remember: bool = False) -> List[ChunkRef]:
+    """Riduce i chunk recuperati a riferimenti.
+
+    Con ``remember`` (domanda in debug) il testo finisce anche nella cache
+    locale; senza debug il percorso caldo non copia nulla. I chunk ancora senza
+    testo (docstore, testo non letto) non entrano nella cache: il debug li
+    legge dal docstore quando servono.
+    """
+    refs: List[ChunkRef] = []
+    for chunk in chunks:
+        chunk_id = str(getattr(chunk, "id", ""))
+        text = getattr(chunk, "text", "") or ""
+        if remember and text:
+            _chunk_cache.put(collection, chunk_id, text, getattr(chunk, "metadata", {}) or {})
+        refs.append(ChunkRef(collection, chunk_id, getattr(chunk, "score", None)))
+    return refs
+
+
+def record_trace(trace: Dict[str, Any]) -> Dict[str, Any]:
+    """Inserisce la trace nel ring buffer e la restituisce con il suo ``trace_id``."""
+    _trace_buffer.add(trace)
+    return trace
+
+
+def _get_qdrant_client():
+    from qdrant_config import get_qdrant_client
+
+    return get_qdrant_client()
+
+
+def _point_id(chunk_id: str):
+    return int(chunk_id) if chunk_id.isdigit() else chunk_id
+
+
+def _fetch_missing(collection: str, chunk_ids: List[str]) -> None:
+    from chunk_docstore import get_docstore
+    from qdrant_config import operation_timeout
+    from retrieval import chunk_from_point
+
+    client = _get_qdrant_client()
+    docstore = get_docstore(client, collection)
+    if docstore is not None:
+        for chunk_id, (text, metadata) in docstore.records(chunk_ids).items():
+            _chunk_cache.put(collection, chunk_id, text, metadata)
+        return
+    points = client.retrieve(
+        collection_name=collection,
+        ids=[_point_id(chunk_id) for chunk_id in chunk_ids],
+        with_payload=True,
+        with_vectors=False,
+        timeout=operation_timeout("retrieve"),
+    )
+    for point in points:
+        chunk = chunk_from_point(point)
+        _chunk_cache.put(collection, chunk.id, chunk.text, chunk.metadata)
+
+
+def materialize_chunks(refs: Iterable[ChunkRef]) -> List[Dict[str, Any]]:
+    """Ricostruisce i preview (id, score, metadata, text) per il pannello di debug."""
+    refs = list(refs)
+    missing: Dict[str, List[str]] = {}
+    for ref in refs:
+        if _chunk_cache.get(ref.collection, ref.id) is None:
+            missing.setdefault(ref.collection, []).append(ref.id)
+
+    for collection, chunk_ids in missing.items():
+        try:
+            _fetch_missing(collection, chunk_ids)
+        except Exception as exc:
+            print(f"⚠ Impossibile recuperare i chunk di debug da '{collection}': {exc}")
+
+    previews: List[Dict[str, Any]] = []
+    for ref in refs:
+        text, metadata = _chunk_cache.get(ref.collection, ref.id) or ("", {})
+        previews.append({"id": ref.id, "score": ref.score, "metadata": metadata, "text": text})
+    return previews
@@ -0,0 +1,109 @@
+"""
+Costruzione differita dei componenti pesanti dei chatbot.
+
+I client (Gemini, embedder, Qdrant) e le pipeline non vengono creati nel
+costruttore ma al primo utilizzo, oppure in un thread di background avviato
+subito dopo la creazione del chatbot (``start_warm_up``). Così l'avvio di
+``app.py`` e dei chatbot da terminale non paga import dei SDK, handshake di
+rete e la verifica della collection Qdrant prima di mostrare l'interfaccia.
+
+Dopo la costruzione, ``_warm_connections()`` apre le connessioni ai backend
+con richieste di prova (embed e ricerca), così la prima domanda non paga gli
+handshake TLS; il chatbot risulta pronto (``is_ready``) solo a probe concluse.
+Un probe fallito viene segnalato ma non blocca il chatbot. Se invece fallisce
+la costruzione, l'errore resta in ``setup_error`` (e in ``health()``) finché un
+nuovo tentativo non riesce, così l'interfaccia può mostrarlo subito.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict
+
+# Testo degli embed di prova del warm-up
+WARMUP_PROBE_TEXT = "Datapizza-AI warm-up probe."
+
+
+def _env_flag(name: str, default: str = "1") -> bool:
+    return os.getenv(name, default).lower() in {"1", "true", "yes", "on"}
+
+
+class DeferredSetup(ABC):
+    """Mixin: ``_setup()`` viene eseguito una sola volta, al primo ``warm_up()``."""
+
+    _setup_lock: threading.Lock
+    _setup_done: bool = False
+    setup_ms: float | None = None
+    connections_ms: float | None = None
+    setup_error: str | None = None
+
+    def _init_deferred_setup(self) -> None:
+        self._setup_lock = threading.Lock()
+        self._setup_done = False
+        self.setup_ms = None
+        self.connections_ms = None
+        self.setup_error = None
+
+    @abstractmethod
+    def _setup(self) -> None:
+        """Costruisce client e pipeline del chatbot."""
+
+    def _warm_connections(self) -> None:
+        """Richieste di prova verso i backend (default: nessuna)."""
+
+    def warm_up(self) -> None:
+        """Costruisce i componenti se non è già stato fatto (bloccante, thread-safe).
+
+        Se la costruzione fallisce l'errore viene propagato e la chiamata
+        successiva ritenta da capo.
+        """
+        if self._setup_done:
+            return
+        with self._setup_lock:
+            if self._setup_done:
+                return
+            started = time.perf_counter()
+            try:
+                self._setup()
+            except Exception as exc:
+                self.setup_error = f"{type(exc).__name__}: {exc}"
+                raise
+            self.setup_error = None
+            self.setup_ms = round((time.perf_counter() - started) * 1000, 1)
+            if _env_flag("WARMUP_CONNECTIONS"):
+                started = time.perf_counter()
+                try:
+                    self._warm_connections()
+                except Exception as exc:
+                    print(f"⚠ Connessioni di prova non riuscite (verranno aperte alla prima domanda): {exc}")
+                self.connections_ms = round((time.perf_counter() - started) * 1000, 1)
+            self._setup_done = True
+
+    def start_warm_up(self) -> threading.Thread:
+        """Avvia ``warm_up()`` in un thread daemon; gli errori vengono ripresentati alla prima domanda."""
+
+        def _run():
+            try:
+                self.warm_up()
+            except Exception as exc:
+                print(f"⚠ Inizializzazione in background non riuscita (verrà ritentata): {exc}")
+
+        thread = threading.Thread(target=_run, name=f"{type(self).__name__}-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def is_ready(self) -> bool:
+        return self._setup_done
+
+    def health(self) -> Dict[str, Any]:
+        """Stato dell'inizializzazione (pronto, tempi, ultimo errore di costruzione)."""
+        return {
+            "ready": self._setup_done,
+            "setup_ms": self.setup_ms,
+            "connections_ms": self.connections_ms,
+            "error": self.setup_error,
+        }
@@ -0,0 +1,259 @@
+"""
+Spazi di embedding delle collection e misura delle chiamate di embedding.
+
+Ogni collection è indicizzata in uno "spazio" (provider, modello, dimensione):
+le FAQ con Gemini (``gemini-embedding-001``), la documentazione ufficiale con
+OpenAI (``text-embedding-3-small``). Se i due spazi coincidono, ad esempio
+dopo aver migrato una collection con ``reembed_collection.py``, la domanda
+viene embeddata una sola volta e lo stesso vettore interroga entrambe le
+collection.
+
+Se ``dimensions`` è impostata e il modello restituisce vettori più lunghi,
+i vettori vengono troncati e rinormalizzati (entrambi i modelli sono addestrati
+con Matryoshka Representation Learning), sia in ingestion sia in query.
+
+``EmbeddingMeter`` conta chiamate e latenza degli embedding della richiesta
+corrente (via contextvar, propagata anche ad ``asyncio.to_thread``).
+
+Con ``build_embedder(space, cache=True)`` (embedder usati a query time) i
+vettori passano dalla cache ``embeddings`` di ``shared_cache``, nel namespace
+dello spazio: un testo già embeddato da questo o da un altro worker non
+chiama il provider e non viene contato dal meter.
+
+Configurazione tramite variabili d'ambiente:
+- ``FAQ_EMBEDDING_PROVIDER`` (default ``google``), ``FAQ_EMBEDDING_MODEL``, ``FAQ_EMBEDDING_DIM``
+- ``OFFICIAL_DOCS_EMBED_PROVIDER`` (default ``openai``), ``OFFICIAL_DOCS_EMBED_MODEL``,
+  ``OFFICIAL_DOCS_EMBEDDING_DIM``
+- ``EMBEDDING_MAX_BATCH`` (default 100): testi per richiesta di embedding (limite di Gemini)
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import inspect
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+
+from llm_cassette import cassette_api_key, with_cassette
+from shared_cache import get_cache, vector_codec
+
+PROVIDER_API_KEYS = {"google": "GOOGLE_API_KEY", "openai": "OPENAI_API_KEY"}
+# Gemini accetta al più 100 testi per richiesta e gli embedder non spezzano i batch
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "100"))
+
+
+@dataclass(frozen=True)
+class EmbeddingSpace:
+    """Provider, modello e dimensione (None = nativa) con cui è indicizzata una collection."""
+
+    provider: str
+    model: str
+    dimensions: int | None = None
+
+    @property
+    def api_key_env(self) -> str:
+        return PROVIDER_API_KEYS[self.provider]
+
+    @property
+    def label(self) -> str:
+        return f"{self.provider}:{self.model}" + (f"@{self.dimensions}" if self.dimensions else "")
+
+
+def _optional_int(value: str | None) -> int | None:
+    return int(value) if value else None
+
+
+def faq_space() -> EmbeddingSpace:
+    return EmbeddingSpace(
+        provider=os.getenv("FAQ_EMBEDDING_PROVIDER", "google"),
+        model=os.getenv("FAQ_EMBEDDING_MODEL", "gemini-embedding-001"),
+        dimensions=_optional_int(os.getenv("FAQ_EMBEDDING_DIM")),
+    )
+
+
+def official_docs_space() -> EmbeddingSpace:
+    return EmbeddingSpace(
+        provider=os.getenv("OFFICIAL_DOCS_EMBED_PROVIDER", "openai"),
+        model=os.getenv("OFFICIAL_DOCS_EMBED_MODEL", "text-embedding-3-small"),
+        dimensions=_optional_int(os.getenv("OFFICIAL_DOCS_EMBEDDING_DIM")),
+    )
+
+
+def shared_embedding_space() -> bool:
+    """True se FAQ e documentazione ufficiale condividono modello e dimensione."""
+    return faq_space() == official_docs_space()
+
+
+def fit_dimensions(vector: List[float], dimensions: int | None) -> List[float]:
+    """Tronca il vettore a ``dimensions`` e lo rinormalizza (no-op se già della dimensione giusta)."""
+    if not dimensions or len(vector) <= dimensions:
+        return vector
+    truncated = vector[:dimensions]
+    norm = math.sqrt(sum(value * value for value in truncated)) or 1.0
+    return [value / norm for value in truncated]
+
+
+def _fit_output(result: Any, dimensions: int | None) -> Any:
+    if not dimensions or not isinstance(result, list) or not result:
+        return result
+    if isinstance(result[0], list):
+        return [fit_dimensions(vector, dimensions) for vector in result]
+    return fit_dimensions(result, dimensions)
+
+
+class EmbeddingMeter:
+    """Chiamate e latenza di embedding di una richiesta, per provider."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+        self.ms: Dict[str, float] = {}
+
+    def record(self, provider: str, elapsed_ms: float) -> None:
+        with self._lock:
+            self.calls[provider] = self.calls.get(provider, 0) + 1
+            self.ms[provider] = self.ms.get(provider, 0.0) + elapsed_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": sum(self.calls.values()),
+                "ms": round(sum(self.ms.values()), 1),
+                "by_provider": {
+                    provider: {"calls": calls, "ms": round(self.ms[provider], 1)}
+                    for provider, calls in self.calls.items()
+                },
+            }
+
+
+_current_meter: contextvars.ContextVar[EmbeddingMeter | None] = contextvars.ContextVar(
+    "embedding_meter", default=None
+)
+
+
+def start_embedding_meter() -> EmbeddingMeter:
+    """Crea il meter della richiesta corrente (contesto del task asyncio o del thread)."""
+    meter = EmbeddingMeter()
+    _current_meter.set(meter)
+    return meter
+
+
+def _wrap_embed(func: Callable, provider: str, dimensions: int | None) -> Callable:
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return _fit_output(await func(*args, **kwargs), dimensions)
+            finally:
+                meter = _current_meter.get()
+                if meter is not None:
+                    meter.record(provider, (time.perf_counter() - started) * 1000)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return _fit_output(func(*args, **kwargs), dimensions)
+        finally:
+            meter = _current_meter.get()
+            if meter is not None:
+                meter.record(provider, (time.perf_counter() - started) * 1000)
+    return wrapper
+
+
+def _cacheable_texts(args: tuple, kwargs: dict) -> List[str] | None:
+    """Testi di una chiamata ``embed(text)`` / ``embed([testi])``; None se la chiamata non è cacheabile."""
+    if len(args) != 1 or kwargs:
+        return None
+    texts = args[0]
+    if isinstance(texts, str):
+        return [texts]
+    if isinstance(texts, list) and texts and all(isinstance(text, str) for text in texts):
+        return texts
+    return None
+
+
+def _wrap_cache(func: Callable, space: EmbeddingSpace) -> Callable:
+    """Legge i vettori dalla cache; se ne manca anche uno la chiamata originale resta invariata.
+
+    Un batch parzialmente in cache viene embeddato per intero: le chiamate al
+    provider restano identiche a quelle registrate nelle cassette.
+    """
+    cache = get_cache("embeddings", vector_codec())
+
+    def _lookup(texts: List[str]) -> Dict[str, List[float]] | None:
+        found = cache.get_many(space.label, texts)
+        return found if len(found) == len(set(texts)) else None
+
+    def _result(args: tuple, texts: List[str], found: Dict[str, List[float]]) -> Any:
+        return found[texts[0]] if isinstance(args[0], str) else [found[text] for text in texts]
+
+    def _store(args: tuple, texts: List[str], result: Any) -> None:
+        vectors = [result] if isinstance(args[0], str) else result
+        if isinstance(vectors, list) and len(vectors) == len(texts):
+            cache.put_many(space.label, dict(zip(texts, vectors)))
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            texts = _cacheable_texts(args, kwargs)
+            if texts is None:
+                return await func(*args, **kwargs)
+            found = _lookup(texts)
+            if found is not None:
+                return _result(args, texts, found)
+            result = await func(*args, **kwargs)
+            _store(args, texts, result)
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        texts = _cacheable_texts(args, kwargs)
+        if texts is None:
+            return func(*args, **kwargs)
+        found = _lookup(texts)
+        if found is not None:
+            return _result(args, texts, found)
+        result = func(*args, **kwargs)
+        _store(args, texts, result)
+        return result
+    return wrapper
+
+
+def build_embedder(space: EmbeddingSpace, cache: bool = False) -> Any:
+    """Embedder del provider dello spazio, con cassetta, misura e adattamento della dimensione.
+
+    Con ``cache=True`` i vettori sono letti e scritti nella cache condivisa
+    (da usare a query time; l'ingestion embedda testi che non si ripetono).
+    """
+    api_key = cassette_api_key(space.api_key_env)
+    if not api_key:
+        raise RuntimeError(f"{space.api_key_env} non configurata: impossibile creare l'embedder {space.label}.")
+
+    if space.provider == "google":
+        from datapizza.embedders.google import GoogleEmbedder
+
+        embedder = GoogleEmbedder(api_key=api_key, model_name=space.model)
+    elif space.provider == "openai":
+        from datapizza.embedders.openai.openai import OpenAIEmbedder
+
+        embedder = OpenAIEmbedder(api_key=api_key, model_name=space.model)
+    else:
+        raise ValueError(f"Provider di embedding non supportato: {space.provider}")
+
+    # Il namespace della cassetta resta quello storico (google_embedder / openai_embedder)
+    embedder = with_cassette(embedder, f"{space.provider}_embedder")
+    for method in ("embed", "a_embed"):
+        func = getattr(embedder, method, None)
+        if func is not None and callable(func):
+            wrapped = _wrap_embed(func, space.provider, space.dimensions)
+            setattr(embedder, method, _wrap_cache(wrapped, space) if cache else wrapped)
+    return embedder
@@ -1,33 +1,95 @@
 """
 Script per l'ingestion delle FAQ nel vector store.
 Processa i file markdown delle FAQ e li inserisce in Qdrant.
-Utilizza Google Embedder per generare gli embeddings.
+Utilizza l'embedder dello spazio delle FAQ (Google Embedder di default, vedi
+``embeddings.py``) per generare gli embeddings.
+
+L'ingestion è in streaming: i file vengono letti per sezioni, splittati
+incrementalmente e i chunk arrivano all'embedder e a Qdrant in batch di
+dimensione fissa, così la memoria non cresce con la dimensione del corpus.
+
+Ogni esecuzione scrive in una nuova collection versionata e, dopo una ricerca
+di controllo, sposta atomicamente l'alias ``COLLECTION_NAME`` su di essa
+(vedi ``collection_aliases.py``): il chatbot continua a servire la versione
+precedente per tutta la durata dell'ingestion.
+
+Con ``--docstore`` (o ``FAQ_DOCSTORE=1``) testo e metadati completi dei chunk
+e dei parent vanno nel docstore locale della versione (``chunk_docstore.py``)
+e Qdrant conserva solo vettori e metadati filtrabili: le ricerche restituiscono
+ID e score e il testo si legge in locale solo per i chunk del prompt.
 """
 
+import argparse
+import fnmatch
 import os
+import re
+import time
+import uuid
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Sequence, Tuple
 
 from dotenv import load_dotenv
-from qdrant_client import models as qdrant_models
 
 from datapizza.core.vectorstore import VectorConfig
 from datapizza.embedders import ChunkEmbedder
-from datapizza.embedders.google import GoogleEmbedder
 from datapizza.modules.parsers import TextParser
 from datapizza.modules.splitters import NodeSplitter
-from datapizza.pipeline import IngestionPipeline
+from datapizza.type import Chunk
+from qdrant_client import models as qdrant_models
 
-from qdrant_config import COLLECTION_NAME, build_qdrant_vectorstore, describe_qdrant_target
+from chunk_docstore import DOCSTORE_FLAG, DocstoreWriter, docstore_enabled, get_docstore
+from collection_aliases import (
+    KEEP_VERSIONS,
+    discard_version,
+    new_version_name,
+    promote_version,
+    prune_versions,
+    resolve_alias,
+    smoke_search,
+)
+from context_compression import compression_enabled, precompute_sentence_embeddings
+from embeddings import EMBEDDING_MAX_BATCH, build_embedder, faq_space
+from llm_cassette import cassette_api_key
+from qdrant_config import (
+    COLLECTION_NAME,
+    describe_qdrant_target,
+    get_qdrant_vectorstore,
+)
+from retrieval import PARENT_KIND
 
 # Carica variabili d'ambiente
 load_dotenv()
 
-EMBEDDING_MODEL = os.getenv("FAQ_EMBEDDING_MODEL", "gemini-embedding-001")
 EMBEDDING_DIM_OVERRIDE = os.getenv("FAQ_EMBEDDING_DIM")
 SCRIPTS_DIR = "Scripts"
 
-
-def _detect_embedding_dimension(embedder_client: GoogleEmbedder) -> int:
-    """Calcola dinamicamente la dimensione degli embedding generati dal client Google."""
+# Radici (file o directory) da indicizzare, separate da virgola
+INGEST_ROOTS = os.getenv("FAQ_INGEST_ROOTS", f"datapizza_faq.md,FAQ_Video.md,{SCRIPTS_DIR}")
+INGEST_INCLUDE = os.getenv("FAQ_INGEST_INCLUDE", "*.md")
+INGEST_EXCLUDE = os.getenv("FAQ_INGEST_EXCLUDE", "")
+INGEST_BATCH_SIZE = int(os.getenv("FAQ_INGEST_BATCH_SIZE", "64"))
+# Dimensione indicativa delle sezioni lette da disco prima dello split
+INGEST_SECTION_CHARS = int(os.getenv("FAQ_INGEST_SECTION_CHARS", "8000"))
+SPLITTER_MAX_CHARS = 2000
+VECTOR_NAME = "embedding"
+
+# "parent": si indicizzano span figli brevi, le sezioni da 2000 caratteri restano
+# come parent senza vettore; "flat": si indicizzano direttamente le sezioni
+CHUNKING_MODES = ("parent", "flat")
+CHUNKING = os.getenv("FAQ_CHUNKING", "parent")
+CHILD_MAX_CHARS = int(os.getenv("FAQ_CHILD_MAX_CHARS", "400"))
+
+# Lingue riconosciute nei documenti (front matter, suffisso del nome o cartella)
+INGEST_LANGUAGES = ("it", "en", "de")
+INGEST_DEFAULT_LANGUAGE = os.getenv("FAQ_INGEST_DEFAULT_LANGUAGE", "it")
+_FRONT_MATTER_LANGUAGE = re.compile(r"^\s*(?:lang|language)\s*:\s*[\"']?([A-Za-z]{2})\b", re.IGNORECASE)
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _detect_embedding_dimension(embedder_client: Any) -> int:
+    """Calcola dinamicamente la dimensione degli embedding generati dall'embedder."""
     probe_text = "Datapizza-AI FAQ dimension probe."
     vector = embedder_client.embed(probe_text)
 
@@ -38,158 +100,459 @@ def _detect_embedding_dimension(embedder_client: GoogleEmbedder) -> int:
             return len(vector[0])
 
     raise ValueError(
-        "Impossibile determinare la dimensione degli embedding restituiti da Google Embedder."
+        "Impossibile determinare la dimensione degli embedding restituiti dall'embedder."
     )
 
 
-def _gather_faq_files() -> list[str]:
-    """Restituisce la lista dei file FAQ da processare, includendo eventuali script."""
-    faq_files = [
-        "datapizza_faq.md",
-        "FAQ_Video.md",
-    ]
+def _split_patterns(value: str | Sequence[str] | None) -> List[str]:
+    """Normalizza una lista di glob (stringa separata da virgole o sequenza)."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [pattern.strip() for pattern in value if pattern.strip()]
 
-    if os.path.isdir(SCRIPTS_DIR):
-        for filename in sorted(os.listdir(SCRIPTS_DIR)):
-            path = os.path.join(SCRIPTS_DIR, filename)
-            if os.path.isfile(path) and filename.lower().endswith(".md"):
-                faq_files.append(path)
 
-    return faq_files
+def _matches_any(path: str, patterns: Sequence[str]) -> bool:
+    """Verifica se il percorso (o il solo nome file) corrisponde a uno dei glob."""
+    normalized = path.replace(os.sep, "/")
+    filename = os.path.basename(path)
+    return any(
+        fnmatch.fnmatch(normalized, pattern) or fnmatch.fnmatch(filename, pattern)
+        for pattern in patterns
+    )
 
 
-def _detect_language_from_path(path: str) -> str:
-    """Deduce la lingua dal percorso del file (Scripts considerato inglese)."""
-    normalized = os.path.normpath(path)
-    first_segment = normalized.split(os.sep)[0].lower()
-    if first_segment == SCRIPTS_DIR.lower():
-        return "en"
-    return "it"
+def iter_document_paths(
+    roots: str | Sequence[str] | None = None,
+    include: str | Sequence[str] | None = None,
+    exclude: str | Sequence[str] | None = None,
+) -> Iterator[str]:
+    """Percorre ricorsivamente le radici indicate restituendo i file da indicizzare.
+
+    I file passati esplicitamente come radice vengono sempre inclusi (se esistono);
+    quelli trovati nelle directory devono corrispondere ad almeno un glob di
+    ``include`` e a nessuno di ``exclude``.
+    """
+    root_list = _split_patterns(roots if roots is not None else INGEST_ROOTS)
+    include_patterns = _split_patterns(include if include is not None else INGEST_INCLUDE)
+    exclude_patterns = _split_patterns(exclude if exclude is not None else INGEST_EXCLUDE)
+
+    for root in root_list:
+        if os.path.isfile(root):
+            if not _matches_any(root, exclude_patterns):
+                yield root
+            continue
 
-def _extract_vector_dimensions(collection_info: qdrant_models.CollectionInfo) -> dict[str, int]:
-    """Return the dense vector dimensions configured on the collection."""
-    dims: dict[str, int] = {}
-    vectors_cfg = collection_info.config.params.vectors
+        if not os.path.isdir(root):
+            print(f"⚠ Percorso non trovato: {root}")
+            continue
 
-    if isinstance(vectors_cfg, qdrant_models.VectorParams):
-        dims["default"] = vectors_cfg.size
-    elif isinstance(vectors_cfg, dict):
-        for name, params in vectors_cfg.items():
-            if isinstance(params, qdrant_models.VectorParams):
-                dims[name] = params.size
-    return dims
+        for dirpath, dirnames, filenames in os.walk(root):
+            # Ordine deterministico e pruning delle directory escluse
+            dirnames[:] = sorted(
+                name for name in dirnames
+                if not _matches_any(os.path.join(dirpath, name), exclude_patterns)
+            )
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                if include_patterns and not _matches_any(path, include_patterns):
+                    continue
+                if _matches_any(path, exclude_patterns):
+                    continue
+                yield path
 
 
-def setup_vectorstore(embedding_dim: int):
-    """Configura e crea la collection nel vector store con la dimensione richiesta dagli embedding."""
-    vectorstore = build_qdrant_vectorstore()
+def _gather_faq_files() -> list[str]:
+    """Restituisce la lista dei file FAQ da processare, includendo eventuali script."""
+    return list(iter_document_paths())
 
-    client = vectorstore.get_client()
 
-    print(f"🔗 Target Qdrant: {describe_qdrant_target()}")
+def _is_scripts_path(path: str) -> bool:
+    return os.path.normpath(path).split(os.sep)[0].lower() == SCRIPTS_DIR.lower()
 
+
+def _front_matter_language(path: str) -> str | None:
+    """Lingua dichiarata nel front matter YAML (``language:`` o ``lang:``), se presente."""
     try:
-        if client.collection_exists(COLLECTION_NAME):
-            info = client.get_collection(COLLECTION_NAME)
-            configured_dims = _extract_vector_dimensions(info)
-            current_dim = configured_dims.get("embedding") or configured_dims.get("default")
+        with open(path, "r", encoding="utf-8") as f:
+            if f.readline().strip() != "---":
+                return None
+            for line in islice(f, 50):
+                if line.strip() == "---":
+                    return None
+                match = _FRONT_MATTER_LANGUAGE.match(line)
+                if match:
+                    return match.group(1).lower()
+    except (OSError, UnicodeDecodeError):
+        return None
+    return None
 
-            if current_dim == embedding_dim:
-                print(f"✓ Collection '{COLLECTION_NAME}' già esistente con {embedding_dim} dimensioni")
-            else:
-                print(
-                    f"⚠ Collection '{COLLECTION_NAME}' trovata con {current_dim} dimensioni: ricreo con {embedding_dim}"
-                )
-                vectorstore.delete_collection(COLLECTION_NAME)
-                vectorstore.create_collection(
-                    COLLECTION_NAME,
-                    vector_config=[VectorConfig(name="embedding", dimensions=embedding_dim)]
-                )
-                print(f"✓ Collection '{COLLECTION_NAME}' ricreata con successo ({embedding_dim} dimensioni)")
-        else:
-            vectorstore.create_collection(
-                COLLECTION_NAME,
-                vector_config=[VectorConfig(name="embedding", dimensions=embedding_dim)]
-            )
-            print(f"✓ Collection '{COLLECTION_NAME}' creata con successo ({embedding_dim} dimensioni)")
+
+def _detect_language_from_path(path: str) -> str:
+    """Lingua del documento: front matter, poi suffisso (``nome.en.md``), cartella, Scripts.
+
+    Senza indicazioni si usa ``FAQ_INGEST_DEFAULT_LANGUAGE``; gli Scripts sono in inglese.
+    """
+    language = _front_matter_language(path)
+    if language in INGEST_LANGUAGES:
+        return language
+    name_parts = os.path.basename(path).lower().split(".")
+    if len(name_parts) > 2 and name_parts[-2] in INGEST_LANGUAGES:
+        return name_parts[-2]
+    for segment in reversed(os.path.normpath(path).lower().split(os.sep)[:-1]):
+        if segment in INGEST_LANGUAGES:
+            return segment
+    if _is_scripts_path(path):
+        return "en"
+    return INGEST_DEFAULT_LANGUAGE
+
+def setup_vectorstore(embedding_dim: int, collection_name: str):
+    """Crea la collection fisica ``collection_name`` (nuova versione dietro l'alias) con la dimensione degli embedding."""
+    vectorstore = get_qdrant_vectorstore()
+
+    print(f"🔗 Target Qdrant: {describe_qdrant_target()}")
+
+    try:
+        vectorstore.create_collection(
+            collection_name,
+            vector_config=[VectorConfig(name=VECTOR_NAME, dimensions=embedding_dim)]
+        )
+        print(f"✓ Collection '{collection_name}' creata con successo ({embedding_dim} dimensioni)")
     except Exception as e:
         print(f"✗ Errore nella configurazione della collection: {e}")
         raise
     
     return vectorstore
 
-def create_ingestion_pipeline(vectorstore, embedder_client: GoogleEmbedder):
-    """Crea la pipeline di ingestion con Google Embedder."""
-    
-    # Crea la pipeline
-    ingestion_pipeline = IngestionPipeline(
-        modules=[
-            TextParser(),  # Parser per file markdown
-            NodeSplitter(max_char=2000),  # Split in chunks più grandi per non spezzare Q&A
-            ChunkEmbedder(client=embedder_client),  # Genera embeddings
-        ],
-        vector_store=vectorstore,
-        collection_name=COLLECTION_NAME
+def _document_metadata(path: str) -> dict:
+    """Costruisce i metadati associati a tutti i chunk di un file."""
+    language = _detect_language_from_path(path)
+    category = "scripts" if _is_scripts_path(path) else "faq"
+    metadata = {
+        "source": path,
+        "type": category,
+        "language": language,
+    }
+
+    if category == "scripts":
+        # Deriva un topic leggibile dal nome file
+        filename = os.path.splitext(os.path.basename(path))[0]
+        metadata["topic"] = filename.replace("_", " ").replace("-", " ").strip()
+
+    return metadata
+
+
+def iter_file_sections(path: str, max_chars: int = INGEST_SECTION_CHARS) -> Iterator[str]:
+    """Legge un file riga per riga restituendo sezioni di dimensione limitata.
+
+    Le sezioni vengono chiuse preferibilmente su un heading markdown, così le
+    coppie domanda/risposta non vengono spezzate; se un blocco senza heading
+    supera il doppio del limite viene chiuso comunque a fine riga.
+    """
+    buffer: List[str] = []
+    size = 0
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            is_heading = line.startswith("#")
+            if buffer and (
+                (is_heading and size >= max_chars) or size + len(line) > 2 * max_chars
+            ):
+                yield "".join(buffer)
+                buffer, size = [], 0
+
+            # Righe patologicamente lunghe (es. file minificati) vengono spezzate
+            while len(line) > 2 * max_chars:
+                yield line[: 2 * max_chars]
+                line = line[2 * max_chars:]
+
+            buffer.append(line)
+            size += len(line)
+
+    if buffer:
+        text = "".join(buffer)
+        if text.strip():
+            yield text
+
+
+def iter_chunks(
+    paths: Iterable[str],
+    parser: TextParser | None = None,
+    splitter: NodeSplitter | None = None,
+    max_section_chars: int = INGEST_SECTION_CHARS,
+    stats: dict | None = None,
+) -> Iterator[Chunk]:
+    """Genera i chunk di tutti i documenti, una sezione alla volta.
+
+    Un file che non si riesce a leggere o a splittare viene saltato; con
+    ``stats`` vengono contati i file processati (``files``) e quelli falliti
+    (``failed_files``, percorsi in ``failed_paths``).
+    """
+    parser = parser or TextParser()  # Parser per file markdown
+    # Chunk grandi per non spezzare le Q&A
+    splitter = splitter or NodeSplitter(max_char=SPLITTER_MAX_CHARS)
+
+    for path in paths:
+        metadata = _document_metadata(path)
+        try:
+            print(f"📄 Processando {path}...")
+            for section in iter_file_sections(path, max_section_chars):
+                if not section.strip():
+                    continue
+                # Il TextParser si aspetta una stringa, non un filepath
+                node = parser.parse(section, metadata=dict(metadata))
+                yield from splitter.split(node)
+        except Exception as e:
+            if stats is not None:
+                stats["failed_files"] += 1
+                stats["failed_paths"].append(path)
+            print(f"✗ Errore nel processare {path}: {e}")
+            import traceback
+            traceback.print_exc()
+        else:
+            if stats is not None:
+                stats["files"] += 1
+
+
+def _stripped_span(text: str, start: int, end: int) -> Iterator[Tuple[int, int]]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start < end:
+        yield start, end
+
+
+def _split_spans(text: str, separator: re.Pattern, start: int, end: int) -> Iterator[Tuple[int, int]]:
+    """Segmenti non vuoti di ``text[start:end]`` tra i separatori, con offset assoluti."""
+    position = start
+    for match in separator.finditer(text, start, end):
+        yield from _stripped_span(text, position, match.start())
+        position = match.end()
+    yield from _stripped_span(text, position, end)
+
+
+def child_spans(text: str, max_chars: int = CHILD_MAX_CHARS) -> List[Tuple[int, int]]:
+    """Span (inizio, fine) dei figli di un parent: paragrafi, o frasi se il paragrafo è lungo.
+
+    Segmenti brevi consecutivi (ad es. un heading e la sua risposta) vengono
+    uniti finché restano entro ``max_chars``.
+    """
+    pieces: List[Tuple[int, int]] = []
+    for start, end in _split_spans(text, _PARAGRAPH_BREAK, 0, len(text)):
+        if end - start <= max_chars:
+            pieces.append((start, end))
+            continue
+        for sentence_start, sentence_end in _split_spans(text, _SENTENCE_END, start, end):
+            # Frasi più lunghe del limite (codice, elenchi senza punteggiatura): tagliate a misura
+            while sentence_end - sentence_start > max_chars:
+                pieces.append((sentence_start, sentence_start + max_chars))
+                sentence_start += max_chars
+            pieces.append((sentence_start, sentence_end))
+
+    merged: List[Tuple[int, int]] = []
+    for start, end in pieces:
+        if merged and end - merged[-1][0] <= max_chars:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def split_parent(parent: Chunk, max_chars: int = CHILD_MAX_CHARS) -> List[Chunk]:
+    """Chunk figli di un parent, con ``parent_id`` e offset dello span nei metadati."""
+    parent_id = str(parent.id)
+    return [
+        Chunk(
+            id=str(uuid.uuid4()),
+            text=parent.text[start:end],
+            metadata={**(parent.metadata or {}), "parent_id": parent_id, "span_start": start, "span_end": end},
+        )
+        for start, end in child_spans(parent.text, max_chars)
+    ]
+
+
+def _parent_point(parent: Chunk) -> qdrant_models.PointStruct:
+    """Parent come punto senza vettore: non compare nelle ricerche, si recupera per ID."""
+    return qdrant_models.PointStruct(
+        id=str(parent.id),
+        vector={},
+        payload={"text": parent.text, "metadata": {**(parent.metadata or {}), "kind": PARENT_KIND}},
     )
-    
-    return ingestion_pipeline
 
-def ingest_documents(pipeline, faq_files):
-    """Processa e ingerisce i documenti FAQ."""
-    for faq_file in faq_files:
-        if not os.path.exists(faq_file):
-            print(f"⚠ File non trovato: {faq_file}")
-            continue
-        
+
+def _batched(items: Iterable[Chunk], size: int) -> Iterator[List[Chunk]]:
+    """Raggruppa un iterabile in liste di al più ``size`` elementi."""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def ingest_documents(
+    vectorstore,
+    embedder_client: Any,
+    faq_files: Iterable[str],
+    batch_size: int = INGEST_BATCH_SIZE,
+    collection_name: str = COLLECTION_NAME,
+    chunking: str = CHUNKING,
+    child_max_chars: int = CHILD_MAX_CHARS,
+    sentence_cache: bool = True,
+    docstore: DocstoreWriter | None = None,
+) -> dict:
+    """Processa e ingerisce i documenti in streaming, un batch di chunk alla volta.
+
+    In modalità ``parent`` ogni batch di sezioni diventa un batch di span figli
+    (embeddati e indicizzati) più i parent senza vettore. Con ``sentence_cache``
+    le frasi dei testi che finiranno nel prompt (sezioni o parent) vengono
+    embeddate nella cache usata dalla compressione del contesto. Con ``docstore``
+    testo e metadati vanno nel docstore locale: i parent non vengono scritti in
+    Qdrant e i punti indicizzati hanno il payload senza testo.
+
+    Returns:
+        Statistiche dell'ingestion (chunk indicizzati, parent, file e batch
+        falliti, durata) e il testo del primo chunk scritto, usato per la ricerca di controllo.
+    """
+    # Genera embeddings: in modalità parent un batch di sezioni diventa centinaia di span
+    chunk_embedder = ChunkEmbedder(client=embedder_client, batch_size=EMBEDDING_MAX_BATCH)
+    stats = {
+        "chunks": 0,
+        "parents": 0,
+        "sentences": 0,
+        "batches": 0,
+        "files": 0,
+        "failed_files": 0,
+        "failed_paths": [],
+        "failed_batches": 0,
+        "failed_sentence_batches": 0,
+        "seconds": 0.0,
+        "probe_text": None,
+    }
+    space = faq_space()
+    started = time.perf_counter()
+
+    for batch in _batched(iter_chunks(faq_files, stats=stats), batch_size):
         try:
-            print(f"📄 Processando {faq_file}...")
-            
-            # Leggi il contenuto del file
-            with open(faq_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            language = _detect_language_from_path(faq_file)
-            category = "scripts" if language == "en" else "faq"
-            subtopic = None
-
-            if category == "scripts":
-                # Deriva un topic leggibile dal nome file
-                filename = os.path.splitext(os.path.basename(faq_file))[0]
-                subtopic = filename.replace("_", " ").replace("-", " ").strip()
-            
-            # Il TextParser si aspetta una stringa, non un filepath
-            pipeline.run(
-                content, 
-                metadata={
-                    "source": faq_file,
-                    "type": category,
-                    "language": language,
-                    **({"topic": subtopic} if subtopic else {}),
-                }
-            )
-            print(f"✓ {faq_file} processato con successo ({language.upper()})")
+            if chunking == "parent":
+                indexed = [child for parent in batch for child in split_parent(parent, child_max_chars)]
+                if docstore is not None:
+                    for parent in batch:
+                        docstore.add(parent.id, parent.text, {**(parent.metadata or {}), "kind": PARENT_KIND})
+                else:
+                    vectorstore.get_client().upsert(
+                        collection_name=collection_name,
+                        points=[_parent_point(parent) for parent in batch],
+                        wait=True,
+                    )
+                stats["parents"] += len(batch)
+            else:
+                indexed = batch
+            embedded = chunk_embedder.embed(indexed)
+            prompt_texts = [chunk.text for chunk in batch]
+            if stats["probe_text"] is None:
+                stats["probe_text"] = indexed[0].text
+            if docstore is not None:
+                # In Qdrant restano vettore e metadati filtrabili
+                for chunk in embedded:
+                    docstore.add(chunk.id, chunk.text, chunk.metadata)
+                    chunk.text = ""
+                    # Il flag fa fallire il retrieval dei processi senza i file del docstore
+                    chunk.metadata = {**(chunk.metadata or {}), DOCSTORE_FLAG: True}
+            vectorstore.add(embedded, collection_name=collection_name)
+            stats["chunks"] += len(indexed)
+            stats["batches"] += 1
         except Exception as e:
-            print(f"✗ Errore nel processare {faq_file}: {e}")
+            stats["failed_batches"] += 1
+            print(f"✗ Errore nell'upsert di un batch da {len(batch)} chunk: {e}")
             import traceback
             traceback.print_exc()
+            continue
+
+        if sentence_cache:
+            # Cache opzionale: un errore qui non invalida il batch già indicizzato
+            try:
+                stats["sentences"] += precompute_sentence_embeddings(embedder_client, space, prompt_texts)
+            except Exception as e:
+                stats["failed_sentence_batches"] += 1
+                print(f"⚠ Embedding delle frasi non riuscito per un batch: {e}")
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def _parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Ingestion in streaming delle FAQ in Qdrant.")
+    parser.add_argument(
+        "--root",
+        action="append",
+        dest="roots",
+        help="File o directory da indicizzare (ripetibile). Default: FAQ_INGEST_ROOTS",
+    )
+    parser.add_argument("--include", help="Glob inclusi, separati da virgola. Default: FAQ_INGEST_INCLUDE")
+    parser.add_argument("--exclude", help="Glob esclusi, separati da virgola. Default: FAQ_INGEST_EXCLUDE")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=INGEST_BATCH_SIZE,
+        help="Numero di chunk per batch di embedding/upsert",
+    )
+    parser.add_argument(
+        "--chunking",
+        choices=CHUNKING_MODES,
+        default=CHUNKING,
+        help="parent: span figli indicizzati + sezioni parent; flat: sezioni da 2000 caratteri (default: FAQ_CHUNKING)",
+    )
+    parser.add_argument(
+        "--child-max-chars",
+        type=int,
+        default=CHILD_MAX_CHARS,
+        help="Lunghezza massima degli span figli in modalità parent",
+    )
+    parser.add_argument(
+        "--no-sentence-cache",
+        action="store_true",
+        help="Non precalcola gli embedding delle frasi per la compressione del contesto",
+    )
+    parser.add_argument(
+        "--docstore",
+        action="store_true",
+        default=docstore_enabled(),
+        help="Testo e metadati nel docstore locale, Qdrant solo con vettori e campi filtrabili (default: FAQ_DOCSTORE)",
+    )
+    parser.add_argument(
+        "--no-promote",
+        action="store_true",
+        help="Costruisce la nuova versione senza spostare l'alias (promozione manuale con collection_aliases.py)",
+    )
+    parser.add_argument(
+        "--keep",
+        type=int,
+        default=KEEP_VERSIONS,
+        help="Versioni da conservare per il rollback, inclusa quella attiva",
+    )
+    return parser.parse_args(argv)
+
 
-def main():
+def main(argv: Sequence[str] | None = None):
     """Funzione principale per l'ingestion."""
+    args = _parse_args(argv)
+
     print("=" * 60)
     print("🚀 Inizio ingestion delle FAQ Datapizza-AI")
-    print(f"   (Google Embedder - {EMBEDDING_MODEL})")
+    space = faq_space()
+    print(f"   (Embedder {space.label})")
     print("=" * 60)
     
-    # Verifica API key
-    if not os.getenv("GOOGLE_API_KEY"):
-        print("✗ ERRORE: GOOGLE_API_KEY non trovata nel file .env")
+    # Verifica API key (in replay delle cassette basta il placeholder, come in build_embedder)
+    if not cassette_api_key(space.api_key_env):
+        print(f"✗ ERRORE: {space.api_key_env} non trovata nel file .env")
         return
 
-    # Inizializza il Google Embedder
-    embedder_client = GoogleEmbedder(
-        api_key=os.getenv("GOOGLE_API_KEY"),
-        model_name=EMBEDDING_MODEL,
-    )
+    # Inizializza l'embedder dello spazio delle FAQ
+    embedder_client = build_embedder(space)
 
     # Determina la dimensione degli embedding
     if EMBEDDING_DIM_OVERRIDE:
@@ -203,25 +566,97 @@ def main():
             print(f"✗ Impossibile determinare la dimensione degli embedding: {e}")
             return
     
-    # Setup vector store
+    # Nuova versione fisica: quella attiva resta servita fino allo swap dell'alias
+    version = new_version_name(COLLECTION_NAME)
     print("\n📦 Setup vector store...")
-    vectorstore = setup_vectorstore(embedding_dim)
-    
-    # Crea pipeline
-    print("\n🔧 Creazione pipeline di ingestion...")
-    pipeline = create_ingestion_pipeline(vectorstore, embedder_client)
+    vectorstore = setup_vectorstore(embedding_dim, version)
     
     # File FAQ da processare
-    faq_files = _gather_faq_files()
+    faq_files = list(iter_document_paths(args.roots, args.include, args.exclude))
     print(f"\n🗂️ Documenti rilevati ({len(faq_files)}):")
-    for path in faq_files:
+    for path in faq_files[:20]:
         lang = _detect_language_from_path(path)
         print(f"   • {path} [{lang.upper()}]")
-    
+    if len(faq_files) > 20:
+        print(f"   … e altri {len(faq_files) - 20} file")
+
     # Ingest documenti
-    print("\n📚 Ingestion documenti...")
-    ingest_documents(pipeline, faq_files)
-    
+    print(f"\n📚 Ingestion documenti (batch da {args.batch_size} chunk, chunking {args.chunking})...")
+    client = vectorstore.get_client()
+    docstore = DocstoreWriter(version) if args.docstore else None
+    try:
+        stats = ingest_documents(
+            vectorstore,
+            embedder_client,
+            faq_files,
+            args.batch_size,
+            version,
+            args.chunking,
+            args.child_max_chars,
+            compression_enabled() and not args.no_sentence_cache,
+            docstore,
+        )
+    except BaseException:
+        if docstore is not None:
+            docstore.abort()
+        discard_version(client, version)
+        raise
+    if docstore is not None:
+        # Il docstore è completo prima della ricerca di controllo e della promozione
+        docstore.close()
+        print(f"📦 Docstore locale: {len(docstore)} record, {docstore.bytes / 1e6:.2f} MB in {docstore.blob_path}")
+    rate = stats["chunks"] / stats["seconds"] if stats["seconds"] else 0.0
+    parents = f", {stats['parents']} parent" if stats["parents"] else ""
+    print(
+        f"✓ {stats['chunks']} chunk indicizzati{parents} in {stats['batches']} batch "
+        f"({stats['seconds']:.1f}s, {rate:.1f} chunk/s)"
+    )
+    if stats["sentences"]:
+        print(f"🧠 Frasi embeddate per la compressione del contesto: {stats['sentences']}")
+    if stats["failed_sentence_batches"]:
+        print(f"⚠ Batch senza cache delle frasi: {stats['failed_sentence_batches']} (la compressione le embedda a query time)")
+    if stats["failed_batches"]:
+        print(f"⚠ Batch falliti: {stats['failed_batches']}")
+    if stats["failed_files"]:
+        print(f"⚠ File non processati: {stats['failed_files']} su {stats['files'] + stats['failed_files']}")
+        for path in stats["failed_paths"][:20]:
+            print(f"   • {path}")
+    if stats["failed_batches"] and not stats["batches"]:
+        # Nessun batch riuscito: errore sistematico (API key, quota, limiti del provider)
+        discard_version(client, version)
+        raise RuntimeError(
+            f"Tutti i {stats['failed_batches']} batch sono falliti: nessun chunk indicizzato in '{version}'."
+        )
+
+    # Verifica della nuova versione prima dello swap: le build scartate vengono eliminate
+    manual_promote = f"python collection_aliases.py promote --alias {COLLECTION_NAME} --version {version}"
+    if stats["failed_batches"] or stats["failed_files"] or not stats["chunks"]:
+        print(f"\n❌ Versione '{version}' incompleta: l'alias '{COLLECTION_NAME}' non viene spostato.")
+        discard_version(client, version)
+        print(f"🗑 Versione '{version}' eliminata")
+        return
+
+    smoke = smoke_search(client, version, embedder_client.embed(stats["probe_text"]), vector_name=VECTOR_NAME)
+    points = client.count(collection_name=version, exact=True).count
+    print(f"\n🔎 Ricerca di controllo su '{version}': top score {smoke['top_score']}, {points} punti")
+    if docstore is not None and smoke["top_id"] is not None:
+        # Il punto trovato da Qdrant deve avere testo e metadati nel docstore
+        smoke["passed"] = smoke["passed"] and smoke["top_id"] in get_docstore(client, version)
+    if not smoke["passed"] or points < stats["chunks"]:
+        print(f"❌ Controllo fallito: l'alias '{COLLECTION_NAME}' resta su {resolve_alias(client, COLLECTION_NAME)}.")
+        discard_version(client, version)
+        print(f"🗑 Versione '{version}' eliminata")
+        return
+
+    if args.no_promote:
+        print(f"⏸ Versione pronta, alias non spostato. Per promuoverla: {manual_promote}")
+    else:
+        previous = promote_version(client, COLLECTION_NAME, version)
+        print(f"🔀 Alias '{COLLECTION_NAME}' → '{version}' (prima: {previous or 'nessuna'})")
+        deleted = prune_versions(client, COLLECTION_NAME, args.keep)
+        if deleted:
+            print(f"🧹 Versioni eliminate: {', '.join(deleted)}")
+
     # Verifica risultati
     print("\n✅ Ingestion completata!")
     print("=" * 60)
@@ -0,0 +1,247 @@
+"""
+Layer di record/replay per i client Google e OpenAI ("cassette").
+
+Permette di eseguire chatbot, test e benchmark in modo deterministico e senza
+chiavi API: in modalità ``record`` ogni richiesta a client ed embedder viene
+eseguita davvero e salvata (risposta + latenza osservata) in un file SQLite
+compatto; in modalità ``replay`` le risposte vengono servite localmente,
+opzionalmente riproducendo la latenza originale.
+
+Configurazione tramite variabili d'ambiente:
+- ``DATAPIZZA_CASSETTE_MODE``: ``off`` (default), ``record`` oppure ``replay``
+- ``DATAPIZZA_CASSETTE_PATH``: file della cassetta (default ``.cassettes/datapizza.sqlite``)
+- ``DATAPIZZA_CASSETTE_REPLAY_LATENCY``: se attivo, in replay attende la latenza registrata
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import dataclasses
+import enum
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Tuple
+
+CASSETTE_MODES = {"off", "record", "replay"}
+
+# Metodi intercettati: API pubbliche e implementazioni interne dei client datapizza
+CASSETTE_METHODS = ("invoke", "_invoke", "a_invoke", "_a_invoke", "embed", "a_embed")
+
+# Placeholder usato al posto delle API key quando si lavora in replay
+REPLAY_API_KEY = "cassette-replay"
+
+# Evita registrazioni annidate quando un metodo intercettato ne chiama un altro
+_inside_cassette: contextvars.ContextVar[bool] = contextvars.ContextVar("inside_cassette", default=False)
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in {"1", "true", "yes", "on"}
+
+
+def cassette_mode() -> str:
+    """Modalità corrente letta da ``DATAPIZZA_CASSETTE_MODE``."""
+    mode = os.getenv("DATAPIZZA_CASSETTE_MODE", "off").lower()
+    if mode not in CASSETTE_MODES:
+        raise ValueError(f"DATAPIZZA_CASSETTE_MODE non valido: '{mode}' (ammessi: {sorted(CASSETTE_MODES)})")
+    return mode
+
+
+def cassette_api_key(env_name: str) -> str | None:
+    """Legge una API key; in replay restituisce un placeholder se assente."""
+    value = os.getenv(env_name)
+    if not value and cassette_mode() == "replay":
+        return REPLAY_API_KEY
+    return value
+
+
+class CassetteMissError(KeyError):
+    """Richiesta non presente nella cassetta durante il replay."""
+
+
+def _fingerprint(value: Any, _seen: set | None = None) -> Any:
+    """Riduce argomenti arbitrari a una struttura JSON stabile per calcolare la chiave."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bytes):
+        return {"__bytes__": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, enum.Enum):
+        return _fingerprint(value.value, _seen)
+    if isinstance(value, dict):
+        return {str(k): _fingerprint(v, _seen) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = sorted(value, key=repr) if isinstance(value, (set, frozenset)) else value
+        return [_fingerprint(v, _seen) for v in items]
+    if inspect.isclass(value) or callable(value) and not hasattr(value, "__dict__"):
+        return {"__callable__": getattr(value, "__qualname__", repr(value))}
+
+    _seen = _seen if _seen is not None else set()
+    if id(value) in _seen:
+        return {"__cycle__": type(value).__name__}
+    _seen = _seen | {id(value)}
+
+    if hasattr(value, "model_dump"):
+        return {type(value).__name__: _fingerprint(value.model_dump(), _seen)}
+    if dataclasses.is_dataclass(value):
+        return {
+            type(value).__name__: {
+                f.name: _fingerprint(getattr(value, f.name, None), _seen) for f in dataclasses.fields(value)
+            }
+        }
+    if inspect.isfunction(value) or inspect.ismethod(value):
+        return {"__callable__": value.__qualname__}
+    if hasattr(value, "__dict__"):
+        public = {k: v for k, v in vars(value).items() if not k.startswith("_")}
+        return {type(value).__name__: _fingerprint(public, _seen)}
+    return {type(value).__name__: repr(value)}
+
+
+def request_key(namespace: str, method: str, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> str:
+    # Sync e async condividono la stessa registrazione
+    method = method.lstrip("_")
+    if method.startswith("a_"):
+        method = method[2:]
+    payload = json.dumps(
+        {"ns": namespace, "method": method, "args": _fingerprint(args), "kwargs": _fingerprint(kwargs)},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Archivio SQLite di coppie richiesta → risposta (pickle compresso + latenza)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS interactions ("
+            " key TEXT PRIMARY KEY, namespace TEXT, method TEXT,"
+            " response BLOB, latency_ms REAL, recorded_at REAL)"
+        )
+        self._conn.commit()
+
+    def load(self, key: str) -> Tuple[Any, float] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, latency_ms FROM interactions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(zlib.decompress(row[0])), row[1]
+
+    def save(self, key: str, namespace: str, method: str, response: Any, latency_ms: float) -> None:
+        blob = zlib.compress(pickle.dumps(response, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO interactions VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, method, blob, latency_ms, time.time()),
+            )
+            self._conn.commit()
+
+
+_cassette: Cassette | None = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Cassette:
+    """Restituisce (con caching) la cassetta condivisa dal processo."""
+    global _cassette
+
+    with _cassette_lock:
+        if _cassette is None:
+            path = os.getenv("DATAPIZZA_CASSETTE_PATH", os.path.join(".cassettes", "datapizza.sqlite"))
+            _cassette = Cassette(path)
+        return _cassette
+
+
+def _wrap_sync(func: Callable, namespace: str, method: str, mode: str, cassette: Cassette) -> Callable:
+    replay_latency = _env_flag("DATAPIZZA_CASSETTE_REPLAY_LATENCY")
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _inside_cassette.get():
+            return func(*args, **kwargs)
+        key = request_key(namespace, method, args, kwargs)
+        token = _inside_cassette.set(True)
+        try:
+            if mode == "replay":
+                recorded = cassette.load(key)
+                if recorded is None:
+                    raise CassetteMissError(f"{namespace}.{method}: richiesta non registrata ({key[:12]})")
+                response, latency_ms = recorded
+                if replay_latency and latency_ms:
+                    time.sleep(latency_ms / 1000)
+                return response
+
+            started = time.perf_counter()
+            response = func(*args, **kwargs)
+            cassette.save(key, namespace, method, response, (time.perf_counter() - started) * 1000)
+            return response
+        finally:
+            _inside_cassette.reset(token)
+
+    return wrapper
+
+
+def _wrap_async(func: Callable, namespace: str, method: str, mode: str, cassette: Cassette) -> Callable:
+    replay_latency = _env_flag("DATAPIZZA_CASSETTE_REPLAY_LATENCY")
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if _inside_cassette.get():
+            return await func(*args, **kwargs)
+        key = request_key(namespace, method, args, kwargs)
+        token = _inside_cassette.set(True)
+        try:
+            if mode == "replay":
+                recorded = cassette.load(key)
+                if recorded is None:
+                    raise CassetteMissError(f"{namespace}.{method}: richiesta non registrata ({key[:12]})")
+                response, latency_ms = recorded
+                if replay_latency and latency_ms:
+                    await asyncio.sleep(latency_ms / 1000)
+                return response
+
+            started = time.perf_counter()
+            response = await func(*args, **kwargs)
+            cassette.save(key, namespace, method, response, (time.perf_counter() - started) * 1000)
+            return response
+        finally:
+            _inside_cassette.reset(token)
+
+    return wrapper
+
+
+def with_cassette(obj: Any, namespace: str) -> Any:
+    """Aggancia la cassetta ai metodi di un client/embedder, se la modalità è attiva.
+
+    I metodi vengono sostituiti sull'istanza, così anche pipeline e rewriter che
+    ricevono l'oggetto passano dalla cassetta. Restituisce lo stesso oggetto.
+    """
+    mode = cassette_mode()
+    if mode == "off":
+        return obj
+
+    cassette = get_cassette()
+    for method in CASSETTE_METHODS:
+        func = getattr(obj, method, None)
+        if func is None or not callable(func):
+            continue
+        if inspect.iscoroutinefunction(func):
+            wrapped = _wrap_async(func, namespace, method, mode, cassette)
+        else:
+            wrapped = _wrap_sync(func, namespace, method, mode, cassette)
+        setattr(obj, method, wrapped)
+    return obj
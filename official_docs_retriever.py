@@ -3,7 +3,10 @@ Utility per interrogare la documentazione ufficiale di Datapizza-AI
 indicizzata in Qdrant.
 
 Fornisce un'API asincrona che restituisce sia il testo combinato da usare
-nei prompt RAG sia i metadati dei chunk per il debug dell'interfaccia.
+nei prompt RAG sia i riferimenti compatti ai chunk per il debug dell'interfaccia.
+Se FAQ e documentazione condividono lo spazio di embedding (vedi
+``embeddings.py``) il chatbot non passa da qui per l'embedding: cerca con il
+vettore già calcolato per le FAQ e usa solo ``docs_result_from_chunks``.
 """
 
 from __future__ import annotations
@@ -11,17 +14,19 @@ from __future__ import annotations
 import asyncio
 import os
 from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+from typing import TYPE_CHECKING, Any, List
 
-from datapizza.embedders.openai.openai import OpenAIEmbedder
-from datapizza.vectorstores.qdrant import QdrantVectorstore
-from datapizza.type import Chunk
+from debug_traces import ChunkRef, chunk_refs
+from deferred_setup import WARMUP_PROBE_TEXT
+from embeddings import build_embedder, official_docs_space
+from qdrant_config import OFFICIAL_DOCS_COLLECTION, get_qdrant_vectorstore
+from resilience import get_breaker, qdrant_breaker_name, with_circuit_breaker
+from retrieval import RetrievedChunk, best_score, hydrate_texts, search_chunks
 
-from qdrant_config import build_qdrant_vectorstore
+if TYPE_CHECKING:
+    from datapizza.vectorstores.qdrant import QdrantVectorstore
 
 # Configurazione tramite variabili d'ambiente (con default sensati)
-OFFICIAL_DOCS_COLLECTION = os.getenv("OFFICIAL_DOCS_COLLECTION", "datapizza_official_docs")
-OFFICIAL_DOCS_EMBED_MODEL = os.getenv("OFFICIAL_DOCS_EMBED_MODEL", "text-embedding-3-small")
 OFFICIAL_DOCS_MAX_SECTION_CHARS = int(os.getenv("OFFICIAL_DOCS_MAX_SECTION_CHARS", "1200"))
 
 
@@ -30,56 +35,63 @@ class DocsResult:
     """Risultato formalizzato della ricerca documentazione."""
 
     combined_text: str
-    chunk_previews: List[Dict[str, Any]]
+    chunk_refs: List[ChunkRef]
+    best_score: float | None = None
 
 
-_embedder: OpenAIEmbedder | None = None
-_vectorstore: QdrantVectorstore | None = None
+_embedder: Any = None
 
 
-def _get_embedder() -> OpenAIEmbedder:
-    """Restituisce (con caching) l'embedder OpenAI usato per le query."""
+def embedder_breaker_name() -> str:
+    """Breaker dell'embedder della documentazione (``openai_embedder`` di default)."""
+    return f"{official_docs_space().provider}_embedder"
+
+
+def _get_embedder() -> Any:
+    """Restituisce (con caching) l'embedder dello spazio della documentazione (SDK importato qui)."""
     global _embedder
 
     if _embedder is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise RuntimeError(
-                "OPENAI_API_KEY non configurata: impossibile interrogare la documentazione ufficiale."
-            )
-
-        _embedder = OpenAIEmbedder(
-            api_key=api_key,
-            model_name=OFFICIAL_DOCS_EMBED_MODEL,
+        _embedder = with_circuit_breaker(
+            build_embedder(official_docs_space(), cache=True),
+            get_breaker(embedder_breaker_name()),
+            ("embed", "a_embed"),
         )
 
     return _embedder
 
 
 def _get_vectorstore() -> QdrantVectorstore:
-    """Restituisce (con caching) il vector store Qdrant configurato via qdrant_config."""
-    global _vectorstore
+    """Vector store Qdrant condiviso nel processo (stesso client delle FAQ se il target coincide)."""
+    return get_qdrant_vectorstore()
 
-    if _vectorstore is None:
-        _vectorstore = build_qdrant_vectorstore()
 
-    return _vectorstore
+def official_docs_available() -> bool:
+    """False se il breaker della collection docs o dell'embedder OpenAI è aperto."""
+    return not (
+        get_breaker(qdrant_breaker_name(OFFICIAL_DOCS_COLLECTION)).is_open
+        or get_breaker(embedder_breaker_name()).is_open
+    )
+
 
+def warm_up_official_docs() -> None:
+    """Embed e ricerca di prova: apre le connessioni dell'embedder e del vector store condivisi."""
+    query_vector = _get_embedder().embed(WARMUP_PROBE_TEXT)
+    search_chunks(_get_vectorstore(), OFFICIAL_DOCS_COLLECTION, query_vector, 1)
 
-def _build_combined_context(chunks: List[Chunk]) -> Tuple[str, List[Dict[str, Any]]]:
-    """Costruisce il testo da usare nei prompt e i preview per il debug."""
+
+def _build_combined_context(chunks: List[RetrievedChunk]) -> str:
+    """Costruisce il testo da usare nei prompt."""
     if not chunks:
-        return "", []
+        return ""
 
     section_lines: List[str] = []
-    previews: List[Dict[str, Any]] = []
 
     section_lines.append("=== DOCUMENTAZIONE UFFICIALE ===\n")
 
     for idx, chunk in enumerate(chunks, start=1):
         metadata = getattr(chunk, "metadata", {}) or {}
         text = getattr(chunk, "text", "") or ""
-        score = getattr(chunk, "score", None)
 
         file_path = metadata.get("file_path") or metadata.get("source") or "documentazione"
         filename = metadata.get("filename") or metadata.get("title") or file_path
@@ -93,48 +105,43 @@ def _build_combined_context(chunks: List[Chunk]) -> Tuple[str, List[Dict[str, An
         section_lines.append(cleaned_text)
         section_lines.append("")  # Riga vuota di separazione
 
-        previews.append(
-            {
-                "id": getattr(chunk, "id", None),
-                "score": score,
-                "metadata": metadata,
-                "text": text,
-            }
-        )
+    return "\n".join(section_lines).strip()
+
 
-    combined_text = "\n".join(section_lines).strip()
-    return combined_text, previews
+def docs_result_from_chunks(chunks: List[RetrievedChunk], remember: bool = False) -> DocsResult:
+    """Testo per il prompt, riferimenti e miglior score dei chunk della documentazione.
 
+    ``remember``: conserva il testo nella cache del debug (vedi ``debug_traces.chunk_refs``).
+    """
+    hydrate_texts(_get_vectorstore(), OFFICIAL_DOCS_COLLECTION, chunks)
+    return DocsResult(
+        combined_text=_build_combined_context(chunks),
+        chunk_refs=chunk_refs(chunks, OFFICIAL_DOCS_COLLECTION, remember=remember),
+        best_score=best_score(chunks),
+    )
 
-def _query_official_docs_sync(query: str, max_results: int = 5) -> DocsResult:
+
+def _query_official_docs_sync(query: str, max_results: int = 5, remember: bool = False) -> DocsResult:
     """Esegue la ricerca sui documenti ufficiali (versione sincrona)."""
     embedder = _get_embedder()
     vectorstore = _get_vectorstore()
 
     query_vector = embedder.embed(query)
 
-    chunks: List[Chunk] = vectorstore.search(
-        collection_name=OFFICIAL_DOCS_COLLECTION,
-        query_vector=query_vector,
-        k=max_results,
-    )
+    chunks = search_chunks(vectorstore, OFFICIAL_DOCS_COLLECTION, query_vector, max_results)
+    return docs_result_from_chunks(chunks, remember)
 
-    combined_text, previews = _build_combined_context(chunks)
-    return DocsResult(combined_text=combined_text, chunk_previews=previews)
 
-
-async def query_official_docs(query: str, max_results: int = 5) -> DocsResult:
+async def query_official_docs(query: str, max_results: int = 5, remember: bool = False) -> DocsResult:
     """
     Interroga la documentazione ufficiale in maniera asincrona.
 
     Restituisce un DocsResult con:
     - combined_text: porzioni di documentazione pronte per essere inserite nel prompt
-    - chunk_previews: lista di dizionari con metadati e testi grezzi per il debug
+    - chunk_refs: riferimenti (collection, id, score) ai chunk, materializzati solo dal debug
+    - best_score: similarità del chunk migliore, usata dal gate di rilevanza
+
+    Con ``remember`` (domanda in debug) il testo dei chunk resta nella cache del debug.
     """
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(
-        None,
-        _query_official_docs_sync,
-        query,
-        max_results,
-    )
+    # to_thread propaga il contesto (cassetta, misura degli embedding) al thread
+    return await asyncio.to_thread(_query_official_docs_sync, query, max_results, remember)
@@ -0,0 +1,46 @@
+"""
+Piccole utility statistiche condivise da diagnostica e benchmark
+(percentili e riepiloghi di latenze/dimensioni).
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Dict, Iterable, List
+
+
+def percentile(values: Iterable[float], pct: float) -> float | None:
+    """Percentile con interpolazione lineare (``pct`` in [0, 100])."""
+    ordered: List[float] = sorted(values)
+    if not ordered:
+        return None
+    if len(ordered) == 1:
+        return ordered[0]
+
+    rank = (pct / 100.0) * (len(ordered) - 1)
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    if lower == upper:
+        return ordered[lower]
+    weight = rank - lower
+    return ordered[lower] * (1 - weight) + ordered[upper] * weight
+
+
+def summarize(values: Iterable[float], digits: int = 3) -> Dict[str, float | int | None]:
+    """Riepilogo compatto (count, min, mean, p50/p95/p99, max) serializzabile in JSON."""
+    data = list(values)
+    if not data:
+        return {"count": 0, "min": None, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+
+    def _round(value: float | None) -> float | None:
+        return None if value is None else round(value, digits)
+
+    return {
+        "count": len(data),
+        "min": _round(min(data)),
+        "mean": _round(sum(data) / len(data)),
+        "p50": _round(percentile(data, 50)),
+        "p95": _round(percentile(data, 95)),
+        "p99": _round(percentile(data, 99)),
+        "max": _round(max(data)),
+    }
@@ -0,0 +1,151 @@
+"""
+Profilo dell'avvio a freddo: tempo di import per modulo e costruzione del chatbot.
+
+Per ogni target esegue in un processo Python nuovo (``-X importtime``) gli
+import che fa l'entrypoint e la costruzione del chatbot, poi riporta:
+- il tempo totale fino al chatbot pronto a ricevere la prima domanda
+- i moduli con il tempo di import cumulativo più alto
+- il confronto con il tempo obiettivo del target
+
+Target:
+- ``web`` (``run_web.sh``): streamlit + ``chatbot_enhanced`` + session store,
+  poi ``EnhancedFAQChatbot()``; obiettivo ``STARTUP_TARGET_WEB_MS`` (default 1500)
+- ``terminal`` (``run_chatbot.sh``): ``chatbot_faq`` e ``FAQChatbot()``;
+  obiettivo ``STARTUP_TARGET_TERMINAL_MS`` (default 800)
+
+La costruzione del chatbot non tocca la rete (client e Qdrant sono differiti al
+``warm_up``); se GOOGLE_API_KEY manca viene misurato solo l'import.
+
+Esempi:
+    python profile_startup.py
+    python profile_startup.py --target web --top 25 --check
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+TARGETS: Dict[str, Dict[str, Any]] = {
+    "web": {
+        "imports": ["streamlit", "chatbot_enhanced", "debug_traces", "session_store"],
+        "construct": "chatbot_enhanced.EnhancedFAQChatbot()",
+        "target_ms": float(os.getenv("STARTUP_TARGET_WEB_MS", "1500")),
+    },
+    "terminal": {
+        "imports": ["chatbot_faq"],
+        "construct": "chatbot_faq.FAQChatbot()",
+        "target_ms": float(os.getenv("STARTUP_TARGET_TERMINAL_MS", "800")),
+    },
+}
+
+_PROBE = """
+import json, os, time
+started = time.perf_counter()
+{imports}
+imported = time.perf_counter()
+constructed = None
+if os.getenv("GOOGLE_API_KEY"):
+    {construct}
+    constructed = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "construct_ms": None if constructed is None else (constructed - imported) * 1000,
+}}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Righe di ``-X importtime`` → [{module, self_ms, cumulative_ms, depth}]."""
+    rows: List[Dict[str, Any]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        except ValueError:
+            continue
+        rows.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return rows
+
+
+def profile_target(name: str, top: int) -> Dict[str, Any]:
+    config = TARGETS[name]
+    code = _PROBE.format(
+        imports="\n".join(f"import {module}" for module in config["imports"]),
+        construct=config["construct"],
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    rows = parse_importtime(completed.stderr)
+    if completed.returncode != 0:
+        errors = [line for line in completed.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"avvio del target '{name}' fallito:\n" + "\n".join(errors[-5:]))
+
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    total_ms = timings["import_ms"] + (timings["construct_ms"] or 0.0)
+    slowest = sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:top]
+    heaviest_self = sorted(rows, key=lambda row: row["self_ms"], reverse=True)[:top]
+
+    return {
+        "target": name,
+        "import_ms": round(timings["import_ms"], 1),
+        "construct_ms": None if timings["construct_ms"] is None else round(timings["construct_ms"], 1),
+        "total_ms": round(total_ms, 1),
+        "target_ms": config["target_ms"],
+        "within_target": total_ms <= config["target_ms"],
+        "modules_imported": len(rows),
+        "slowest_cumulative": slowest,
+        "slowest_self": heaviest_self,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profilo dei tempi di import e di avvio dei chatbot.")
+    parser.add_argument("--target", choices=sorted(TARGETS), action="append", help="Target da profilare (default: tutti)")
+    parser.add_argument("--top", type=int, default=15, help="Moduli più lenti da mostrare")
+    parser.add_argument("--check", action="store_true", help="Esce con codice 1 se un target supera l'obiettivo")
+    parser.add_argument("--output", help="Scrive il report JSON su file")
+    args = parser.parse_args()
+
+    results = [profile_target(name, args.top) for name in (args.target or sorted(TARGETS))]
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    for result in results:
+        print("=" * 70)
+        status = "✅" if result["within_target"] else "❌"
+        construct = "n/d (GOOGLE_API_KEY assente)" if result["construct_ms"] is None else f"{result['construct_ms']} ms"
+        print(
+            f"{status} [{result['target']}] avvio {result['total_ms']} ms (obiettivo {result['target_ms']:.0f} ms) | "
+            f"import {result['import_ms']} ms · costruzione {construct} · {result['modules_imported']} moduli"
+        )
+        print("=" * 70)
+        for row in result["slowest_cumulative"]:
+            print(f"   {row['cumulative_ms']:8.1f} ms  (self {row['self_ms']:6.1f})  {'  ' * row['depth']}{row['module']}")
+
+    if args.check and not all(result["within_target"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)
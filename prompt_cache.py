@@ -0,0 +1,218 @@
+"""
+Layout dei prompt con prefisso stabile e contabilità del prompt caching.
+
+Il system prompt statico (regole + istruzione di lingua) viene compilato una
+sola volta per lingua e passato come ``system_prompt`` del client: così la
+richiesta inizia sempre con lo stesso prefisso (system prompt, poi la
+cronologia della sessione) e solo la parte finale (contesto recuperato +
+domanda) cambia. Gemini 2.5 applica il caching implicito ai prefissi
+ripetuti e riporta i token serviti dalla cache nei metadati di utilizzo.
+
+Il prefisso da solo è molto più corto del minimo richiesto dalle cache
+esplicite di Gemini, quindi non viene creata nessuna ``CachedContent``: ci si
+affida al caching implicito. ``LocalPrefixCache`` ne è un sostituto locale
+che simula le hit per prefisso, così la contabilità si può verificare offline
+(cassette in replay, benchmark) quando il provider non riporta i token in cache.
+
+Configurazione tramite variabili d'ambiente:
+- ``PROMPT_CACHE_MIN_TOKENS`` (default 1024): prefisso minimo perché la cache si applichi
+- ``PROMPT_CACHE_TTL`` (secondi, default 300): durata di un prefisso in cache
+- ``PROMPT_CACHE_DISCOUNT`` (default 0.75): sconto sui token serviti dalla cache
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Mapping, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima grezza (~4 caratteri per token), sufficiente per la contabilità relativa."""
+    return max(1, len(text) // 4) if text else 0
+
+
+@dataclass(frozen=True)
+class PromptPrefix:
+    """System prompt precompilato per una lingua."""
+
+    language: str
+    text: str
+    fingerprint: str
+    tokens: int
+
+
+@functools.lru_cache(maxsize=8)
+def compile_system_prompts(template: str, language_config: Tuple[Tuple[str, str, str], ...]) -> Dict[str, PromptPrefix]:
+    """Formatta il template per ogni lingua (``(codice, fallback, istruzione)``) una sola volta."""
+    prefixes: Dict[str, PromptPrefix] = {}
+    for language, fallback, instruction in language_config:
+        text = template.format(fallback_message=fallback, language_instruction=instruction)
+        prefixes[language] = PromptPrefix(
+            language=language,
+            text=text,
+            fingerprint=hashlib.sha256(text.encode("utf-8")).hexdigest()[:16],
+            tokens=estimate_tokens(text),
+        )
+    return prefixes
+
+
+def memory_segments(memory: Any) -> List[str]:
+    """Testo dei turni della Memory, nell'ordine in cui il client li invia."""
+    segments: List[str] = []
+    try:
+        turns = list(memory) if memory is not None else []
+    except TypeError:
+        return segments
+    for turn in turns:
+        blocks = getattr(turn, "blocks", None)
+        if blocks is None:
+            try:
+                blocks = list(turn)
+            except TypeError:
+                blocks = [turn]
+        role = getattr(getattr(turn, "role", None), "value", getattr(turn, "role", ""))
+        text = "".join(str(getattr(block, "content", block)) for block in blocks)
+        segments.append(f"{role}:{text}")
+    return segments
+
+
+def usage_value(response: Any, *names: str) -> int | None:
+    """Primo contatore intero trovato nei metadati di utilizzo o nella risposta stessa."""
+    usage = getattr(response, "usage", None) or getattr(response, "usage_metadata", None)
+    for source in (usage, response):
+        if source is None:
+            continue
+        for name in names:
+            value = source.get(name) if isinstance(source, Mapping) else getattr(source, name, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def usage_from_response(response: Any) -> Tuple[int | None, int | None]:
+    """Token di input e token serviti dalla cache riportati dal provider (se presenti)."""
+    prompt_tokens = usage_value(response, "prompt_tokens", "prompt_tokens_used", "prompt_token_count", "input_tokens")
+    cached_tokens = usage_value(response, "cached_tokens", "cached_tokens_used", "cached_content_token_count")
+    return prompt_tokens, cached_tokens
+
+
+def output_tokens_from_response(response: Any) -> int | None:
+    """Token generati riportati dal provider (se presenti)."""
+    return usage_value(
+        response, "completion_tokens", "completion_tokens_used", "candidates_token_count", "output_tokens"
+    )
+
+
+class LocalPrefixCache:
+    """Simula una cache implicita per prefisso e tiene la contabilità dei token.
+
+    Ogni richiesta è una sequenza di segmenti (system prompt, turni della
+    cronologia, input finale). Una hit copre il prefisso cumulativo più lungo
+    già visto entro il TTL, purché superi ``min_tokens``.
+    """
+
+    def __init__(self, min_tokens: int = 1024, ttl_seconds: float = 300.0, discount: float = 0.75, max_entries: int = 50000):
+        self.min_tokens = min_tokens
+        self.ttl_seconds = ttl_seconds
+        self.discount = discount
+        self.max_entries = max_entries
+
+        self._seen: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.hits = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.billed_input_tokens = 0.0
+        self.provider_reported = 0
+
+    def _lookup(self, segments: Iterable[str]) -> Tuple[int, int]:
+        """Restituisce (token totali, token del prefisso in cache) e registra i prefissi."""
+        now = time.monotonic()
+        digest = hashlib.sha256()
+        total = 0
+        cached = 0
+        boundaries: List[str] = []
+        segments = list(segments)
+
+        for index, segment in enumerate(segments):
+            digest.update(segment.encode("utf-8"))
+            digest.update(b"\x00")
+            total += estimate_tokens(segment)
+            # L'ultimo segmento (input corrente) non è mai un prefisso riutilizzabile
+            if index == len(segments) - 1:
+                break
+            key = digest.hexdigest()
+            boundaries.append(key)
+            expires = self._seen.get(key)
+            if expires is not None and expires > now:
+                cached = total
+
+        for key in boundaries:
+            self._seen[key] = now + self.ttl_seconds
+        if len(self._seen) > self.max_entries:
+            self._seen = {k: v for k, v in self._seen.items() if v > now}
+
+        return total, cached if cached >= self.min_tokens else 0
+
+    def record(self, segments: List[str], response: Any = None) -> Dict[str, Any]:
+        """Contabilizza una richiesta; usa i token riportati dal provider se disponibili."""
+        provider_prompt, provider_cached = usage_from_response(response) if response is not None else (None, None)
+
+        with self._lock:
+            estimated_total, estimated_cached = self._lookup(segments)
+            from_provider = provider_prompt is not None and provider_cached is not None
+            input_tokens = provider_prompt if from_provider else estimated_total
+            cached_tokens = provider_cached if from_provider else estimated_cached
+            billed = input_tokens - cached_tokens * self.discount
+
+            self.requests += 1
+            self.hits += 1 if cached_tokens else 0
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            self.billed_input_tokens += billed
+            self.provider_reported += 1 if from_provider else 0
+
+        return {
+            "cache_hit": bool(cached_tokens),
+            "source": "provider" if from_provider else "local",
+            "input_tokens": input_tokens,
+            "cached_tokens": cached_tokens,
+            "billed_input_tokens": round(billed, 1),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.requests, 3) if self.requests else 0.0,
+                "input_tokens": self.input_tokens,
+                "cached_tokens": self.cached_tokens,
+                "billed_input_tokens": round(self.billed_input_tokens, 1),
+                "provider_reported": self.provider_reported,
+            }
+
+
+_prompt_cache: LocalPrefixCache | None = None
+_prompt_cache_lock = threading.Lock()
+
+
+def get_prompt_cache() -> LocalPrefixCache:
+    """Contabilità condivisa dal processo."""
+    global _prompt_cache
+
+    with _prompt_cache_lock:
+        if _prompt_cache is None:
+            _prompt_cache = LocalPrefixCache(
+                min_tokens=int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024")),
+                ttl_seconds=float(os.getenv("PROMPT_CACHE_TTL", "300")),
+                discount=float(os.getenv("PROMPT_CACHE_DISCOUNT", "0.75")),
+            )
+        return _prompt_cache
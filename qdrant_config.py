@@ -5,17 +5,50 @@ Supports different deployment scenarios:
 - Local Docker (`QDRANT_HOST`/`QDRANT_PORT`)
 - Qdrant Cloud (`QDRANT_URL`/`QDRANT_API_KEY`)
 - Embedded Qdrant (`QDRANT_LOCATION`, e.g. ':memory:' or a filesystem path)
+
+`QDRANT_HTTPS` forces TLS on or off (an `https://` URL turns it on), and
+`QDRANT_TOKEN`/`QDRANT_API_URL` are accepted as aliases of `QDRANT_API_KEY`/`QDRANT_URL`.
+The collection (alias) names shared by every script are `FAQ_COLLECTION_NAME`
+(default `datapizzai_faq`) and `OFFICIAL_DOCS_COLLECTION` (default
+`datapizza_official_docs`).
+
+The environment resolves to a `QdrantTarget`. `get_qdrant_vectorstore()` and
+`get_qdrant_client()` return one shared vector store (and client) per target
+for the whole process, so the chatbots, the docs retriever, ingestion and the
+maintenance scripts reuse the same pooled connections instead of opening their
+own. `build_qdrant_vectorstore()` still builds a fresh, unshared instance.
+
+Transport and timeouts:
+- `QDRANT_PREFER_GRPC` (default off): use gRPC on `QDRANT_GRPC_PORT` (default 6334)
+  for the operations the client supports over gRPC
+- `QDRANT_POOL_SIZE`: REST connection pool size, with keep-alive. Without it
+  qdrant-client disables keep-alive for localhost. A gRPC channel multiplexes
+  requests over one connection and has no pool.
+- `QDRANT_TIMEOUT_S` (default 30): client-wide timeout (upserts, scrolls, admin calls)
+- `QDRANT_SEARCH_TIMEOUT_S` (default 5) and `QDRANT_RETRIEVE_TIMEOUT_S` (default 5):
+  per-request timeouts of searches and point lookups (0 = client-wide timeout)
+
+Timeouts accept fractional seconds; an unparsable or negative value falls back
+to the default with a warning.
 """
 
 from __future__ import annotations
 
+import math
 import os
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict
 from urllib.parse import urlparse
 
-from datapizza.vectorstores.qdrant import QdrantVectorstore
+if TYPE_CHECKING:
+    # Imported lazily at runtime: the SDKs are only needed once a client is built
+    from datapizza.vectorstores.qdrant import QdrantVectorstore
+    from qdrant_client import QdrantClient
+    from qdrant_client import models as qdrant_models
 
 COLLECTION_NAME = os.getenv("FAQ_COLLECTION_NAME", "datapizzai_faq")
-
+OFFICIAL_DOCS_COLLECTION = os.getenv("OFFICIAL_DOCS_COLLECTION", "datapizza_official_docs")
 
 def _bool_from_env(value: str | None) -> bool | None:
     if value is None:
@@ -23,45 +56,50 @@ def _bool_from_env(value: str | None) -> bool | None:
     return value.lower() in {"1", "true", "yes", "on"}
 
 
-def describe_qdrant_target() -> str:
-    """Human-readable description of the configured Qdrant endpoint."""
+def _seconds_from_env(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        value = -1.0
+    if not math.isfinite(value) or value < 0:
+        print(f"⚠ Invalid {name}={raw!r}, using the default of {default:g} s")
+        return default
+    return value
+
+
+@dataclass(frozen=True)
+class QdrantTarget:
+    """Resolved Qdrant endpoint and transport: the key of the client registry."""
+
+    location: str | None = None
+    host: str = "localhost"
+    port: int = 6333
+    https: bool | None = None
+    prefer_grpc: bool = False
+    grpc_port: int = 6334
+    api_key: str | None = field(default=None, repr=False)
+
+    @property
+    def transport(self) -> str:
+        if self.location:
+            return "embedded"
+        return "grpc" if self.prefer_grpc else "rest"
+
+
+def qdrant_target(prefer_grpc: bool | None = None) -> QdrantTarget:
+    """Resolve the endpoint from the environment (`prefer_grpc` overrides `QDRANT_PREFER_GRPC`)."""
+    api_key = os.getenv("QDRANT_API_KEY") or os.getenv("QDRANT_TOKEN")
+    https = _bool_from_env(os.getenv("QDRANT_HTTPS"))
     location = os.getenv("QDRANT_LOCATION")
     if location:
-        return f"embedded Qdrant at '{location}'"
+        return QdrantTarget(location=location, https=https, api_key=api_key)
 
-    url = os.getenv("QDRANT_URL") or os.getenv("QDRANT_API_URL")
-    if url:
-        parsed = urlparse(url)
-        host = parsed.hostname or "unknown-host"
-        port = parsed.port or ("443" if parsed.scheme == "https" else "80")
-        return f"{parsed.scheme or 'http'}://{host}:{port}"
-
-    host = os.getenv("QDRANT_HOST", "localhost")
-    port = os.getenv("QDRANT_PORT", "6333")
-    scheme = "https" if _bool_from_env(os.getenv("QDRANT_HTTPS")) else "http"
-    return f"{scheme}://{host}:{port}"
-
-
-def build_qdrant_vectorstore() -> QdrantVectorstore:
-    """Instantiate a QdrantVectorstore based on environment configuration."""
-    api_key = os.getenv("QDRANT_API_KEY") or os.getenv("QDRANT_TOKEN")
-    location = os.getenv("QDRANT_LOCATION")
     url = os.getenv("QDRANT_URL") or os.getenv("QDRANT_API_URL")
     host = os.getenv("QDRANT_HOST")
     port = os.getenv("QDRANT_PORT")
-    https_flag = _bool_from_env(os.getenv("QDRANT_HTTPS"))
-
-    kwargs: dict[str, object] = {}
-    if https_flag is not None:
-        kwargs["https"] = https_flag
-
-    if location:
-        return QdrantVectorstore(
-            api_key=api_key,
-            location=location,
-            **kwargs,
-        )
-
     if url:
         parsed = urlparse(url)
         host = parsed.hostname or host
@@ -73,16 +111,123 @@ def build_qdrant_vectorstore() -> QdrantVectorstore:
                 port = "443"
             else:
                 port = "80"
-        if https_flag is None and parsed.scheme == "https":
-            kwargs["https"] = True
-
-    # Fallback to defaults if host/port missing
-    host = host or "localhost"
-    port = int(port) if port else 6333
-
-    return QdrantVectorstore(
-        host=host,
-        port=port,
+        if https is None and parsed.scheme == "https":
+            https = True
+
+    if prefer_grpc is None:
+        prefer_grpc = bool(_bool_from_env(os.getenv("QDRANT_PREFER_GRPC")))
+    return QdrantTarget(
+        # Fallback to defaults if host/port missing
+        host=host or "localhost",
+        port=int(port) if port else 6333,
+        https=https,
+        prefer_grpc=prefer_grpc,
+        grpc_port=int(os.getenv("QDRANT_GRPC_PORT", "6334")),
         api_key=api_key,
-        **kwargs,
     )
+
+
+def describe_qdrant_target(target: QdrantTarget | None = None) -> str:
+    """Human-readable description of the configured Qdrant endpoint."""
+    target = target or qdrant_target()
+    if target.location:
+        return f"embedded Qdrant at '{target.location}'"
+    scheme = "https" if target.https else "http"
+    description = f"{scheme}://{target.host}:{target.port}"
+    if target.prefer_grpc:
+        description += f" (gRPC :{target.grpc_port})"
+    return description
+
+
+def operation_timeout(operation: str) -> int | None:
+    """Per-request timeout in seconds for `search` or `retrieve` (None = client-wide timeout).
+
+    The server-side timeout takes whole seconds, so fractional values are rounded up.
+    """
+    value = _seconds_from_env(f"QDRANT_{operation.upper()}_TIMEOUT_S", 5.0)
+    return math.ceil(value) or None
+
+
+def qdrant_client_kwargs(target: QdrantTarget, pool_size: int | None = None) -> Dict[str, object]:
+    """Keyword arguments forwarded to `QdrantClient` for the target's transport, pool and timeout."""
+    kwargs: Dict[str, object] = {}
+    if target.https is not None:
+        kwargs["https"] = target.https
+    if target.location:
+        kwargs["location"] = target.location
+        return kwargs
+
+    kwargs["timeout"] = _seconds_from_env("QDRANT_TIMEOUT_S", 30.0)
+    if target.prefer_grpc:
+        kwargs["prefer_grpc"] = True
+        kwargs["grpc_port"] = target.grpc_port
+        return kwargs
+
+    if pool_size is None and os.getenv("QDRANT_POOL_SIZE"):
+        pool_size = int(os.getenv("QDRANT_POOL_SIZE"))
+    if pool_size:
+        import httpx
+
+        kwargs["limits"] = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return kwargs
+
+
+def build_qdrant_vectorstore(target: QdrantTarget | None = None, pool_size: int | None = None) -> QdrantVectorstore:
+    """Instantiate a new (unshared) QdrantVectorstore; prefer `get_qdrant_vectorstore()`."""
+    from datapizza.vectorstores.qdrant import QdrantVectorstore
+
+    target = target or qdrant_target()
+    kwargs = qdrant_client_kwargs(target, pool_size)
+    if target.location:
+        return QdrantVectorstore(api_key=target.api_key, **kwargs)
+    return QdrantVectorstore(host=target.host, port=target.port, api_key=target.api_key, **kwargs)
+
+
+_vectorstores: Dict[QdrantTarget, QdrantVectorstore] = {}
+_vectorstores_lock = threading.Lock()
+
+
+def get_qdrant_vectorstore(target: QdrantTarget | None = None) -> QdrantVectorstore:
+    """Process-wide vector store for the target, with its client already built."""
+    target = target or qdrant_target()
+    with _vectorstores_lock:
+        vectorstore = _vectorstores.get(target)
+        if vectorstore is None:
+            vectorstore = build_qdrant_vectorstore(target)
+            # The SDK builds the client lazily without a lock: build it once here
+            vectorstore.get_client()
+            _vectorstores[target] = vectorstore
+        return vectorstore
+
+
+def get_qdrant_client(target: QdrantTarget | None = None) -> QdrantClient:
+    """Shared `QdrantClient` for the target (see `get_qdrant_vectorstore`)."""
+    return get_qdrant_vectorstore(target).get_client()
+
+
+def close_qdrant_clients() -> None:
+    """Close and forget every shared client (tests, benchmarks, shutdown)."""
+    with _vectorstores_lock:
+        vectorstores = list(_vectorstores.values())
+        _vectorstores.clear()
+    for vectorstore in vectorstores:
+        try:
+            vectorstore.get_client().close()
+        except Exception:
+            pass
+
+
+def extract_vector_dimensions(collection_info: qdrant_models.CollectionInfo) -> dict[str, int]:
+    """Return the dense vector dimensions configured on the collection."""
+    from qdrant_client import models as qdrant_models
+
+    dims: dict[str, int] = {}
+    vectors_cfg = collection_info.config.params.vectors
+
+    if isinstance(vectors_cfg, qdrant_models.VectorParams):
+        dims["default"] = vectors_cfg.size
+    elif isinstance(vectors_cfg, dict):
+        for name, params in vectors_cfg.items():
+            if isinstance(params, qdrant_models.VectorParams):
+                dims[name] = params.size
+    return dims
@@ -0,0 +1,90 @@
+"""
+Espansione multi-query della domanda dell'utente.
+
+Con una sola chiamata al modello si ottengono N riformulazioni della domanda
+(la prima è la riscrittura "canonica", equivalente a quella del ToolRewriter).
+Le varianti vengono poi cercate insieme con ``retrieval.multi_query_search``
+(un embed batch e una ricerca batch), quindi i round-trip restano costanti
+mentre il recall aumenta. Le varianti di ogni domanda restano nella cache
+``rewrites`` di ``shared_cache``, versionata sul prompt e sul numero di varianti.
+
+Configurazione tramite variabili d'ambiente:
+- ``FAQ_MULTI_QUERY`` (default off): abilita la modalità multi-query nei chatbot
+- ``FAQ_MULTI_QUERY_VARIANTS`` (default 3): numero di varianti richieste
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from typing import Any, List
+
+from shared_cache import content_version, get_cache
+
+MULTI_QUERY_SYSTEM_PROMPT = """Riscrivi la domanda dell'utente per migliorare il retrieval dalle FAQ di Datapizza-AI.
+Genera {n} varianti diverse della domanda:
+- Mantieni il contesto specifico: "questo framework" si riferisce a "Datapizza-AI"
+- La prima variante è la riscrittura più fedele; le altre usano sinonimi, termini tecnici o angolazioni diverse
+- Mantieni la lingua della domanda originale
+- Restituisci SOLO un array JSON di stringhe, senza spiegazioni aggiuntive."""
+
+
+def multi_query_enabled() -> bool:
+    return os.getenv("FAQ_MULTI_QUERY", "").lower() in {"1", "true", "yes", "on"}
+
+
+def _response_text(response: Any) -> str:
+    content = getattr(response, "content", response)
+    if not isinstance(content, list):
+        return str(content)
+    parts: List[str] = []
+    for block in content:
+        text = getattr(block, "content", block)
+        if isinstance(text, str):
+            parts.append(text)
+    return "".join(parts)
+
+
+def parse_variants(text: str) -> List[str]:
+    """Estrae le varianti da un array JSON (o, in mancanza, da un elenco riga per riga)."""
+    match = re.search(r"\[.*\]", text, re.DOTALL)
+    if match:
+        try:
+            items = json.loads(match.group(0))
+            return [str(item).strip() for item in items if str(item).strip()]
+        except json.JSONDecodeError:
+            pass
+    lines = (re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip().strip('"') for line in text.splitlines())
+    return [line for line in lines if line]
+
+
+class MultiQueryRewriter:
+    """Ottiene N varianti della domanda con una sola chiamata al client."""
+
+    def __init__(self, client: Any, variants: int | None = None, model: str | None = None):
+        self.client = client
+        self.variants = variants or int(os.getenv("FAQ_MULTI_QUERY_VARIANTS", "3"))
+        # Il modello fa parte della versione: un cambio di modello non riusa le varianti in cache
+        self.cache_version = content_version("multi_query", model, MULTI_QUERY_SYSTEM_PROMPT, self.variants)
+
+    def rewrite(self, question: str) -> List[str]:
+        """Restituisce le varianti deduplicate; la domanda originale è sempre inclusa."""
+        cached = get_cache("rewrites").get(self.cache_version, question)
+        if cached is not None:
+            return list(cached)
+        response = self.client.invoke(
+            input=question,
+            system_prompt=MULTI_QUERY_SYSTEM_PROMPT.format(n=self.variants),
+        )
+        variants = parse_variants(_response_text(response))[: self.variants]
+
+        queries: List[str] = []
+        seen = set()
+        for query in [*variants, question]:
+            key = query.casefold()
+            if key not in seen:
+                seen.add(key)
+                queries.append(query)
+        get_cache("rewrites").put(self.cache_version, question, queries)
+        return queries
@@ -0,0 +1,282 @@
+"""
+Migrazione di una collection Qdrant verso un altro spazio di embedding.
+
+Rilegge i payload della collection sorgente (il testo è in ``payload["text"]``),
+ricalcola gli embedding con il provider/modello/dimensione richiesti e scrive
+i punti, con gli stessi ID e payload, in una nuova collection. La sorgente non
+viene toccata: il chatbot continua a usarla finché la configurazione non
+punta alla nuova collection. I parent del layout parent/child (punti senza
+vettore) vengono copiati così come sono. Se la sorgente ha un docstore locale
+(``chunk_docstore.py``) il testo si legge da lì e il docstore viene copiato
+sulla nuova collection.
+
+Tipicamente si porta la documentazione ufficiale nello spazio delle FAQ
+(``--to faq``), così ogni domanda viene embeddata una sola volta e lo stesso
+vettore interroga entrambe le collection (vedi ``embeddings.py``).
+
+Gli embedding dei batch vengono calcolati in parallelo (``--workers``), con un
+numero limitato di batch in volo; alla fine una ricerca di controllo verifica
+che il testo del primo punto ritrovi se stesso nella nuova collection.
+
+Di default la destinazione è una nuova versione dell'alias sorgente (vedi
+``collection_aliases.py``); con ``--promote`` l'alias viene spostato sulla
+nuova versione se la ricerca di controllo passa. Per le collection del chatbot
+``--promote`` è accettato solo se lo spazio di destinazione coincide con quello
+già configurato: altrimenti il chatbot interrogherebbe la nuova versione con
+vettori dello spazio vecchio. Per cambiare spazio l'ordine è: re-embedding
+senza ``--promote``, aggiornamento del ``.env``, promozione
+(``python collection_aliases.py promote``) e riavvio del chatbot. Se la ricerca
+di controllo fallisce, la versione creata automaticamente viene eliminata.
+
+Esempi:
+    python reembed_collection.py --collection datapizza_official_docs --to faq
+    python collection_aliases.py promote --alias datapizza_official_docs --version <versione>
+    python reembed_collection.py --collection datapizzai_faq --provider openai \\
+        --model text-embedding-3-small --target datapizzai_faq_openai
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+from qdrant_client import models as qdrant_models
+
+from chunk_docstore import DOCSTORE_FLAG, copy_docstore, get_docstore, require_docstore
+from collection_aliases import discard_version, new_version_name, promote_version, smoke_search
+from embeddings import EmbeddingSpace, build_embedder, faq_space, official_docs_space, start_embedding_meter
+from qdrant_config import (
+    COLLECTION_NAME,
+    OFFICIAL_DOCS_COLLECTION,
+    describe_qdrant_target,
+    get_qdrant_client,
+)
+from retrieval import is_parent_payload
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+COLLECTION_ENV = {
+    COLLECTION_NAME: ("FAQ_COLLECTION_NAME", "FAQ_EMBEDDING_PROVIDER", "FAQ_EMBEDDING_MODEL", "FAQ_EMBEDDING_DIM"),
+    OFFICIAL_DOCS_COLLECTION: (
+        "OFFICIAL_DOCS_COLLECTION",
+        "OFFICIAL_DOCS_EMBED_PROVIDER",
+        "OFFICIAL_DOCS_EMBED_MODEL",
+        "OFFICIAL_DOCS_EMBEDDING_DIM",
+    ),
+}
+
+
+def _vector_layout(info: Any) -> tuple[str | None, qdrant_models.Distance]:
+    """Nome del vettore denso (None se anonimo) e distanza della collection sorgente."""
+    vectors_cfg = info.config.params.vectors
+    if isinstance(vectors_cfg, qdrant_models.VectorParams):
+        return None, vectors_cfg.distance
+    if isinstance(vectors_cfg, dict) and len(vectors_cfg) == 1:
+        name, params = next(iter(vectors_cfg.items()))
+        return name, params.distance
+    raise ValueError("Sono supportate solo collection con un singolo vettore denso.")
+
+
+def _vector_struct(vector_name: str | None, vector: List[float] | None) -> Any:
+    if vector is None:
+        return {}
+    return {vector_name: vector} if vector_name else vector
+
+
+def reembed_collection(
+    collection: str,
+    target: str,
+    space: EmbeddingSpace,
+    batch_size: int = 64,
+    workers: int = 4,
+    recreate: bool = False,
+) -> Dict[str, Any]:
+    """Copia ``collection`` in ``target`` ricalcolando gli embedding nello spazio indicato."""
+    client = get_qdrant_client()
+    vector_name, distance = _vector_layout(client.get_collection(collection))
+    embedder = build_embedder(space)
+    meter = start_embedding_meter()
+    # Con il docstore i payload non contengono il testo
+    docstore = get_docstore(client, collection)
+
+    def _text(point: Any) -> str:
+        payload = point.payload or {}
+        text = payload.get("text")
+        if not text and (docstore is not None or payload.get(DOCSTORE_FLAG)):
+            store = docstore or require_docstore(client, collection)
+            text = store.records([str(point.id)]).get(str(point.id), ("", {}))[0]
+        return text or ""
+
+    if client.collection_exists(target):
+        if not recreate:
+            raise RuntimeError(f"La collection '{target}' esiste già: usa --recreate per sovrascriverla.")
+        client.delete_collection(target)
+
+    # La dimensione del nuovo spazio determina la collection di destinazione
+    dimension = len(embedder.embed("Datapizza-AI embedding dimension probe."))
+    vector_params = qdrant_models.VectorParams(size=dimension, distance=distance)
+    client.create_collection(
+        collection_name=target,
+        vectors_config={vector_name: vector_params} if vector_name else vector_params,
+    )
+
+    stats: Dict[str, Any] = {"points": 0, "parents": 0, "skipped": 0, "dimension": dimension, "first_point": None}
+    started = time.perf_counter()
+
+    def _embed_and_upsert(points: List[Any], texts: Dict[Any, str]) -> int:
+        # I parent del layout parent/child restano senza vettore
+        indexed = [point for point in points if not is_parent_payload(point.payload)]
+        vectors = dict(zip(
+            (point.id for point in indexed),
+            embedder.embed([texts[point.id] for point in indexed]) if indexed else [],
+        ))
+        client.upsert(
+            collection_name=target,
+            points=[
+                qdrant_models.PointStruct(
+                    id=point.id,
+                    vector=_vector_struct(vector_name, vectors.get(point.id)),
+                    payload=point.payload,
+                )
+                for point in points
+            ],
+            wait=True,
+        )
+        return len(points)
+
+    offset = None
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            texts = {point.id: _text(point) for point in points}
+            batch = [point for point in points if texts[point.id]]
+            stats["skipped"] += len(points) - len(batch)
+            stats["parents"] += sum(1 for point in batch if is_parent_payload(point.payload))
+            if stats["first_point"] is None:
+                stats["first_point"] = next(
+                    ((p, texts[p.id]) for p in batch if not is_parent_payload(p.payload)), None
+                )
+            if batch:
+                # Limita i batch in volo per mantenere la memoria costante
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    stats["points"] += sum(future.result() for future in done)
+                pending.add(executor.submit(_embed_and_upsert, batch, texts))
+            if offset is None:
+                break
+        for future in pending:
+            stats["points"] += future.result()
+
+    stats["seconds"] = time.perf_counter() - started
+    stats["embedding"] = meter.snapshot()
+    stats["vector_name"] = vector_name
+    first_point = stats.pop("first_point")
+    stats["smoke_check"] = None
+    if first_point is not None:
+        point, text = first_point
+        stats["smoke_check"] = smoke_search(
+            client,
+            target,
+            embedder.embed(text),
+            vector_name=vector_name,
+            expected_id=point.id,
+        )
+    stats["docstore"] = docstore is not None and copy_docstore(docstore.collection, target)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ricalcola gli embedding di una collection in un nuovo spazio.")
+    parser.add_argument("--collection", default=OFFICIAL_DOCS_COLLECTION, help="Collection sorgente")
+    parser.add_argument("--to", choices=["faq", "docs"], help="Usa lo spazio di embedding configurato per FAQ o docs")
+    parser.add_argument("--provider", choices=["google", "openai"], help="Provider dello spazio di destinazione")
+    parser.add_argument("--model", help="Modello dello spazio di destinazione")
+    parser.add_argument("--dimensions", type=int, help="Dimensione (troncamento Matryoshka) dello spazio di destinazione")
+    parser.add_argument("--target", help="Collection di destinazione (default: nuova versione dell'alias sorgente)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4, help="Batch di embedding in parallelo")
+    parser.add_argument("--recreate", action="store_true", help="Ricrea la collection di destinazione se esiste")
+    parser.add_argument("--promote", action="store_true", help="Sposta l'alias sorgente sulla nuova versione")
+    args = parser.parse_args()
+
+    if args.to:
+        space = faq_space() if args.to == "faq" else official_docs_space()
+    elif args.provider and args.model:
+        space = EmbeddingSpace(provider=args.provider, model=args.model, dimensions=args.dimensions)
+    else:
+        parser.error("indica --to faq|docs oppure --provider e --model")
+    if args.dimensions and args.to:
+        space = EmbeddingSpace(provider=space.provider, model=space.model, dimensions=args.dimensions)
+    target = args.target or new_version_name(args.collection)
+    if args.promote and args.collection in COLLECTION_ENV:
+        # L'alias non può passare a uno spazio diverso da quello con cui il chatbot embedda le domande
+        configured = faq_space() if args.collection == COLLECTION_NAME else official_docs_space()
+        if space != configured:
+            parser.error(
+                f"--promote cambierebbe lo spazio di '{args.collection}' ({configured.label} → {space.label}) "
+                "prima del .env: esegui senza --promote, aggiorna il .env, poi "
+                f"'python collection_aliases.py promote --alias {args.collection} --version <versione>' e riavvia"
+            )
+
+    print("=" * 70)
+    print(f"🔁 Re-embedding '{args.collection}' → '{target}' ({space.label})")
+    print(f"🔗 Target Qdrant: {describe_qdrant_target()}")
+    print("=" * 70)
+
+    stats = reembed_collection(args.collection, target, space, args.batch_size, args.workers, args.recreate)
+    rate = stats["points"] / stats["seconds"] if stats["seconds"] else 0.0
+    print(
+        f"✓ {stats['points']} punti migrati in {stats['seconds']:.1f}s ({rate:.1f} punti/s), "
+        f"{stats['dimension']} dim, {stats['embedding']['calls']} chiamate di embedding"
+    )
+    if stats["skipped"]:
+        print(f"⚠ Punti senza testo saltati: {stats['skipped']}")
+    if stats["docstore"]:
+        print(f"📦 Docstore locale copiato su '{target}'")
+    smoke = stats["smoke_check"]
+    if smoke:
+        status = "✅" if smoke["passed"] else "❌"
+        print(f"{status} Ricerca di controllo: punto {smoke['expected_id']} → {smoke['top_id']} (score {smoke['top_score']})")
+
+    promoted = False
+    if args.promote:
+        if not smoke or not smoke["passed"]:
+            if not args.target:
+                discard_version(get_qdrant_client(), target)
+            raise RuntimeError(f"Ricerca di controllo fallita: l'alias '{args.collection}' non viene spostato.")
+        previous = promote_version(get_qdrant_client(), args.collection, target)
+        promoted = True
+        print(f"🔀 Alias '{args.collection}' → '{target}' (prima: {previous or 'nessuna'})")
+
+    env_names = COLLECTION_ENV.get(args.collection)
+    if env_names:
+        collection_env, provider_env, model_env, dim_env = env_names
+        print("\nAggiorna lo spazio di embedding nel file .env:")
+        if not promoted:
+            print(f"   {collection_env}={target}")
+        print(f"   {provider_env}={space.provider}")
+        print(f"   {model_env}={space.model}")
+        if space.dimensions:
+            print(f"   {dim_env}={space.dimensions}")
+        if faq_space() == official_docs_space() or args.to:
+            print("   (con FAQ e docs nello stesso spazio ogni domanda viene embeddata una sola volta)")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,38 @@
+"""
+Stato di una singola domanda, separato dall'istanza del chatbot.
+
+Un'istanza di ``EnhancedFAQChatbot`` o ``FAQChatbot`` contiene solo client,
+vector store e pipeline, costruiti una volta e poi solo letti: può quindi
+servire in parallelo le domande di più sessioni (thread o task asyncio).
+Memory, lingua, sessione e opzioni viaggiano in un ``RequestContext`` creato
+per ogni domanda; ``answer``/``answer_async`` restituiscono un ``ChatAnswer``
+con la risposta e la sua trace invece di scriverle sull'istanza.
+
+``ask``/``ask_async`` restano per l'uso a sessione singola (terminale, test):
+usano ``self.memory`` e aggiornano ``self.last_debug_info``, quindi non vanno
+chiamati in parallelo sulla stessa istanza.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict
+
+
+@dataclass
+class RequestContext:
+    """Stato per-domanda: memory della sessione e opzioni della richiesta."""
+
+    memory: Any
+    language: str = "it"
+    session_id: str | None = None
+    use_official_docs: bool = False
+    debug_mode: bool = False
+
+
+@dataclass
+class ChatAnswer:
+    """Risposta di una domanda con la sua trace di debug (None se l'elaborazione è fallita)."""
+
+    text: str
+    trace: Dict[str, Any] | None = None
@@ -0,0 +1,285 @@
+"""
+Hedged requests e circuit breaker per i backend del retrieval.
+
+- ``CircuitBreaker``: dopo N errori consecutivi il breaker si apre e le chiamate
+  falliscono subito con ``CircuitOpenError``; trascorso ``reset_timeout`` lascia
+  passare una richiesta di prova (half-open) e si richiude se va a buon fine.
+- ``hedged_call``: se la prima richiesta supera il p95 osservato ne lancia una
+  seconda identica e usa la prima risposta che arriva, tagliando la coda
+  della distribuzione di latenza.
+
+I breaker sono condivisi nel processo e identificati per nome (es.
+``qdrant:datapizzai_faq``, ``openai_embedder``), così tutte le sessioni vedono
+lo stesso stato di salute dei backend.
+
+Configurazione tramite variabili d'ambiente:
+- ``CIRCUIT_FAILURE_THRESHOLD`` (default 3) e ``CIRCUIT_RESET_TIMEOUT`` (secondi, default 30)
+- ``HEDGE_MIN_SAMPLES`` (default 20): campioni minimi prima di attivare l'hedging
+- ``HEDGE_ENABLED`` (default on)
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict
+
+from cost_ledger import counted_call
+from perf_stats import percentile
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Il backend è considerato non disponibile: la chiamata non viene eseguita."""
+
+
+class CircuitBreaker:
+    """Circuit breaker thread-safe con stato closed → open → half-open."""
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """True se le chiamate verrebbero rifiutate subito (nessuna prova disponibile)."""
+        with self._lock:
+            state = self._current_state()
+            return state == OPEN or (state == HALF_OPEN and self._probe_in_flight)
+
+    def allow_request(self) -> bool:
+        """Prenota l'esecuzione di una chiamata; in half-open lascia passare una sola prova."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._state = HALF_OPEN
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.trips += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def call(self, func: Callable, *args, **kwargs):
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit '{self.name}' aperto: backend temporaneamente escluso")
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    async def a_call(self, func: Callable, *args, **kwargs):
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit '{self.name}' aperto: backend temporaneamente escluso")
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self._current_state(),
+                "consecutive_failures": self._consecutive_failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+class LatencyTracker:
+    """Finestra mobile delle latenze osservate per stimare il p95."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count_hedge(self, won: bool = False) -> None:
+        """Conta una richiesta di riserva lanciata (``won=False``) o vincente (``won=True``)."""
+        with self._lock:
+            if won:
+                self.hedges_won += 1
+            else:
+                self.hedges_fired += 1
+
+    def hedge_delay(self) -> float | None:
+        """Ritardo dopo cui lanciare la richiesta di riserva (None se i campioni sono pochi)."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            return percentile(self._samples, 95)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            p95 = percentile(self._samples, 95)
+            return {
+                "samples": len(self._samples),
+                "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+                "hedges_fired": self.hedges_fired,
+                "hedges_won": self.hedges_won,
+            }
+
+
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+def hedged_call(tracker: LatencyTracker, func: Callable, *args, **kwargs):
+    """Esegue ``func`` con una richiesta di riserva se la prima supera il p95 osservato."""
+    delay = tracker.hedge_delay() if os.getenv("HEDGE_ENABLED", "1").lower() in {"1", "true", "yes", "on"} else None
+    started = time.perf_counter()
+
+    if delay is None:
+        result = func(*args, **kwargs)
+        tracker.record(time.perf_counter() - started)
+        return result
+
+    # Ogni richiesta nel contesto del chiamante (cassetta, meter, costo della domanda);
+    # un Context non può essere attivo in due thread, quindi una copia per richiesta
+    primary = _hedge_executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        result = primary.result()
+        tracker.record(time.perf_counter() - started)
+        return result
+
+    tracker.count_hedge(won=False)
+    backup = _hedge_executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+    pending = {primary, backup}
+    last_error: BaseException | None = None
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                last_error = future.exception()
+                continue
+            if future is backup:
+                tracker.count_hedge(won=True)
+            tracker.record(time.perf_counter() - started)
+            return future.result()
+
+    raise last_error
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_trackers: Dict[str, LatencyTracker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Restituisce il breaker condiviso per il backend indicato."""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3")),
+                reset_timeout=float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30")),
+            )
+        return _breakers[name]
+
+
+def get_latency_tracker(name: str) -> LatencyTracker:
+    with _registry_lock:
+        if name not in _trackers:
+            _trackers[name] = LatencyTracker(min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", "20")))
+        return _trackers[name]
+
+
+def qdrant_breaker_name(collection: str) -> str:
+    return f"qdrant:{collection}"
+
+
+def resilient_call(name: str, func: Callable, *args, **kwargs):
+    """Esegue ``func`` hedged e protetta dal breaker ``name`` (es. ``qdrant:<collection>``).
+
+    Ogni richiesta effettiva (comprese quelle di riserva) viene contata nel
+    costo della domanda corrente (``cost_ledger``).
+    """
+    return get_breaker(name).call(hedged_call, get_latency_tracker(name), counted_call(name, func), *args, **kwargs)
+
+
+def with_circuit_breaker(obj: Any, breaker: CircuitBreaker, methods: tuple[str, ...]) -> Any:
+    """Protegge i metodi indicati (sync o async) di un client con il breaker."""
+    for method in methods:
+        func = getattr(obj, method, None)
+        if func is None or not callable(func):
+            continue
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, _func=func, **kwargs):
+                return await breaker.a_call(_func, *args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, _func=func, **kwargs):
+                return breaker.call(_func, *args, **kwargs)
+        setattr(obj, method, wrapper)
+    return obj
+
+
+def resilience_snapshot() -> Dict[str, Any]:
+    """Stato di tutti i breaker e tracker registrati nel processo."""
+    with _registry_lock:
+        breakers = list(_breakers.values())
+        trackers = dict(_trackers)
+    return {
+        "breakers": {b.name: b.snapshot() for b in breakers},
+        "hedging": {name: t.snapshot() for name, t in trackers.items()},
+    }
@@ -0,0 +1,526 @@
+"""
+Ricerca vettoriale su Qdrant con punteggi di similarità.
+
+Le collection vengono interrogate direttamente tramite il client Qdrant, così
+ogni chunk restituito porta con sé lo score e la ricerca passa sempre da
+hedging e circuit breaker. In modalità multi-query le varianti della domanda
+vengono cercate con un'unica ``query_batch_points`` e fuse per rango (RRF).
+Quando FAQ e documentazione condividono lo spazio di embedding,
+``search_collections`` usa gli stessi vettori su entrambe le collection, con
+le ricerche in parallelo.
+
+Layout parent/child (``ingest_faq.py --chunking parent``): nella collection
+sono indicizzati solo piccoli span figli con ``parent_id`` nei metadati, mentre
+le sezioni parent sono punti senza vettore. ``search_parents`` cerca
+``k × FAQ_CHILD_OVERFETCH`` figli, li raggruppa per parent, recupera ogni
+parent una sola volta (una ``retrieve``) e lo limita a ``FAQ_PARENT_MAX_CHARS``
+caratteri attorno agli span trovati. Su collection senza parent restituisce i
+primi ``k`` chunk come ``search_chunks``.
+
+Docstore locale (``chunk_docstore.py``): se la versione servita ne ha uno, le
+ricerche chiedono a Qdrant solo ID e score (``with_payload=False``) e leggono i
+metadati dal docstore; i chunk restano senza testo finché ``hydrate_texts`` non
+lo legge per quelli scelti per il prompt. Anche i parent vengono letti dal
+docstore invece che con una ``retrieve``. Se Qdrant restituisce punti marcati
+come "testo nel docstore" e i file non si trovano, la ricerca solleva
+``DocstoreUnavailable``. ``start_transfer_meter`` conta i byte
+di payload ricevuti da Qdrant e quelli letti dal docstore.
+
+Dopo il retrieval il ``RelevanceGate`` confronta il miglior score di FAQ e
+documentazione con le soglie calibrate: se nessuna fonte le supera il chatbot
+risponde subito con il fallback localizzato, senza chiamare il generatore.
+
+Soglie configurabili tramite variabili d'ambiente:
+- ``FAQ_RELEVANCE_THRESHOLD`` (default: ``score_threshold`` passato ad ``ask``)
+- ``OFFICIAL_DOCS_RELEVANCE_THRESHOLD`` (default 0.3, embedding OpenAI)
+- ``RELEVANCE_GATE_ENABLED`` (default on)
+- ``FAQ_CHILD_OVERFETCH`` (default 3), ``FAQ_PARENT_MAX_CHARS`` (default 1500)
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Collection, Dict, List, Sequence, Tuple
+
+from chunk_docstore import DOCSTORE_FLAG, ChunkDocstore, get_docstore, physical_collection, require_docstore
+from qdrant_config import extract_vector_dimensions, operation_timeout
+from resilience import qdrant_breaker_name, resilient_call
+
+
+@dataclass
+class RetrievedChunk:
+    """Chunk recuperato da Qdrant: stessi attributi usati dai template (``text``, ``metadata``)."""
+
+    id: str
+    text: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    score: float | None = None
+
+
+_vector_names: Dict[str, str | None] = {}
+_vector_names_lock = threading.Lock()
+
+
+def _vector_name(client, collection: str, refresh: bool = False) -> str | None:
+    """Nome del vettore denso della collection (None se anonimo), con caching.
+
+    La cache è per collection fisica: dopo uno spostamento dell'alias su una
+    versione con un altro layout il nome viene riletto.
+    """
+    physical = physical_collection(client, collection, refresh)
+    with _vector_names_lock:
+        if physical in _vector_names and not refresh:
+            return _vector_names[physical]
+
+    dims = extract_vector_dimensions(client.get_collection(physical))
+    name = next((n for n in dims if n != "default"), None)
+    with _vector_names_lock:
+        _vector_names[physical] = name
+    return name
+
+
+def _with_vector_name(client, collection: str, search: Callable[[str | None], Any]) -> Any:
+    """Esegue ``search(using)``; se fallisce e l'alias è passato a un altro layout, riprova col nome nuovo.
+
+    La collection fisica dietro l'alias è in cache per qualche secondo: subito
+    dopo ``promote_version`` o ``rollback`` il nome in cache può essere vecchio.
+    """
+    vector_name = _vector_name(client, collection)
+    try:
+        return search(vector_name)
+    except Exception:
+        fresh = _vector_name(client, collection, refresh=True)
+        if fresh == vector_name:
+            raise
+        return search(fresh)
+
+
+def chunk_from_point(point) -> RetrievedChunk:
+    """Converte un punto Qdrant (payload ``text`` + ``metadata``) in RetrievedChunk."""
+    payload = point.payload or {}
+    metadata = payload.get("metadata")
+    if not isinstance(metadata, dict):
+        metadata = {key: value for key, value in payload.items() if key != "text"}
+    return RetrievedChunk(
+        id=str(point.id),
+        text=payload.get("text") or "",
+        metadata=metadata,
+        score=getattr(point, "score", None),
+    )
+
+
+class TransferMeter:
+    """Byte di payload ricevuti da Qdrant e letti dal docstore durante una richiesta."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.qdrant_bytes = 0
+        self.docstore_bytes = 0
+        self.points = 0
+
+    def record(self, qdrant_bytes: int = 0, docstore_bytes: int = 0, points: int = 0) -> None:
+        with self._lock:
+            self.qdrant_bytes += qdrant_bytes
+            self.docstore_bytes += docstore_bytes
+            self.points += points
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "qdrant_payload_bytes": self.qdrant_bytes,
+                "docstore_bytes": self.docstore_bytes,
+                "points": self.points,
+            }
+
+
+_current_transfer: contextvars.ContextVar[TransferMeter | None] = contextvars.ContextVar(
+    "transfer_meter", default=None
+)
+
+
+def start_transfer_meter() -> TransferMeter:
+    """Crea il meter dei byte della richiesta corrente (contesto del task asyncio o del thread)."""
+    meter = TransferMeter()
+    _current_transfer.set(meter)
+    return meter
+
+
+def _payload_bytes(points) -> int:
+    """Dimensione JSON dei payload ricevuti (approssima i byte della risposta oltre a ID e score)."""
+    return sum(
+        len(json.dumps(point.payload, ensure_ascii=False, default=str).encode("utf-8"))
+        for point in points
+        if point.payload
+    )
+
+
+def _record_points(points) -> None:
+    meter = _current_transfer.get()
+    if meter is not None:
+        meter.record(qdrant_bytes=_payload_bytes(points), points=len(points))
+
+
+def _record_docstore(docstore: ChunkDocstore, ids: List[str], with_text: bool) -> None:
+    meter = _current_transfer.get()
+    if meter is not None:
+        meter.record(docstore_bytes=docstore.read_bytes(ids, with_text))
+
+
+def _read_docstore(client, collection: str, ids: List[str], with_text: bool) -> Dict[str, Any]:
+    """Metadati (o testo e metadati) dal docstore; un ID mancante fa rileggere l'alias una volta."""
+    docstore = get_docstore(client, collection)
+    if docstore is None:
+        return {}
+    read = docstore.records if with_text else docstore.metadata
+    found = read(ids)
+    if len(found) < len(ids):
+        # Alias appena spostato su una nuova versione: docstore della versione nuova
+        refreshed = get_docstore(client, collection, refresh=True)
+        if refreshed is not None and refreshed is not docstore:
+            docstore = refreshed
+            found = (docstore.records if with_text else docstore.metadata)(ids)
+    _record_docstore(docstore, list(found), with_text)
+    return found
+
+
+def _chunks_from_response(client, collection: str, points, docstore: bool) -> List[RetrievedChunk]:
+    _record_points(points)
+    if not docstore and any((point.payload or {}).get(DOCSTORE_FLAG) for point in points):
+        # Versione con docstore non ancora aperto da questo processo: senza file si solleva
+        require_docstore(client, collection)
+        docstore = True
+    if not docstore:
+        return [chunk_from_point(point) for point in points]
+    metadata = _read_docstore(client, collection, [str(point.id) for point in points], with_text=False)
+    return [
+        RetrievedChunk(id=str(point.id), text="", metadata=metadata.get(str(point.id), {}), score=point.score)
+        for point in points
+    ]
+
+
+def search_chunks(vectorstore, collection: str, query_vector: List[float], k: int) -> List[RetrievedChunk]:
+    """Cerca i ``k`` chunk più simili nella collection, con score.
+
+    Con il docstore i chunk hanno i metadati ma non il testo (vedi ``hydrate_texts``).
+    """
+    client = vectorstore.get_client()
+    docstore = get_docstore(client, collection) is not None
+
+    response = _with_vector_name(client, collection, lambda vector_name: resilient_call(
+        qdrant_breaker_name(collection),
+        client.query_points,
+        collection_name=collection,
+        query=query_vector,
+        using=vector_name,
+        limit=k,
+        with_payload=not docstore,
+        timeout=operation_timeout("search"),
+    ))
+    return _chunks_from_response(client, collection, response.points, docstore)
+
+
+def search_chunks_batch(
+    vectorstore, collection: str, query_vectors: List[List[float]], k: int
+) -> List[List[RetrievedChunk]]:
+    """Cerca più vettori nella stessa collection con una sola richiesta ``query_batch_points``."""
+    from qdrant_client import models
+
+    client = vectorstore.get_client()
+    docstore = get_docstore(client, collection) is not None
+
+    def _search(vector_name: str | None) -> Any:
+        requests = [
+            models.QueryRequest(query=vector, using=vector_name, limit=k, with_payload=not docstore)
+            for vector in query_vectors
+        ]
+        return resilient_call(
+            qdrant_breaker_name(collection),
+            client.query_batch_points,
+            collection_name=collection,
+            requests=requests,
+            timeout=operation_timeout("search"),
+        )
+
+    responses = _with_vector_name(client, collection, _search)
+    return [_chunks_from_response(client, collection, response.points, docstore) for response in responses]
+
+
+def hydrate_texts(vectorstore, collection: str, chunks: List[RetrievedChunk]) -> List[RetrievedChunk]:
+    """Legge dal docstore il testo dei chunk che ne sono privi (in place); restituisce i chunk.
+
+    Va chiamata solo sui chunk che finiranno nel prompt: senza docstore, o con
+    chunk che hanno già il testo, non fa nulla.
+    """
+    missing = [chunk.id for chunk in chunks if not chunk.text]
+    if not missing:
+        return chunks
+    records = _read_docstore(vectorstore.get_client(), collection, missing, with_text=True)
+    for chunk in chunks:
+        if not chunk.text and chunk.id in records:
+            chunk.text = records[chunk.id][0]
+    return chunks
+
+
+def reciprocal_rank_fusion(rankings: List[List[RetrievedChunk]], limit: int, rrf_k: int = 60) -> List[RetrievedChunk]:
+    """Fonde più classifiche per rango (RRF).
+
+    L'ordine segue il punteggio RRF; ``score`` resta la similarità migliore
+    osservata per il chunk, così il gate di rilevanza mantiene la sua scala.
+    """
+    fused: Dict[str, float] = {}
+    best: Dict[str, RetrievedChunk] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, start=1):
+            fused[chunk.id] = fused.get(chunk.id, 0.0) + 1.0 / (rrf_k + rank)
+            current = best.get(chunk.id)
+            if current is None or (chunk.score or 0.0) > (current.score or 0.0):
+                best[chunk.id] = chunk
+
+    ordered = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return [best[chunk_id] for chunk_id in ordered]
+
+
+def multi_query_search(vectorstore, collection: str, embedder, queries: List[str], k: int) -> List[RetrievedChunk]:
+    """Un embed batch per tutte le varianti, una ricerca batch, poi fusione RRF."""
+    vectors = embedder.embed(queries)
+    return reciprocal_rank_fusion(search_chunks_batch(vectorstore, collection, vectors, k), limit=k)
+
+
+PARENT_KIND = "parent"
+CHILD_OVERFETCH = int(os.getenv("FAQ_CHILD_OVERFETCH", "3"))
+PARENT_MAX_CHARS = int(os.getenv("FAQ_PARENT_MAX_CHARS", "1500"))
+
+
+def is_parent_payload(payload: Dict[str, Any] | None) -> bool:
+    """True per i punti parent (senza vettore) del layout parent/child."""
+    payload = payload or {}
+    metadata = payload.get("metadata") if isinstance(payload.get("metadata"), dict) else payload
+    return metadata.get("kind") == PARENT_KIND
+
+
+def cap_parent_text(text: str, spans: Sequence[Tuple[int, int]], max_chars: int = PARENT_MAX_CHARS) -> str:
+    """Limita il parent a ``max_chars`` caratteri centrati sugli span dei figli trovati."""
+    if len(text) <= max_chars or max_chars <= 0:
+        return text
+    if not spans:
+        return text[:max_chars].rstrip() + " …"
+
+    low = min(start for start, _ in spans)
+    high = max(end for _, end in spans)
+    if high - low >= max_chars:
+        # Span distanti: solo i frammenti trovati, nell'ordine del testo
+        return " … ".join(text[start:end].strip() for start, end in sorted(spans))[:max_chars]
+
+    slack = max_chars - (high - low)
+    end = min(len(text), high + slack - slack // 2)
+    start = max(0, end - max_chars)
+    end = min(len(text), start + max_chars)
+    return ("… " if start else "") + text[start:end].strip() + (" …" if end < len(text) else "")
+
+
+def expand_parents(
+    vectorstore, collection: str, chunks: List[RetrievedChunk], limit: int, max_chars: int = PARENT_MAX_CHARS
+) -> List[RetrievedChunk]:
+    """Raggruppa i figli per parent e restituisce al più ``limit`` parent, ciascuno una volta.
+
+    L'ordine è quello del miglior figlio di ogni parent e lo ``score`` del
+    parent è lo score di quel figlio, così il gate di rilevanza resta valido.
+    I chunk senza ``parent_id`` (layout piatto) passano invariati. I parent si
+    leggono dal docstore se la versione ne ha uno, altrimenti con una ``retrieve``.
+    """
+    groups: Dict[str, List[RetrievedChunk]] = {}
+    for chunk in chunks:
+        key = chunk.metadata.get("parent_id") or chunk.id
+        if key in groups or len(groups) < limit:
+            groups.setdefault(key, []).append(chunk)
+
+    parent_ids = [key for key, children in groups.items() if children[0].metadata.get("parent_id")]
+    parents: Dict[str, RetrievedChunk] = {}
+    if parent_ids:
+        client = vectorstore.get_client()
+        if get_docstore(client, collection) is not None:
+            records = _read_docstore(client, collection, parent_ids, with_text=True)
+            parents = {
+                key: RetrievedChunk(id=key, text=text, metadata=metadata)
+                for key, (text, metadata) in records.items()
+            }
+        else:
+            points = resilient_call(
+                qdrant_breaker_name(collection),
+                client.retrieve,
+                collection_name=collection,
+                ids=parent_ids,
+                with_payload=True,
+                timeout=operation_timeout("retrieve"),
+            )
+            _record_points(points)
+            parents = {str(point.id): chunk_from_point(point) for point in points}
+
+    expanded: List[RetrievedChunk] = []
+    for key, children in groups.items():
+        if not children[0].metadata.get("parent_id"):
+            expanded.append(children[0])
+            continue
+        spans = [
+            (child.metadata["span_start"], child.metadata["span_end"])
+            for child in children
+            if "span_start" in child.metadata and "span_end" in child.metadata
+        ]
+        parent = parents.get(key)
+        if parent is None:
+            # Parent mancante: si usano i soli span trovati
+            hydrate_texts(vectorstore, collection, children)
+            text = " … ".join(child.text for child in children)[:max_chars]
+            metadata = {k: v for k, v in children[0].metadata.items() if not k.startswith("span_")}
+        else:
+            text = cap_parent_text(parent.text, spans, max_chars)
+            metadata = dict(parent.metadata)
+        metadata["child_ids"] = [child.id for child in children]
+        expanded.append(RetrievedChunk(id=key, text=text, metadata=metadata, score=children[0].score))
+    return expanded
+
+
+def search_parents(vectorstore, collection: str, vectors: List[List[float]], k: int) -> List[RetrievedChunk]:
+    """Cerca i figli (``k × FAQ_CHILD_OVERFETCH``) e restituisce al più ``k`` parent distinti."""
+    children = _search_vectors(vectorstore, collection, vectors, k * max(CHILD_OVERFETCH, 1))
+    return expand_parents(vectorstore, collection, children, k)
+
+
+_search_executor: ThreadPoolExecutor | None = None
+_search_executor_lock = threading.Lock()
+
+
+def _get_search_executor() -> ThreadPoolExecutor:
+    global _search_executor
+
+    with _search_executor_lock:
+        if _search_executor is None:
+            _search_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("RETRIEVAL_SEARCH_WORKERS", "8")),
+                thread_name_prefix="qdrant-search",
+            )
+        return _search_executor
+
+
+def _search_vectors(vectorstore, collection: str, vectors: List[List[float]], k: int) -> List[RetrievedChunk]:
+    if len(vectors) == 1:
+        return search_chunks(vectorstore, collection, vectors[0], k)
+    return reciprocal_rank_fusion(search_chunks_batch(vectorstore, collection, vectors, k), limit=k)
+
+
+def search_collections(
+    vectorstore,
+    searches: Sequence[Tuple[str, List[List[float]], int]],
+    parent_collections: Collection[str] = (),
+    timings: Dict[str, float] | None = None,
+) -> List[List[RetrievedChunk] | Exception]:
+    """Cerca gli stessi vettori di query su più collection, in parallelo.
+
+    Qdrant non ha una richiesta batch tra collection diverse: ogni collection
+    riceve una sola richiesta (batch + RRF se i vettori sono più di uno) e le
+    richieste partono insieme. Come ``asyncio.gather(return_exceptions=True)``,
+    l'errore di una collection viene restituito al posto dei suoi risultati.
+    Le collection in ``parent_collections`` passano da ``search_parents``.
+    Con ``timings`` la durata di ogni ricerca (ms) viene registrata per collection.
+    """
+
+    def _timed(search: Callable[..., List[RetrievedChunk]], collection: str, *args: Any) -> List[RetrievedChunk]:
+        started = time.perf_counter()
+        try:
+            return search(vectorstore, collection, *args)
+        finally:
+            if timings is not None:
+                timings[collection] = round((time.perf_counter() - started) * 1000, 1)
+
+    executor = _get_search_executor()
+    futures = [
+        executor.submit(
+            contextvars.copy_context().run,
+            _timed,
+            search_parents if collection in parent_collections else _search_vectors,
+            collection,
+            vectors,
+            k,
+        )
+        for collection, vectors, k in searches
+    ]
+    results: List[List[RetrievedChunk] | Exception] = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as exc:
+            results.append(exc)
+    return results
+
+
+def best_score(chunks: List[RetrievedChunk]) -> float | None:
+    scores = [chunk.score for chunk in chunks if chunk.score is not None]
+    return max(scores) if scores else None
+
+
+def faq_relevance_threshold(default: float) -> float:
+    value = os.getenv("FAQ_RELEVANCE_THRESHOLD")
+    return float(value) if value else default
+
+
+OFFICIAL_DOCS_RELEVANCE_THRESHOLD = float(os.getenv("OFFICIAL_DOCS_RELEVANCE_THRESHOLD", "0.3"))
+
+
+class RelevanceGate:
+    """Decide se il contesto recuperato giustifica una generazione; tiene i contatori."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.short_circuited = 0
+
+    @staticmethod
+    def enabled() -> bool:
+        return os.getenv("RELEVANCE_GATE_ENABLED", "1").lower() in {"1", "true", "yes", "on"}
+
+    def evaluate(
+        self,
+        faq_score: float | None,
+        faq_threshold: float,
+        docs_score: float | None = None,
+        docs_threshold: float = OFFICIAL_DOCS_RELEVANCE_THRESHOLD,
+    ) -> Dict[str, Any]:
+        """Restituisce la decisione (``passed``) con score e soglie usate."""
+        faq_passed = faq_score is not None and faq_score >= faq_threshold
+        docs_passed = docs_score is not None and docs_score >= docs_threshold
+        passed = faq_passed or docs_passed or not self.enabled()
+
+        with self._lock:
+            self.checked += 1
+            if not passed:
+                self.short_circuited += 1
+
+        return {
+            "passed": passed,
+            "best_faq_score": round(faq_score, 4) if faq_score is not None else None,
+            "faq_threshold": faq_threshold,
+            "best_docs_score": round(docs_score, 4) if docs_score is not None else None,
+            "docs_threshold": docs_threshold,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "short_circuited": self.short_circuited,
+                "llm_calls_saved": self.short_circuited,
+            }
+
+
+_relevance_gate = RelevanceGate()
+
+
+def get_relevance_gate() -> RelevanceGate:
+    """Gate condiviso dal processo (i contatori aggregano tutte le sessioni)."""
+    return _relevance_gate
@@ -0,0 +1,418 @@
+"""
+Benchmark offline di qualità e latenza del retrieval.
+
+Esegue un set di domande etichettate (italiano, inglese, tedesco) contro una
+collection Qdrant e calcola recall@k, MRR e nDCG@k, più la latenza di ogni
+ricerca. Gli embedding delle domande sono letti da una cache su disco, così
+il benchmark gira senza chiamare l'embedder: basta popolarla una volta con
+``--refresh-cache`` (richiede GOOGLE_API_KEY).
+
+Un risultato è rilevante se la ``source`` del chunk (o il suo ID) compare
+tra quelle attese per la domanda. Le domande marcate ``off_topic`` non entrano
+nelle metriche di ranking: servono a calibrare la soglia del gate di
+rilevanza (``FAQ_RELEVANCE_THRESHOLD``), confrontando il miglior score delle
+domande pertinenti con quello delle domande fuori tema.
+
+Il report include anche la dimensione dell'indice e i token di contesto che
+finirebbero nel prompt; con ``--baseline-collection`` le stesse domande vengono
+eseguite su una seconda collection (ad es. layout parent/child contro
+``NodeSplitter(max_char=2000)``) e le due configurazioni messe a confronto.
+
+Per ogni domanda si misurano anche i byte di payload ricevuti da Qdrant e
+quelli letti dal docstore locale (``chunk_docstore.py``): confrontando una
+versione con docstore con una senza (``--baseline-collection``) si vede quanto
+testo non viaggia più sulla rete e quanto cambia la latenza. La latenza
+include la lettura del testo di tutti i chunk restituiti, come nel prompt.
+
+Esempi:
+    python retrieval_benchmark.py --refresh-cache
+    python retrieval_benchmark.py --k 5 --label "NodeSplitter 2000" --output bench.json
+    python retrieval_benchmark.py --label "parent/child" --baseline-collection datapizzai_faq__v20261019120000
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Sequence
+
+from dotenv import load_dotenv
+
+from embeddings import EMBEDDING_MAX_BATCH
+from perf_stats import summarize
+from prompt_cache import estimate_tokens
+from qdrant_config import (
+    COLLECTION_NAME,
+    describe_qdrant_target,
+    extract_vector_dimensions,
+    get_qdrant_vectorstore,
+)
+from chunk_docstore import get_docstore
+from retrieval import PARENT_KIND, hydrate_texts, search_parents, start_transfer_meter
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+EMBEDDING_MODEL = os.getenv("FAQ_EMBEDDING_MODEL", "gemini-embedding-001")
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+DEFAULT_QUERIES_PATH = os.path.join(BENCHMARK_DIR, "retrieval_queries.jsonl")
+DEFAULT_CACHE_PATH = os.path.join(BENCHMARK_DIR, "embedding_cache.json.gz")
+
+
+@dataclass
+class LabeledQuery:
+    """Domanda del benchmark con le sorgenti (o i chunk) attesi."""
+
+    id: str
+    language: str
+    question: str
+    expected_sources: List[str]
+    expected_chunk_ids: List[str] = field(default_factory=list)
+    off_topic: bool = False
+
+
+def load_queries(path: str, languages: Sequence[str] | None = None) -> List[LabeledQuery]:
+    queries: List[LabeledQuery] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            query = LabeledQuery(
+                id=data["id"],
+                language=data.get("language", "it"),
+                question=data["question"],
+                expected_sources=data.get("expected_sources", []),
+                expected_chunk_ids=[str(cid) for cid in data.get("expected_chunk_ids", [])],
+                off_topic=bool(data.get("off_topic", False)),
+            )
+            if languages and query.language not in languages:
+                continue
+            queries.append(query)
+    return queries
+
+
+class EmbeddingCache:
+    """Cache su disco degli embedding delle domande, indicizzata per modello e testo."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data: Dict[str, Dict[str, List[float]]] = {}
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str) -> List[float] | None:
+        return self.data.get(model, {}).get(self._key(text))
+
+    def put(self, model: str, text: str, vector: List[float]) -> None:
+        self.data.setdefault(model, {})[self._key(text)] = list(vector)
+
+    def save(self) -> None:
+        """Scrive la cache in modo atomico: un'interruzione non lascia un file troncato."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with gzip.open(f"{self.path}.tmp", "wt", encoding="utf-8") as f:
+            json.dump(self.data, f, separators=(",", ":"))
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+def refresh_cache(cache: EmbeddingCache, queries: Sequence[LabeledQuery], model: str) -> int:
+    """Calcola con GoogleEmbedder gli embedding mancanti e li salva in cache.
+
+    La cache viene salvata dopo ogni batch: se un batch fallisce, quelli già
+    calcolati restano su disco.
+    """
+    missing = [q.question for q in queries if cache.get(model, q.question) is None]
+    if not missing:
+        return 0
+
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise RuntimeError("GOOGLE_API_KEY non configurata: impossibile popolare la cache degli embedding.")
+
+    from datapizza.embedders.google import GoogleEmbedder
+
+    embedder = GoogleEmbedder(api_key=api_key, model_name=model)
+    for offset in range(0, len(missing), EMBEDDING_MAX_BATCH):
+        batch = missing[offset:offset + EMBEDDING_MAX_BATCH]
+        for text, vector in zip(batch, embedder.embed(batch)):
+            cache.put(model, text, vector)
+        cache.save()
+    return len(missing)
+
+
+def _point_source(payload: Dict[str, Any]) -> str | None:
+    metadata = payload.get("metadata") if isinstance(payload.get("metadata"), dict) else {}
+    return metadata.get("source") or payload.get("source")
+
+
+def score_ranking(query: LabeledQuery, hits: Sequence[Dict[str, Any]], k: int) -> Dict[str, float]:
+    """Calcola recall@k, reciprocal rank e nDCG@k con rilevanza binaria.
+
+    Ogni sorgente/chunk atteso conta una sola volta: i chunk successivi della
+    stessa sorgente non aumentano il guadagno.
+    """
+    expected = set(query.expected_chunk_ids) | set(query.expected_sources)
+    found: set[str] = set()
+    reciprocal_rank = 0.0
+    dcg = 0.0
+
+    for rank, hit in enumerate(hits[:k], start=1):
+        matches = {str(hit["id"]), hit.get("source")} & expected
+        new_matches = matches - found
+        if not new_matches:
+            continue
+        if reciprocal_rank == 0.0:
+            reciprocal_rank = 1.0 / rank
+        found |= new_matches
+        dcg += 1.0 / math.log2(rank + 1)
+
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(expected), k) + 1))
+    return {
+        "recall": len(found) / len(expected) if expected else 0.0,
+        "reciprocal_rank": reciprocal_rank,
+        "ndcg": dcg / ideal if ideal else 0.0,
+    }
+
+
+def suggest_threshold(on_topic_scores: Sequence[float], off_topic_scores: Sequence[float]) -> Dict[str, Any]:
+    """Sceglie la soglia che separa meglio domande pertinenti e fuori tema.
+
+    Prova come candidati i punti medi tra score consecutivi e massimizza
+    l'accuratezza; a parità preferisce la soglia più bassa (meno falsi fallback).
+    """
+    if not on_topic_scores or not off_topic_scores:
+        return {"threshold": None, "accuracy": None}
+
+    scores = sorted(set(on_topic_scores) | set(off_topic_scores))
+    candidates = [scores[0] - 1e-6] + [(a + b) / 2 for a, b in zip(scores, scores[1:])] + [scores[-1] + 1e-6]
+    total = len(on_topic_scores) + len(off_topic_scores)
+
+    best = (-1.0, 0.0)
+    for threshold in candidates:
+        correct = sum(1 for s in on_topic_scores if s >= threshold) + sum(1 for s in off_topic_scores if s < threshold)
+        accuracy = correct / total
+        if accuracy > best[0]:
+            best = (accuracy, threshold)
+
+    return {"threshold": round(best[1], 4), "accuracy": round(best[0], 4)}
+
+
+def index_stats(client, collection: str) -> Dict[str, Any]:
+    """Dimensione dell'indice: punti, parent senza vettore, vettori, MB di vettori float32 e docstore."""
+    from qdrant_client import models as qdrant_models
+
+    dims = extract_vector_dimensions(client.get_collection(collection))
+    dimension = next((size for name, size in dims.items() if name != "default"), dims.get("default", 0))
+    points = client.count(collection_name=collection, exact=True).count
+    parents = client.count(
+        collection_name=collection,
+        count_filter=qdrant_models.Filter(must=[
+            qdrant_models.FieldCondition(key="metadata.kind", match=qdrant_models.MatchValue(value=PARENT_KIND))
+        ]),
+        exact=True,
+    ).count
+    vectors = points - parents
+    docstore = get_docstore(client, collection)
+    return {
+        "points": points,
+        "parents": parents,
+        "vectors": vectors,
+        "dimension": dimension,
+        "vector_mb": round(vectors * dimension * 4 / (1024 * 1024), 2),
+        "docstore_records": len(docstore) if docstore is not None else None,
+        "docstore_mb": round(docstore.size_bytes / (1024 * 1024), 2) if docstore is not None else None,
+    }
+
+
+def run_benchmark(
+    queries: Sequence[LabeledQuery],
+    cache: EmbeddingCache,
+    model: str,
+    collection: str,
+    k: int,
+) -> Dict[str, Any]:
+    """Esegue le ricerche e aggrega metriche di qualità, latenza e contesto.
+
+    Le ricerche passano da ``search_parents`` come nel chatbot: su collection
+    parent/child la latenza include il recupero dei parent e il contesto è
+    quello dei parent limitati; su collection piatte equivale a una ricerca top-k.
+    """
+    vectorstore = get_qdrant_vectorstore()
+    client = vectorstore.get_client()
+
+    missing = [q.id for q in queries if cache.get(model, q.question) is None]
+    if missing:
+        raise RuntimeError(
+            f"Embedding mancanti in cache per {len(missing)} domande ({', '.join(missing[:5])}...): "
+            "esegui con --refresh-cache."
+        )
+
+    per_query: List[Dict[str, Any]] = []
+    for query in queries:
+        vector = cache.get(model, query.question)
+        meter = start_transfer_meter()
+        started = time.perf_counter()
+        chunks = hydrate_texts(vectorstore, collection, search_parents(vectorstore, collection, [vector], k))
+        latency_ms = (time.perf_counter() - started) * 1000
+        transfer = meter.snapshot()
+
+        hits = [
+            {"id": chunk.id, "score": chunk.score, "source": chunk.metadata.get("source")}
+            for chunk in chunks
+        ]
+        context = "\n\n".join(chunk.text for chunk in chunks)
+        row = {
+            "id": query.id,
+            "language": query.language,
+            "off_topic": query.off_topic,
+            "latency_ms": round(latency_ms, 2),
+            "qdrant_payload_bytes": transfer["qdrant_payload_bytes"],
+            "docstore_bytes": transfer["docstore_bytes"],
+            "context_tokens": estimate_tokens(context),
+            "top_score": round(hits[0]["score"], 4) if hits else None,
+            "top_sources": [hit["source"] for hit in hits[:3]],
+        }
+        if not query.off_topic:
+            metrics = score_ranking(query, hits, k)
+            row.update({name: round(value, 4) for name, value in metrics.items()})
+        per_query.append(row)
+
+    def _aggregate(rows: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        if not rows:
+            return {}
+        return {
+            "queries": len(rows),
+            f"recall@{k}": round(sum(r["recall"] for r in rows) / len(rows), 4),
+            "mrr": round(sum(r["reciprocal_rank"] for r in rows) / len(rows), 4),
+            f"ndcg@{k}": round(sum(r["ndcg"] for r in rows) / len(rows), 4),
+            "latency_ms": summarize((r["latency_ms"] for r in rows), digits=2),
+            "qdrant_payload_bytes": summarize((r["qdrant_payload_bytes"] for r in rows), digits=0),
+            "docstore_bytes": summarize((r["docstore_bytes"] for r in rows), digits=0),
+            "context_tokens": summarize((r["context_tokens"] for r in rows), digits=0),
+        }
+
+    ranked = [row for row in per_query if not row["off_topic"]]
+    on_scores = [row["top_score"] for row in ranked if row["top_score"] is not None]
+    off_scores = [row["top_score"] for row in per_query if row["off_topic"] and row["top_score"] is not None]
+
+    languages = sorted({row["language"] for row in ranked})
+    return {
+        "index": index_stats(client, collection),
+        "overall": _aggregate(ranked),
+        "by_language": {lang: _aggregate([r for r in ranked if r["language"] == lang]) for lang in languages},
+        "relevance_calibration": {
+            "on_topic_top_score": summarize(on_scores, digits=4),
+            "off_topic_top_score": summarize(off_scores, digits=4),
+            "suggested_threshold": suggest_threshold(on_scores, off_scores),
+        },
+        "queries": per_query,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del retrieval (recall@k, MRR, nDCG, latenza).")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES_PATH, help="File JSONL con le domande etichettate")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Cache degli embedding delle domande")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="Modello di embedding delle domande")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--language", action="append", dest="languages", help="Filtra per lingua (ripetibile)")
+    parser.add_argument("--label", default="", help="Etichetta della configurazione (chunking, quantizzazione...)")
+    parser.add_argument("--refresh-cache", action="store_true", help="Calcola gli embedding mancanti (online)")
+    parser.add_argument(
+        "--baseline-collection",
+        help="Seconda collection da confrontare (ad es. una versione con chunking flat)",
+    )
+    parser.add_argument("--output", help="Scrive il report JSON su file")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries, args.languages)
+    cache = EmbeddingCache(args.cache)
+
+    if args.refresh_cache:
+        added = refresh_cache(cache, queries, args.model)
+        print(f"🧠 Embedding aggiunti in cache: {added}", file=sys.stderr)
+
+    results = run_benchmark(queries, cache, args.model, args.collection, args.k)
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "label": args.label,
+        "target": describe_qdrant_target(),
+        "collection": args.collection,
+        "embedding_model": args.model,
+        "k": args.k,
+        **results,
+    }
+    if args.baseline_collection:
+        baseline = run_benchmark(queries, cache, args.model, args.baseline_collection, args.k)
+        report["baseline"] = {"collection": args.baseline_collection, **baseline}
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    overall = report["overall"]
+    print("=" * 70)
+    print(f"📊 Benchmark retrieval – {args.collection} {f'[{args.label}]' if args.label else ''}")
+    print("=" * 70)
+    print(
+        f"Domande: {overall['queries']} | recall@{args.k}: {overall[f'recall@{args.k}']} | "
+        f"MRR: {overall['mrr']} | nDCG@{args.k}: {overall[f'ndcg@{args.k}']}"
+    )
+    lat = overall["latency_ms"]
+    print(f"Latenza (ms): p50={lat['p50']} p95={lat['p95']} p99={lat['p99']}")
+    payload, local = overall["qdrant_payload_bytes"], overall["docstore_bytes"]
+    print(f"Byte per domanda: payload Qdrant p50={payload['p50']} p95={payload['p95']} | docstore p50={local['p50']}")
+    index = report["index"]
+    print(
+        f"Indice: {index['vectors']} vettori ({index['vector_mb']} MB), {index['parents']} parent | "
+        f"token di contesto p50={overall['context_tokens']['p50']} p95={overall['context_tokens']['p95']}"
+    )
+    for lang, agg in report["by_language"].items():
+        print(
+            f"  [{lang}] recall@{args.k}={agg[f'recall@{args.k}']} "
+            f"MRR={agg['mrr']} nDCG@{args.k}={agg[f'ndcg@{args.k}']}"
+        )
+    suggested = report["relevance_calibration"]["suggested_threshold"]
+    if index["docstore_records"] is not None:
+        print(f"Docstore locale: {index['docstore_records']} record ({index['docstore_mb']} MB)")
+    if suggested["threshold"] is not None:
+        print(
+            f"🎚️  Soglia di rilevanza suggerita: {suggested['threshold']} "
+            f"(accuratezza pertinenti/fuori tema: {suggested['accuracy']})"
+        )
+
+    if args.baseline_collection:
+        baseline = report["baseline"]
+        print("-" * 70)
+        print(f"{'':24}{args.collection[:22]:>22}{args.baseline_collection[:22]:>22}")
+        rows = [
+            ("vettori", index["vectors"], baseline["index"]["vectors"]),
+            ("MB vettori", index["vector_mb"], baseline["index"]["vector_mb"]),
+            ("latenza p50 (ms)", lat["p50"], baseline["overall"]["latency_ms"]["p50"]),
+            ("latenza p95 (ms)", lat["p95"], baseline["overall"]["latency_ms"]["p95"]),
+            ("payload Qdrant p50 (B)", payload["p50"], baseline["overall"]["qdrant_payload_bytes"]["p50"]),
+            ("docstore p50 (B)", local["p50"], baseline["overall"]["docstore_bytes"]["p50"]),
+            ("token contesto p50", overall["context_tokens"]["p50"], baseline["overall"]["context_tokens"]["p50"]),
+            (f"recall@{args.k}", overall[f"recall@{args.k}"], baseline["overall"][f"recall@{args.k}"]),
+            ("MRR", overall["mrr"], baseline["overall"]["mrr"]),
+        ]
+        for name, value, baseline_value in rows:
+            print(f"{name:24}{value!s:>22}{baseline_value!s:>22}")
+
+
+if __name__ == "__main__":
+    main()
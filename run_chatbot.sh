@@ -63,6 +63,12 @@ echo "✅ Tutti i prerequisiti soddisfatti!"
 echo "=================================================="
 echo ""
 
+# Profilo dei tempi di avvio (opzionale)
+if [ -n "${PROFILE_STARTUP:-}" ]; then
+    python profile_startup.py --target terminal
+    echo ""
+fi
+
 # Avvia il chatbot
 python chatbot_faq.py
 
@@ -95,5 +95,17 @@ echo ""
 echo "=================================================="
 echo ""
 
+# Profilo dei tempi di avvio (opzionale)
+if [ -n "${PROFILE_STARTUP:-}" ]; then
+    python profile_startup.py --target web
+    echo ""
+fi
+
+# Warm-up prima dell'avvio (opzionale): connessioni e risposte ai suggerimenti
+if [ -n "${WARMUP_BEFORE_START:-}" ]; then
+    python warmup.py
+    echo ""
+fi
+
 # Avvia streamlit
 streamlit run app.py
@@ -0,0 +1,254 @@
+"""
+Store delle sessioni di conversazione con budget di memoria e spill su disco.
+
+Ogni sessione dell'interfaccia (messaggi, Memory del chatbot e ID delle trace di debug)
+vive in un LRU in memoria. Quando la dimensione stimata delle sessioni
+residenti supera il budget, oppure una sessione resta inattiva troppo a lungo,
+viene serializzata (pickle compresso) in un file SQLite e rimossa dalla RAM;
+al messaggio successivo viene ripristinata in modo trasparente.
+
+Chi modifica una sessione (una domanda in corso) tiene ``SessionState.lock``:
+lo store serializza una sessione solo sotto il suo lock e non espelle quelle
+occupate. Le sessioni su disco non riprese entro ``SESSION_SPILL_TTL_S``
+vengono cancellate in base al timestamp salvato con la riga.
+
+Configurazione tramite variabili d'ambiente:
+- ``SESSION_MEMORY_BUDGET_MB`` (default 256): budget delle sessioni residenti
+- ``SESSION_IDLE_SECONDS`` (default 900): inattività dopo cui una sessione va su disco
+- ``SESSION_STORE_PATH`` (default ``.sessions/sessions.sqlite``)
+- ``SESSION_SPILL_TTL_S`` (default 604800, 7 giorni; 0 = mai): durata delle sessioni su disco
+"""
+
+from __future__ import annotations
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from datapizza.memory import Memory
+
+from perf_stats import summarize
+
+# Numero massimo di trace di debug referenziate per sessione
+MAX_DEBUG_TRACES = 50
+# Intervallo minimo tra due pulizie delle sessioni su disco scadute
+PRUNE_INTERVAL_S = 60.0
+
+
+@dataclass
+class SessionState:
+    """Stato conversazionale di una sessione dell'interfaccia."""
+
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    memory: Memory = field(default_factory=Memory)
+    # Le trace complete vivono nel ring buffer di debug_traces
+    debug_trace_ids: List[int] = field(default_factory=list)
+    # Tenuto durante le modifiche; non viene serializzato
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False, compare=False)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.pop("lock", None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def add_debug_trace(self, trace_id: int) -> None:
+        self.debug_trace_ids.append(trace_id)
+        if len(self.debug_trace_ids) > MAX_DEBUG_TRACES:
+            del self.debug_trace_ids[:-MAX_DEBUG_TRACES]
+
+    def reset(self) -> None:
+        self.messages = []
+        self.memory = Memory()
+        self.debug_trace_ids = []
+
+
+@dataclass
+class _Resident:
+    state: SessionState
+    size_bytes: int
+    last_access: float
+
+
+class SessionStore:
+    """LRU di sessioni con budget in byte; le sessioni espulse finiscono su SQLite."""
+
+    def __init__(self, path: str, memory_budget_bytes: int, idle_seconds: float, spill_ttl_s: float = 0.0):
+        self.path = path
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_seconds = idle_seconds
+        self.spill_ttl_s = spill_ttl_s
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, state BLOB, raw_bytes INTEGER, updated_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._conn.commit()
+
+        self._resident: "OrderedDict[str, _Resident]" = OrderedDict()
+        self._resident_bytes = 0
+        self._lock = threading.RLock()
+
+        self.evictions = 0
+        self.idle_evictions = 0
+        self.restores = 0
+        self.expired = 0
+        self._last_prune = 0.0
+        self._restore_ms: deque[float] = deque(maxlen=200)
+
+    # --- Serializzazione -------------------------------------------------
+
+    @staticmethod
+    def _dumps(state: SessionState) -> bytes:
+        with state.lock:
+            return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _spill(self, session_id: str, raw: bytes) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+            (session_id, zlib.compress(raw), len(raw), time.time()),
+        )
+        self._conn.commit()
+
+    def _restore(self, session_id: str) -> SessionState | None:
+        started = time.perf_counter()
+        row = self._conn.execute(
+            "SELECT state FROM sessions WHERE session_id = ? AND updated_at >= ?",
+            (session_id, self._expiry_cutoff()),
+        ).fetchone()
+        if row is None:
+            return None
+        state = pickle.loads(zlib.decompress(row[0]))
+        # La sessione torna residente: la copia su disco verrà riscritta alla prossima espulsione
+        self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._conn.commit()
+        self.restores += 1
+        self._restore_ms.append((time.perf_counter() - started) * 1000)
+        return state
+
+    def _expiry_cutoff(self) -> float:
+        return time.time() - self.spill_ttl_s if self.spill_ttl_s > 0 else 0.0
+
+    def prune_spilled(self) -> int:
+        """Cancella le sessioni su disco più vecchie di ``spill_ttl_s``; restituisce quante."""
+        if self.spill_ttl_s <= 0:
+            return 0
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (self._expiry_cutoff(),)
+            ).rowcount
+            self._conn.commit()
+            self.expired += deleted
+            self._last_prune = time.monotonic()
+            return deleted
+
+    # --- Gestione LRU ----------------------------------------------------
+
+    def _evict(self, session_id: str) -> bool:
+        """Porta la sessione su disco; False se è occupata da una domanda in corso."""
+        entry = self._resident[session_id]
+        if not entry.state.lock.acquire(blocking=False):
+            return False
+        try:
+            raw = self._dumps(entry.state)
+        finally:
+            entry.state.lock.release()
+        del self._resident[session_id]
+        self._resident_bytes -= entry.size_bytes
+        self._spill(session_id, raw)
+        return True
+
+    def _enforce_limits(self, keep: str | None = None) -> None:
+        now = time.monotonic()
+        for session_id, entry in list(self._resident.items()):
+            if session_id != keep and now - entry.last_access > self.idle_seconds and self._evict(session_id):
+                self.idle_evictions += 1
+
+        # Le sessioni meno recenti escono per prime; quella corrente e quelle occupate restano residenti
+        for session_id in [session_id for session_id in self._resident if session_id != keep]:
+            if self._resident_bytes <= self.memory_budget_bytes:
+                break
+            if self._evict(session_id):
+                self.evictions += 1
+
+        if self.spill_ttl_s > 0 and now - self._last_prune > PRUNE_INTERVAL_S:
+            self.prune_spilled()
+
+    def get(self, session_id: str) -> SessionState:
+        """Restituisce la sessione (ripristinandola dal disco se serve)."""
+        with self._lock:
+            entry = self._resident.get(session_id)
+            if entry is not None:
+                entry.last_access = time.monotonic()
+                self._resident.move_to_end(session_id)
+                return entry.state
+
+            state = self._restore(session_id) or SessionState()
+            self._resident[session_id] = _Resident(state, len(self._dumps(state)), time.monotonic())
+            self._resident_bytes += self._resident[session_id].size_bytes
+            self._enforce_limits(keep=session_id)
+            return state
+
+    def save(self, session_id: str, state: SessionState) -> None:
+        """Registra le modifiche alla sessione e applica budget e inattività."""
+        with self._lock:
+            previous = self._resident.pop(session_id, None)
+            if previous is not None:
+                self._resident_bytes -= previous.size_bytes
+            else:
+                # Sessione espulsa tra get e save: la copia su disco è ormai superata
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._conn.commit()
+            size = len(self._dumps(state))
+            self._resident[session_id] = _Resident(state, size, time.monotonic())
+            self._resident_bytes += size
+            self._enforce_limits(keep=session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Sessioni residenti, byte per sessione, sessioni su disco e latenza di ripristino."""
+        with self._lock:
+            sizes = [entry.size_bytes for entry in self._resident.values()]
+            spilled = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            return {
+                "resident_sessions": len(self._resident),
+                "resident_bytes": self._resident_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "bytes_per_session": summarize(sizes, digits=0),
+                "spilled_sessions": spilled,
+                "evictions": self.evictions,
+                "idle_evictions": self.idle_evictions,
+                "restores": self.restores,
+                "expired": self.expired,
+                "restore_ms": summarize(self._restore_ms, digits=2),
+            }
+
+
+_store: SessionStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Restituisce lo store condiviso da tutte le sessioni del processo."""
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore(
+                path=os.getenv("SESSION_STORE_PATH", os.path.join(".sessions", "sessions.sqlite")),
+                memory_budget_bytes=int(float(os.getenv("SESSION_MEMORY_BUDGET_MB", "256")) * 1024 * 1024),
+                idle_seconds=float(os.getenv("SESSION_IDLE_SECONDS", "900")),
+                spill_ttl_s=float(os.getenv("SESSION_SPILL_TTL_S", str(7 * 24 * 3600))),
+            )
+        return _store
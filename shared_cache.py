@@ -0,0 +1,518 @@
+"""
+Cache a due livelli condivisa tra processi: embedding, riscritture e risposte.
+
+Con più worker (Streamlit o API) ogni cache in-process verrebbe duplicata e
+ogni worker dovrebbe scaldarla da solo. Ogni ``SharedCache`` consulta due
+livelli (``CacheBackend``):
+
+1. ``memory``: LRU in-process, senza serializzazione;
+2. ``shared``: un file SQLite in WAL condiviso dai processi sulla stessa
+   macchina (default), un server che parla il protocollo Redis (Redis,
+   Valkey o uno stand-in locale) oppure nessuno.
+
+La lettura è read-through (un hit del livello condiviso ripopola la memoria),
+la scrittura è write-through su entrambi i livelli. Le chiavi vivono in
+namespace versionati ``<nome>@<versione>``: la versione è scelta dal
+chiamante (spazio di embedding, prompt del rewriter, collection fisiche dietro
+gli alias), quindi dopo una nuova ingestion o un cambio di modello le voci
+vecchie non vengono più lette e scadono con il TTL. Un errore del livello
+condiviso viene contato e trattato come miss: la cache non fa mai fallire una
+domanda. Hit, miss, scritture ed errori sono contati per cache e per livello
+(``cache_snapshot()``, riportato da ``stats()`` dei chatbot).
+
+Configurazione tramite variabili d'ambiente:
+- ``CACHE_BACKEND`` (default ``sqlite``): ``sqlite``, ``redis`` o ``none`` (solo memoria)
+- ``CACHE_SQLITE_PATH`` (default ``.cache/shared_cache.sqlite``)
+- ``CACHE_REDIS_URL`` (default ``redis://localhost:6379/0``), ``CACHE_REDIS_PREFIX`` (default ``faqaccia:``)
+- ``CACHE_MEMORY_ENTRIES`` (default 2048): voci in memoria per cache
+- ``CACHE_TTL_S`` (default 604800, 0 = nessuna scadenza)
+
+Esempi:
+    python shared_cache.py stats
+    python shared_cache.py clear --name rewrites
+    python shared_cache.py prune
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+from urllib.parse import urlparse
+
+TIERS = ("memory", "shared")
+
+
+def content_version(*parts: Any) -> str:
+    """Versione breve derivata da un contenuto (es. prompt e modello di un rewriter)."""
+    return hashlib.sha1("\n".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:12]
+
+
+def _hash_key(key: str) -> str:
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _expires_at(ttl_s: float) -> float | None:
+    return time.time() + ttl_s if ttl_s > 0 else None
+
+
+class CacheBackend(ABC):
+    """Livello di cache: valori per (namespace, chiave), letti e scritti a blocchi."""
+
+    name = "backend"
+
+    @abstractmethod
+    def get_many(self, namespace: str, keys: Sequence[str]) -> Dict[str, Any]:
+        """Valori presenti per le chiavi indicate (le chiavi mancanti o scadute sono omesse)."""
+
+    @abstractmethod
+    def set_many(self, namespace: str, items: Dict[str, Any], ttl_s: float) -> None:
+        """Scrive le voci con scadenza ``ttl_s`` (0 = nessuna scadenza)."""
+
+    @abstractmethod
+    def clear(self, prefix: str = "") -> int:
+        """Elimina i namespace che iniziano con ``prefix``; restituisce le voci eliminate."""
+
+
+class MemoryBackend(CacheBackend):
+    """LRU in-process limitato a ``max_entries`` voci (valori non serializzati)."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Tuple[str, str], Tuple[float | None, Any]] = OrderedDict()
+
+    def get_many(self, namespace: str, keys: Sequence[str]) -> Dict[str, Any]:
+        found: Dict[str, Any] = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get((namespace, key))
+                if entry is None:
+                    continue
+                if entry[0] is not None and entry[0] < now:
+                    del self._entries[(namespace, key)]
+                    continue
+                self._entries.move_to_end((namespace, key))
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, namespace: str, items: Dict[str, Any], ttl_s: float) -> None:
+        expires_at = _expires_at(ttl_s)
+        with self._lock:
+            for key, value in items.items():
+                self._entries[(namespace, key)] = (expires_at, value)
+                self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, prefix: str = "") -> int:
+        with self._lock:
+            stale = [entry for entry in self._entries if entry[0].startswith(prefix)]
+            for entry in stale:
+                del self._entries[entry]
+        return len(stale)
+
+
+class SQLiteBackend(CacheBackend):
+    """File SQLite in WAL condiviso dai processi della stessa macchina (valori già serializzati)."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        # timeout: con più processi un writer attende il lock invece di fallire subito
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "namespace TEXT, key TEXT, value BLOB, expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        self._conn.commit()
+
+    def get_many(self, namespace: str, keys: Sequence[str]) -> Dict[str, Any]:
+        found: Dict[str, Any] = {}
+        now = time.time()
+        with self._lock:
+            # SQLite limita il numero di parametri per query
+            for offset in range(0, len(keys), 500):
+                batch = list(keys[offset:offset + 500])
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE namespace = ? AND key IN ({','.join('?' * len(batch))}) "
+                    "AND (expires_at IS NULL OR expires_at >= ?)",
+                    [namespace, *batch, now],
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def set_many(self, namespace: str, items: Dict[str, Any], ttl_s: float) -> None:
+        expires_at = _expires_at(ttl_s)
+        rows = [(namespace, key, value, expires_at) for key, value in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def clear(self, prefix: str = "") -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM entries WHERE substr(namespace, 1, ?) = ?", (len(prefix), prefix))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def prune(self) -> int:
+        """Elimina le voci scadute."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT namespace, COUNT(*), SUM(LENGTH(value)) FROM entries GROUP BY namespace ORDER BY namespace"
+            ).fetchall()
+        return [{"namespace": namespace, "entries": count, "bytes": size or 0} for namespace, count, size in rows]
+
+
+class RedisBackend(CacheBackend):
+    """Client minimale del protocollo Redis (RESP2): MGET, SET ... PX, SCAN, DEL.
+
+    Basta un server compatibile (Redis, Valkey, KeyDB o uno stand-in locale):
+    nessuna dipendenza aggiuntiva. Una connessione per processo, serializzata
+    da un lock; dopo un errore viene riaperta alla richiesta successiva.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "faqaccia:", timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock: socket.socket | None = None
+        self._reader: Any = None
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._roundtrip([("AUTH", self.password)])
+        if self.db:
+            self._roundtrip([("SELECT", str(self.db))])
+
+    def _close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    @staticmethod
+    def _encode(command: Sequence[Any]) -> bytes:
+        parts = [f"*{len(command)}\r\n".encode()]
+        for arg in command:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("connessione Redis chiusa")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RuntimeError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            data = self._reader.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(payload)
+            return None if size < 0 else [self._read_reply() for _ in range(size)]
+        raise RuntimeError(f"Risposta Redis non valida: {line!r}")
+
+    def _roundtrip(self, commands: List[Sequence[Any]]) -> List[Any]:
+        """Invia i comandi in pipeline e legge le risposte nello stesso ordine."""
+        self._sock.sendall(b"".join(self._encode(command) for command in commands))
+        return [self._read_reply() for _ in commands]
+
+    def _execute(self, commands: List[Sequence[Any]]) -> List[Any]:
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                return self._roundtrip(commands)
+            except Exception:
+                self._close()
+                raise
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}{namespace}:{key}"
+
+    def get_many(self, namespace: str, keys: Sequence[str]) -> Dict[str, Any]:
+        if not keys:
+            return {}
+        (values,) = self._execute([("MGET", *(self._key(namespace, key) for key in keys))])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, namespace: str, items: Dict[str, Any], ttl_s: float) -> None:
+        ttl = ("PX", int(ttl_s * 1000)) if ttl_s > 0 else ()
+        if items:
+            self._execute([("SET", self._key(namespace, key), value, *ttl) for key, value in items.items()])
+
+    def clear(self, prefix: str = "") -> int:
+        deleted, cursor = 0, "0"
+        while True:
+            ((cursor, keys),) = self._execute([("SCAN", cursor, "MATCH", f"{self.prefix}{prefix}*", "COUNT", 500)])
+            cursor = cursor.decode() if isinstance(cursor, bytes) else cursor
+            if keys:
+                (count,) = self._execute([("DEL", *keys)])
+                deleted += count
+            if cursor == "0":
+                return deleted
+
+
+def json_codec() -> Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]:
+    return (
+        lambda value: json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        lambda data: json.loads(data),
+    )
+
+
+def vector_codec() -> Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]:
+    """Vettori come float32 (la precisione con cui Qdrant li indicizza)."""
+
+    def decode(data: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(data)
+        return vector.tolist()
+
+    return lambda value: array("f", value).tobytes(), decode
+
+
+class SharedCache:
+    """Cache read-through/write-through su livello in memoria e livello condiviso."""
+
+    def __init__(
+        self,
+        name: str,
+        memory: MemoryBackend,
+        shared: CacheBackend | None,
+        ttl_s: float = 0.0,
+        codec: Tuple[Callable[[Any], bytes], Callable[[bytes], Any]] | None = None,
+    ):
+        self.name = name
+        self.memory = memory
+        self.shared = shared
+        self.ttl_s = ttl_s
+        self._encode, self._decode = codec or json_codec()
+        self._lock = threading.Lock()
+        self._stats = {tier: {"hits": 0, "misses": 0, "writes": 0, "errors": 0} for tier in TIERS}
+        self._warned = False
+
+    def _namespace(self, version: str) -> str:
+        return f"{self.name}@{version}"
+
+    def _count(self, tier: str, field: str, amount: int = 1) -> None:
+        if amount:
+            with self._lock:
+                self._stats[tier][field] += amount
+
+    def _shared_error(self, exc: Exception) -> None:
+        self._count("shared", "errors")
+        if not self._warned:
+            self._warned = True
+            print(f"⚠ Cache condivisa '{self.name}' non disponibile ({self.shared.name}): {exc}")
+
+    def get_many(self, version: str, keys: Sequence[str]) -> Dict[str, Any]:
+        """Valori presenti per le chiavi indicate (memoria, poi livello condiviso)."""
+        namespace = self._namespace(version)
+        hashed = {key: _hash_key(key) for key in dict.fromkeys(keys)}
+        in_memory = self.memory.get_many(namespace, list(hashed.values()))
+        found = {key: in_memory[digest] for key, digest in hashed.items() if digest in in_memory}
+        self._count("memory", "hits", len(found))
+        self._count("memory", "misses", len(hashed) - len(found))
+
+        missing = {digest: key for key, digest in hashed.items() if key not in found}
+        if missing and self.shared is not None:
+            try:
+                rows = self.shared.get_many(namespace, list(missing))
+            except Exception as exc:
+                self._shared_error(exc)
+                rows = {}
+            decoded: Dict[str, Any] = {}
+            for digest, data in rows.items():
+                # Una voce corrotta o in un formato vecchio è un miss, non un errore della domanda
+                try:
+                    decoded[digest] = self._decode(data)
+                except Exception as exc:
+                    self._shared_error(exc)
+            self._count("shared", "hits", len(decoded))
+            self._count("shared", "misses", len(missing) - len(decoded))
+            if decoded:
+                # Read-through: il prossimo accesso di questo processo resta in memoria
+                self.memory.set_many(namespace, decoded, self.ttl_s)
+                found.update({missing[digest]: value for digest, value in decoded.items()})
+        return found
+
+    def get(self, version: str, key: str) -> Any:
+        return self.get_many(version, [key]).get(key)
+
+    def put_many(self, version: str, items: Dict[str, Any]) -> None:
+        """Write-through: scrive su memoria e livello condiviso."""
+        if not items:
+            return
+        namespace = self._namespace(version)
+        hashed = {_hash_key(key): value for key, value in items.items()}
+        self.memory.set_many(namespace, hashed, self.ttl_s)
+        self._count("memory", "writes", len(hashed))
+        if self.shared is not None:
+            try:
+                self.shared.set_many(
+                    namespace, {digest: self._encode(value) for digest, value in hashed.items()}, self.ttl_s
+                )
+                self._count("shared", "writes", len(hashed))
+            except Exception as exc:
+                self._shared_error(exc)
+
+    def put(self, version: str, key: str, value: Any) -> None:
+        self.put_many(version, {key: value})
+
+    def get_or_compute(self, version: str, key: str, compute: Callable[[], Any]) -> Any:
+        value = self.get(version, key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.put(version, key, value)
+        return value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {tier: dict(values) for tier, values in self._stats.items()}
+        for values in stats.values():
+            lookups = values["hits"] + values["misses"]
+            values["hit_rate"] = round(values["hits"] / lookups, 3) if lookups else None
+        stats["shared"]["backend"] = self.shared.name if self.shared is not None else None
+        return stats
+
+
+_shared_backend: CacheBackend | None = None
+_shared_backend_ready = False
+_caches: Dict[str, SharedCache] = {}
+_caches_lock = threading.Lock()
+
+
+def build_shared_backend() -> CacheBackend | None:
+    """Livello condiviso scelto da ``CACHE_BACKEND``."""
+    kind = os.getenv("CACHE_BACKEND", "sqlite").lower()
+    if kind == "sqlite":
+        return SQLiteBackend(os.getenv("CACHE_SQLITE_PATH", ".cache/shared_cache.sqlite"))
+    if kind == "redis":
+        return RedisBackend(
+            os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"),
+            prefix=os.getenv("CACHE_REDIS_PREFIX", "faqaccia:"),
+        )
+    if kind in {"none", "memory", "off"}:
+        return None
+    raise ValueError(f"CACHE_BACKEND non supportato: {kind}")
+
+
+def _get_shared_backend() -> CacheBackend | None:
+    global _shared_backend, _shared_backend_ready
+
+    if not _shared_backend_ready:
+        try:
+            _shared_backend = build_shared_backend()
+        except Exception as exc:
+            print(f"⚠ Cache condivisa disabilitata: {exc}")
+            _shared_backend = None
+        _shared_backend_ready = True
+    return _shared_backend
+
+
+def get_cache(name: str, codec: Tuple[Callable[[Any], bytes], Callable[[bytes], Any]] | None = None) -> SharedCache:
+    """Cache del processo con questo nome (livello condiviso comune a tutte)."""
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = SharedCache(
+                name,
+                MemoryBackend(int(os.getenv("CACHE_MEMORY_ENTRIES", "2048"))),
+                _get_shared_backend(),
+                ttl_s=float(os.getenv("CACHE_TTL_S", "604800")),
+                codec=codec,
+            )
+        return _caches[name]
+
+
+def cache_snapshot() -> Dict[str, Any]:
+    """Hit/miss per cache e per livello dall'avvio del processo."""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.snapshot() for cache in caches}
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Ispezione del livello condiviso della cache.")
+    parser.add_argument("command", choices=["stats", "clear", "prune"])
+    parser.add_argument("--name", help="Solo la cache indicata (es. embeddings, rewrites, answers)")
+    args = parser.parse_args()
+
+    backend = build_shared_backend()
+    if backend is None:
+        print("ℹ CACHE_BACKEND=none: nessun livello condiviso")
+        return
+    prefix = f"{args.name}@" if args.name else ""
+
+    if args.command == "clear":
+        deleted = backend.clear(prefix)
+        print(f"🗑 Eliminate {deleted} voci da {backend.name}")
+    elif args.command == "prune":
+        if not isinstance(backend, SQLiteBackend):
+            print(f"ℹ {backend.name}: le voci scadono da sole con il TTL")
+            return
+        print(f"🧹 Eliminate {backend.prune()} voci scadute")
+    else:
+        if not isinstance(backend, SQLiteBackend):
+            print("ℹ Statistiche per namespace disponibili solo con CACHE_BACKEND=sqlite")
+            return
+        rows = [row for row in backend.stats() if row["namespace"].startswith(prefix)]
+        print(f"📦 {backend.path}")
+        for row in rows:
+            print(f"   {row['namespace']:<60} {row['entries']:>7} voci {row['bytes'] / 1024:>10.1f} KB")
+        if not rows:
+            print("   (vuota)")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,173 @@
+"""
+Stress test di concorrenza: molte sessioni in parallelo su un'unica istanza del chatbot.
+
+Crea un solo ``EnhancedFAQChatbot`` e ``--sessions`` sessioni (default 100),
+ognuna con la sua ``Memory``; ogni sessione pone ``--turns`` domande in
+sequenza, tutte le sessioni in parallelo tramite ``answer_async``. Ogni
+domanda porta il marcatore della sessione (``[s017]``), così un eventuale
+scambio di stato tra richieste è visibile. Verifiche:
+
+- la trace di ogni risposta riporta la sessione che l'ha prodotta;
+- la Memory di ogni sessione contiene solo le sue domande e le risposte
+  restituite a lei, nell'ordine;
+- i ``trace_id`` sono tutti distinti;
+- il ledger dei costi conta per ogni sessione esattamente le sue domande.
+
+Le richieste scartate dall'admission control o fallite non entrano nella
+Memory e vengono solo conteggiate. Con ``DATAPIZZA_CASSETTE_MODE=replay`` il
+test gira offline sulle risposte registrate. Esce con codice 1 se trova
+anche una sola violazione.
+
+Esempi:
+    python stress_sessions.py
+    python stress_sessions.py --sessions 100 --turns 3 --concurrency 50 --no-docs
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+from perf_stats import summarize
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+QUESTIONS = [
+    "Come funziona la memory?",
+    "Supporta modelli Llama?",
+    "Cosa differenzia Datapizza-AI da altri framework?",
+    "Posso usare documenti aziendali in locale?",
+    "Quali sono i casi d'uso concreti?",
+]
+
+
+def _turn_texts(memory: Any, role: str) -> List[str]:
+    from prompt_cache import memory_segments
+
+    prefix = f"{role}:"
+    return [segment[len(prefix):] for segment in memory_segments(memory) if segment.startswith(prefix)]
+
+
+async def run_session(
+    chatbot: Any, index: int, turns: int, semaphore: asyncio.Semaphore, use_official_docs: bool
+) -> Dict[str, Any]:
+    """Esegue le domande di una sessione in sequenza e verifica trace e Memory."""
+    from datapizza.memory import Memory
+    from datapizza.type import ROLE
+
+    session_id = f"s{index:03d}"
+    memory = Memory()
+    asked: List[str] = []
+    answers: List[str] = []
+    latencies: List[float] = []
+    violations: List[str] = []
+    trace_ids: List[int] = []
+    shed = errors = 0
+
+    for turn in range(turns):
+        question = f"[{session_id}] {QUESTIONS[(index + turn) % len(QUESTIONS)]}"
+        async with semaphore:
+            started = time.perf_counter()
+            result = await chatbot.answer_async(
+                question, memory, session_id=session_id, use_official_docs=use_official_docs
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        trace = result.trace
+        if trace is None:
+            errors += 1
+            continue
+        trace_ids.append(trace["trace_id"])
+        if trace.get("session_id") != session_id:
+            violations.append(f"trace {trace['trace_id']}: sessione {trace.get('session_id')}")
+        if trace.get("load_shed"):
+            shed += 1
+            continue
+        asked.append(question)
+        answers.append(result.text)
+
+    if _turn_texts(memory, ROLE.USER.value) != asked:
+        violations.append("domande nella Memory diverse da quelle della sessione")
+    if _turn_texts(memory, ROLE.ASSISTANT.value) != answers:
+        violations.append("risposte nella Memory diverse da quelle restituite alla sessione")
+
+    return {
+        "session_id": session_id,
+        "latencies": latencies,
+        "trace_ids": trace_ids,
+        "violations": violations,
+        "shed": shed,
+        "errors": errors,
+    }
+
+
+async def run_stress(sessions: int, turns: int, concurrency: int, use_official_docs: bool) -> List[Dict[str, Any]]:
+    from chatbot_enhanced import EnhancedFAQChatbot
+
+    chatbot = EnhancedFAQChatbot(use_official_docs=use_official_docs)
+    await asyncio.to_thread(chatbot.warm_up)
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(
+        *(run_session(chatbot, index, turns, semaphore, use_official_docs) for index in range(sessions))
+    )
+
+
+def main():
+    from cost_ledger import get_cost_ledger
+
+    parser = argparse.ArgumentParser(description="Sessioni parallele su un'unica istanza del chatbot.")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=2, help="Domande per sessione (in sequenza)")
+    parser.add_argument("--concurrency", type=int, help="Domande in volo (default: una per sessione)")
+    parser.add_argument("--no-docs", action="store_true", help="Disabilita la documentazione ufficiale")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"🧵 Stress test: {args.sessions} sessioni × {args.turns} domande su un solo chatbot")
+    print("=" * 70)
+    started = time.perf_counter()
+    results = asyncio.run(
+        run_stress(args.sessions, args.turns, args.concurrency or args.sessions, not args.no_docs)
+    )
+    elapsed = time.perf_counter() - started
+
+    ledger = get_cost_ledger()
+    violations: List[str] = []
+    for result in results:
+        violations.extend(f"{result['session_id']}: {v}" for v in result["violations"])
+        counted = ledger.session_totals(result["session_id"])["questions"]
+        if counted != args.turns:
+            violations.append(f"{result['session_id']}: {counted} domande nel ledger invece di {args.turns}")
+    trace_ids = [trace_id for result in results for trace_id in result["trace_ids"]]
+    if len(set(trace_ids)) != len(trace_ids):
+        violations.append("trace_id duplicati tra richieste diverse")
+
+    latency = summarize([ms for result in results for ms in result["latencies"]], digits=1)
+    print(
+        f"✓ {args.sessions * args.turns} domande in {elapsed:.1f}s – latenza p50={latency['p50']} "
+        f"p95={latency['p95']} max={latency['max']} ms"
+    )
+    print(
+        f"   scartate dall'admission control: {sum(r['shed'] for r in results)}, "
+        f"fallite: {sum(r['errors'] for r in results)}"
+    )
+    if violations:
+        print(f"❌ {len(violations)} violazioni di isolamento tra sessioni:")
+        for violation in violations[:20]:
+            print(f"   - {violation}")
+        sys.exit(1)
+    print("✅ Nessuno scambio di stato tra sessioni")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,106 @@
+"""
+Test unitari di ``AdmissionController``: AIMD, scarti e attese async (nessuna API key).
+"""
+
+import asyncio
+
+import pytest
+
+from admission_control import AdmissionController, AdmissionRejected
+
+
+def _controller(**kwargs) -> AdmissionController:
+    options = {"initial_limit": 4, "min_limit": 1, "max_limit": 8, "latency_target_ms": 1000.0}
+    options.update(kwargs)
+    return AdmissionController("test", **options)
+
+
+def test_additive_increase_on_fast_successes():
+    controller = _controller()
+    for _ in range(5):
+        controller.acquire()
+        controller.release(0.01)
+    # +1/limit per successo: dopo cinque risposte veloci il limite sale di uno
+    assert controller.limit == 5
+
+
+def test_limit_never_exceeds_max():
+    controller = _controller(initial_limit=8, max_limit=8)
+    for _ in range(50):
+        controller.acquire()
+        controller.release(0.01)
+    assert controller.limit == 8
+
+
+def test_multiplicative_decrease_on_rate_limit():
+    controller = _controller(initial_limit=8, decrease_factor=0.5)
+    controller.acquire()
+    controller.release(0.01, RuntimeError("429 RESOURCE_EXHAUSTED"))
+    assert controller.limit == 4
+    assert controller.rate_limited == 1
+
+    # Un solo decremento per finestra: un secondo 429 immediato non dimezza ancora
+    controller.acquire()
+    controller.release(0.01, RuntimeError("429 RESOURCE_EXHAUSTED"))
+    assert controller.limit == 4
+
+
+def test_slow_response_decreases_limit_down_to_min():
+    controller = _controller(initial_limit=4, min_limit=3, decrease_factor=0.5)
+    controller.acquire()
+    controller.release(5.0)
+    assert controller.limit == 3
+
+
+def test_full_queue_sheds_immediately():
+    controller = _controller(initial_limit=1, max_limit=1, max_queue=0)
+    controller.acquire()
+    with pytest.raises(AdmissionRejected):
+        controller.acquire()
+    assert controller.snapshot()["shed"] == 1
+
+
+def test_queue_timeout_sheds():
+    controller = _controller(initial_limit=1, max_limit=1, max_queue=1, queue_timeout=0.05)
+    controller.acquire()
+    with pytest.raises(AdmissionRejected):
+        controller.acquire()
+    snapshot = controller.snapshot()
+    assert (snapshot["shed"], snapshot["shed_timeouts"], snapshot["queue_depth"]) == (1, 1, 0)
+
+
+def test_acquire_async_waits_for_release():
+    async def scenario():
+        controller = _controller(initial_limit=1, max_limit=1, queue_timeout=5.0)
+        controller.acquire()
+        asyncio.get_running_loop().call_later(0.05, controller.release, 0.01)
+        waited = await controller.acquire_async()
+        return controller, waited
+
+    controller, waited = asyncio.run(scenario())
+    assert waited >= 0.04
+    assert controller.snapshot()["in_flight"] == 1
+
+
+def test_cancelled_acquire_async_leaves_no_slot_or_waiter():
+    async def scenario():
+        controller = _controller(initial_limit=1, max_limit=1, queue_timeout=5.0)
+        controller.acquire()
+        task = asyncio.create_task(controller.acquire_async())
+        await asyncio.sleep(0.02)
+        assert controller.snapshot()["queue_depth"] == 1
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert controller.snapshot()["queue_depth"] == 0
+        assert controller._async_waiters == []
+
+        # Lo slot occupato resta uno solo: dopo il rilascio la prossima richiesta entra subito
+        controller.release(0.01)
+        await asyncio.wait_for(controller.acquire_async(), 0.5)
+        return controller.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["in_flight"] == 1
+    assert snapshot["admitted"] == 2
@@ -6,6 +6,7 @@ Utile per verificare il funzionamento senza interazione manuale.
 import os
 from dotenv import load_dotenv
 from chatbot_faq import FAQChatbot
+from retrieval import get_relevance_gate
 
 # Carica variabili d'ambiente
 load_dotenv()
@@ -74,6 +75,10 @@ def test_chatbot():
                 results["failed"] += 1
             
             print(f"🤖 Risposta: {response[:200]}{'...' if len(response) > 200 else ''}")
+            relevance = (chatbot.last_debug_info or {}).get("relevance")
+            if relevance:
+                skipped = " (generazione evitata)" if not relevance["passed"] else ""
+                print(f"📏 Miglior score FAQ: {relevance['best_faq_score']} / soglia {relevance['faq_threshold']}{skipped}")
             
         except Exception as e:
             print(f"❌ Errore: {e}")
@@ -88,6 +93,8 @@ def test_chatbot():
     print(f"✅ Test passati: {results['passed']}/{results['total']}")
     print(f"❌ Test falliti: {results['failed']}/{results['total']}")
     print(f"📈 Percentuale successo: {(results['passed']/results['total']*100):.1f}%")
+    gate = get_relevance_gate().snapshot()
+    print(f"✂️  Chiamate LLM evitate dal gate di rilevanza: {gate['llm_calls_saved']}/{gate['checked']}")
     print("=" * 70)
     
     if results["failed"] == 0:
@@ -0,0 +1,106 @@
+"""
+Test unitari della compressione estrattiva del contesto (embedder finto, nessuna API key).
+"""
+
+import pytest
+
+import context_compression
+from context_compression import ContextCompressor, SentenceEmbeddingStore, split_sentences
+from embeddings import EmbeddingSpace
+from retrieval import RetrievedChunk
+
+SPACE = EmbeddingSpace(provider="google", model="test-model", dimensions=3)
+QUERY = [1.0, 0.0, 0.0]
+
+
+class KeywordEmbedder:
+    """Vettori per parola chiave: ``memory`` è vicina alla domanda, il resto è ortogonale."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        return [
+            [1.0, 0.0, 0.0] if "memory" in text else [0.0, 1.0, 0.0] if "pizza" in text else [0.0, 0.0, 1.0]
+            for text in texts
+        ]
+
+
+@pytest.fixture(autouse=True)
+def sentence_store(tmp_path, monkeypatch):
+    store = SentenceEmbeddingStore(str(tmp_path / "sentences.sqlite"))
+    monkeypatch.setattr(context_compression, "_sentence_store", store)
+    return store
+
+
+def test_split_sentences_keeps_code_blocks_whole():
+    text = "Prima frase. Seconda frase!\n```python\nx = 1. y = 2\n```\nUltima riga"
+    assert split_sentences(text) == ["Prima frase.", "Seconda frase!", "```python\nx = 1. y = 2\n```", "Ultima riga"]
+
+
+def test_under_budget_passes_through_without_embedding():
+    pytest.importorskip("numpy")
+    embedder = KeywordEmbedder()
+    chunks = [RetrievedChunk(id="a", text="La memory conserva i turni.")]
+    compressed, stats = ContextCompressor(embedder, SPACE, budget_chars=1000).compress(QUERY, chunks)
+    assert compressed == chunks
+    assert stats["ratio"] == 1.0
+    assert embedder.calls == []
+
+
+def test_keeps_best_sentences_and_one_per_chunk():
+    pytest.importorskip("numpy")
+    chunks = [
+        RetrievedChunk(id="a", text="La pizza è buona. La memory conserva i turni. Il meteo è variabile."),
+        RetrievedChunk(id="b", text="La pizza margherita ha il pomodoro. Altro testo qui."),
+    ]
+    compressor = ContextCompressor(KeywordEmbedder(), SPACE, budget_chars=40, neighbors=0, embed_missing=True)
+    compressed, stats = compressor.compress(QUERY, chunks)
+
+    assert [chunk.id for chunk in compressed] == ["a", "b"]
+    assert compressed[0].text == "La memory conserva i turni."
+    # Nessun chunk sparisce: anche fuori budget resta la sua frase migliore
+    assert compressed[1].text == "La pizza margherita ha il pomodoro."
+    assert stats["sentences"] == 5
+    assert stats["kept"] == 2
+    assert stats["output_chars"] < stats["input_chars"]
+
+
+def test_neighbors_and_gap_markers():
+    pytest.importorskip("numpy")
+    text = "Uno. La memory A. Tre. Quattro. La memory B. Sei."
+    chunk = RetrievedChunk(id="a", text=text)
+
+    with_neighbors, _ = ContextCompressor(KeywordEmbedder(), SPACE, budget_chars=30, neighbors=1).compress(
+        QUERY, [chunk]
+    )
+    assert with_neighbors[0].text == "Uno.\nLa memory A.\nTre."
+
+    gaps, _ = ContextCompressor(KeywordEmbedder(), SPACE, budget_chars=30, neighbors=0).compress(QUERY, [chunk])
+    assert gaps[0].text == "La memory A.\n…\nLa memory B."
+
+
+def test_sentence_embeddings_are_cached():
+    pytest.importorskip("numpy")
+    chunks = [RetrievedChunk(id="a", text="La memory conserva i turni. Filler uno. Filler due. Filler tre.")]
+    embedder = KeywordEmbedder()
+    compressor = ContextCompressor(embedder, SPACE, budget_chars=30, neighbors=0, embed_missing=True)
+
+    _, first = compressor.compress(QUERY, chunks)
+    _, second = compressor.compress(QUERY, chunks)
+    assert (first["embedded"], first["cache_hits"]) == (4, 0)
+    assert (second["embedded"], second["cache_hits"]) == (0, 4)
+    assert len(embedder.calls) == 1
+
+
+def test_missing_embeddings_are_skipped_when_disabled():
+    pytest.importorskip("numpy")
+    chunks = [RetrievedChunk(id="a", text="La memory conserva i turni. Filler uno. Filler due.")]
+    embedder = KeywordEmbedder()
+    compressed, stats = ContextCompressor(embedder, SPACE, budget_chars=20, embed_missing=False).compress(
+        QUERY, chunks
+    )
+    assert embedder.calls == []
+    assert stats["embedded"] == 0
+    assert compressed and compressed[0].text
@@ -0,0 +1,52 @@
+"""
+Test unitari della divisione parent/child di ``ingest_faq.py`` (nessuna API key né Qdrant).
+"""
+
+import pytest
+
+pytest.importorskip("datapizza")
+
+from datapizza.type import Chunk  # noqa: E402
+
+from ingest_faq import child_spans, split_parent  # noqa: E402
+
+PARENT_TEXT = (
+    "## Come funziona la memory?\n\n"
+    "La Memory conserva i turni della conversazione. Ogni turno ha un ruolo e dei blocchi. "
+    "Il client la invia al modello a ogni richiesta.\n\n"
+    "## Supporta modelli locali?\n\n"
+    "Sì, tramite i client compatibili con OpenAI."
+)
+
+
+def test_child_spans_respect_max_chars():
+    for max_chars in (40, 80, 400):
+        spans = child_spans(PARENT_TEXT, max_chars)
+        assert spans
+        assert all(0 < end - start <= max_chars for start, end in spans)
+        # Gli span sono ordinati e non si sovrappongono
+        assert all(previous[1] <= current[0] for previous, current in zip(spans, spans[1:]))
+
+
+def test_child_spans_merge_short_segments():
+    """Heading e risposta brevi consecutivi finiscono nello stesso figlio."""
+    spans = child_spans(PARENT_TEXT, 400)
+    assert len(spans) == 1
+    assert PARENT_TEXT[slice(*spans[0])] == PARENT_TEXT.strip()
+
+
+def test_child_spans_cut_long_sentences():
+    text = "x" * 95
+    assert child_spans(text, 40) == [(0, 40), (40, 80), (80, 95)]
+
+
+def test_split_parent_metadata_and_offsets():
+    parent = Chunk(id="parent-1", text=PARENT_TEXT, metadata={"source": "faq.md"})
+    children = split_parent(parent, max_chars=80)
+    assert len(children) > 1
+    for child in children:
+        assert child.id != parent.id
+        assert child.metadata["source"] == "faq.md"
+        assert child.metadata["parent_id"] == "parent-1"
+        assert child.text == PARENT_TEXT[child.metadata["span_start"]:child.metadata["span_end"]]
+    assert len({child.id for child in children}) == len(children)
@@ -0,0 +1,86 @@
+"""
+Test unitari della contabilità del prompt caching (``prompt_cache.py``, nessuna API key).
+"""
+
+import time
+from types import SimpleNamespace
+
+from prompt_cache import LocalPrefixCache, compile_system_prompts, estimate_tokens
+
+SYSTEM = "s" * 400  # 100 token stimati
+HISTORY = "h" * 200  # 50 token stimati
+
+
+def test_first_request_is_a_miss():
+    cache = LocalPrefixCache(min_tokens=10)
+    info = cache.record([SYSTEM, "domanda uno"])
+    assert (info["cache_hit"], info["cached_tokens"], info["source"]) == (False, 0, "local")
+    assert info["input_tokens"] == estimate_tokens(SYSTEM) + estimate_tokens("domanda uno")
+
+
+def test_repeated_prefix_hits_longest_seen_prefix():
+    cache = LocalPrefixCache(min_tokens=10, discount=0.5)
+    cache.record([SYSTEM, HISTORY, "domanda uno"])
+    info = cache.record([SYSTEM, HISTORY, "domanda due"])
+    assert info["cache_hit"]
+    assert info["cached_tokens"] == 150
+    assert info["billed_input_tokens"] == info["input_tokens"] - 150 * 0.5
+
+
+def test_final_segment_is_never_a_cached_prefix():
+    cache = LocalPrefixCache(min_tokens=10)
+    cache.record([SYSTEM, "stessa domanda"])
+    info = cache.record([SYSTEM, "stessa domanda"])
+    assert info["cached_tokens"] == estimate_tokens(SYSTEM)
+
+
+def test_prefix_below_min_tokens_is_not_cached():
+    cache = LocalPrefixCache(min_tokens=1024)
+    cache.record([SYSTEM, "domanda uno"])
+    assert not cache.record([SYSTEM, "domanda due"])["cache_hit"]
+
+
+def test_changed_history_only_reuses_system_prompt():
+    cache = LocalPrefixCache(min_tokens=10)
+    cache.record([SYSTEM, HISTORY, "domanda"])
+    info = cache.record([SYSTEM, "h" * 199 + "x", "domanda"])
+    assert info["cached_tokens"] == estimate_tokens(SYSTEM)
+
+
+def test_prefixes_expire_after_ttl():
+    cache = LocalPrefixCache(min_tokens=10, ttl_seconds=0.05)
+    cache.record([SYSTEM, "domanda uno"])
+    time.sleep(0.08)
+    assert not cache.record([SYSTEM, "domanda due"])["cache_hit"]
+
+
+def test_provider_usage_takes_precedence():
+    cache = LocalPrefixCache(min_tokens=10, discount=0.75)
+    response = SimpleNamespace(usage_metadata={"prompt_token_count": 100, "cached_content_token_count": 40})
+    info = cache.record([SYSTEM, "domanda"], response)
+    assert info == {
+        "cache_hit": True,
+        "source": "provider",
+        "input_tokens": 100,
+        "cached_tokens": 40,
+        "billed_input_tokens": 70.0,
+    }
+    assert cache.snapshot()["provider_reported"] == 1
+
+
+def test_snapshot_totals():
+    cache = LocalPrefixCache(min_tokens=10)
+    cache.record([SYSTEM, "uno"])
+    cache.record([SYSTEM, "due"])
+    snapshot = cache.snapshot()
+    assert (snapshot["requests"], snapshot["hits"], snapshot["hit_rate"]) == (2, 1, 0.5)
+    assert snapshot["cached_tokens"] == estimate_tokens(SYSTEM)
+
+
+def test_compiled_prompts_have_stable_fingerprints():
+    config = (("it", "Nessuna risposta.", "Rispondi in italiano."), ("en", "No answer.", "Answer in English."))
+    template = "Regole. Fallback: {fallback_message}. {language_instruction}"
+    first, second = compile_system_prompts(template, config), compile_system_prompts(template, config)
+    assert first["it"].text == "Regole. Fallback: Nessuna risposta.. Rispondi in italiano."
+    assert first["it"].fingerprint == second["it"].fingerprint
+    assert first["it"].fingerprint != first["en"].fingerprint
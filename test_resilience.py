@@ -0,0 +1,111 @@
+"""
+Test unitari del circuit breaker e delle chiamate hedged di ``resilience.py`` (nessuna API key).
+"""
+
+import asyncio
+import contextvars
+import time
+
+import pytest
+
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, LatencyTracker, hedged_call
+
+RESET_TIMEOUT = 0.05
+
+
+def _fail():
+    raise ConnectionError("backend giù")
+
+
+def _tripped_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=RESET_TIMEOUT)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(_fail)
+    return breaker
+
+
+def test_trips_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=RESET_TIMEOUT)
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail)
+    assert breaker.state == CLOSED
+
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail)
+    assert breaker.state == OPEN
+    assert breaker.is_open
+    assert breaker.trips == 1
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=RESET_TIMEOUT)
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail)
+    assert breaker.call(lambda: "ok") == "ok"
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail)
+    assert breaker.state == CLOSED
+
+
+def test_open_breaker_rejects_without_calling():
+    breaker = _tripped_breaker()
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(calls.append, "chiamata")
+    assert calls == []
+    assert breaker.snapshot()["rejected"] == 1
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = _tripped_breaker()
+    time.sleep(RESET_TIMEOUT * 1.5)
+    assert breaker.state == HALF_OPEN
+    assert not breaker.is_open
+
+    assert breaker.allow_request()
+    # Prova in corso: le altre richieste vengono rifiutate
+    assert breaker.is_open
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = _tripped_breaker()
+    time.sleep(RESET_TIMEOUT * 1.5)
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail)
+    assert breaker.state == OPEN
+    assert breaker.trips == 2
+
+
+def test_async_call_uses_the_same_state_machine():
+    async def fail():
+        raise ConnectionError("backend giù")
+
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=RESET_TIMEOUT)
+    with pytest.raises(ConnectionError):
+        asyncio.run(breaker.a_call(fail))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(breaker.a_call(fail))
+
+
+def test_hedged_call_runs_in_the_caller_context():
+    """Richiesta principale e di riserva vedono le context variable del chiamante."""
+    marker = contextvars.ContextVar("marker", default=None)
+    tracker = LatencyTracker(min_samples=1)
+    tracker.record(0.001)
+    seen = []
+
+    def slow():
+        seen.append(marker.get())
+        time.sleep(0.05)
+        return "ok"
+
+    marker.set("domanda-1")
+    assert hedged_call(tracker, slow) == "ok"
+    time.sleep(0.06)
+    assert seen == ["domanda-1", "domanda-1"]
+    assert tracker.snapshot()["hedges_fired"] == 1
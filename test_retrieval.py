@@ -0,0 +1,71 @@
+"""
+Test unitari delle funzioni pure di ``retrieval.py`` (nessuna API key né Qdrant).
+"""
+
+from retrieval import RetrievedChunk, cap_parent_text, reciprocal_rank_fusion
+
+
+def _chunk(chunk_id: str, score: float | None = None) -> RetrievedChunk:
+    return RetrievedChunk(id=chunk_id, text=f"testo {chunk_id}", score=score)
+
+
+def test_rrf_orders_by_fused_rank():
+    """Un chunk presente in più classifiche supera quelli visti una sola volta."""
+    rankings = [
+        [_chunk("a", 0.9), _chunk("b", 0.8), _chunk("c", 0.7)],
+        [_chunk("b", 0.85), _chunk("d", 0.6)],
+    ]
+    fused = reciprocal_rank_fusion(rankings, limit=10)
+    assert [chunk.id for chunk in fused] == ["b", "a", "d", "c"]
+
+
+def test_rrf_keeps_best_similarity_score():
+    """Lo score del chunk fuso resta la similarità migliore, non il punteggio RRF."""
+    rankings = [[_chunk("a", 0.4)], [_chunk("a", 0.7)], [_chunk("a", None)]]
+    (fused,) = reciprocal_rank_fusion(rankings, limit=5)
+    assert fused.score == 0.7
+
+
+def test_rrf_respects_limit_and_deduplicates():
+    rankings = [[_chunk(str(i), 1 - i / 10) for i in range(6)], [_chunk(str(i), 0.5) for i in range(6)]]
+    fused = reciprocal_rank_fusion(rankings, limit=3)
+    assert [chunk.id for chunk in fused] == ["0", "1", "2"]
+    assert len({chunk.id for chunk in fused}) == len(fused)
+
+
+def test_rrf_ties_keep_first_seen_order():
+    """A parità di rango vince l'ordine delle classifiche (ordinamento stabile)."""
+    fused = reciprocal_rank_fusion([[_chunk("x")], [_chunk("y")]], limit=2)
+    assert [chunk.id for chunk in fused] == ["x", "y"]
+
+
+def test_rrf_empty_rankings():
+    assert reciprocal_rank_fusion([], limit=5) == []
+    assert reciprocal_rank_fusion([[], []], limit=5) == []
+
+
+def test_cap_parent_text_short_text_unchanged():
+    assert cap_parent_text("breve", [(0, 5)], max_chars=100) == "breve"
+
+
+def test_cap_parent_text_without_spans_keeps_head():
+    text = "a" * 50 + "b" * 50
+    assert cap_parent_text(text, [], max_chars=40) == "a" * 40 + " …"
+
+
+def test_cap_parent_text_centers_on_child_spans():
+    text = "x" * 100 + "TROVATO" + "y" * 100
+    capped = cap_parent_text(text, [(100, 107)], max_chars=41)
+    assert "TROVATO" in capped
+    assert capped.startswith("… ") and capped.endswith(" …")
+    body = capped[2:-2]
+    assert len(body) == 41
+    # Margine uguale (±1) prima e dopo lo span
+    assert abs(body.index("TROVATO") - (len(body) - body.index("TROVATO") - 7)) <= 1
+
+
+def test_cap_parent_text_distant_spans_keep_fragments():
+    text = "PRIMO" + "-" * 200 + "SECONDO"
+    capped = cap_parent_text(text, [(205, 212), (0, 5)], max_chars=30)
+    assert capped == "PRIMO … SECONDO"
+    assert len(capped) <= 30
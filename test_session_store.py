@@ -0,0 +1,114 @@
+"""
+Test unitari dello store delle sessioni: spill su SQLite, ripristino, lock e TTL.
+"""
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("datapizza")
+
+from session_store import SessionState, SessionStore  # noqa: E402
+
+
+def _store(tmp_path, budget_bytes: int = 10 * 1024 * 1024, idle_seconds: float = 900, spill_ttl_s: float = 0):
+    return SessionStore(str(tmp_path / "sessions.sqlite"), budget_bytes, idle_seconds, spill_ttl_s)
+
+
+def _fill(store: SessionStore, session_id: str, text: str) -> SessionState:
+    state = store.get(session_id)
+    state.messages.append({"role": "user", "content": text})
+    state.add_debug_trace(1)
+    store.save(session_id, state)
+    return state
+
+
+def test_over_budget_spills_least_recent_and_restores(tmp_path):
+    store = _store(tmp_path, budget_bytes=1)
+    _fill(store, "a", "domanda di a")
+    _fill(store, "b", "domanda di b")
+
+    stats = store.stats()
+    assert (stats["resident_sessions"], stats["spilled_sessions"], stats["evictions"]) == (1, 1, 1)
+
+    restored = store.get("a")
+    assert restored.messages == [{"role": "user", "content": "domanda di a"}]
+    assert restored.debug_trace_ids == [1]
+    assert store.stats()["restores"] == 1
+
+
+def test_restored_state_gets_a_fresh_lock(tmp_path):
+    store = _store(tmp_path, budget_bytes=1)
+    original = _fill(store, "a", "domanda")
+    _fill(store, "b", "altra domanda")
+
+    restored = store.get("a")
+    assert restored is not original
+    assert restored.lock is not original.lock
+    assert restored.lock.acquire(blocking=False)
+    restored.lock.release()
+
+
+def test_idle_sessions_are_spilled(tmp_path):
+    store = _store(tmp_path, idle_seconds=0.01)
+    _fill(store, "a", "domanda")
+    time.sleep(0.03)
+    _fill(store, "b", "domanda")
+    stats = store.stats()
+    assert (stats["resident_sessions"], stats["spilled_sessions"], stats["idle_evictions"]) == (1, 1, 1)
+
+
+def test_busy_session_is_not_evicted(tmp_path):
+    store = _store(tmp_path, budget_bytes=1)
+    busy = _fill(store, "a", "domanda in corso")
+    holding, done = threading.Event(), threading.Event()
+
+    def hold():
+        with busy.lock:
+            holding.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    holding.wait(5)
+    try:
+        _fill(store, "b", "domanda")
+        assert store.stats()["spilled_sessions"] == 0
+    finally:
+        done.set()
+        thread.join()
+
+    _fill(store, "c", "domanda")
+    assert store.stats()["spilled_sessions"] == 2
+
+
+def test_save_after_eviction_drops_stale_disk_copy(tmp_path):
+    store = _store(tmp_path, budget_bytes=1)
+    state = _fill(store, "a", "prima")
+    _fill(store, "b", "domanda")
+    # "a" è su disco, ma la pagina aveva ancora lo stato in mano e lo salva
+    state.messages.append({"role": "assistant", "content": "risposta"})
+    store.save("a", state)
+    assert len(store.get("a").messages) == 2
+
+
+def test_expired_spilled_sessions_are_pruned(tmp_path):
+    store = _store(tmp_path, budget_bytes=1, spill_ttl_s=3600)
+    _fill(store, "a", "vecchia")
+    _fill(store, "b", "recente")
+    store._conn.execute("UPDATE sessions SET updated_at = updated_at - 7200 WHERE session_id = 'a'")
+    store._conn.commit()
+
+    # Una riga scaduta non viene ripristinata anche prima della pulizia
+    assert store.get("a").messages == []
+    assert store.prune_spilled() >= 1
+    assert store.stats()["expired"] >= 1
+
+
+def test_prune_disabled_without_ttl(tmp_path):
+    store = _store(tmp_path, budget_bytes=1, spill_ttl_s=0)
+    _fill(store, "a", "domanda")
+    _fill(store, "b", "domanda")
+    assert store.prune_spilled() == 0
+    assert store.stats()["spilled_sessions"] == 1
@@ -0,0 +1,121 @@
+"""
+Test unitari della cache a due livelli (``shared_cache.py``): memoria, SQLite condiviso ed errori.
+"""
+
+import time
+
+import pytest
+
+from shared_cache import CacheBackend, MemoryBackend, SharedCache, SQLiteBackend, _hash_key, vector_codec
+
+
+class BrokenBackend(CacheBackend):
+    """Livello condiviso irraggiungibile."""
+
+    name = "broken"
+
+    def get_many(self, namespace, keys):
+        raise ConnectionError("backend giù")
+
+    def set_many(self, namespace, items, ttl_s):
+        raise ConnectionError("backend giù")
+
+    def clear(self, prefix=""):
+        return 0
+
+
+@pytest.fixture
+def shared(tmp_path):
+    return SQLiteBackend(str(tmp_path / "shared.sqlite"))
+
+
+def _cache(shared, name="test", **kwargs) -> SharedCache:
+    return SharedCache(name, MemoryBackend(), shared, **kwargs)
+
+
+def test_write_through_and_memory_hit(shared):
+    cache = _cache(shared)
+    cache.put("v1", "chiave", {"risposta": 42})
+    assert cache.get("v1", "chiave") == {"risposta": 42}
+
+    snapshot = cache.snapshot()
+    assert (snapshot["memory"]["hits"], snapshot["memory"]["writes"], snapshot["shared"]["writes"]) == (1, 1, 1)
+    assert snapshot["shared"]["hits"] + snapshot["shared"]["misses"] == 0
+
+
+def test_shared_hit_fills_memory_of_another_worker(shared):
+    _cache(shared).put("v1", "chiave", "valore")
+
+    other = _cache(shared)
+    assert other.get("v1", "chiave") == "valore"
+    assert other.get("v1", "chiave") == "valore"
+    snapshot = other.snapshot()
+    assert (snapshot["shared"]["hits"], snapshot["memory"]["hits"], snapshot["memory"]["misses"]) == (1, 1, 1)
+
+
+def test_versions_and_names_are_isolated(shared):
+    _cache(shared).put("v1", "chiave", "valore")
+    assert _cache(shared).get("v2", "chiave") is None
+    assert _cache(shared, name="altra").get("v1", "chiave") is None
+
+
+def test_get_many_mixes_tiers(shared):
+    writer = _cache(shared)
+    writer.put_many("v1", {"a": 1, "b": 2})
+    reader = _cache(shared)
+    reader.put("v1", "c", 3)
+    assert reader.get_many("v1", ["a", "b", "c", "d"]) == {"a": 1, "b": 2, "c": 3}
+    snapshot = reader.snapshot()
+    assert (snapshot["memory"]["hits"], snapshot["shared"]["hits"], snapshot["shared"]["misses"]) == (1, 2, 1)
+
+
+def test_get_or_compute_caches_only_values(shared):
+    cache = _cache(shared)
+    calls = []
+    assert cache.get_or_compute("v1", "k", lambda: calls.append(1) or "calcolato") == "calcolato"
+    assert cache.get_or_compute("v1", "k", lambda: calls.append(1) or "altro") == "calcolato"
+    assert cache.get_or_compute("v1", "vuoto", lambda: None) is None
+    assert calls == [1]
+
+
+def test_broken_shared_tier_is_a_counted_miss(capsys):
+    cache = _cache(BrokenBackend())
+    cache.put("v1", "chiave", "valore")
+    assert cache.get("v1", "altra") is None
+    assert cache.get("v1", "chiave") == "valore"
+    snapshot = cache.snapshot()
+    assert snapshot["shared"]["errors"] == 2
+    assert snapshot["shared"]["backend"] == "broken"
+    # Un solo avviso per cache
+    assert capsys.readouterr().out.count("non disponibile") == 1
+
+
+def test_undecodable_shared_row_is_a_miss(shared):
+    cache = _cache(shared)
+    shared.set_many("test@v1", {_hash_key("rotta"): b"\xff{", _hash_key("buona"): b'"ok"'}, 0)
+    assert cache.get_many("v1", ["rotta", "buona"]) == {"buona": "ok"}
+    snapshot = cache.snapshot()
+    assert (snapshot["shared"]["hits"], snapshot["shared"]["misses"], snapshot["shared"]["errors"]) == (1, 1, 1)
+
+
+def test_expired_entries_are_misses(shared):
+    cache = _cache(shared, ttl_s=0.05)
+    cache.put("v1", "chiave", "valore")
+    time.sleep(0.08)
+    assert cache.get("v1", "chiave") is None
+    assert shared.prune() == 1
+
+
+def test_memory_tier_is_bounded():
+    memory = MemoryBackend(max_entries=2)
+    memory.set_many("ns", {"a": 1, "b": 2}, 0)
+    memory.get_many("ns", ["a"])
+    memory.set_many("ns", {"c": 3}, 0)
+    # "b" è la meno recente dopo la lettura di "a"
+    assert memory.get_many("ns", ["a", "b", "c"]) == {"a": 1, "c": 3}
+
+
+def test_vector_codec_round_trip(shared):
+    cache = _cache(shared, codec=vector_codec())
+    cache.put("v1", "frase", [0.5, -1.0, 0.25])
+    assert _cache(shared, codec=vector_codec()).get("v1", "frase") == [0.5, -1.0, 0.25]
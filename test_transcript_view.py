@@ -0,0 +1,51 @@
+"""
+Test unitari del rendering a finestra della chat (``transcript_view.py``).
+"""
+
+from transcript_view import _close_fences, _neutralize_html, render_message, render_transcript
+
+
+def test_close_fences_leaves_balanced_content():
+    content = "Esempio:\n```python\nprint('ciao')\n```\nFine."
+    assert _close_fences(content) == content
+
+
+def test_close_fences_closes_truncated_block():
+    assert _close_fences("Esempio:\n```python\nprint('ciao')") == "Esempio:\n```python\nprint('ciao')\n```"
+
+
+def test_close_fences_uses_the_opening_fence():
+    assert _close_fences("~~~~\ncodice").endswith("\n~~~~")
+    # Un fence più corto o di altro tipo non chiude il blocco
+    assert _close_fences("````\ncodice\n```").endswith("\n````")
+    assert _close_fences("```\ncodice\n~~~").endswith("\n```")
+
+
+def test_close_fences_ignores_info_string_lines_inside_block():
+    """Una riga ```python dentro il blocco non lo chiude (ha un info string)."""
+    assert _close_fences("```\na\n```python\nb").endswith("\n```")
+
+
+def test_neutralize_html_outside_code():
+    assert _neutralize_html("<script>alert(1)</script> & co") == "&lt;script>alert(1)&lt;/script> &amp; co"
+
+
+def test_neutralize_html_keeps_code_verbatim():
+    content = "Usa `<div>` oppure:\n```html\n<b>grassetto</b>\n```\ne <i>"
+    assert _neutralize_html(content) == "Usa `<div>` oppure:\n```html\n<b>grassetto</b>\n```\ne &lt;i>"
+
+
+def test_render_message_escapes_avatar_and_closes_fences():
+    rendered = render_message("assistant", "```\ncodice <b>", '<img src=x onerror="1">')
+    assert '<img src=x' not in rendered
+    assert "&lt;img" in rendered
+    assert "```\ncodice <b>\n```" in rendered
+    assert 'class="chat-message assistant"' in rendered
+
+
+def test_render_transcript_window():
+    messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"messaggio {i}"} for i in range(5)]
+    hidden, html = render_transcript(messages, 2, {"user": "U", "assistant": "A"})
+    assert hidden == 3
+    assert "messaggio 3" in html and "messaggio 4" in html
+    assert "messaggio 2" not in html
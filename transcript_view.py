@@ -0,0 +1,94 @@
+"""
+Rendering a finestra della conversazione nell'interfaccia Streamlit.
+
+Ogni rerun di ``app.py`` ridisegna la chat: invece di tre ``st.markdown`` per
+messaggio, la finestra visibile (gli ultimi ``TRANSCRIPT_WINDOW`` messaggi)
+viene emessa con un'unica chiamata, concatenando l'HTML dei singoli messaggi.
+L'HTML di ogni messaggio è in una cache LRU per (ruolo, contenuto, avatar),
+quindi a ogni rerun si compone solo il messaggio nuovo. I messaggi più vecchi
+restano nella sessione e si mostrano a blocchi con il pulsante "carica
+precedenti".
+
+Configurazione tramite variabili d'ambiente:
+- ``TRANSCRIPT_WINDOW`` (default 20): messaggi mostrati (e caricati per clic)
+- ``TRANSCRIPT_CACHE_SIZE`` (default 2048): messaggi renderizzati in cache
+"""
+
+from __future__ import annotations
+
+import functools
+import html
+import os
+import re
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+TRANSCRIPT_WINDOW = int(os.getenv("TRANSCRIPT_WINDOW", "20"))
+
+# Blocchi e span di codice: il loro contenuto è già mostrato alla lettera dal markdown
+_CODE_PATTERN = re.compile(r"(```.*?```|~~~.*?~~~|`[^`\n]+`)", re.DOTALL)
+_FENCE_PATTERN = re.compile(r"^ {0,3}(`{3,}|~{3,})(.*)$")
+
+
+def _close_fences(content: str) -> str:
+    """Chiude un blocco di codice lasciato aperto (es. risposta troncata).
+
+    Un fence non chiuso inghiottirebbe i messaggi successivi, visto che la
+    finestra viene emessa con un'unica chiamata ``st.markdown``.
+    """
+    open_fence = None
+    for line in content.splitlines():
+        match = _FENCE_PATTERN.match(line)
+        if not match:
+            continue
+        fence, rest = match.groups()
+        if open_fence is None:
+            open_fence = fence
+        elif fence[0] == open_fence[0] and len(fence) >= len(open_fence) and not rest.strip():
+            open_fence = None
+    return content if open_fence is None else f"{content}\n{open_fence}"
+
+
+def _neutralize_html(content: str) -> str:
+    """Disattiva l'HTML grezzo fuori dal codice (il testo arriva da utente e modello)."""
+    parts = _CODE_PATTERN.split(content)
+    for index in range(0, len(parts), 2):
+        parts[index] = parts[index].replace("&", "&amp;").replace("<", "&lt;")
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=int(os.getenv("TRANSCRIPT_CACHE_SIZE", "2048")))
+def render_message(role: str, content: str, avatar: str) -> str:
+    """HTML + markdown di un messaggio, pronto per ``st.markdown(..., unsafe_allow_html=True)``.
+
+    Le righe vuote attorno al contenuto chiudono i blocchi HTML, così il testo
+    del messaggio viene interpretato come markdown dentro la bolla; i blocchi di
+    codice rimasti aperti vengono chiusi dentro il messaggio.
+    """
+    classes = "chat-message user" if role == "user" else "chat-message assistant"
+    return (
+        f'<div class="{classes}"><div class="avatar">{html.escape(avatar)}</div><div class="bubble">\n\n'
+        f"{_neutralize_html(_close_fences(content.strip()))}\n\n"
+        "</div></div>"
+    )
+
+
+def visible_window(messages: Sequence[Mapping[str, str]], window: int) -> Tuple[int, Sequence[Mapping[str, str]]]:
+    """Restituisce (messaggi nascosti, messaggi visibili) per la finestra richiesta."""
+    hidden = max(0, len(messages) - max(window, 0))
+    return hidden, messages[hidden:]
+
+
+def render_transcript(messages: Sequence[Mapping[str, str]], window: int, avatars: Dict[str, str]) -> Tuple[int, str]:
+    """Compone la finestra visibile in un'unica stringa; restituisce anche quanti messaggi sono nascosti."""
+    hidden, visible = visible_window(messages, window)
+    parts: List[str] = ['<div class="chat-shell">']
+    for message in visible:
+        role = message["role"]
+        parts.append(render_message(role, message["content"], avatars.get(role, "")))
+    parts.append("</div>")
+    return hidden, "\n\n".join(parts)
+
+
+def cache_info() -> Dict[str, int]:
+    info = render_message.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize or 0}
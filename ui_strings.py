@@ -0,0 +1,289 @@
+"""
+Testi dell'interfaccia web per lingua (senza dipendenze da Streamlit).
+
+Separati da ``app.py`` così che anche il warm-up (``warmup.py``) possa leggere
+i suggerimenti della chat vuota e precalcolarne le risposte.
+"""
+
+LANGUAGE_OPTIONS = {
+    "it": {
+        "label": "Italiano",
+        "flag": "🇮🇹",
+        "ui": {
+            "language_label": "Lingua",
+            "init_spinner": "🔧 Inizializzazione chatbot con Google Gemini 2.5 Flash...",
+            "init_error": """⚠️ **Errore nell'inizializzazione del chatbot**
+
+{error}
+
+**Assicurati di:**
+1. Aver eseguito l'ingestion: `python ingest_faq.py`
+2. Aver configurato il file `.env` con GOOGLE_API_KEY e OPENAI_API_KEY
+3. Aver indicizzato la documentazione ufficiale con `python -m datapizza_mcp.indexer`
+4. Aver configurato Qdrant (host remoto o embedded) tramite le variabili `QDRANT_*`
+""",
+            "hero_subtitle": "Il chatbot per rispondere ai dubbi sul framework Datapizza-AI.",
+            "sidebar_model_title": "### 🧠 Modello AI",
+            "sidebar_model_info": "**Google Gemini 2.5 Flash** con Memory attiva\n\nIntegra FAQ + documentazione ufficiale (MCP).",
+            "sidebar_tips_title": "### 💡 Suggerimenti",
+            "sidebar_tips_body": """Prova a chiedere:
+- Cosa differenzia Datapizza-AI da altri framework?
+- Supporta modelli Llama?
+- Come funziona la memory?
+- Quali sono i casi d'uso concreti?
+- Posso usare documenti aziendali in locale?
+
+**Novità**: Il chatbot ora ricorda la conversazione! 🧠
+""",
+            "sidebar_debug_title": "### 🧪 Debug",
+            "debug_checkbox_label": "Mostra dettagli retrieval",
+            "debug_checkbox_help": "Abilita il logging della query riscritta, dei chunk trovati e di eventuali fallback.",
+            "debug_no_logs": "Invia una domanda per visualizzare i dettagli di debug.",
+            "debug_query_rewritten": "**Query riscritta**",
+            "debug_fallback_overridden": "Il modello aveva restituito il fallback: mostrato il testo più rilevante dalle FAQ.",
+            "debug_fallback_triggered": "Il modello ha restituito il fallback (nessuna informazione rilevante trovata).",
+            "debug_fallback_gated": "Nessuna fonte sopra la soglia di rilevanza (FAQ {best_faq_score} / {faq_threshold}): fallback senza chiamare il modello.",
+            "debug_top_chunks_sidebar": "**Top chunk (max 3)**",
+            "debug_chunk_source_unknown": "sorgente sconosciuta",
+            "score_label": " · punteggio: ",
+            "debug_docs_excerpt": "**Documentazione ufficiale (estratto)**",
+            "debug_docs_chunks_sidebar": "**Chunk documentazione (max 2)**",
+            "debug_docs_chunk_source_fallback": "documentazione",
+            "debug_admission": "**Admission control Gemini** · limite {limit} · in coda {queue_depth} · attesa media {avg_wait_ms} ms · scartate {shed}",
+            "debug_session_store": "**Session store** · residenti {resident_sessions} · su disco {spilled_sessions} · {resident_kb} KB in RAM · ripristino p95 {restore_p95_ms} ms",
+            "debug_details_title": "🔍 Dettagli retrieval",
+            "debug_no_chunks": "Nessun chunk recuperato dal vector store.",
+            "debug_top_chunks_expander": "**Top chunk (max 3)**",
+            "docs_not_supported_info": "Configura OPENAI_API_KEY per abilitare la documentazione ufficiale (Qdrant deve contenere 'datapizza_official_docs').",
+            "docs_toggle_label": "Includi documentazione ufficiale",
+            "docs_toggle_help": "Abilita il recupero tramite MCP della collection 'datapizza_official_docs'.",
+            "settings_title": "### ⚙️ Impostazioni",
+            "slider_label": "Chunks da recuperare",
+            "slider_help": "Numero di chunks rilevanti da recuperare dal vector store",
+            "stats_title": "### 📊 Statistiche",
+            "metric_messages": "Messaggi totali",
+            "debug_cost": "**Costo ultima domanda** · {llm_calls} chiamate LLM · {input_tokens} token in / {output_tokens} out · {embedding_calls} embedding · {qdrant_requests} richieste Qdrant",
+            "session_cost": "💰 Sessione: {llm_calls} chiamate LLM · {input_tokens} token in / {output_tokens} out · {embedding_calls} embedding · {qdrant_requests} richieste Qdrant",
+            "clear_chat_button": "🗑️ Pulisci chat",
+            "load_earlier_button": "⬆️ Carica messaggi precedenti ({count} nascosti)",
+            "warmup_running": "⏳ Warm-up in corso: connessioni e risposte ai suggerimenti...",
+            "warmup_ready": "✅ Pronto · warm-up in {total_ms} ms · {answers} risposte ai suggerimenti precalcolate",
+            "warmup_failed": "⚠️ Warm-up non riuscito: le connessioni verranno aperte alla prima domanda.",
+            "setup_failed": "⚠️ Inizializzazione non riuscita (verrà ritentata alla prima domanda): {error}",
+            "resources_title": "### 📚 Risorse",
+            "resources_links": """- [Documentazione](https://docs.datapizza.ai/)
+- [GitHub](https://github.com/datapizza-labs/datapizza-ai)
+- [Guida RAG](https://docs.datapizza.ai/0.0.2/Guides/RAG/rag/)
+""",
+            "empty_chat_title": "Benvenuto in FAQaccia!",
+            "empty_chat_intro": "Chiedimi qualcosa per iniziare oppure prova uno dei suggerimenti.",
+            "empty_chat_suggestions": [
+                "Come posso integrare Datapizza-AI in un progetto esistente?",
+                "Quali differenze ci sono rispetto a un classico framework RAG?",
+                "Serve una chiave API per usare la documentazione ufficiale?",
+            ],
+            "input_label": "Messaggio",
+            "input_placeholder": "Scrivi la tua domanda qui...",
+            "submit_button": "Invia",
+            "thinking_spinner": "🤔 Sto pensando...",
+            "generic_error": "Si è verificato un errore: {error}",
+            "footer_text": """<div class="footer">
+        Costruito con ❤️ usando <a href="https://docs.datapizza.ai/" target="_blank">Datapizza-AI</a>
+        e <a href="https://streamlit.io/" target="_blank">Streamlit</a>
+    </div>
+    </div>""",
+            "user_avatar": "TU",
+            "assistant_avatar": "AI",
+        },
+    },
+    "en": {
+        "label": "English",
+        "flag": "🇬🇧",
+        "ui": {
+            "language_label": "Language",
+            "init_spinner": "🔧 Initializing chatbot with Google Gemini 2.5 Flash...",
+            "init_error": """⚠️ **Chatbot initialization error**
+
+{error}
+
+**Make sure to:**
+1. Run the ingestion: `python ingest_faq.py`
+2. Configure the `.env` file with GOOGLE_API_KEY and OPENAI_API_KEY
+3. Index the official documentation with `python -m datapizza_mcp.indexer`
+4. Configure Qdrant (remote host or embedded) via the `QDRANT_*` variables
+""",
+            "hero_subtitle": "The chatbot that answers questions about the Datapizza-AI framework.",
+            "sidebar_model_title": "### 🧠 AI Model",
+            "sidebar_model_info": "**Google Gemini 2.5 Flash** with active Memory\n\nCombines FAQ + official documentation (MCP).",
+            "sidebar_tips_title": "### 💡 Tips",
+            "sidebar_tips_body": """Try asking:
+- What sets Datapizza-AI apart from other frameworks?
+- Does it support Llama models?
+- How does the memory work?
+- What are concrete use cases?
+- Can I use on-premise company documents?
+
+**What's new**: The chatbot now remembers the conversation! 🧠
+""",
+            "sidebar_debug_title": "### 🧪 Debug",
+            "debug_checkbox_label": "Show retrieval details",
+            "debug_checkbox_help": "Enable logging for the rewritten query, retrieved chunks, and fallback status.",
+            "debug_no_logs": "Send a question to view the debug details.",
+            "debug_query_rewritten": "**Rewritten query**",
+            "debug_fallback_overridden": "The model returned the fallback; showing the most relevant FAQ snippet instead.",
+            "debug_fallback_triggered": "The model returned the fallback (no relevant information found).",
+            "debug_fallback_gated": "No source above the relevance threshold (FAQ {best_faq_score} / {faq_threshold}): fallback returned without calling the model.",
+            "debug_top_chunks_sidebar": "**Top chunks (max 3)**",
+            "debug_chunk_source_unknown": "unknown source",
+            "score_label": " · score: ",
+            "debug_docs_excerpt": "**Official documentation (excerpt)**",
+            "debug_docs_chunks_sidebar": "**Documentation chunks (max 2)**",
+            "debug_docs_chunk_source_fallback": "documentation",
+            "debug_admission": "**Gemini admission control** · limit {limit} · queued {queue_depth} · avg wait {avg_wait_ms} ms · shed {shed}",
+            "debug_session_store": "**Session store** · resident {resident_sessions} · on disk {spilled_sessions} · {resident_kb} KB in RAM · restore p95 {restore_p95_ms} ms",
+            "debug_details_title": "🔍 Retrieval details",
+            "debug_no_chunks": "No chunks retrieved from the vector store.",
+            "debug_top_chunks_expander": "**Top chunks (max 3)**",
+            "docs_not_supported_info": "Configure OPENAI_API_KEY to enable the official documentation (Qdrant must contain 'datapizza_official_docs').",
+            "docs_toggle_label": "Include official documentation",
+            "docs_toggle_help": "Enable MCP retrieval from the 'datapizza_official_docs' collection.",
+            "settings_title": "### ⚙️ Settings",
+            "slider_label": "Chunks to retrieve",
+            "slider_help": "Number of relevant chunks to fetch from the vector store",
+            "stats_title": "### 📊 Statistics",
+            "metric_messages": "Total messages",
+            "debug_cost": "**Last question cost** · {llm_calls} LLM calls · {input_tokens} tokens in / {output_tokens} out · {embedding_calls} embeddings · {qdrant_requests} Qdrant requests",
+            "session_cost": "💰 Session: {llm_calls} LLM calls · {input_tokens} tokens in / {output_tokens} out · {embedding_calls} embeddings · {qdrant_requests} Qdrant requests",
+            "clear_chat_button": "🗑️ Clear chat",
+            "load_earlier_button": "⬆️ Load earlier messages ({count} hidden)",
+            "warmup_running": "⏳ Warming up: connections and suggestion answers...",
+            "warmup_ready": "✅ Ready · warm-up in {total_ms} ms · {answers} suggestion answers precomputed",
+            "warmup_failed": "⚠️ Warm-up failed: connections will be opened on the first question.",
+            "setup_failed": "⚠️ Initialization failed (it will be retried on the first question): {error}",
+            "resources_title": "### 📚 Resources",
+            "resources_links": """- [Documentation](https://docs.datapizza.ai/)
+- [GitHub](https://github.com/datapizza-labs/datapizza-ai)
+- [RAG guide](https://docs.datapizza.ai/0.0.2/Guides/RAG/rag/)
+""",
+            "empty_chat_title": "Welcome to FAQaccia!",
+            "empty_chat_intro": "Ask me something to get started or try one of the suggestions.",
+            "empty_chat_suggestions": [
+                "How can I integrate Datapizza-AI into an existing project?",
+                "What makes it different from a classic RAG framework?",
+                "Do I need an API key to use the official documentation?",
+            ],
+            "input_label": "Message",
+            "input_placeholder": "Type your question here...",
+            "submit_button": "Send",
+            "thinking_spinner": "🤔 Thinking...",
+            "generic_error": "An error occurred: {error}",
+            "footer_text": """<div class="footer">
+        Built with ❤️ using <a href="https://docs.datapizza.ai/" target="_blank">Datapizza-AI</a>
+        and <a href="https://streamlit.io/" target="_blank">Streamlit</a>
+    </div>
+    </div>""",
+            "user_avatar": "YOU",
+            "assistant_avatar": "AI",
+        },
+    },
+    "de": {
+        "label": "Deutsch",
+        "flag": "🇩🇪",
+        "ui": {
+            "language_label": "Sprache",
+            "init_spinner": "🔧 Chatbot wird mit Google Gemini 2.5 Flash initialisiert...",
+            "init_error": """⚠️ **Fehler bei der Initialisierung des Chatbots**
+
+{error}
+
+**Stelle sicher, dass du:**
+1. Die Ingestion ausgeführt hast: `python ingest_faq.py`
+2. Die Datei `.env` mit GOOGLE_API_KEY und OPENAI_API_KEY konfiguriert hast
+3. Die offizielle Dokumentation mit `python -m datapizza_mcp.indexer` indiziert hast
+4. Qdrant (Remote-Host oder Embedded) über die Variablen `QDRANT_*` konfiguriert hast
+""",
+            "hero_subtitle": "Der Chatbot, der Fragen zum Datapizza-AI-Framework beantwortet.",
+            "sidebar_model_title": "### 🧠 KI-Modell",
+            "sidebar_model_info": "**Google Gemini 2.5 Flash** mit aktivem Gedächtnis\n\nKombiniert FAQ + offizielle Dokumentation (MCP).",
+            "sidebar_tips_title": "### 💡 Tipps",
+            "sidebar_tips_body": """Frag zum Beispiel:
+- Was unterscheidet Datapizza-AI von anderen Frameworks?
+- Unterstützt es Llama-Modelle?
+- Wie funktioniert das Memory?
+- Welche konkreten Use Cases gibt es?
+- Kann ich lokale Unternehmensdokumente nutzen?
+
+**Neu**: Der Chatbot merkt sich jetzt das Gespräch! 🧠
+""",
+            "sidebar_debug_title": "### 🧪 Debug",
+            "debug_checkbox_label": "Retrieval-Details anzeigen",
+            "debug_checkbox_help": "Aktiviere das Logging für die umformulierte Anfrage, gefundene Chunks und etwaige Fallbacks.",
+            "debug_no_logs": "Stelle eine Frage, um die Debug-Details zu sehen.",
+            "debug_query_rewritten": "**Umformulierte Anfrage**",
+            "debug_fallback_overridden": "Das Modell hat den Fallback geliefert; stattdessen wird der relevanteste FAQ-Ausschnitt angezeigt.",
+            "debug_fallback_triggered": "Das Modell hat den Fallback ausgegeben (keine relevanten Informationen gefunden).",
+            "debug_fallback_gated": "Keine Quelle über der Relevanzschwelle (FAQ {best_faq_score} / {faq_threshold}): Fallback ohne Modellaufruf.",
+            "debug_top_chunks_sidebar": "**Top-Chunks (max. 3)**",
+            "debug_chunk_source_unknown": "unbekannte Quelle",
+            "score_label": " · Score: ",
+            "debug_docs_excerpt": "**Offizielle Dokumentation (Auszug)**",
+            "debug_docs_chunks_sidebar": "**Dokumentations-Chunks (max. 2)**",
+            "debug_docs_chunk_source_fallback": "Dokumentation",
+            "debug_admission": "**Gemini-Admission-Control** · Limit {limit} · in Warteschlange {queue_depth} · Ø Wartezeit {avg_wait_ms} ms · verworfen {shed}",
+            "debug_session_store": "**Session-Store** · resident {resident_sessions} · auf Festplatte {spilled_sessions} · {resident_kb} KB im RAM · Wiederherstellung p95 {restore_p95_ms} ms",
+            "debug_details_title": "🔍 Retrieval-Details",
+            "debug_no_chunks": "Keine Chunks aus dem Vektor-Store gefunden.",
+            "debug_top_chunks_expander": "**Top-Chunks (max. 3)**",
+            "docs_not_supported_info": "Konfiguriere OPENAI_API_KEY, um die offizielle Dokumentation zu aktivieren (Qdrant muss 'datapizza_official_docs' enthalten).",
+            "docs_toggle_label": "Offizielle Dokumentation einbeziehen",
+            "docs_toggle_help": "Aktiviert den MCP-Retrieval der Collection 'datapizza_official_docs'.",
+            "settings_title": "### ⚙️ Einstellungen",
+            "slider_label": "Chunks abrufen",
+            "slider_help": "Anzahl relevanter Chunks, die aus dem Vektor-Store geholt werden",
+            "stats_title": "### 📊 Statistiken",
+            "metric_messages": "Nachrichten insgesamt",
+            "debug_cost": "**Kosten der letzten Frage** · {llm_calls} LLM-Aufrufe · {input_tokens} Token ein / {output_tokens} aus · {embedding_calls} Embeddings · {qdrant_requests} Qdrant-Anfragen",
+            "session_cost": "💰 Sitzung: {llm_calls} LLM-Aufrufe · {input_tokens} Token ein / {output_tokens} aus · {embedding_calls} Embeddings · {qdrant_requests} Qdrant-Anfragen",
+            "clear_chat_button": "🗑️ Chat löschen",
+            "load_earlier_button": "⬆️ Frühere Nachrichten laden ({count} ausgeblendet)",
+            "warmup_running": "⏳ Aufwärmphase läuft: Verbindungen und Antworten auf Vorschläge...",
+            "warmup_ready": "✅ Bereit · Aufwärmphase in {total_ms} ms · {answers} Antworten auf Vorschläge vorberechnet",
+            "warmup_failed": "⚠️ Aufwärmphase fehlgeschlagen: Verbindungen werden bei der ersten Frage geöffnet.",
+            "setup_failed": "⚠️ Initialisierung fehlgeschlagen (wird bei der ersten Frage wiederholt): {error}",
+            "resources_title": "### 📚 Ressourcen",
+            "resources_links": """- [Dokumentation](https://docs.datapizza.ai/)
+- [GitHub](https://github.com/datapizza-labs/datapizza-ai)
+- [RAG-Anleitung](https://docs.datapizza.ai/0.0.2/Guides/RAG/rag/)
+""",
+            "empty_chat_title": "Willkommen bei FAQaccia!",
+            "empty_chat_intro": "Frag mich etwas, um zu starten, oder nutze eine der Vorschläge.",
+            "empty_chat_suggestions": [
+                "Wie integriere ich Datapizza-AI in ein bestehendes Projekt?",
+                "Worin unterscheidet es sich von einem klassischen RAG-Framework?",
+                "Brauche ich einen API-Schlüssel, um die offizielle Dokumentation zu nutzen?",
+            ],
+            "input_label": "Nachricht",
+            "input_placeholder": "Schreibe deine Frage hier...",
+            "submit_button": "Senden",
+            "thinking_spinner": "🤔 Ich überlege...",
+            "generic_error": "Es ist ein Fehler aufgetreten: {error}",
+            "footer_text": """<div class="footer">
+        Erstellt mit ❤️ dank <a href="https://docs.datapizza.ai/" target="_blank">Datapizza-AI</a>
+        und <a href="https://streamlit.io/" target="_blank">Streamlit</a>
+    </div>
+    </div>""",
+            "user_avatar": "DU",
+            "assistant_avatar": "AI",
+        },
+    },
+}
+
+DEFAULT_LANGUAGE = "it"
+
+
+def get_ui_value(language: str, key: str):
+    default_ui = LANGUAGE_OPTIONS[DEFAULT_LANGUAGE]["ui"]
+    lang_ui = LANGUAGE_OPTIONS.get(language, {}).get("ui", {})
+    if key in lang_ui:
+        return lang_ui[key]
+    return default_ui.get(key)
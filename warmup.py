@@ -0,0 +1,281 @@
+"""
+Warm-up del processo: connessioni ai backend e risposte precalcolate ai suggerimenti.
+
+Dopo un deploy la prima domanda paga handshake TLS verso Qdrant, Google e
+OpenAI e cache vuote. Il warm-up, avviato all'avvio di ``app.py`` (in un
+thread, una sola volta per processo) oppure da terminale, esegue:
+
+1. la costruzione del chatbot con embed e ricerche di prova su FAQ e
+   documentazione ufficiale (``DeferredSetup._warm_connections``);
+2. il precalcolo delle risposte a ogni ``empty_chat_suggestions`` di ogni
+   lingua di ``LANGUAGE_OPTIONS``, salvate nella cache ``answers`` di
+   ``shared_cache`` nel namespace della versione delle collection e del
+   generatore, con chiave (lingua, domanda). Con il livello condiviso i worker successivi al primo
+   trovano le risposte già pronte.
+
+La versione è la collection fisica a cui puntano gli alias (vedi
+``collection_aliases.py``) più ``answer_version`` del chatbot, un hash del
+modello di generazione e dei system prompt compilati: dopo una nuova
+ingestion o un cambio di modello o di prompt le risposte precalcolate non
+vengono più servite e il warm-up successivo le ricalcola. Le risposte si
+servono solo come prima domanda di una conversazione, quando la memory è vuota
+come durante il precalcolo; si salvano solo le risposte con ``answered`` nella
+trace (generate dal modello), mai fallback, errori o risposte degradate.
+
+Lo stato (``WarmUp.snapshot()``) diventa ``ready`` solo a warm-up concluso.
+
+Configurazione tramite variabili d'ambiente:
+- ``WARMUP_ON_START`` (default on): ``app.py`` avvia il warm-up all'avvio del processo
+- ``WARMUP_CONNECTIONS`` (default on): embed e ricerche di prova dopo la costruzione dei client
+- ``WARMUP_PRECOMPUTE`` (default on): precalcola le risposte ai suggerimenti
+- ``WARMUP_VERSION_TTL_S`` (default 60): ogni quanto rileggere gli alias delle collection
+
+Esempi:
+    python warmup.py
+    python warmup.py --force --language en
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from collection_aliases import resolve_alias
+from cost_ledger import empty_request_cost, get_cost_ledger
+from qdrant_config import COLLECTION_NAME, OFFICIAL_DOCS_COLLECTION, get_qdrant_client
+from shared_cache import SharedCache, get_cache
+from ui_strings import LANGUAGE_OPTIONS, get_ui_value
+
+VERSION_TTL_S = float(os.getenv("WARMUP_VERSION_TTL_S", "60"))
+
+
+def _env_flag(name: str, default: str = "1") -> bool:
+    return os.getenv(name, default).lower() in {"1", "true", "yes", "on"}
+
+
+def warm_up_on_start() -> bool:
+    return _env_flag("WARMUP_ON_START")
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.split()).casefold()
+
+
+def suggestion_questions(languages: List[str] | None = None) -> List[Tuple[str, str]]:
+    """Coppie (lingua, domanda) dei suggerimenti della chat vuota."""
+    return [
+        (language, question)
+        for language in languages or list(LANGUAGE_OPTIONS)
+        for question in get_ui_value(language, "empty_chat_suggestions") or []
+    ]
+
+
+def answer_key(language: str, question: str) -> str:
+    """Chiave di una risposta precalcolata nel namespace della versione delle collection."""
+    return f"{language}\n{normalize_question(question)}"
+
+
+def get_answer_store() -> SharedCache:
+    return get_cache("answers")
+
+
+_versions: Dict[bool, Tuple[float, str]] = {}
+_versions_lock = threading.Lock()
+
+
+def index_version(use_official_docs: bool) -> str:
+    """Versioni fisiche delle collection interrogate (rilette al più ogni ``WARMUP_VERSION_TTL_S``)."""
+    with _versions_lock:
+        cached = _versions.get(use_official_docs)
+        if cached and time.monotonic() - cached[0] < VERSION_TTL_S:
+            return cached[1]
+        client = get_qdrant_client()
+        version = f"faq={resolve_alias(client, COLLECTION_NAME) or COLLECTION_NAME}"
+        if use_official_docs:
+            version += f";docs={resolve_alias(client, OFFICIAL_DOCS_COLLECTION) or OFFICIAL_DOCS_COLLECTION}"
+        _versions[use_official_docs] = (time.monotonic(), version)
+        return version
+
+
+def answers_version(use_official_docs: bool, answer_version: str) -> str:
+    """Namespace delle risposte precalcolate: collection interrogate più modello e system prompt."""
+    return f"{index_version(use_official_docs)};answers={answer_version}"
+
+
+def serve_precomputed_answer(
+    memory: Any,
+    language: str,
+    question: str,
+    use_official_docs: bool,
+    answer_version: str,
+    session_id: str | None = None,
+) -> str | None:
+    """Risposta precalcolata (aggiunta alla memory come un turno normale) o None.
+
+    ``answer_version`` è quella del chatbot che risponderebbe (``EnhancedFAQChatbot.answer_version``).
+    La risposta servita entra nel ledger dei costi con esito ``precomputed`` e costo nullo.
+    """
+    try:
+        answer = get_answer_store().get(
+            answers_version(use_official_docs, answer_version), answer_key(language, question)
+        )
+    except Exception as exc:
+        print(f"⚠ Risposte precalcolate non disponibili: {exc}")
+        return None
+    if answer is None:
+        return None
+
+    from datapizza.type import ROLE, TextBlock
+
+    memory.add_turn(TextBlock(content=question), role=ROLE.USER)
+    memory.add_turn(TextBlock(content=answer), role=ROLE.ASSISTANT)
+    get_cost_ledger().record(empty_request_cost(), session_id, language, "precomputed")
+    return answer
+
+
+class WarmUp:
+    """Warm-up del processo: costruzione del chatbot, probe e precalcolo dei suggerimenti."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self.state = "idle"
+        self.steps: List[Dict[str, Any]] = []
+        self.precomputed = 0
+        self.reused = 0
+        self.total_ms: float | None = None
+
+    def _step(self, name: str, started: float, **extra: Any) -> None:
+        self.steps.append({"name": name, "ms": round((time.perf_counter() - started) * 1000, 1), **extra})
+
+    def run(
+        self,
+        chatbot: Any = None,
+        precompute: bool | None = None,
+        force: bool = False,
+        languages: List[str] | None = None,
+    ) -> Dict[str, Any]:
+        """Esegue il warm-up (bloccante) e restituisce lo stato finale."""
+        precompute = _env_flag("WARMUP_PRECOMPUTE") if precompute is None else precompute
+        self.state = "running"
+        self.steps = []
+        started = time.perf_counter()
+        try:
+            if chatbot is None:
+                from chatbot_enhanced import EnhancedFAQChatbot
+
+                chatbot = EnhancedFAQChatbot(use_official_docs=True)
+            stage_started = time.perf_counter()
+            chatbot.warm_up()
+            self._step("setup", stage_started, setup_ms=chatbot.setup_ms, connections_ms=chatbot.connections_ms)
+            if precompute:
+                self._precompute(chatbot, force, languages)
+        except Exception as exc:
+            self.state = "failed"
+            self.steps.append({"name": "error", "error": str(exc)})
+            raise
+        finally:
+            self.total_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.state = "ready"
+        return self.snapshot()
+
+    def _precompute(self, chatbot: Any, force: bool, languages: List[str] | None) -> None:
+        from datapizza.memory import Memory
+
+        store = get_answer_store()
+        version = answers_version(chatbot.use_official_docs, chatbot.answer_version)
+        for language, question in suggestion_questions(languages):
+            stage_started = time.perf_counter()
+            if not force and store.get(version, answer_key(language, question)) is not None:
+                self.reused += 1
+                continue
+            # Memory vuota: la risposta è quella di una prima domanda
+            result = chatbot.answer(question, Memory(), language=language, session_id="warmup")
+            trace = result.trace
+            # Solo risposte generate dal modello: niente fallback, errori o risposte degradate
+            stored = bool(trace) and trace.get("answered") is True
+            if stored:
+                store.put(version, answer_key(language, question), result.text)
+                self.precomputed += 1
+            self._step(f"suggestion[{language}]", stage_started, question=question, stored=stored)
+
+    def start(self, chatbot: Any = None) -> threading.Thread:
+        """Avvia il warm-up in un thread daemon, una sola volta per processo."""
+        with self._lock:
+            if self._thread is None:
+                def _run():
+                    try:
+                        self.run(chatbot)
+                    except Exception as exc:
+                        print(f"⚠ Warm-up non riuscito: {exc}")
+
+                self._thread = threading.Thread(target=_run, name="process-warm-up", daemon=True)
+                self._thread.start()
+            return self._thread
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "total_ms": self.total_ms,
+            "precomputed": self.precomputed,
+            "reused": self.reused,
+            "steps": list(self.steps),
+        }
+
+
+_warm_up: WarmUp | None = None
+_warm_up_lock = threading.Lock()
+
+
+def get_warm_up() -> WarmUp:
+    global _warm_up
+
+    with _warm_up_lock:
+        if _warm_up is None:
+            _warm_up = WarmUp()
+        return _warm_up
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Warm-up: connessioni ai backend e risposte ai suggerimenti.")
+    parser.add_argument("--force", action="store_true", help="Ricalcola anche le risposte già salvate")
+    parser.add_argument("--no-precompute", action="store_true", help="Solo connessioni e probe")
+    parser.add_argument("--language", action="append", choices=list(LANGUAGE_OPTIONS), help="Lingua (ripetibile)")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("🔥 Warm-up FAQaccia")
+    print("=" * 70)
+    status = get_warm_up().run(precompute=not args.no_precompute, force=args.force, languages=args.language)
+    for step in status["steps"]:
+        if step["name"] == "setup":
+            print(
+                f"✓ Client e pipeline in {step['setup_ms']} ms, "
+                f"connessioni di prova in {step['connections_ms'] or 0} ms"
+            )
+        else:
+            marker = "✓" if step["stored"] else "⚠"
+            print(f"{marker} {step['name']} {step['question']} ({step['ms']} ms)")
+    print(
+        f"✅ Pronto in {status['total_ms']} ms: {status['precomputed']} risposte precalcolate, "
+        f"{status['reused']} già disponibili"
+    )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"❌ Errore: {e}", file=sys.stderr)
+        sys.exit(1)